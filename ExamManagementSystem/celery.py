@@ -17,4 +17,16 @@ app.conf.beat_schedule = {
         'task': 'exams.tasks.check_and_update_exams',
         'schedule': 60.0,  
     },
+    'purge-stale-draft-timetables-daily': {
+        'task': 'schedules.tasks.purge_stale_draft_timetables',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    'purge-attendance-events-daily': {
+        'task': 'exams.tasks.purge_attendance_events',
+        'schedule': crontab(hour=2, minute=45),
+    },
+    'compact-notifications-daily': {
+        'task': 'notifications.tasks.compact_notifications',
+        'schedule': crontab(hour=3, minute=0),
+    },
 }
\ No newline at end of file
@@ -4,6 +4,7 @@ load_dotenv()
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
 import dj_database_url
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -84,6 +85,7 @@ REST_FRAMEWORK = {
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    "sharedapp.instrumentation.QueryMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     'whitenoise.middleware.WhiteNoiseMiddleware',  
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -141,6 +143,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",   
     "http://127.0.0.1:3000",
 ]
+# Response headers the frontend reads: Content-Disposition for exports, the
+# next-page cursor of /api/notifications/unread/ (see notifications/views.py).
+CORS_EXPOSE_HEADERS = ["Content-Disposition", "X-Next-Cursor"]
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -217,6 +222,62 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Africa/Kigali'
+# Login OTP mail gets its own queue so it is never stuck behind bulk
+# notification fan-out. Run a worker with `-Q mail_high,celery` (or a
+# dedicated one with `-Q mail_high`).
+CELERY_TASK_ROUTES = {
+    'notifications.tasks.deliver_email': {'queue': 'mail_high'},
+}
+
+# Outbound mail transport used by notifications.utils.send_mail:
+# "resend" (production), "console" (log only) or "file" (JSON lines
+# appended to EMAIL_FILE_PATH, handy for tests and local setups).
+EMAIL_TRANSPORT = os.getenv('EMAIL_TRANSPORT', 'resend')
+EMAIL_FILE_PATH = os.getenv('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails.jsonl'))
+
+# Memory-mapped enrollment snapshots shared by scheduler worker processes
+# (enrollments/snapshot.py). Must be on a local filesystem.
+ENROLLMENT_SNAPSHOT_DIR = os.getenv('ENROLLMENT_SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'enrollment-snapshots'))
+
+# Per-endpoint query instrumentation (sharedapp/instrumentation.py). Every
+# web and Celery worker process dumps its metrics into QUERY_METRICS_DIR;
+# /api/metrics/ and `manage.py query_metrics` merge them. Requests above
+# QUERY_BUDGET statements are logged with their most repeated query.
+QUERY_METRICS_ENABLED = os.getenv('QUERY_METRICS_ENABLED', 'True').lower() == 'true'
+QUERY_METRICS_DIR = os.getenv('QUERY_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'auca-query-metrics'))
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', '200'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# DRAFT timetables untouched for this many days are torn down every night
+# by schedules.tasks.purge_stale_draft_timetables (the newest timetable of
+# each location is always kept). Their rows are archived first (see
+# schedules/teardown.py); set DRAFT_TIMETABLE_PURGE_ARCHIVE=False to only
+# delete them.
+DRAFT_TIMETABLE_RETENTION_DAYS = int(os.getenv('DRAFT_TIMETABLE_RETENTION_DAYS', '14'))
+DRAFT_TIMETABLE_PURGE_ARCHIVE = os.getenv('DRAFT_TIMETABLE_PURGE_ARCHIVE', 'True').lower() == 'true'
+
+# Pre-rendered student/instructor timetables (exams/read_model.py) are
+# rebuilt after a change, and in any case once older than this (seconds),
+# which covers writers that bypass the invalidation hooks.
+READ_MODEL_MAX_AGE = int(os.getenv('READ_MODEL_MAX_AGE', '900'))
+
+# Signed exam passes (exams/passes.py). EXAM_PASS_SIGNING_KEY is a
+# base64url Ed25519 seed (`manage.py generate_exam_passes --keygen`);
+# unset, a key derived from SECRET_KEY is used. Passes are valid from
+# EXAM_PASS_EARLY_MINUTES before the exam until it ends; offline scans are
+# accepted EXAM_PASS_GRACE_MINUTES either side of that window.
+EXAM_PASS_SIGNING_KEY = os.getenv('EXAM_PASS_SIGNING_KEY')
+EXAM_PASS_EARLY_MINUTES = int(os.getenv('EXAM_PASS_EARLY_MINUTES', '60'))
+EXAM_PASS_GRACE_MINUTES = int(os.getenv('EXAM_PASS_GRACE_MINUTES', '15'))
+
+# Idempotency keys of batched attendance events (exams/attendance.py) are
+# remembered this many days; a device resending an older batch would have
+# it applied again (harmlessly, timestamps decide).
+ATTENDANCE_EVENT_RETENTION_DAYS = int(os.getenv('ATTENDANCE_EVENT_RETENTION_DAYS', '30'))
+
+# Read notifications older than this many days are moved to the archive
+# table every night (notifications.tasks.compact_notifications).
+NOTIFICATION_ARCHIVE_AFTER_DAYS = int(os.getenv('NOTIFICATION_ARCHIVE_AFTER_DAYS', '90'))
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -3,6 +3,8 @@ from django.urls import path
 from django.urls import path, include
 from django.conf import settings
 
+from sharedapp.views import metrics_view
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -21,4 +23,5 @@ urlpatterns = [
     path("api/config/", include("config.urls")),
     path("api/report/", include("report.urls")),
     path("api/webhooks/", include("webhooks.urls")),
+    path("api/metrics/", metrics_view, name="metrics"),
 ]
@@ -1,10 +1,14 @@
 from rest_framework import serializers
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from .models import CourseGroup, Department, Semester, Course
 from django.contrib.auth import get_user_model
 from departments.serializers import DepartmentSerializer
 from schedules.models import CourseSchedule
 from semesters.serializers import SemesterSerializer
 from users.serializers import UserSerializer
+from enrollments.models import Enrollment
+from sharedapp.query_plans import QueryPlan
 User = get_user_model()
 
 
@@ -58,9 +62,27 @@ class CourseSerializer(serializers.ModelSerializer):
             'is_cross_departmental',
             'associated_departments', 'associated_department_ids',
         ]
+        # A correlated subquery rather than Count("enrollments"): viewsets
+        # filter courses through M2M joins, which would multiply a JOIN count.
+        query_plan = QueryPlan(annotations={
+            "students_enrolled_count": Coalesce(
+                Subquery(
+                    Enrollment.objects.filter(course=OuterRef("pk"), status="enrolled")
+                    .order_by()
+                    .values("course")
+                    .annotate(n=Count("id"))
+                    .values("n")[:1]
+                ),
+                0,
+            ),
+        })
+
     def get_students_enrolled(self, obj):
         # Enrollment.STATUS_CHOICES is enrolled/dropped/completed — 'active'
         # was never a valid value, so this always returned 0.
+        annotated = getattr(obj, "students_enrolled_count", None)
+        if annotated is not None:
+            return annotated
         return obj.enrollments.filter(status='enrolled').count()
      
     
@@ -19,9 +19,10 @@ from enrollments.serializers import EnrollmentSerializer
 from django.db.models import Count
 from rest_framework.response import Response
 from .models import CourseGroup
-from config.utils import JsonConfigManager
+from schedules.slot_calendar import get_slot_calendar
 from .serializers import CourseGroupSerializer
 from users.models import User
+from sharedapp.query_plans import QueryPlanMixin, apply_query_plan
 
 
 
@@ -130,8 +131,11 @@ class BaseViewSet(viewsets.ModelViewSet):
 
         try:
             location = client_conf.get("location")
-            courses = Course.objects.filter(
-                semester__id=int(semester), department__location_id=int(location)
+            courses = apply_query_plan(
+                Course.objects.filter(
+                    semester__id=int(semester), department__location_id=int(location)
+                ),
+                CourseSerializer,
             )
             coursesSerializer = CourseSerializer(courses, many=True)
             return Response(
@@ -161,15 +165,9 @@ class BaseViewSet(viewsets.ModelViewSet):
             wanted_instructor= None
             start_time = None
             end_time = None
-            config_manager = JsonConfigManager()
-            config = config_manager.read_config()
-            time_config = config.get("time_constraints", {})
-            time_slots = time_config.get("time_slots", [])
-            for slot in time_slots:
-                if slot.get("name").lower() == dayTime.lower():
-                    start_time = slot.get("start_time")
-                    end_time = slot.get("end_time")
-                    break
+            slot = get_slot_calendar().slot(dayTime)
+            if slot:
+                start_time, end_time = slot.start, slot.end
             if selected_instructor:
                 wanted_instructor=User.objects.get(id=int(selected_instructor))
             course_group = CourseGroup.objects.get(id=group_id, course__id=course_id)
@@ -214,7 +212,7 @@ class BaseViewSet(viewsets.ModelViewSet):
             )
 
 
-class CourseViewSet(BaseViewSet):
+class CourseViewSet(QueryPlanMixin, BaseViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
     basename = "course"
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from courses.models import Course
@@ -11,6 +11,35 @@ class TimeStampedModel(models.Model):
 
     class Meta:
         abstract = True 
+
+
+class EnrollmentQuerySet(models.QuerySet):
+    """
+    Queryset writes that skip post_save/post_delete (update(), and so
+    bulk_update(), and bulk_create()) bump the enrollment snapshot version
+    in the same transaction, like the signals do for single saves, so no
+    ORM write path leaves the scheduler reading an old roster.
+    """
+
+    def update(self, **kwargs):
+        from enrollments.snapshot import bump_version
+
+        with transaction.atomic(using=self.db):
+            updated = super().update(**kwargs)
+            if updated:
+                bump_version()
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from enrollments.snapshot import bump_version
+
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            if created:
+                bump_version()
+        return created
+
+
 class Enrollment(TimeStampedModel):
     STATUS_CHOICES = [
         ('enrolled', 'Enrolled'),
@@ -53,8 +82,13 @@ class Enrollment(TimeStampedModel):
     )
     group=models.ForeignKey("courses.CourseGroup", null=True, on_delete=models.DO_NOTHING)
 
+    objects = EnrollmentQuerySet.as_manager()
+
     class Meta:
         unique_together = ('student', 'course')
+        indexes = [
+            models.Index(fields=['group', 'status'], name='enrollment_group_status_idx'),
+        ]
         verbose_name = 'Enrollment'
         verbose_name_plural = 'Enrollments'
 
@@ -62,4 +96,21 @@ class Enrollment(TimeStampedModel):
         return f"{self.student} in {self.course}"
 
     def is_fully_paid(self):
-        return self.amount_paid >= self.amount_to_pay
\ No newline at end of file
+        return self.amount_paid >= self.amount_to_pay
+
+class EnrollmentSnapshotVersion(models.Model):
+    """
+    One-row counter behind enrollments/snapshot.py. Bumped inside the
+    transaction that writes enrollments, so every process sees the bump
+    exactly when it sees the rows, and a rollback takes it back.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    # Fresh on every bump: a version number reused after a rollback never
+    # names the snapshot directory built from the discarded rows.
+    token = models.CharField(max_length=32, default="")
+
+    class Meta:
+        verbose_name = 'Enrollment snapshot version'
+
+    def __str__(self):
+        return f"v{self.version}-{self.token}"
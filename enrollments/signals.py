@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from enrollments.models import Enrollment
+from enrollments.snapshot import bump_version
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_changed(sender, **kwargs):
+    # queryset.delete() sends post_delete per row; update(), bulk_update()
+    # and bulk_create() bump through EnrollmentQuerySet instead.
+    bump_version()
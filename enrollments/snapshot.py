@@ -0,0 +1,435 @@
+"""
+Compact, versioned, read-only snapshot of the Enrollment table.
+
+Every scheduler entry point used to read enrollments its own way — ORM
+.iterator() over model instances, .values() dicts, Enrollment.objects.all(),
+or one query per course inside a loop — so a single generation run or
+verification pass loaded the same ~100k rows several times over, as Python
+objects.
+
+The snapshot loads (student_id, course_id, group_id, status) once into four
+NumPy arrays sorted by (course, student), with CSR-style indexes:
+
+    course_ids / course_indptr    course  -> row range in the main arrays
+    group_ids  / group_indptr     group   -> range in group_order (row numbers)
+    student_ids / student_indptr  student -> range in student_order
+
+so "students of course c", "students of group g" and "courses of student s"
+are a binary search plus a slice. A group x group overlap matrix (how many
+students two groups share) is derived from the same arrays on first use,
+see group_overlaps(). The arrays are written once per version
+to ENROLLMENT_SNAPSHOT_DIR and opened with mmap_mode="r", so every worker
+process on the host (Celery, the generation portfolio, web workers) shares
+the same physical pages instead of holding its own copy.
+
+Versioning: a one-row counter (EnrollmentSnapshotVersion) is bumped inside
+the writing transaction on every ORM write to Enrollment: save/delete
+through enrollments/signals.py, update()/bulk_update()/bulk_create()
+through EnrollmentQuerySet. Raw SQL writers (sharedapp/snapshots.py) call
+bump_version() themselves. Every process reads the counter from the
+database, so a commit is seen everywhere at once and a rollback takes the
+bump back with the rows. The snapshot directory is named after the
+(version, token) pair, so any process can find one another already wrote
+without a shared cache.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+STATUS_CODES = {"enrolled": 0, "dropped": 1, "completed": 2}
+UNKNOWN_STATUS = 3
+ENROLLED = STATUS_CODES["enrolled"]
+NO_GROUP = -1
+
+ARRAYS = (
+    "student", "course", "group", "status",
+    "course_ids", "course_indptr",
+    "group_order", "group_ids", "group_indptr",
+    "student_order", "student_ids", "student_indptr",
+)
+
+# Group x group shared-student counts, CSR over the first group. Built on
+# first use and written next to the main arrays.
+OVERLAP_ARRAYS = ("overlap_ids", "overlap_indptr", "overlap_groups", "overlap_counts")
+
+# Old snapshot directories are removed once they are this old (seconds).
+STALE_AFTER = 3600
+
+
+def _snapshot_root():
+    return getattr(settings, "ENROLLMENT_SNAPSHOT_DIR", None) or os.path.join(
+        tempfile.gettempdir(), "enrollment-snapshots"
+    )
+
+
+def _csr(keys):
+    """Unique sorted keys and the indptr of their runs in a sorted array."""
+    ids, starts = np.unique(keys, return_index=True)
+    indptr = np.append(starts, len(keys)).astype(np.int64)
+    return ids.astype(np.int64), indptr
+
+
+class EnrollmentSnapshot:
+    def __init__(self, arrays, version=0, path=None):
+        self.version = version
+        self.token = ""
+        self.path = path
+        self._overlaps = None
+        self._overlaps_lock = threading.Lock()
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    # ------------------------------------------------------------------
+    # Building and loading
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_rows(cls, rows, version=0):
+        """Build from (student_id, course_id, group_id or None, status) tuples."""
+        rows = list(rows)
+        n = len(rows)
+        student = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        course = np.fromiter((r[1] for r in rows), dtype=np.int64, count=n)
+        group = np.fromiter(
+            (NO_GROUP if r[2] is None else r[2] for r in rows), dtype=np.int64, count=n
+        )
+        status = np.fromiter(
+            (STATUS_CODES.get(r[3], UNKNOWN_STATUS) for r in rows), dtype=np.int8, count=n
+        )
+
+        order = np.lexsort((student, course))
+        student, course, group, status = student[order], course[order], group[order], status[order]
+
+        course_ids, course_indptr = _csr(course)
+        group_order = np.lexsort((student, group)).astype(np.int64)
+        group_ids, group_indptr = _csr(group[group_order])
+        student_order = np.argsort(student, kind="stable").astype(np.int64)
+        student_ids, student_indptr = _csr(student[student_order])
+
+        return cls({
+            "student": student, "course": course, "group": group, "status": status,
+            "course_ids": course_ids, "course_indptr": course_indptr,
+            "group_order": group_order, "group_ids": group_ids, "group_indptr": group_indptr,
+            "student_order": student_order, "student_ids": student_ids,
+            "student_indptr": student_indptr,
+        }, version=version)
+
+    @classmethod
+    def from_database(cls, version=0):
+        from enrollments.models import Enrollment
+
+        rows = Enrollment.objects.values_list(
+            "student_id", "course_id", "group_id", "status"
+        ).iterator(chunk_size=10000)
+        return cls.from_rows(rows, version=version)
+
+    def save(self, directory):
+        """Write every array as .npy into a fresh directory, atomically."""
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=parent, prefix=".building-")
+        try:
+            for name in ARRAYS:
+                np.save(os.path.join(tmp, f"{name}.npy"), getattr(self, name))
+            os.replace(tmp, directory)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.path = directory
+
+    @classmethod
+    def open(cls, directory, version=0):
+        """Memory-map a saved snapshot read-only."""
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in ARRAYS
+        }
+        return cls(arrays, version=version, path=directory)
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.student)
+
+    @staticmethod
+    def _range(ids, indptr, key):
+        i = np.searchsorted(ids, key)
+        if i < len(ids) and ids[i] == key:
+            return int(indptr[i]), int(indptr[i + 1])
+        return 0, 0
+
+    def _course_rows(self, course_id):
+        lo, hi = self._range(self.course_ids, self.course_indptr, course_id)
+        return slice(lo, hi)
+
+    def course_enrollments(self, course_id):
+        """(students, groups, status codes) arrays for one course; NO_GROUP for none."""
+        rows = self._course_rows(course_id)
+        return self.student[rows], self.group[rows], self.status[rows]
+
+    def course_students(self, course_id, enrolled_only=True):
+        rows = self._course_rows(course_id)
+        students = self.student[rows]
+        if enrolled_only:
+            students = students[self.status[rows] == ENROLLED]
+        return np.asarray(students)
+
+    def group_students(self, group_id, enrolled_only=True):
+        lo, hi = self._range(self.group_ids, self.group_indptr, group_id)
+        rows = self.group_order[lo:hi]
+        if enrolled_only:
+            rows = rows[self.status[rows] == ENROLLED]
+        return np.asarray(self.student[rows])
+
+    def student_courses(self, student_id, enrolled_only=False):
+        lo, hi = self._range(self.student_ids, self.student_indptr, student_id)
+        rows = self.student_order[lo:hi]
+        if enrolled_only:
+            rows = rows[self.status[rows] == ENROLLED]
+        return np.asarray(self.course[rows])
+
+    def course_group_maps(self, course_ids):
+        """
+        Enrolled, grouped students of the given courses as plain dicts:
+        course -> students, course -> group -> students, course -> group ->
+        size, plus the number of enrolled rows skipped for having no group.
+        """
+        course_students, course_group_students, course_group_sizes = {}, {}, {}
+        missing = 0
+        for course_id in course_ids:
+            rows = self._course_rows(course_id)
+            keep = self.status[rows] == ENROLLED
+            students = self.student[rows][keep]
+            groups = self.group[rows][keep]
+            grouped = groups != NO_GROUP
+            missing += int((~grouped).sum())
+            if not grouped.any():
+                continue
+            students, groups = students[grouped], groups[grouped]
+            by_group = {}
+            for group_id in dict.fromkeys(groups.tolist()):
+                by_group[group_id] = set(students[groups == group_id].tolist())
+            course_students[int(course_id)] = set(students.tolist())
+            course_group_students[int(course_id)] = by_group
+            course_group_sizes[int(course_id)] = {g: len(s) for g, s in by_group.items()}
+        return course_students, course_group_students, course_group_sizes, missing
+
+    def group_student_sets(self, group_ids, enrolled_only=True):
+        """{group_id: set(student ids)} for the given groups (empty ones omitted)."""
+        result = {}
+        for group_id in group_ids:
+            students = self.group_students(group_id, enrolled_only=enrolled_only)
+            if len(students):
+                result[group_id] = set(students.tolist())
+        return result
+
+    def courses_by_student(self, student_ids=None, enrolled_only=False):
+        """{student_id: [course ids]}, for all students or the given ones."""
+        if student_ids is None:
+            student_ids = self.student_ids.tolist()
+        return {
+            student_id: self.student_courses(student_id, enrolled_only=enrolled_only).tolist()
+            for student_id in student_ids
+        }
+
+    # ------------------------------------------------------------------
+    # Group overlaps
+    # ------------------------------------------------------------------
+
+    def _build_overlaps(self):
+        """
+        Count, for every pair of groups, the students enrolled in both.
+
+        Rows are taken in student order with duplicate (student, group)
+        pairs dropped; pairs of a student's groups are then the rows i and
+        i + d that belong to the same student, for d = 1, 2, ... up to the
+        largest number of groups any one student has. Every status counts,
+        as it did in the raw-SQL compatibility check this replaces.
+        """
+        grouped = self.group != NO_GROUP
+        student = np.asarray(self.student)[grouped]
+        group = np.asarray(self.group)[grouped]
+        order = np.lexsort((group, student))
+        student, group = student[order], group[order]
+        if len(student):
+            fresh = np.ones(len(student), dtype=bool)
+            fresh[1:] = (student[1:] != student[:-1]) | (group[1:] != group[:-1])
+            student, group = student[fresh], group[fresh]
+
+        firsts, seconds = [], []
+        d = 1
+        while d < len(student):
+            same = student[d:] == student[:-d]
+            if not same.any():
+                break
+            firsts.append(group[:-d][same])
+            seconds.append(group[d:][same])
+            d += 1
+
+        empty = np.empty(0, dtype=np.int64)
+        a = np.concatenate(firsts + seconds) if firsts else empty
+        b = np.concatenate(seconds + firsts) if firsts else empty
+        order = np.lexsort((b, a))
+        a, b = a[order], b[order]
+        if len(a):
+            starts = np.flatnonzero(np.r_[True, (a[1:] != a[:-1]) | (b[1:] != b[:-1])])
+            counts = np.diff(np.append(starts, len(a))).astype(np.int32)
+            a, b = a[starts], b[starts]
+        else:
+            counts = np.empty(0, dtype=np.int32)
+        overlap_ids, overlap_indptr = _csr(a)
+        return {
+            "overlap_ids": overlap_ids, "overlap_indptr": overlap_indptr,
+            "overlap_groups": b.astype(np.int64), "overlap_counts": counts,
+        }
+
+    def _load_overlaps(self):
+        if self.path:
+            files = {name: os.path.join(self.path, f"{name}.npy") for name in OVERLAP_ARRAYS}
+            if all(os.path.exists(f) for f in files.values()):
+                try:
+                    return {name: np.load(f, mmap_mode="r") for name, f in files.items()}
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not open group overlaps in {self.path}: {e}")
+
+        arrays = self._build_overlaps()
+        if self.path:
+            try:
+                for name in OVERLAP_ARRAYS:
+                    fd, tmp = tempfile.mkstemp(dir=self.path, prefix=f".{name}-", suffix=".npy")
+                    with os.fdopen(fd, "wb") as f:
+                        np.save(f, arrays[name])
+                    os.replace(tmp, os.path.join(self.path, f"{name}.npy"))
+            except OSError as e:
+                logger.warning(f"Could not write group overlaps to {self.path}: {e}")
+        return arrays
+
+    def group_overlaps(self):
+        """The overlap CSR arrays, built or memory-mapped on first use."""
+        if self._overlaps is None:
+            with self._overlaps_lock:
+                if self._overlaps is None:
+                    self._overlaps = self._load_overlaps()
+        return self._overlaps
+
+    def overlapping_groups(self, group_id):
+        """(group ids, shared-student counts) of every group overlapping this one."""
+        overlaps = self.group_overlaps()
+        lo, hi = self._range(overlaps["overlap_ids"], overlaps["overlap_indptr"], group_id)
+        return overlaps["overlap_groups"][lo:hi], overlaps["overlap_counts"][lo:hi]
+
+    def shared_count(self, group_a, group_b):
+        groups, counts = self.overlapping_groups(group_a)
+        i = np.searchsorted(groups, group_b)
+        if i < len(groups) and groups[i] == group_b:
+            return int(counts[i])
+        return 0
+
+    def shared_students(self, group_a, group_b):
+        """Students enrolled in both groups (any status), as a sorted array."""
+        return np.intersect1d(
+            self.group_students(group_a, enrolled_only=False),
+            self.group_students(group_b, enrolled_only=False),
+        )
+
+
+# ----------------------------------------------------------------------
+# Versioning and the process-local handle
+# ----------------------------------------------------------------------
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def current_version():
+    """The (version, token) pair the snapshot must have been built at."""
+    from enrollments.models import EnrollmentSnapshotVersion
+
+    row = EnrollmentSnapshotVersion.objects.filter(pk=1).values_list("version", "token").first()
+    return row or (0, "")
+
+
+def bump_version():
+    """
+    Mark the snapshot stale. Runs in the caller's transaction: the counter
+    row stays locked until it commits, and a rollback discards the bump.
+    """
+    from enrollments.models import EnrollmentSnapshotVersion
+
+    token = uuid.uuid4().hex
+    updated = EnrollmentSnapshotVersion.objects.filter(pk=1).update(
+        version=F("version") + 1, token=token
+    )
+    if not updated:
+        EnrollmentSnapshotVersion.objects.get_or_create(pk=1)
+        EnrollmentSnapshotVersion.objects.filter(pk=1).update(
+            version=F("version") + 1, token=token
+        )
+
+
+def _prune(root, keep):
+    cutoff = time.time() - STALE_AFTER
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if path == keep or not os.path.isdir(path):
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def get_enrollment_snapshot():
+    """
+    The snapshot for the current version: reused if this process already
+    has it, memory-mapped if another process already wrote it, otherwise
+    built from the database (one query) and written for the others.
+    """
+    global _snapshot
+    version, token = current_version()
+    with _lock:
+        if _snapshot is not None and (_snapshot.version, _snapshot.token) == (version, token):
+            return _snapshot
+
+    root = _snapshot_root()
+    path = os.path.join(root, f"v{version}-{token or 'initial'}")
+    snapshot = None
+    if os.path.isdir(path):
+        try:
+            snapshot = EnrollmentSnapshot.open(path, version=version)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not open enrollment snapshot {path}: {e}")
+
+    if snapshot is None:
+        snapshot = EnrollmentSnapshot.from_database(version=version)
+        try:
+            snapshot.save(path)
+        except OSError as e:
+            # The directory exists if another process wrote this version
+            # first; otherwise it is unwritable and the in-memory arrays stay.
+            if not os.path.isdir(path):
+                logger.warning(f"Could not write enrollment snapshot to {path}: {e}")
+        if os.path.isdir(path):
+            try:
+                snapshot = EnrollmentSnapshot.open(path, version=version)
+                _prune(root, keep=path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not open enrollment snapshot {path}: {e}")
+
+    snapshot.token = token
+    with _lock:
+        _snapshot = snapshot
+    return snapshot
@@ -1,3 +1,132 @@
-from django.test import TestCase
+from django.db import transaction
+from django.test import TestCase, override_settings
+import tempfile
 
-# Create your tests here.
+from courses.models import CourseGroup
+from enrollments.models import Enrollment
+from enrollments.snapshot import EnrollmentSnapshot, bump_version, current_version, get_enrollment_snapshot
+from sharedapp.testing import make_campus, make_group, make_students
+
+
+class EnrollmentSnapshotTests(TestCase):
+    def test_csr_lookups(self):
+        snapshot = EnrollmentSnapshot.from_rows([
+            (1, 10, 100, "enrolled"),
+            (2, 10, 101, "enrolled"),
+            (3, 10, 101, "dropped"),
+            (1, 20, 200, "enrolled"),
+            (4, 20, None, "enrolled"),
+        ])
+        self.assertEqual(sorted(snapshot.course_students(10).tolist()), [1, 2])
+        self.assertEqual(sorted(snapshot.course_students(10, enrolled_only=False).tolist()), [1, 2, 3])
+        self.assertEqual(snapshot.group_students(101).tolist(), [2])
+        self.assertEqual(sorted(snapshot.student_courses(1).tolist()), [10, 20])
+        self.assertEqual(snapshot.course_students(99).tolist(), [])
+
+        course_students, groups, sizes, missing = snapshot.course_group_maps([10, 20])
+        self.assertEqual(course_students[20], {1})
+        self.assertEqual(groups[10], {100: {1}, 101: {2}})
+        self.assertEqual(sizes[10], {100: 1, 101: 1})
+        self.assertEqual(missing, 1)
+
+    def test_snapshot_is_memory_mapped_and_follows_writes(self):
+        group = make_group(make_campus())
+        course = group.course
+        students = make_students(2)
+
+        with override_settings(ENROLLMENT_SNAPSHOT_DIR=tempfile.mkdtemp()):
+            Enrollment.objects.create(student=students[0], course=course, group=group)
+            first = get_enrollment_snapshot()
+            self.assertEqual(first.course_students(course.id).tolist(), [students[0].id])
+            self.assertEqual(first.student.__class__.__name__, "memmap")
+            self.assertIs(get_enrollment_snapshot(), first)
+
+            Enrollment.objects.create(student=students[1], course=course, group=group)
+            second = get_enrollment_snapshot()
+            self.assertGreater(second.version, first.version)
+            self.assertEqual(len(second.course_students(course.id)), 2)
+
+    def test_queryset_writes_bump_the_version(self):
+        group = make_group(make_campus())
+        students = make_students(2)
+        with override_settings(ENROLLMENT_SNAPSHOT_DIR=tempfile.mkdtemp()):
+            before = get_enrollment_snapshot()
+            Enrollment.objects.bulk_create([
+                Enrollment(student=s, course=group.course, group=group) for s in students
+            ])
+            created = get_enrollment_snapshot()
+            self.assertGreater(created.version, before.version)
+            self.assertEqual(len(created.group_students(group.id)), 2)
+
+            Enrollment.objects.filter(student=students[0]).update(status="dropped")
+            self.assertEqual(get_enrollment_snapshot().group_students(group.id).tolist(), [students[1].id])
+
+            rows = list(Enrollment.objects.all())
+            for row in rows:
+                row.status = "enrolled"
+            Enrollment.objects.bulk_update(rows, ["status"])
+            self.assertEqual(len(get_enrollment_snapshot().group_students(group.id)), 2)
+
+            # Nothing matched: no bump.
+            version = current_version()
+            Enrollment.objects.filter(student=None).update(status="dropped")
+            self.assertEqual(current_version(), version)
+
+    def test_version_lives_in_the_database(self):
+        bump_version()
+        committed = current_version()
+        try:
+            with transaction.atomic():
+                bump_version()
+                self.assertEqual(current_version()[0], committed[0] + 1)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(current_version(), committed)
+
+    def test_group_overlaps(self):
+        rows = [
+            (1, 10, 100, "enrolled"),
+            (1, 20, 200, "enrolled"),
+            (1, 30, 300, "dropped"),
+            (2, 10, 100, "enrolled"),
+            (2, 20, 200, "enrolled"),
+            (2, 20, 200, "enrolled"),  # duplicate row counts once
+            (3, 10, 101, "enrolled"),
+            (3, 20, 200, "enrolled"),
+            (4, 30, None, "enrolled"),
+        ]
+        snapshot = EnrollmentSnapshot.from_rows(rows)
+        self.assertEqual(snapshot.shared_count(100, 200), 2)
+        self.assertEqual(snapshot.shared_count(200, 100), 2)
+        self.assertEqual(snapshot.shared_count(100, 300), 1)
+        self.assertEqual(snapshot.shared_count(100, 101), 0)
+        groups, counts = snapshot.overlapping_groups(200)
+        self.assertEqual(dict(zip(groups.tolist(), counts.tolist())), {100: 2, 101: 1, 300: 1})
+        self.assertEqual(snapshot.shared_students(100, 200).tolist(), [1, 2])
+
+        with tempfile.TemporaryDirectory() as root:
+            snapshot.save(f"{root}/snap")
+            opened = EnrollmentSnapshot.open(f"{root}/snap")
+            self.assertEqual(opened.shared_count(200, 101), 1)
+            # Written next to the arrays and memory-mapped on the next open.
+            reopened = EnrollmentSnapshot.open(f"{root}/snap")
+            self.assertEqual(reopened.group_overlaps()["overlap_counts"].__class__.__name__, "memmap")
+            self.assertEqual(reopened.shared_count(100, 200), 2)
+
+    def test_group_overlaps_follow_queryset_updates(self):
+        campus = make_campus()
+        group, other_group = make_group(campus), make_group(campus, code="MA101", title="Maths")
+        for s in make_students(3):
+            Enrollment.objects.create(student=s, course=group.course, group=group)
+            Enrollment.objects.create(student=s, course=other_group.course, group=other_group)
+
+        with override_settings(ENROLLMENT_SNAPSHOT_DIR=tempfile.mkdtemp()):
+            self.assertEqual(get_enrollment_snapshot().shared_count(group.id, other_group.id), 3)
+
+            # Moved with .update(): no signal, but the queryset bumps the version.
+            empty = CourseGroup.objects.create(course=group.course, group_name="B")
+            Enrollment.objects.filter(group=group).update(group=empty)
+            snapshot = get_enrollment_snapshot()
+            self.assertEqual(snapshot.shared_count(group.id, other_group.id), 0)
+            self.assertEqual(snapshot.shared_count(empty.id, other_group.id), 3)
@@ -0,0 +1,223 @@
+"""
+Batched, idempotent attendance updates.
+
+signin_student / signout_student toggle one student per request and
+verify_room_qr saves the whole StudentExam row, so an invigilator working
+through a queue at the door sends a burst of small requests, each with its
+own transaction and its own notification.
+
+apply_events() takes a batch of events instead:
+
+    idempotency_key   chosen by the device, unique per event
+    student_exam_id
+    action            signin | signout | undo_signin | undo_signout
+    client_timestamp  when it happened on the device
+
+and, per batch:
+
+    1. drops events whose key is already in the AttendanceEvent ledger
+       (a resent batch) or repeated within the batch;
+    2. locks the target rows with one SELECT ... FOR UPDATE;
+    3. keeps, per row and flag, the latest event, and only if it is newer
+       than the flag's stored timestamp (signin_at / signout_at), so
+       devices syncing out of order converge on the last change;
+    4. writes all winners with one UPDATE ... FROM (VALUES ...) on
+       PostgreSQL (one bulk_update elsewhere) and records the batch in the
+       ledger with one INSERT;
+    5. after commit, sends the per-exam signed-in/out count changes to the
+       exams WebSocket group in one message.
+"""
+import logging
+from collections import defaultdict, namedtuple
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from exams import read_model
+from exams.models import AttendanceEvent, StudentExam
+
+logger = logging.getLogger(__name__)
+
+# action -> (flag, value)
+ACTIONS = {
+    "signin": ("signin_attendance", True),
+    "signout": ("signout_attendance", True),
+    "undo_signin": ("signin_attendance", False),
+    "undo_signout": ("signout_attendance", False),
+}
+TIMESTAMP_FIELDS = {"signin_attendance": "signin_at", "signout_attendance": "signout_at"}
+DELTA_KEYS = {"signin_attendance": "signed_in", "signout_attendance": "signed_out"}
+
+MAX_BATCH = 5000
+
+Event = namedtuple("Event", ["index", "key", "student_exam_id", "action", "at"])
+
+
+def parse_events(raw_events):
+    """Validate request payload events; returns (events, rejected)."""
+    events, rejected = [], []
+    for index, raw in enumerate(raw_events):
+        if not isinstance(raw, dict):
+            rejected.append({"index": index, "reason": "not an object"})
+            continue
+        action = raw.get("action")
+        if action not in ACTIONS:
+            rejected.append({"index": index, "reason": f"unknown action {action!r}"})
+            continue
+        try:
+            student_exam_id = int(raw.get("student_exam_id"))
+        except (TypeError, ValueError):
+            rejected.append({"index": index, "reason": "missing student_exam_id"})
+            continue
+        at = parse_datetime(str(raw.get("client_timestamp") or ""))
+        if at is None:
+            rejected.append({"index": index, "reason": "missing client_timestamp"})
+            continue
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        key = raw.get("idempotency_key")
+        if key is not None:
+            key = str(key)[:64]
+        events.append(Event(index, key, student_exam_id, action, at))
+    return events, rejected
+
+
+def _write(changes):
+    """changes: {(student_exam_id, flag): (value, at)}"""
+    by_flag = defaultdict(list)
+    for (se_id, flag), (value, at) in changes.items():
+        by_flag[flag].append((se_id, value, at))
+
+    table = connection.ops.quote_name(StudentExam._meta.db_table)
+    for flag, rows in by_flag.items():
+        stamp = TIMESTAMP_FIELDS[flag]
+        if connection.vendor == "postgresql":
+            values = ", ".join(["(%s, %s, %s::timestamptz)"] * len(rows))
+            params = [p for row in rows for p in row]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} AS se SET {flag} = v.value, {stamp} = v.at "
+                    f"FROM (VALUES {values}) AS v(id, value, at) WHERE se.id = v.id",
+                    params,
+                )
+        else:
+            StudentExam.objects.bulk_update(
+                [StudentExam(id=se_id, **{flag: value, stamp: at}) for se_id, value, at in rows],
+                [flag, stamp],
+                batch_size=500,
+            )
+
+
+def _broadcast(deltas):
+    message = {
+        "type": "attendance_delta",
+        "exams": [{"exam_id": exam_id, **counts} for exam_id, counts in sorted(deltas.items())],
+    }
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            "broadcast_exams", {"type": "send_exam_data", "message": message}
+        )
+    except Exception as e:
+        # Counts are also visible on the next attendance fetch.
+        logger.warning(f"Could not broadcast attendance deltas: {e}")
+
+
+def apply_events(events, user=None, restrict_to_instructor=True):
+    """
+    Apply parsed events (see module docstring). With restrict_to_instructor,
+    an instructor may only change rows they invigilate. Returns counts and
+    per-event rejections.
+    """
+    result = {"applied": 0, "duplicates": 0, "stale": 0, "rejected": []}
+    if not events:
+        return result
+
+    keys = [e.key for e in events if e.key]
+    seen = set(AttendanceEvent.objects.filter(idempotency_key__in=keys).values_list("idempotency_key", flat=True))
+    fresh = []
+    for event in events:
+        if event.key and event.key in seen:
+            result["duplicates"] += 1
+            continue
+        if event.key:
+            seen.add(event.key)
+        fresh.append(event)
+
+    with transaction.atomic():
+        rows = {
+            row["id"]: row
+            for row in StudentExam.objects.select_for_update()
+            .filter(id__in={e.student_exam_id for e in fresh})
+            .values("id", "exam_id", "student_id", "instructor_id", *TIMESTAMP_FIELDS, *TIMESTAMP_FIELDS.values())
+        }
+
+        # Latest event per (row, flag) wins; the rest of the batch is stale.
+        winners = {}
+        stale = []
+        for event in fresh:
+            row = rows.get(event.student_exam_id)
+            if row is None:
+                result["rejected"].append({"index": event.index, "reason": "unknown student exam"})
+                continue
+            if (
+                restrict_to_instructor and user is not None and user.role == "instructor"
+                and row["instructor_id"] != user.id
+            ):
+                result["rejected"].append({"index": event.index, "reason": "not invigilated by you"})
+                continue
+            flag, _ = ACTIONS[event.action]
+            current = winners.get((event.student_exam_id, flag))
+            if current is None or event.at > current.at:
+                if current is not None:
+                    stale.append(current)
+                winners[(event.student_exam_id, flag)] = event
+            else:
+                stale.append(event)
+
+        changes, deltas, touched = {}, defaultdict(lambda: defaultdict(int)), set()
+        for (se_id, flag), event in list(winners.items()):
+            row = rows[se_id]
+            stored_at = row[TIMESTAMP_FIELDS[flag]]
+            if stored_at is not None and event.at <= stored_at:
+                stale.append(event)
+                del winners[(se_id, flag)]
+                continue
+            value = ACTIONS[event.action][1]
+            changes[(se_id, flag)] = (value, event.at)
+            touched.add(se_id)
+            if row[flag] != value:
+                deltas[row["exam_id"]][DELTA_KEYS[flag]] += 1 if value else -1
+
+        if changes:
+            _write(changes)
+        outcome = {id(e): "applied" for e in winners.values()}
+        AttendanceEvent.objects.bulk_create(
+            [
+                AttendanceEvent(
+                    idempotency_key=e.key,
+                    student_exam_id=e.student_exam_id,
+                    action=e.action,
+                    client_timestamp=e.at,
+                    outcome=outcome.get(id(e), "stale"),
+                    recorded_by=user if user is not None and user.is_authenticated else None,
+                )
+                for e in list(winners.values()) + stale
+                if e.key
+            ],
+            ignore_conflicts=True,
+        )
+        if touched:
+            read_model.invalidate_owners(
+                [rows[i]["student_id"] for i in touched], [rows[i]["instructor_id"] for i in touched]
+            )
+        deltas = {exam_id: dict(counts) for exam_id, counts in deltas.items() if any(counts.values())}
+        if deltas:
+            transaction.on_commit(lambda: _broadcast(deltas))
+
+    result["applied"] = len(winners)
+    result["stale"] = len(stale)
+    result["rejected"].sort(key=lambda r: r["index"])
+    return result
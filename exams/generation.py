@@ -0,0 +1,452 @@
+"""
+Timetable generation runs: one campus, or several in parallel.
+
+generate_for_location() is one generation: a MasterTimetable for the
+campus, generate_exam_schedule() (colouring, placement, room allocation),
+then the unscheduled courses recorded as UnscheduledExam rows.
+_run_generate_timetable in exams/views.py wraps it in one transaction.
+
+generate_locations() is the multi-campus mode (configurations.locations
+in the generate-exam-schedule request). Each campus is a shard: its own
+courses (those of departments at that location), its own rooms and its
+own MasterTimetable, so the shards read and write disjoint data. Shards
+run in spawned worker processes, each with its own database connection
+and transaction, and report progress through a manager queue; the SSE
+stream gets a progress bar per shard plus the overall one.
+
+    SQLite              shards run one after another in this process (the
+                        workers could not see a test database, and SQLite
+                        has one writer at a time anyway)
+    no worker pool      the same, for the shards not already done
+
+A student enrolled at more than one of the campuses is a cross-campus
+student: each shard places their exams without seeing the others, so two
+of them can land in the same slot. They are counted before the run, and
+afterwards the coordinated pass finds every cross-campus student with two
+exams in the same date and slot across the new timetables. Those clashes
+are reported in the result ("cross_campus"); resolving them means moving
+one of the exams (see reschedule-exam).
+"""
+import logging
+import multiprocessing
+import os
+import queue as queue_mod
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import django
+from django.db import connection, connections, transaction
+from django.db.models import Count
+
+from courses.models import Course
+from courses.serializers import CourseSerializer
+from enrollments.models import Enrollment
+from enrollments.snapshot import get_enrollment_snapshot
+from exams.models import StudentExam, UnscheduledExam
+from rooms.models import Location
+from schedules import occupancy
+from schedules.models import MasterTimetable
+from schedules.utils import generate_exam_schedule
+from sharedapp.models import UnscheduledExamGroup
+from sharedapp.shared_serializer import CourseGroupSerializer
+from student.models import Student
+
+logger = logging.getLogger(__name__)
+
+# Clashes listed in the result; the count covers all of them.
+MAX_REPORTED_CONFLICTS = 200
+
+
+def record_unscheduled(master_timetable, unscheduled, reasons):
+    """Store the courses that got no slot as UnscheduledExam rows; returns their payload."""
+    unScheduled = []
+    unscheduled_courses = [course["courses"] for course in unscheduled]
+    if not unscheduled_courses:
+        return unScheduled
+
+    # Flatten and collect all unique course IDs and group IDs
+    all_course_ids = set()
+    all_group_ids = set()
+    course_group_mapping = defaultdict(list)
+
+    for unscheduleds_ in unscheduled_courses:
+        for unscheduled_ in unscheduleds_:
+            course_id = unscheduled_["course_id"]
+            groups = unscheduled_["groups"]
+            all_course_ids.add(course_id)
+            course_group_mapping[course_id].extend(groups)
+            all_group_ids.update(filter(None, groups))
+
+    # Bulk fetch courses and enrollments
+    courses_dict = {
+        course.id: course
+        for course in Course.objects.filter(id__in=all_course_ids)
+    }
+
+    # Bulk fetch enrollments with related groups
+    enrollments_dict = {}
+    if all_group_ids:
+        enrollments = Enrollment.objects.filter(
+            course_id__in=all_course_ids, group_id__in=all_group_ids
+        ).select_related("group", "course")
+
+        for enrollment in enrollments:
+            key = (enrollment.course_id, enrollment.group_id)
+            enrollments_dict[key] = enrollment
+
+    # Process unscheduled exams in batches
+    unscheduled_exams_to_create = []
+
+    for unscheduleds_ in unscheduled_courses:
+        for unscheduled_ in unscheduleds_:
+            course_id = unscheduled_["course_id"]
+            groups = unscheduled_["groups"]
+
+            course = courses_dict.get(course_id)
+            if not course:
+                continue
+
+            # Filter out None/empty groups
+            valid_groups = [g for g in groups if g]
+            if not valid_groups:
+                continue
+
+            # Get reason for first valid group
+            reason = reasons.get(valid_groups[0], "Unknown reason")
+
+            # Prepare course data structure
+            c = {
+                "course": CourseSerializer(course).data,
+                "groups": [],
+                "reason": reason,
+            }
+
+            # Create unscheduled exam object (will be bulk created later)
+            unscheduled_exam_data = {
+                "course": course,
+                "master_timetable": master_timetable,
+                "reason": reason,
+                "groups_data": [],
+            }
+
+            # Process groups for this course
+            for group_id in valid_groups:
+                enrollment = enrollments_dict.get((course_id, group_id))
+                if enrollment:
+                    c["groups"].append(
+                        CourseGroupSerializer(enrollment.group).data
+                    )
+                    unscheduled_exam_data["groups_data"].append(
+                        enrollment.group
+                    )
+
+            if c["groups"]:  # Only add if we have valid groups
+                unScheduled.append(c)
+                unscheduled_exams_to_create.append(unscheduled_exam_data)
+
+    # Bulk create unscheduled exams
+    for exam_data in unscheduled_exams_to_create:
+        unscheduled_exam = UnscheduledExam.objects.create(
+            course=exam_data["course"],
+            master_timetable=exam_data["master_timetable"],
+            reason=exam_data["reason"],
+        )
+
+        # Bulk create groups for this exam
+        groups_to_create = [
+            UnscheduledExamGroup(exam=unscheduled_exam, group=group)
+            for group in exam_data["groups_data"]
+        ]
+
+        if groups_to_create:
+            UnscheduledExamGroup.objects.bulk_create(groups_to_create)
+
+            # Add groups to the exam (using add with the created objects)
+            unscheduled_exam.groups.add(
+                *[
+                    ug.id
+                    for ug in UnscheduledExamGroup.objects.filter(
+                        exam=unscheduled_exam
+                    )
+                ]
+            )
+    return unScheduled
+
+
+def unaccommodated_summary(unaccommodated):
+    # Students whose exam WAS scheduled but who ran out of room during
+    # allocation (distinct from the unscheduled courses — courses that never
+    # got a date/slot at all). This used to be computed and immediately
+    # discarded (`_`) with a hardcoded `"unaccomodated": []` stub here,
+    # so an admin had no way to know a generation left students seatless.
+    # Bulk-fetch student->user in one query instead of one per student
+    # (unaccommodated can easily be 100+ students for an oversubscribed
+    # slot).
+    student_users = {
+        s.id: s.user
+        for s in Student.objects.filter(
+            id__in=[item["student"].id for item in unaccommodated]
+        ).select_related("user")
+    }
+    return [
+        {
+            "student_id": item["student"].id,
+            "reg_no": item["student"].reg_no,
+            "name": (
+                f"{u.first_name} {u.last_name}".strip()
+                if (u := student_users.get(item["student"].id))
+                else ""
+            ),
+            "exam_id": item["exam"].id,
+            "course": item["exam"].group.course.title,
+            "group": item["exam"].group.group_name,
+            # ISO strings, not raw date/time objects — this SSE stream
+            # is encoded with plain json.dumps() (see _sse_event), not
+            # DRF's date-aware renderer, so a raw datetime.date/time
+            # object here throws "Object of type date is not JSON
+            # serializable" and takes down the whole "done" event after
+            # generation otherwise completed successfully.
+            "date": item["exam"].date.isoformat() if item["exam"].date else None,
+            "start_time": (
+                item["exam"].start_time.isoformat()
+                if item["exam"].start_time else None
+            ),
+        }
+        for item in unaccommodated
+    ]
+
+
+def generate_for_location(params, location_id, user_id, semester_id, course_ids, progress_callback):
+    """
+    One campus: create its MasterTimetable and generate into it. `params`
+    is the parsed request (see exams/views._generation_params). Runs in the
+    caller's transaction.
+    """
+    master_timetable = MasterTimetable.objects.create(
+        academic_year=params["academic_year"],
+        generated_by_id=user_id,
+        start_date=params["start_date"],
+        end_date=params["end_date"],
+        category=params["category"],
+        location_id=int(location_id),
+        semester_id=int(semester_id),
+    )
+
+    exams, unaccommodated, unscheduled, reasons, errors, stats = generate_exam_schedule(
+        slots=params["slots"],
+        course_ids=course_ids,
+        master_timetable=master_timetable,
+        location=int(location_id),
+        constraints=params["constraints"],
+        progress_callback=progress_callback,
+    )
+    # Bulk-created exams: any occupancy index built mid-run is rebuilt.
+    occupancy.invalidate_timetable(master_timetable.id)
+
+    return {
+        "timetable_id": master_timetable.id,
+        "exams": len(exams),
+        "unaccommodated": unaccommodated_summary(unaccommodated),
+        "unscheduled": record_unscheduled(master_timetable, unscheduled, reasons),
+        "errors": errors,
+        "stats": dict(stats),
+    }
+
+
+# ----------------------------------------------------------------------
+# Multi-campus
+# ----------------------------------------------------------------------
+
+def location_courses(location_ids, course_ids=None):
+    """{location id: [course ids]}: each campus' courses, limited to `course_ids` if given."""
+    courses = Course.objects.filter(department__location_id__in=location_ids)
+    if course_ids:
+        courses = courses.filter(id__in=course_ids)
+    by_location = {int(location_id): [] for location_id in location_ids}
+    for course_id, location_id in courses.order_by("id").values_list("id", "department__location_id"):
+        by_location[location_id].append(course_id)
+    return by_location
+
+
+def cross_campus_students(courses_by_location):
+    """Ids of students enrolled (with a group) at more than one of the campuses."""
+    snapshot = get_enrollment_snapshot()
+    seen, cross = {}, set()
+    for location_id, course_ids in courses_by_location.items():
+        course_students, _, _, _ = snapshot.course_group_maps(course_ids)
+        for students in course_students.values():
+            for student_id in students:
+                first = seen.setdefault(student_id, location_id)
+                if first != location_id:
+                    cross.add(student_id)
+    return cross
+
+
+def cross_campus_conflicts(timetable_ids):
+    """
+    The coordinated pass: students with two exams in the same date and
+    slot in different timetables of this run (only cross-campus students
+    can have them; each shard keeps its own students apart).
+    """
+    if len(timetable_ids) < 2:
+        return []
+    return list(
+        StudentExam.objects.filter(exam__master_timetable_id__in=timetable_ids)
+        .values("student_id", "exam__date", "exam__slot_name")
+        .annotate(exams=Count("id"), timetables=Count("exam__master_timetable_id", distinct=True))
+        .filter(timetables__gt=1)
+        .order_by("exam__date", "exam__slot_name", "student_id")
+    )
+
+
+def run_shard(shard, progress):
+    """Generate one campus in its own transaction; never raises."""
+    location_id = shard["location_id"]
+    try:
+        with transaction.atomic():
+            result = generate_for_location(
+                shard["params"], location_id, shard["user_id"], shard["semester_id"],
+                shard["course_ids"], progress,
+            )
+        return {"location_id": location_id, **result}
+    except Exception as exc:
+        logger.exception(f"Generation for location {location_id} failed")
+        return {"location_id": location_id, "error": str(exc)}
+
+
+def _shard_worker(shard, events):
+    def progress(step, total, message, stats=None):
+        events.put((shard["location_id"], step, total, message, stats))
+
+    try:
+        return run_shard(shard, progress)
+    finally:
+        connections.close_all()
+
+
+def _pool_workers(shards, max_workers):
+    if connection.vendor == "sqlite":
+        return 0
+    workers = min(len(shards), max_workers or os.cpu_count() or 1)
+    return workers if workers > 1 else 0
+
+
+def _run_in_pool(shards, workers, on_event, results):
+    """
+    Run the shards in worker processes, filling `results` as each one
+    completes. A shard that fails, or is lost with a broken pool, is left
+    out of `results` (and logged) so the caller reruns only that one; the
+    ones already finished keep their timetables.
+    """
+    # spawn, not fork: see schedules/planner.run_portfolio. django.setup
+    # runs before the first shard is unpickled, so the worker can import
+    # this module and the models.
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        events = manager.Queue()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            pending = {pool.submit(_shard_worker, shard, events): shard["location_id"] for shard in shards}
+            while pending:
+                done, _ = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+                for future in done:
+                    location_id = pending.pop(future)
+                    try:
+                        results[location_id] = future.result()
+                    except Exception as exc:
+                        logger.warning(f"Shard for location {location_id} failed in a worker: {exc}")
+                while True:
+                    try:
+                        on_event(*events.get_nowait())
+                    except queue_mod.Empty:
+                        break
+
+
+def generate_locations(params, location_ids, user_id, semester_id, progress_callback, shard_callback,
+                       max_workers=None):
+    """
+    Generate several campuses in parallel (see the module docstring).
+    shard_callback(location, step, total, message, stats) gets each shard's
+    progress; progress_callback(step, total, message) the overall progress.
+    """
+    location_ids = list(dict.fromkeys(int(location_id) for location_id in location_ids))
+    names = dict(Location.objects.filter(id__in=location_ids).values_list("id", "name"))
+    unknown = [location_id for location_id in location_ids if location_id not in names]
+    if unknown:
+        raise ValueError(f"Unknown location(s): {', '.join(map(str, unknown))}")
+
+    courses_by_location = location_courses(location_ids, params["course_ids"])
+    cross = cross_campus_students(courses_by_location)
+    if cross:
+        logger.info(f"{len(cross)} students are enrolled at more than one of locations {location_ids}")
+    progress_callback(0, 100, f"Generating {len(location_ids)} locations; {len(cross)} cross-campus students")
+
+    shards = [
+        {
+            "location_id": location_id,
+            "params": params,
+            "user_id": user_id,
+            "semester_id": semester_id,
+            "course_ids": courses_by_location[location_id],
+        }
+        for location_id in location_ids
+    ]
+    percents = {location_id: 0 for location_id in location_ids}
+
+    def on_event(location_id, step, total, message, stats=None):
+        shard_callback({"id": location_id, "name": names[location_id]}, step, total, message, stats)
+        percents[location_id] = round(step / total * 100) if total else 0
+        overall = round(sum(percents.values()) / len(percents))
+        progress_callback(overall, 100, f"{names[location_id]}: {message}")
+
+    results = {}
+    workers = _pool_workers(shards, max_workers)
+    if workers:
+        try:
+            _run_in_pool(shards, workers, on_event, results)
+        except Exception as exc:
+            logger.warning(f"Shard workers unavailable ({exc}); running the remaining locations inline")
+    for shard in shards:
+        if shard["location_id"] not in results:
+            results[shard["location_id"]] = run_shard(
+                shard, lambda step, total, message, stats=None, _id=shard["location_id"]: on_event(
+                    _id, step, total, message, stats
+                ),
+            )
+
+    ordered = [{"location": names[location_id], **results[location_id]} for location_id in location_ids]
+    timetable_ids = [r["timetable_id"] for r in ordered if "timetable_id" in r]
+    progress_callback(100, 100, "Checking cross-campus students ...")
+    conflicts = cross_campus_conflicts(timetable_ids)
+
+    stats = defaultdict(int)
+    for result in ordered:
+        for key, value in result.get("stats", {}).items():
+            if isinstance(value, (int, float)):
+                stats[key] += value
+    return {
+        "success": all("error" not in r for r in ordered),
+        "message": (
+            f"{sum(r.get('exams', 0) for r in ordered)} exams scheduled across "
+            f"{len(timetable_ids)} of {len(ordered)} locations."
+        ),
+        "shards": ordered,
+        "cross_campus": {
+            "students": len(cross),
+            "conflicts": len(conflicts),
+            "clashes": [
+                {
+                    "student_id": row["student_id"],
+                    "date": row["exam__date"].isoformat(),
+                    "slot_name": row["exam__slot_name"],
+                    "exams": row["exams"],
+                }
+                for row in conflicts[:MAX_REPORTED_CONFLICTS]
+            ],
+        },
+        "unscheduled": [u for r in ordered for u in r.get("unscheduled", [])],
+        "unaccommodated": [u for r in ordered for u in r.get("unaccommodated", [])],
+        "errors": [e for r in ordered for e in r.get("errors", [])]
+                  + [f"{r['location']}: {r['error']}" for r in ordered if "error" in r],
+        "stats": dict(stats),
+    }
+
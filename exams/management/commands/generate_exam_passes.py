@@ -0,0 +1,43 @@
+import base64
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exams import pass_codec
+from exams.passes import generate_passes, public_key_data
+from schedules.models import MasterTimetable
+
+
+class Command(BaseCommand):
+    help = (
+        "Issue (or re-issue) the signed exam passes of a timetable, e.g. "
+        "after editing rooms or seats of a published timetable. Re-issued "
+        "passes supersede the old ones. --keygen prints a new signing key "
+        "for EXAM_PASS_SIGNING_KEY instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--timetable", type=int, help="MasterTimetable id.")
+        parser.add_argument(
+            "--keygen",
+            action="store_true",
+            help="Print a new EXAM_PASS_SIGNING_KEY and its public key, then exit.",
+        )
+
+    def handle(self, *args, **options):
+        if options["keygen"]:
+            seed = os.urandom(32)
+            public = pass_codec.public_bytes(seed)
+            self.stdout.write(f"EXAM_PASS_SIGNING_KEY={base64.urlsafe_b64encode(seed).rstrip(b'=').decode()}")
+            self.stdout.write(f"public key: {base64.urlsafe_b64encode(public).rstrip(b'=').decode()}")
+            self.stdout.write(f"key id: {pass_codec.key_id(public):08x}")
+            return
+
+        timetable_id = options["timetable"]
+        if timetable_id is None:
+            raise CommandError("--timetable is required")
+        if not MasterTimetable.objects.filter(id=timetable_id).exists():
+            raise CommandError(f"Timetable {timetable_id} not found")
+        count = generate_passes(timetable_id=timetable_id)
+        kid = public_key_data()[0]["kid"]
+        self.stdout.write(self.style.SUCCESS(f"Issued {count} passes for timetable {timetable_id} (key {kid})"))
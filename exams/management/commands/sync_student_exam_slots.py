@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from exams.models import StudentExam
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill and check the slot columns StudentExam copies from its "
+        "exam (slot_date, slot_start, slot_end, location, master_timetable). "
+        "Without --check, every exam with at least one stale row is "
+        "re-synced; with --check, stale rows are only reported and the "
+        "command fails if there are any."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Report rows that disagree with their exam instead of fixing them.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Exams re-synced per UPDATE (default 500).",
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=10,
+            help="With --check, how many stale rows to print (default 10).",
+        )
+
+    def handle(self, *args, **options):
+        stale = StudentExam.stale_slots()
+        exam_ids = sorted(set(stale.values_list("exam_id", flat=True)))
+
+        if options["check"]:
+            count = stale.count()
+            if not count:
+                self.stdout.write(self.style.SUCCESS("All StudentExam slot columns match their exams."))
+                return
+            for row in stale.order_by("id")[: options["sample"]]:
+                self.stdout.write(
+                    f"StudentExam {row.id} (exam {row.exam_id}): "
+                    f"has {row.slot_date} {row.slot_start}-{row.slot_end} "
+                    f"location={row.location_id} timetable={row.master_timetable_id}, "
+                    f"expected {row.expected_slot_date} {row.expected_slot_start}-{row.expected_slot_end} "
+                    f"location={row.expected_location_id} timetable={row.expected_master_timetable_id}"
+                )
+            raise CommandError(f"{count} stale StudentExam row(s) across {len(exam_ids)} exam(s).")
+
+        if not exam_ids:
+            self.stdout.write(self.style.SUCCESS("Nothing to backfill."))
+            return
+        updated = StudentExam.sync_slots(exam_ids, batch_size=max(1, options["batch_size"]))
+        self.stdout.write(
+            self.style.SUCCESS(f"Re-synced {updated} StudentExam row(s) across {len(exam_ids)} exam(s).")
+        )
@@ -1,7 +1,10 @@
 from django.db import models
-from rooms.models import Room
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from rooms.models import Location, Room
 from schedules.models import MasterTimetable
 from  student.models import Student
+import zlib
 from datetime import datetime
 from sharedapp.models import UnscheduledExamGroup
 class TimeStampedModel(models.Model):
@@ -27,25 +30,41 @@ class Exam(TimeStampedModel):
     group= models.ForeignKey("courses.CourseGroup", on_delete=models.DO_NOTHING, null=True)
     slot_name=  models.CharField(max_length=10, default='Morning')
     master_timetable = models.ForeignKey(MasterTimetable, on_delete=models.CASCADE, null=True)
-    
 
-     
+    class Meta:
+        # Slot lookups (occupancy, reschedule, dashboard) filter on the date
+        # plus either the slot name or the exact times.
+        indexes = [
+            models.Index(fields=['date', 'slot_name'], name='exam_date_slot_idx'),
+            models.Index(fields=['date', 'start_time', 'end_time'], name='exam_date_times_idx'),
+        ]
+
     def __str__(self):
         return f"{self.group.course.code} - {self.date} - {self.status}"
 
     def update_status(self):
-        now = datetime.now()
+        """
+        Set SCHEDULED / ONGOING / COMPLETED from the current time with a
+        conditional UPDATE (see exams/status.py); True if this call changed it.
+        """
+        from exams.status import local_now, set_status
+
+        now = local_now().replace(tzinfo=None)
         exam_datetime = datetime.combine(self.date, self.start_time)
         exam_end_datetime = datetime.combine(self.date, self.end_time)
 
-        if self.status != 'CANCELLED':
-            if now < exam_datetime:
-                self.status = 'SCHEDULED'
-            elif exam_datetime <= now <= exam_end_datetime:
-                self.status = 'ONGOING'
-            elif now > exam_end_datetime:
-                self.status = 'COMPLETED'
-            self.save(update_fields=['status'])
+        if self.status == 'CANCELLED':
+            return False
+        if now < exam_datetime:
+            status = 'SCHEDULED'
+        elif now <= exam_end_datetime:
+            status = 'ONGOING'
+        else:
+            status = 'COMPLETED'
+        if not set_status(self.pk, status):
+            return False
+        self.status = status
+        return True
     
 class StudentExam(TimeStampedModel):
     STATUS_CHOICES = [
@@ -64,9 +83,130 @@ class StudentExam(TimeStampedModel):
     instructor=models.ForeignKey("users.user", on_delete=models.SET_NULL, null=True, blank=True)
     signin_attendance= models.BooleanField(default=False)
     signout_attendance= models.BooleanField(default=False)
+    # Device time of the last sign-in/sign-out change applied through
+    # exams/attendance.py; an older event for the same flag loses.
+    signin_at = models.DateTimeField(null=True, blank=True)
+    signout_at = models.DateTimeField(null=True, blank=True)
+
+    # Copies of the exam's slot, campus and timetable, so room and seat
+    # queries filter this table alone instead of joining exam (and
+    # group -> course -> department for the location). Filled on save and
+    # by bulk creators, re-synced with sync_slots() whenever an exam moves.
+    # `manage.py sync_student_exam_slots` backfills and checks them.
+    slot_date = models.DateField(null=True, blank=True)
+    slot_start = models.TimeField(null=True, blank=True)
+    slot_end = models.TimeField(null=True, blank=True)
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    master_timetable = models.ForeignKey(MasterTimetable, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    SLOT_FIELDS = ['slot_date', 'slot_start', 'slot_end', 'location', 'master_timetable']
+
+    class Meta:
+        # Room allocation, seat maps and QR checks go room -> exams of a
+        # slot; student conflict checks go student -> exams. The partial
+        # index covers the "still waiting for a room" rows that allocation
+        # scans for, without indexing the (much larger) allocated set.
+        indexes = [
+            models.Index(fields=['room', 'exam'], name='studentexam_room_exam_idx'),
+            models.Index(fields=['student', 'exam'], name='studentexam_student_exam_idx'),
+            models.Index(
+                fields=['exam'], name='studentexam_pending_room_idx',
+                condition=models.Q(room__isnull=True),
+            ),
+            models.Index(fields=['room', 'slot_date', 'slot_start', 'slot_end'], name='studentexam_room_slot_idx'),
+            models.Index(fields=['location', 'slot_date', 'slot_start', 'slot_end'], name='studentexam_loc_slot_idx'),
+            models.Index(fields=['master_timetable', 'slot_date'], name='studentexam_mtt_slot_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student.reg_no} - {self.exam.group.course.code} - {self.status}"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The exam the copied columns were taken from; read from __dict__
+        # so a deferred exam_id is not loaded just for this.
+        self._slot_exam_id = self.__dict__.get('exam_id')
+
+    def save(self, *args, **kwargs):
+        if self.exam_id and (self.slot_date is None or self.exam_id != self._slot_exam_id):
+            self.fill_slot_fields()
+        super().save(*args, **kwargs)
+        self._slot_exam_id = self.exam_id
+
+    @staticmethod
+    def exam_slot_values(exam_ids=None):
+        """
+        Exam queryset annotated with what StudentExam copies. Exams created
+        by the manual scheduling flows have no master_timetable FK and are
+        only linked through MasterTimetableExam, so that is the fallback.
+        """
+        from schedules.models import MasterTimetableExam
+
+        link = MasterTimetableExam.objects.filter(exam_id=OuterRef('pk')).order_by('-id')
+        qs = Exam.objects.all() if exam_ids is None else Exam.objects.filter(pk__in=exam_ids)
+        return qs.annotate(
+            slot_location_id=F('group__course__department__location_id'),
+            slot_timetable_id=Coalesce(
+                F('master_timetable_id'),
+                Subquery(link.values('master_timetable_id')[:1]),
+                output_field=models.IntegerField(),
+            ),
+        )
+
+    def fill_slot_fields(self):
+        exam = StudentExam.exam_slot_values([self.exam_id]).first()
+        if exam is not None:
+            self.slot_date, self.slot_start, self.slot_end = exam.date, exam.start_time, exam.end_time
+            self.location_id = exam.slot_location_id
+            self.master_timetable_id = exam.slot_timetable_id
+
+    @classmethod
+    def sync_slots(cls, exam_ids, batch_size=500):
+        """
+        Re-copy slot, location and timetable onto every StudentExam of these
+        exams. One UPDATE per batch of exams, a correlated subquery per
+        column, and their passes are reissued on commit. Returns the number
+        of rows updated.
+        """
+        exam_ids = list(exam_ids)
+        exam = cls.exam_slot_values().filter(pk=OuterRef('exam_id'))
+        updated = 0
+        for i in range(0, len(exam_ids), batch_size):
+            updated += cls.objects.filter(exam_id__in=exam_ids[i:i + batch_size]).update(
+                slot_date=Subquery(exam.values('date')[:1]),
+                slot_start=Subquery(exam.values('start_time')[:1]),
+                slot_end=Subquery(exam.values('end_time')[:1]),
+                location_id=Subquery(exam.values('slot_location_id')[:1]),
+                master_timetable_id=Subquery(exam.values('slot_timetable_id')[:1]),
+            )
+        # Issued passes carry the old window.
+        from exams.passes import request_reissue
+        request_reissue(exam_ids=exam_ids)
+        return updated
+
+    @classmethod
+    def stale_slots(cls):
+        """StudentExam rows whose copied columns no longer match their exam."""
+        exam = cls.exam_slot_values().filter(pk=OuterRef('exam_id'))
+        expected = {
+            'slot_date': 'date', 'slot_start': 'start_time', 'slot_end': 'end_time',
+            'location_id': 'slot_location_id', 'master_timetable_id': 'slot_timetable_id',
+        }
+        qs = cls.objects.annotate(**{
+            f'expected_{field}': Subquery(exam.values(source)[:1])
+            for field, source in expected.items()
+        })
+        stale = models.Q()
+        for field in expected:
+            other = f'expected_{field}'
+            # NULL-safe "is distinct from".
+            stale |= models.Q(**{f'{field}__isnull': True, f'{other}__isnull': False})
+            stale |= models.Q(**{f'{field}__isnull': False, f'{other}__isnull': True})
+            stale |= (
+                ~models.Q(**{field: F(other)})
+                & models.Q(**{f'{field}__isnull': False, f'{other}__isnull': False})
+            )
+        return qs.filter(stale)
 class UnscheduledExam(models.Model):
 
     course= models.ForeignKey("courses.Course", on_delete=models.CASCADE, related_name="unscheduled_exam")
@@ -80,9 +220,75 @@ class UnscheduledExam(models.Model):
             models.Index(fields=['master_timetable_id']),
             models.Index(fields=['created_at']),
         ]
- 
 
 
+class TimetableDocument(models.Model):
+    """
+    A pre-rendered response body for a student or instructor timetable
+    endpoint (see exams/read_model.py), zlib-compressed JSON.
+    """
+    STUDENT = 'student'
+    INSTRUCTOR_EXAMS = 'instructor_exams'
+    INSTRUCTOR_DAY = 'instructor_day'
+    KIND_CHOICES = [
+        (STUDENT, 'Student timetable'),
+        (INSTRUCTOR_EXAMS, 'Instructor exams'),
+        (INSTRUCTOR_DAY, "Instructor's students for one day"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Student id for STUDENT, user id for the instructor kinds.
+    owner_id = models.IntegerField()
+    # The day (ISO date) for INSTRUCTOR_DAY, empty otherwise.
+    scope = models.CharField(max_length=10, blank=True, default='')
+    etag = models.CharField(max_length=40)
+    payload = models.BinaryField()
+    built_at = models.DateTimeField()
+    # Set when something the document was built from changes; the
+    # document is rebuilt on next read if this is later than built_at.
+    invalidated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'owner_id', 'scope'], name='timetable_document_key'),
+        ]
+
+    def body(self):
+        return zlib.decompress(bytes(self.payload))
+
+
+class ExamPass(models.Model):
+    """
+    The signed, self-contained pass of one StudentExam (exams/passes.py),
+    verifiable offline with the public key.
+    """
+    student_exam = models.OneToOneField(StudentExam, on_delete=models.CASCADE, related_name='exam_pass')
+    token = models.TextField()
+    key_id = models.CharField(max_length=8)
+    not_before = models.DateTimeField()
+    not_after = models.DateTimeField()
+    issued_at = models.DateTimeField()
+
 
+class AttendanceEvent(models.Model):
+    """
+    Ledger of batched attendance events by idempotency key, so a device
+    resending a batch it got no answer for does not apply it twice.
+    """
+    OUTCOME_CHOICES = [
+        ('applied', 'Applied'),
+        ('stale', 'Older than the current state'),
+    ]
 
+    idempotency_key = models.CharField(max_length=64, unique=True)
+    student_exam = models.ForeignKey(StudentExam, on_delete=models.CASCADE, related_name='+')
+    action = models.CharField(max_length=20)
+    client_timestamp = models.DateTimeField()
+    outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES)
+    recorded_by = models.ForeignKey("users.user", on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    received_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['received_at'], name='attendance_event_received_idx'),
+        ]
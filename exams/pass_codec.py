@@ -0,0 +1,121 @@
+"""
+Wire format of signed exam passes (see exams/passes.py).
+
+Kept free of Django so pass signing can run in spawned worker processes,
+and so the layout below is the whole contract an invigilator device has
+to implement to verify a pass offline.
+
+A pass is base64url (unpadded) of
+
+    offset  size  field
+         0     1  version (1)
+         1     1  flags (bit 0: payment cleared)
+         2     4  key id (first 4 bytes of sha256 of the public key)
+         6     4  student_exam id
+        10     4  exam id
+        14     4  student id
+        18     4  room id (0: no room yet)
+        22     2  seat row (0: none)
+        24     2  seat column (0: none)
+        26     4  valid from, unix seconds
+        30     4  valid until, unix seconds
+        34     1  length n of the registration number
+        35     n  registration number, UTF-8
+      35+n    64  Ed25519 signature of bytes 0 .. 35+n
+
+all integers big-endian.
+"""
+import base64
+import hashlib
+
+import numpy as np
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import (
+    Ed25519PrivateKey, Ed25519PublicKey,
+)
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+VERSION = 1
+FLAG_PAYMENT_CLEARED = 1
+SIGNATURE_SIZE = 64
+
+HEADER = np.dtype([
+    ("version", "u1"),
+    ("flags", "u1"),
+    ("key_id", ">u4"),
+    ("student_exam_id", ">u4"),
+    ("exam_id", ">u4"),
+    ("student_id", ">u4"),
+    ("room_id", ">u4"),
+    ("seat_row", ">u2"),
+    ("seat_column", ">u2"),
+    ("not_before", ">u4"),
+    ("not_after", ">u4"),
+])
+
+
+class InvalidPass(ValueError):
+    pass
+
+
+def public_bytes(seed):
+    return Ed25519PrivateKey.from_private_bytes(seed).public_key().public_bytes(
+        Encoding.Raw, PublicFormat.Raw
+    )
+
+
+def key_id(public_key):
+    return int.from_bytes(hashlib.sha256(public_key).digest()[:4], "big")
+
+
+def pack(header, reg_nos):
+    """Unsigned pass bodies for a HEADER array and the matching reg numbers."""
+    fixed = header.astype(HEADER, copy=False).tobytes()
+    size = HEADER.itemsize
+    messages = []
+    for i, reg_no in enumerate(reg_nos):
+        tail = (reg_no or "").encode("utf-8")[:255]
+        messages.append(fixed[i * size:(i + 1) * size] + bytes((len(tail),)) + tail)
+    return messages
+
+
+def sign_messages(seed, messages):
+    """Signatures for `messages`; module level so a process pool can run it."""
+    key = Ed25519PrivateKey.from_private_bytes(seed)
+    return [key.sign(m) for m in messages]
+
+
+def encode(message, signature):
+    return base64.urlsafe_b64encode(message + signature).rstrip(b"=").decode("ascii")
+
+
+def decode(token, public_keys):
+    """
+    Verify `token` against {key id: raw public key} and return its fields
+    as a dict. Raises InvalidPass.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (ValueError, TypeError):
+        raise InvalidPass("not base64")
+    size = HEADER.itemsize
+    if len(raw) < size + 1 + SIGNATURE_SIZE:
+        raise InvalidPass("truncated")
+    message, signature = raw[:-SIGNATURE_SIZE], raw[-SIGNATURE_SIZE:]
+    header = np.frombuffer(message[:size], dtype=HEADER)[0]
+    if header["version"] != VERSION:
+        raise InvalidPass(f"unsupported version {header['version']}")
+    length = message[size]
+    if len(message) != size + 1 + length:
+        raise InvalidPass("bad length")
+    public_key = public_keys.get(int(header["key_id"]))
+    if public_key is None:
+        raise InvalidPass("unknown key")
+    try:
+        Ed25519PublicKey.from_public_bytes(public_key).verify(signature, message)
+    except InvalidSignature:
+        raise InvalidPass("bad signature")
+    fields = {name: int(header[name]) for name in HEADER.names}
+    fields["payment_cleared"] = bool(fields["flags"] & FLAG_PAYMENT_CLEARED)
+    fields["reg_no"] = message[size + 1:].decode("utf-8")
+    return fields
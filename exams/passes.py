@@ -0,0 +1,287 @@
+"""
+Signed exam passes for offline check-in.
+
+StudentExamViewSet.verify and RoomViewSet.verify_room_qr need a live round
+trip per scan: decrypt the QR payload, look the student up, sum their
+payments. At exam start a whole hall queues on that.
+
+When a timetable is published every StudentExam gets a pass instead (wire
+format in exams/pass_codec.py): student exam, exam, room, seat, the time
+window it is valid in and whether the student's payments are cleared,
+signed with Ed25519. An invigilator's device fetches the public key once
+(pass-keys), verifies passes locally, and later uploads the scans in
+batches (pass-sync), which re-checks each pass and hands the scans to
+exams/attendance.py.
+
+Generation loads the timetable's rows with one query and the payment
+totals with one GROUP BY, builds the fixed-width pass headers as NumPy
+columns, and signs them; above POOL_THRESHOLD passes the signing is spread
+over a spawned process pool, as the generation portfolio does.
+
+A pass is superseded when it is regenerated; pass-sync refuses superseded
+passes, so a device that cached an old one is told to re-scan. Passes are
+reissued on commit (request_reissue) whenever an issued pass's slot, room
+or seat changes: StudentExam.sync_slots, reallocate_slot_delta and the room
+change views call it, so a moved exam is not rejected as outside its window.
+"""
+import base64
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from pytz import timezone as pytz_timezone
+
+from enrollments.models import Enrollment
+from exams import attendance, pass_codec
+from exams.models import ExamPass, StudentExam
+
+logger = logging.getLogger(__name__)
+
+POOL_THRESHOLD = 5000
+SIGN_CHUNK = 2000
+ACTIONS = ("signin", "signout")
+
+
+def _seed():
+    configured = getattr(settings, "EXAM_PASS_SIGNING_KEY", None)
+    if configured:
+        seed = base64.urlsafe_b64decode(configured + "=" * (-len(configured) % 4))
+        if len(seed) != 32:
+            raise ValueError("EXAM_PASS_SIGNING_KEY must be 32 bytes, base64url-encoded")
+        return seed
+    # Stable per deployment without extra configuration; set
+    # EXAM_PASS_SIGNING_KEY to rotate passes independently of SECRET_KEY.
+    return hashlib.sha256(b"exam-pass:" + settings.SECRET_KEY.encode()).digest()
+
+
+def public_keys():
+    """{key id: raw Ed25519 public key} of the keys passes are signed with."""
+    public = pass_codec.public_bytes(_seed())
+    return {pass_codec.key_id(public): public}
+
+
+def public_key_data():
+    return [
+        {
+            "kid": f"{kid:08x}",
+            "alg": "Ed25519",
+            "public_key": base64.urlsafe_b64encode(public).rstrip(b"=").decode("ascii"),
+        }
+        for kid, public in public_keys().items()
+    ]
+
+
+def _epoch_seconds(dates, times, tz):
+    """Unix seconds of local (date, time) pairs, vectorised per distinct date."""
+    days = np.array(dates, dtype="datetime64[D]")
+    local = days.astype("datetime64[s]").astype(np.int64) + np.fromiter(
+        (t.hour * 3600 + t.minute * 60 + t.second for t in times), dtype=np.int64, count=len(times)
+    )
+    unique_days, inverse = np.unique(days, return_inverse=True)
+    offsets = np.array([
+        int(tz.utcoffset(datetime.combine(day.astype(object), datetime.min.time())).total_seconds())
+        for day in unique_days
+    ], dtype=np.int64)
+    return local - offsets[inverse]
+
+
+def _cleared_students(student_ids):
+    """Sorted ids of students whose payments cover what they owe (as verify computes it)."""
+    totals = (
+        Enrollment.objects.filter(student_id__in=student_ids)
+        .values("student_id")
+        .annotate(to_pay=Sum("amount_to_pay"), paid=Sum("amount_paid"))
+        .values_list("student_id", "to_pay", "paid")
+    )
+    return np.array(sorted(s for s, to_pay, paid in totals if (paid or 0) >= (to_pay or 0)), dtype=np.int64)
+
+
+def _sign(seed, messages):
+    if len(messages) < POOL_THRESHOLD:
+        return pass_codec.sign_messages(seed, messages)
+    chunks = [messages[i:i + SIGN_CHUNK] for i in range(0, len(messages), SIGN_CHUNK)]
+    try:
+        # spawn, not fork: see schedules/planner.run_portfolio.
+        context = multiprocessing.get_context("spawn")
+        workers = min(len(chunks), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            signatures = []
+            for part in pool.map(pass_codec.sign_messages, [seed] * len(chunks), chunks):
+                signatures.extend(part)
+            return signatures
+    except Exception as exc:
+        logger.warning(f"Pass signing workers unavailable ({exc}); signing inline")
+        return pass_codec.sign_messages(seed, messages)
+
+
+def generate_passes(timetable_id=None, student_exam_ids=None):
+    """(Re)issue the passes of a timetable's, or of the given, StudentExams; returns the count."""
+    rows = StudentExam.objects.filter(slot_date__isnull=False)
+    if timetable_id is not None:
+        rows = rows.filter(master_timetable_id=timetable_id)
+    if student_exam_ids is not None:
+        rows = rows.filter(id__in=list(student_exam_ids))
+    rows = list(rows.order_by("id").values_list(
+        "id", "exam_id", "student_id", "room_id", "seat_row", "seat_column",
+        "slot_date", "slot_start", "slot_end", "student__reg_no",
+    ))
+    if not rows:
+        return 0
+    (ids, exam_ids, student_ids, room_ids, seat_rows, seat_columns,
+     dates, starts, ends, reg_nos) = zip(*rows)
+
+    tz = pytz_timezone(settings.TIME_ZONE)
+    early = getattr(settings, "EXAM_PASS_EARLY_MINUTES", 60) * 60
+    seed = _seed()
+    kid = next(iter(public_keys()))
+
+    student_ids = np.array(student_ids, dtype=np.int64)
+    header = np.zeros(len(rows), dtype=pass_codec.HEADER)
+    header["version"] = pass_codec.VERSION
+    header["flags"] = np.where(
+        np.isin(student_ids, _cleared_students(np.unique(student_ids).tolist())),
+        pass_codec.FLAG_PAYMENT_CLEARED, 0,
+    )
+    header["key_id"] = kid
+    header["student_exam_id"] = ids
+    header["exam_id"] = exam_ids
+    header["student_id"] = student_ids
+    header["room_id"] = [r or 0 for r in room_ids]
+    header["seat_row"] = [r or 0 for r in seat_rows]
+    header["seat_column"] = [c or 0 for c in seat_columns]
+    header["not_before"] = _epoch_seconds(dates, starts, tz) - early
+    header["not_after"] = _epoch_seconds(dates, ends, tz)
+
+    messages = pass_codec.pack(header, reg_nos)
+    signatures = _sign(seed, messages)
+
+    now = timezone.now()
+    passes = [
+        ExamPass(
+            student_exam_id=se_id,
+            token=pass_codec.encode(message, signature),
+            key_id=f"{kid:08x}",
+            not_before=datetime.fromtimestamp(int(h["not_before"]), dt_timezone.utc),
+            not_after=datetime.fromtimestamp(int(h["not_after"]), dt_timezone.utc),
+            issued_at=now,
+        )
+        for se_id, message, signature, h in zip(ids, messages, signatures, header)
+    ]
+    ExamPass.objects.bulk_create(
+        passes,
+        batch_size=SIGN_CHUNK,
+        update_conflicts=True,
+        unique_fields=["student_exam"],
+        update_fields=["token", "key_id", "not_before", "not_after", "issued_at"],
+    )
+    logger.info(f"Issued {len(passes)} exam passes (timetable {timetable_id})")
+    return len(passes)
+
+
+def _enqueue_or_run(label, fallback, **task_kwargs):
+    """Queue generate_exam_passes, or run `fallback` inline if the broker is unreachable."""
+    from exams.tasks import generate_exam_passes
+
+    try:
+        generate_exam_passes.delay(**task_kwargs)
+    except Exception as e:
+        logger.warning(f"Could not enqueue {label} ({e}); issuing inline")
+        fallback()
+
+
+def request_generation(timetable):
+    """Issue the timetable's passes in the background once the transaction commits."""
+    timetable_id = timetable.id
+    transaction.on_commit(lambda: _enqueue_or_run(
+        f"pass generation for timetable {timetable_id}",
+        lambda: generate_passes(timetable_id=timetable_id),
+        timetable_id=timetable_id,
+    ))
+
+
+def request_reissue(student_exam_ids=(), exam_ids=()):
+    """
+    Reissue, once the transaction commits, the passes already issued for
+    these StudentExams (or all StudentExams of these exams). Rows without
+    a pass, e.g. of an unpublished timetable, are left alone.
+    """
+    student_exam_ids = [i for i in student_exam_ids if i is not None]
+    exam_ids = [i for i in exam_ids if i is not None]
+    if not student_exam_ids and not exam_ids:
+        return
+
+    def _reissue():
+        ids = list(
+            ExamPass.objects.filter(
+                Q(student_exam_id__in=student_exam_ids) | Q(student_exam__exam_id__in=exam_ids)
+            ).values_list("student_exam_id", flat=True)
+        )
+        if ids:
+            _enqueue_or_run(
+                f"reissue of {len(ids)} exam passes",
+                lambda: generate_passes(student_exam_ids=ids),
+                student_exam_ids=ids,
+            )
+
+    transaction.on_commit(_reissue)
+
+
+def sync_scans(scans, user):
+    """
+    Apply a batch of offline scans ({"pass", "action", "scanned_at"}).
+    Every pass is verified again; sign-ins need a payment-cleared pass.
+    Accepted scans go through exams/attendance.apply_events, keyed by a
+    hash of the scan, so a device can resend a batch safely.
+    """
+    keys = public_keys()
+    grace = timedelta(minutes=getattr(settings, "EXAM_PASS_GRACE_MINUTES", 15)).total_seconds()
+    rejected, accepted = [], []
+
+    for index, scan in enumerate(scans):
+        token = scan.get("pass") or ""
+        action = scan.get("action", "signin")
+        if action not in ACTIONS:
+            rejected.append({"index": index, "reason": f"unknown action {action!r}"})
+            continue
+        try:
+            fields = pass_codec.decode(token, keys)
+        except pass_codec.InvalidPass as e:
+            rejected.append({"index": index, "reason": str(e)})
+            continue
+        scanned_at = parse_datetime(scan.get("scanned_at") or "") or timezone.now()
+        if timezone.is_naive(scanned_at):
+            scanned_at = timezone.make_aware(scanned_at)
+        moment = scanned_at.timestamp()
+        if not fields["not_before"] - grace <= moment <= fields["not_after"] + grace:
+            rejected.append({"index": index, "reason": "outside the pass window"})
+            continue
+        if action == "signin" and not fields["payment_cleared"]:
+            rejected.append({"index": index, "reason": "payment not cleared"})
+            continue
+        key = hashlib.sha256(f"{token}|{action}|{scanned_at.isoformat()}".encode()).hexdigest()
+        accepted.append(attendance.Event(index, key, fields["student_exam_id"], action, scanned_at))
+
+    current = dict(
+        ExamPass.objects.filter(
+            student_exam_id__in={e.student_exam_id for e in accepted}
+        ).values_list("student_exam_id", "token")
+    )
+    events = []
+    for event, scan in zip(accepted, (scans[e.index] for e in accepted)):
+        if current.get(event.student_exam_id) != scan.get("pass"):
+            rejected.append({"index": event.index, "reason": "superseded"})
+        else:
+            events.append(event)
+
+    result = attendance.apply_events(events, user)
+    result["rejected"] = sorted(result["rejected"] + rejected, key=lambda r: r["index"])
+    return result
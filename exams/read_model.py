@@ -0,0 +1,356 @@
+"""
+Pre-serialised timetables for the student and instructor endpoints.
+
+StudentExamViewSet.mine, instructor_students and ExamViewSet.instructor_exams
+used to rebuild their payload on every request through the nested
+StudentExam -> Exam -> CourseGroup -> Course -> Department serializer
+chain. During exam week every student polls their timetable, and the answer
+almost never changes between two polls.
+
+Each of those responses is now stored as a TimetableDocument: the rendered
+body, zlib-compressed, keyed by (kind, owner, scope). A request is one
+keyed fetch; the body is sent as is with its ETag, and a client presenting
+that ETag in If-None-Match gets a 304.
+
+Documents are built:
+
+    in bulk when a timetable is published       materialise_timetable()
+    lazily, on the first read after a change     fetch()
+
+and invalidated (invalidated_at set, rebuilt on next read):
+
+    StudentExam saved                    its student and instructor, batched
+                                         per transaction (invalidate_on_commit)
+    Exam saved or deleted                everyone sitting or invigilating it
+    bulk writers (room re-allocation,    invalidate_exams() /
+    simulation commits, slot retiming,   invalidate_timetable()
+    publish toggle, teardown)
+
+bulk_create/update and queryset.update()/delete() bypass the model signals,
+so anything not listed above is caught by READ_MODEL_MAX_AGE: no document
+is served once it is older than that.
+"""
+import hashlib
+import json
+import logging
+import threading
+import zlib
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+
+from exams.models import Exam, StudentExam, TimetableDocument
+from exams.serializers import ExamSerializer, StudentExamSerializer
+from schedules.models import MasterTimetable, MasterTimetableExam
+from sharedapp.query_plans import apply_query_plan
+
+logger = logging.getLogger(__name__)
+
+STUDENT = TimetableDocument.STUDENT
+INSTRUCTOR_EXAMS = TimetableDocument.INSTRUCTOR_EXAMS
+INSTRUCTOR_DAY = TimetableDocument.INSTRUCTOR_DAY
+
+BATCH_SIZE = 500
+
+
+def _max_age():
+    return timedelta(seconds=getattr(settings, "READ_MODEL_MAX_AGE", 900))
+
+
+def _render(data, message, key="data"):
+    # Same bytes DRF's JSONRenderer would produce for this dict.
+    return json.dumps(
+        {"success": True, key: data, "message": message},
+        cls=DjangoJSONEncoder, ensure_ascii=False, separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def _document(kind, owner_id, scope, body, built_at):
+    return TimetableDocument(
+        kind=kind,
+        owner_id=owner_id,
+        scope=scope,
+        etag=hashlib.sha1(body).hexdigest(),
+        payload=zlib.compress(body, 6),
+        built_at=built_at,
+    )
+
+
+# ----------------------------------------------------------------------
+# Builders: owner ids -> rendered bodies
+# ----------------------------------------------------------------------
+
+def _student_bodies(student_ids, scope):
+    published = MasterTimetableExam.objects.filter(
+        master_timetable__status="PUBLISHED"
+    ).values("exam_id")
+    rows = list(apply_query_plan(
+        StudentExam.objects.filter(student_id__in=student_ids, exam_id__in=published).order_by("id"),
+        StudentExamSerializer,
+    ))
+    by_student = defaultdict(list)
+    for se, data in zip(rows, StudentExamSerializer(rows, many=True).data):
+        by_student[se.student_id].append(data)
+    return {
+        student_id: _render(by_student.get(student_id, []), "Fetched successfully")
+        for student_id in student_ids
+    }
+
+
+def _instructor_exam_bodies(user_ids, scope):
+    bodies = {}
+    for user_id in user_ids:
+        exams = (
+            Exam.objects.filter(studentexam__instructor_id=user_id)
+            .select_related("group", "room")
+            .distinct()
+        )
+        bodies[user_id] = _render(
+            ExamSerializer(apply_query_plan(exams, ExamSerializer), many=True).data,
+            "Instructor exams fetched successfully",
+        )
+    return bodies
+
+
+def _instructor_day_bodies(user_ids, scope):
+    rows = list(apply_query_plan(
+        StudentExam.objects.filter(
+            exam__date=scope,
+            instructor_id__in=user_ids,
+            exam__status__in=["READY", "ONGOING"],
+        ).order_by("id"),
+        StudentExamSerializer,
+    ))
+    by_instructor = defaultdict(list)
+    for se, data in zip(rows, StudentExamSerializer(rows, many=True).data):
+        by_instructor[se.instructor_id].append(data)
+    return {
+        user_id: _render(by_instructor.get(user_id, []), "Fetched successfully", key="students")
+        for user_id in user_ids
+    }
+
+
+BUILDERS = {
+    STUDENT: _student_bodies,
+    INSTRUCTOR_EXAMS: _instructor_exam_bodies,
+    INSTRUCTOR_DAY: _instructor_day_bodies,
+}
+
+
+def build(kind, owner_ids, scope=""):
+    """(Re)build and store the documents of `owner_ids`; returns {owner_id: document}."""
+    owner_ids = sorted({int(o) for o in owner_ids})
+    documents = {}
+    for i in range(0, len(owner_ids), BATCH_SIZE):
+        batch = owner_ids[i:i + BATCH_SIZE]
+        # Taken before reading, so a change committed while we build leaves
+        # invalidated_at later than built_at and the document stale.
+        built_at = timezone.now()
+        docs = [
+            _document(kind, owner_id, scope, body, built_at)
+            for owner_id, body in BUILDERS[kind](batch, scope).items()
+        ]
+        TimetableDocument.objects.bulk_create(
+            docs,
+            update_conflicts=True,
+            unique_fields=["kind", "owner_id", "scope"],
+            update_fields=["etag", "payload", "built_at"],
+        )
+        documents.update((doc.owner_id, doc) for doc in docs)
+    if kind == INSTRUCTOR_DAY and scope:
+        TimetableDocument.objects.filter(
+            kind=INSTRUCTOR_DAY, owner_id__in=owner_ids, scope__lt=scope
+        ).delete()
+    return documents
+
+
+def _fresh(doc):
+    if doc.built_at < timezone.now() - _max_age():
+        return False
+    return doc.invalidated_at is None or doc.invalidated_at < doc.built_at
+
+
+def fetch(kind, owner_id, scope=""):
+    """The current document for one owner, rebuilt first if it is stale."""
+    doc = TimetableDocument.objects.filter(kind=kind, owner_id=owner_id, scope=scope).first()
+    if doc is None or not _fresh(doc):
+        doc = build(kind, [owner_id], scope)[int(owner_id)]
+    return doc
+
+
+def respond(request, kind, owner_id, scope=""):
+    """An HttpResponse for the document, or 304 if the client's copy is current."""
+    doc = fetch(kind, owner_id, scope)
+    etag = quote_etag(doc.etag)
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        tags = parse_etags(if_none_match)
+        if "*" in tags or etag in tags or f"W/{etag}" in tags:
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+    response = HttpResponse(doc.body(), content_type="application/json")
+    response["ETag"] = etag
+    # Always revalidate; the 304 path is what makes polling cheap.
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# ----------------------------------------------------------------------
+# Invalidation
+# ----------------------------------------------------------------------
+
+def _mark(student_ids, instructor_ids, again_on_commit=True):
+    student_ids = {int(s) for s in student_ids if s is not None}
+    instructor_ids = {int(i) for i in instructor_ids if i is not None}
+    if not student_ids and not instructor_ids:
+        return
+    condition = Q(kind=STUDENT, owner_id__in=student_ids) | Q(
+        kind__in=(INSTRUCTOR_EXAMS, INSTRUCTOR_DAY), owner_id__in=instructor_ids
+    )
+
+    def _apply():
+        TimetableDocument.objects.filter(condition).update(invalidated_at=timezone.now())
+
+    # Marked inside the transaction, so its own later reads rebuild, and
+    # again once it commits: a reader in another transaction may have
+    # rebuilt from the old rows in between, stamping built_at after the
+    # first mark.
+    _apply()
+    if again_on_commit and transaction.get_connection().in_atomic_block:
+        transaction.on_commit(_apply)
+
+
+def _owners(student_exams):
+    student_ids, instructor_ids = set(), set()
+    for student_id, instructor_id in student_exams.values_list("student_id", "instructor_id"):
+        student_ids.add(student_id)
+        instructor_ids.add(instructor_id)
+    return student_ids, instructor_ids
+
+
+def invalidate_owners(student_ids=(), instructor_ids=()):
+    _mark(student_ids, instructor_ids)
+
+
+_pending = threading.local()
+
+
+def _flush(student_ids, instructor_ids, timetable_ids):
+    if student_ids or instructor_ids:
+        # Already after the commit: nothing can rebuild from older rows.
+        _mark(student_ids, instructor_ids, again_on_commit=False)
+    if timetable_ids:
+        MasterTimetable.bump_data_version(timetable_ids)
+
+
+def _open_batch(connection):
+    """
+    The (students, instructors, timetables) sets this transaction is
+    collecting. A batch lives exactly as long as its on_commit callback:
+    the callback is queued once, when the batch opens, and if it is no
+    longer queued — the transaction or savepoint that queued it rolled
+    back — the batch and its ids go with it and a new one opens.
+    """
+    current = getattr(_pending, "batch", None)
+    if current is not None:
+        callback, batch = current
+        if any(entry[1] is callback for entry in connection.run_on_commit):
+            return batch
+
+    batch = (set(), set(), set())
+
+    def callback():
+        if getattr(_pending, "batch", None) is current_batch:
+            _pending.batch = None
+        _flush(*batch)
+
+    current_batch = _pending.batch = (callback, batch)
+    connection.on_commit(callback)
+    return batch
+
+
+def invalidate_on_commit(student_ids=(), instructor_ids=(), timetable_ids=()):
+    """
+    Invalidate documents and bump data versions once the transaction
+    commits, for the per-row signal path: a loop saving N StudentExams
+    costs one document UPDATE and one timetable UPDATE, not 3N, and
+    holds no timetable row lock until commit. Outside a transaction it
+    applies right away.
+    """
+    student_ids = {s for s in student_ids if s is not None}
+    instructor_ids = {i for i in instructor_ids if i is not None}
+    timetable_ids = {t for t in timetable_ids if t is not None}
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        _flush(student_ids, instructor_ids, timetable_ids)
+        return
+    pending_students, pending_instructors, pending_timetables = _open_batch(connection)
+    pending_students.update(student_ids)
+    pending_instructors.update(instructor_ids)
+    pending_timetables.update(timetable_ids)
+
+
+def invalidate_exams(exam_ids):
+    """
+    Mark stale the documents of everyone sitting or invigilating these
+    exams. Owners are resolved now, so call it before deleting rows.
+    """
+    exam_ids = [int(e) for e in exam_ids if e is not None]
+    if exam_ids:
+        _mark(*_owners(StudentExam.objects.filter(exam_id__in=exam_ids)))
+        MasterTimetable.bump_data_version(
+            MasterTimetableExam.objects.filter(exam_id__in=exam_ids).values_list("master_timetable_id", flat=True)
+        )
+
+
+def _timetable_student_exams(timetable_id):
+    linked = MasterTimetableExam.objects.filter(master_timetable_id=timetable_id).values("exam_id")
+    return StudentExam.objects.filter(
+        Q(exam_id__in=linked) | Q(exam__master_timetable_id=timetable_id)
+    ).distinct()
+
+
+def invalidate_timetable(timetable_id):
+    """Mark stale the documents of everyone with an exam in this timetable."""
+    if timetable_id is not None:
+        _mark(*_owners(_timetable_student_exams(timetable_id)))
+        MasterTimetable.bump_data_version([timetable_id])
+
+
+def materialise_timetable(timetable_id):
+    """Build the student and instructor documents of a timetable; returns counts."""
+    student_ids, instructor_ids = _owners(_timetable_student_exams(timetable_id))
+    instructor_ids.discard(None)
+    build(STUDENT, student_ids)
+    build(INSTRUCTOR_EXAMS, instructor_ids)
+    logger.info(
+        f"Materialised timetable {timetable_id}: {len(student_ids)} student and "
+        f"{len(instructor_ids)} instructor documents"
+    )
+    return {"students": len(student_ids), "instructors": len(instructor_ids)}
+
+
+def timetable_status_changed(timetable):
+    """Publish/unpublish: drop the affected documents and, if published, rebuild them."""
+    from exams.tasks import materialise_timetable_documents
+
+    invalidate_timetable(timetable.id)
+    if timetable.status != "PUBLISHED":
+        return
+
+    def _enqueue():
+        try:
+            materialise_timetable_documents.delay(timetable.id)
+        except Exception as e:
+            # Documents are built lazily on first read anyway.
+            logger.warning(f"Could not enqueue materialisation of timetable {timetable.id}: {e}")
+
+    transaction.on_commit(_enqueue)
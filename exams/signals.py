@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from exams import read_model
+from exams.models import Exam, StudentExam
+
+
+@receiver(post_save, sender=StudentExam)
+def student_exam_saved(sender, instance, **kwargs):
+    read_model.invalidate_on_commit(
+        [instance.student_id], [instance.instructor_id], [instance.master_timetable_id]
+    )
+
+
+@receiver(post_save, sender=Exam)
+def exam_saved(sender, instance, created, **kwargs):
+    # A new exam has no StudentExams yet (they are bulk-created after it).
+    if not created:
+        read_model.invalidate_exams([instance.id])
+
+
+@receiver(pre_delete, sender=Exam)
+def exam_deleted(sender, instance, **kwargs):
+    # Before the cascade, while its StudentExams still say who sat it.
+    read_model.invalidate_exams([instance.id])
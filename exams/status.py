@@ -0,0 +1,163 @@
+"""
+Exam status transitions as conditional, set-based UPDATEs.
+
+check_and_update_exams (Celery beat, every minute) and the cron webhook
+both walk today's exams; each used to load an Exam, compare its status in
+Python and save it. When the two ran at the same moment both saw
+SCHEDULED, both saved READY and both fanned out notifications.
+
+advance_statuses() applies a whole day in one statement instead:
+
+    UPDATE exams_exam
+       SET status = <target>, updated_at = now
+     WHERE date = today AND status <> 'CANCELLED'
+       AND id IN (exams of a PUBLISHED timetable)
+       AND status <> <target>
+    RETURNING id, status
+
+with <target> a CASE on the exam's times:
+
+    start in (now, now + READY_WINDOW]          READY
+    start <= now < end                          ONGOING
+    end <= now - complete_after                 COMPLETED
+    otherwise                                   unchanged
+
+A concurrent runner blocks on the row locks of the first and, once it
+commits, re-evaluates `status <> <target>` and skips the rows: every
+transition is applied, and returned for notification, exactly once.
+RETURNING needs PostgreSQL or SQLite 3.35+; other backends lock the day's
+rows with SELECT ... FOR UPDATE and update the ones that change.
+
+The UPDATE bypasses post_save, so the read-model documents and data
+versions of the changed exams are invalidated here.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from pytz import timezone as pytz_timezone
+
+from exams import read_model
+from exams.models import Exam
+from schedules.models import MasterTimetableExam
+
+logger = logging.getLogger(__name__)
+
+READY_WINDOW = timedelta(minutes=15)
+
+
+def local_now():
+    return timezone.now().astimezone(pytz_timezone(settings.TIME_ZONE))
+
+
+def _bounds(now, complete_after):
+    """Times of day for the CASE; None where the window leaves today."""
+    today = now.date()
+    now_time = now.time().replace(tzinfo=None)
+    ready_until = now + READY_WINDOW
+    ready_until = ready_until.time().replace(tzinfo=None) if ready_until.date() == today else time.max
+    completed_by = now - complete_after
+    completed_by = completed_by.time().replace(tzinfo=None) if completed_by.date() == today else None
+    return now_time, ready_until, completed_by
+
+
+def _target_sql(now_time, ready_until, completed_by):
+    adapt = connection.ops.adapt_timefield_value
+    sql = (
+        "CASE WHEN start_time > %s AND start_time <= %s THEN %s "
+        "WHEN start_time <= %s AND end_time > %s THEN %s "
+    )
+    params = [adapt(now_time), adapt(ready_until), "READY", adapt(now_time), adapt(now_time), "ONGOING"]
+    if completed_by is not None:
+        sql += "WHEN end_time <= %s THEN %s "
+        params += [adapt(completed_by), "COMPLETED"]
+    return sql + "ELSE status END", params
+
+
+def target_status(exam, now_time, ready_until, completed_by):
+    """The same CASE in Python, for the fallback path."""
+    if now_time < exam.start_time <= ready_until:
+        return "READY"
+    if exam.start_time <= now_time < exam.end_time:
+        return "ONGOING"
+    if completed_by is not None and exam.end_time <= completed_by:
+        return "COMPLETED"
+    return exam.status
+
+
+def _published_exam_ids():
+    return MasterTimetableExam.objects.filter(master_timetable__status="PUBLISHED").values("exam_id")
+
+
+def _update_returning(today, now, bounds):
+    qn = connection.ops.quote_name
+    target, target_params = _target_sql(*bounds)
+    published, published_params = _published_exam_ids().query.sql_with_params()
+    sql = (
+        f"UPDATE {qn(Exam._meta.db_table)} SET status = {target}, updated_at = %s "
+        f"WHERE date = %s AND status <> %s AND id IN ({published}) AND status <> {target} "
+        f"RETURNING id, status"
+    )
+    params = [
+        *target_params, connection.ops.adapt_datetimefield_value(now),
+        connection.ops.adapt_datefield_value(today), "CANCELLED", *published_params,
+        *target_params,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _update_locked(today, now, bounds):
+    exams = (
+        Exam.objects.select_for_update()
+        .filter(date=today, id__in=_published_exam_ids())
+        .exclude(status="CANCELLED")
+        .only("id", "status", "start_time", "end_time")
+    )
+    by_status = defaultdict(list)
+    for exam in exams:
+        new_status = target_status(exam, *bounds)
+        if new_status != exam.status:
+            by_status[new_status].append(exam.id)
+    for new_status, ids in by_status.items():
+        Exam.objects.filter(id__in=ids).update(status=new_status, updated_at=now)
+    return [(exam_id, new_status) for new_status, ids in by_status.items() for exam_id in ids]
+
+
+def advance_statuses(now=None, complete_after=timedelta(0)):
+    """
+    Move today's published exams to the status their times call for.
+    Returns {new status: [exam ids]}, only for rows this call changed.
+    """
+    now = now or local_now()
+    bounds = _bounds(now, complete_after)
+    with transaction.atomic():
+        if connection.vendor in ("postgresql", "sqlite"):
+            rows = _update_returning(now.date(), now, bounds)
+        else:
+            rows = _update_locked(now.date(), now, bounds)
+        changed = defaultdict(list)
+        for exam_id, new_status in rows:
+            changed[new_status].append(exam_id)
+        if rows:
+            read_model.invalidate_exams([exam_id for exam_id, _ in rows])
+    for new_status, ids in changed.items():
+        logger.info(f"{len(ids)} exams set to {new_status}")
+    return dict(changed)
+
+
+def set_status(exam_id, new_status):
+    """Conditionally set one exam's status; True if this call changed it."""
+    with transaction.atomic():
+        updated = (
+            Exam.objects.filter(pk=exam_id)
+            .exclude(status__in=["CANCELLED", new_status])
+            .update(status=new_status, updated_at=timezone.now())
+        )
+        if updated:
+            read_model.invalidate_exams([exam_id])
+    return bool(updated)
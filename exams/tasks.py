@@ -4,11 +4,8 @@ from celery import shared_task
 from django.utils import timezone
 
 
-from schedules.models import MasterTimetableExam
 from student.models import Student
 from .models import Exam, StudentExam
-from datetime import datetime
-from pytz import timezone as pytz_timezone
 from django.conf import settings
 from notifications.models import Notification
 from notifications.tasks import send_notification, send_email_task
@@ -59,60 +56,51 @@ def _notify_students(exam, message):
 
 @shared_task
 def check_and_update_exams():
-    tz = pytz_timezone(settings.TIME_ZONE )
-    now = timezone.now().astimezone(tz) 
-    today = now.date()
-
-    # Cancelled exams must never be resurrected into READY/ONGOING/COMPLETED.
-    exams_today = Exam.objects.filter(date=today).exclude(status='CANCELLED')
-
-    logger.info(f"Checking {exams_today.count()} exams for {today}, current time: {now}")
-
-    # Each exam is gated by its OWN timetable's publish status — not just
-    # whichever exam happens to be first in the queryset (today's exams can
-    # legitimately span multiple timetables, e.g. different locations).
-    published_exam_ids = set(
-        MasterTimetableExam.objects.filter(
-            exam__in=exams_today, master_timetable__status="PUBLISHED"
-        ).values_list("exam_id", flat=True)
-    )
-
-    for exam in exams_today:
-        if exam.id not in published_exam_ids:
-            continue
-
-        start_dt = datetime.combine(exam.date, exam.start_time)
-        end_dt = datetime.combine(exam.date, exam.end_time)
-
-        start_time = timezone.make_aware(start_dt) if timezone.is_naive(start_dt) else start_dt
-        end_time = timezone.make_aware(end_dt) if timezone.is_naive(end_dt) else end_dt
-
-        time_diff = (start_time - now).total_seconds()
-
-        logger.debug(f"Exam: {exam.group.course.title}, Status: {exam.status}, "
-            f"Now: {now}, Start: {start_time}, End: {end_time}, Diff: {time_diff}s")
-
-        if 0 < time_diff <= 900 and exam.status != 'READY':
-            exam.status = 'READY'
-            exam.save(update_fields=['status'])
-            _notify_students(exam,
-                f"Your exam '{exam.group.course.title}' is starting soon "
-                f"({exam.date} {exam.start_time}-{exam.end_time}).")
-            logger.info(f"Exam '{exam}' set to READY.")
-
-        elif start_time <= now < end_time and exam.status != 'ONGOING':
-            exam.status = 'ONGOING'
-            exam.save(update_fields=['status'])
-            logger.info(f"Exam '{exam}' set to ONGOING.")
-
-        elif now >= end_time and exam.status != 'COMPLETED':
-            exam.status = 'COMPLETED'
-            exam.save(update_fields=['status'])
-            _notify_students(exam,
-                f"Your exam '{exam.group.course.title}' scheduled on "
-                f"{exam.date} {exam.start_time}-{exam.end_time} has been marked as completed.")
-            logger.info(f"Exam '{exam}' set to COMPLETED.")
-
-        else:
-            logger.debug(f"Exam '{exam}' remains {exam.status}.")
+    # One conditional UPDATE for the whole day (exams/status.py), so a
+    # concurrent webhook run cannot apply, or notify, a transition twice.
+    # Cancelled exams and exams of unpublished timetables are never touched.
+    from exams.status import advance_statuses, local_now
+
+    now = local_now()
+    changed = advance_statuses(now)
+    logger.info(f"Checked exams for {now.date()} at {now}: {sum(map(len, changed.values()))} transitions")
+
+    ready = changed.get('READY', [])
+    completed = changed.get('COMPLETED', [])
+    exams = Exam.objects.select_related('group__course').in_bulk(ready + completed)
+    for exam_id in ready:
+        exam = exams[exam_id]
+        _notify_students(exam,
+            f"Your exam '{exam.group.course.title}' is starting soon "
+            f"({exam.date} {exam.start_time}-{exam.end_time}).")
+    for exam_id in completed:
+        exam = exams[exam_id]
+        _notify_students(exam,
+            f"Your exam '{exam.group.course.title}' scheduled on "
+            f"{exam.date} {exam.start_time}-{exam.end_time} has been marked as completed.")
 
+
+
+@shared_task
+def materialise_timetable_documents(timetable_id):
+    from exams.read_model import materialise_timetable
+
+    return materialise_timetable(timetable_id)
+
+
+@shared_task
+def generate_exam_passes(timetable_id=None, student_exam_ids=None):
+    from exams.passes import generate_passes
+
+    return generate_passes(timetable_id=timetable_id, student_exam_ids=student_exam_ids)
+
+
+@shared_task
+def purge_attendance_events():
+    from datetime import timedelta
+    from exams.models import AttendanceEvent
+
+    cutoff = timezone.now() - timedelta(days=settings.ATTENDANCE_EVENT_RETENTION_DAYS)
+    deleted, _ = AttendanceEvent.objects.filter(received_at__lt=cutoff).delete()
+    logger.info(f"Purged {deleted} attendance events older than {cutoff}")
+    return deleted
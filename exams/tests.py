@@ -1,3 +1,471 @@
+import json
+from collections import defaultdict
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management import call_command
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from io import StringIO
+from pytz import timezone as pytz_timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from ExamManagementSystem.celery import app as celery_app
+
+from courses.models import CourseGroup
+from enrollments.models import Enrollment
+from exams import pass_codec, passes
+from exams import status as exam_status
+from exams import generation
+from exams.models import Exam, ExamPass, StudentExam, TimetableDocument
+from schedules import benchmark
+from schedules.models import MasterTimetable
+from schedules.synthetic import generate
+from sharedapp.testing import (
+    make_admin, make_campus, make_exam, make_group, make_room, make_student, make_students, make_timetable,
+)
+from student.models import Student
+from users.models import User
+
+
+class StudentExamSlotColumnsTests(TestCase):
+    def setUp(self):
+        campus = make_campus()
+        self.loc = campus.location
+        group = make_group(campus)
+        self.timetable = make_timetable(self.loc, make_admin())
+        self.exam = make_exam(group)
+        self.timetable.exams.add(self.exam)
+        self.students = make_students(3)
+
+    def test_save_copies_slot_location_and_timetable(self):
+        se = StudentExam.objects.create(student=self.students[0], exam=self.exam)
+        se.refresh_from_db()
+        self.assertEqual((se.slot_date, se.slot_start, se.slot_end), (date(2025, 1, 13), time(8, 0), time(11, 0)))
+        self.assertEqual(se.location_id, self.loc.id)
+        self.assertEqual(se.master_timetable_id, self.timetable.id)
+
+    def test_sync_after_move_and_checker(self):
+        for s in self.students:
+            StudentExam.objects.create(student=s, exam=self.exam)
+        Exam.objects.filter(id=self.exam.id).update(date=date(2025, 1, 14), start_time=time(13, 0), end_time=time(16, 0))
+        self.assertEqual(StudentExam.stale_slots().count(), 3)
+        with self.assertRaises(CommandError):
+            call_command("sync_student_exam_slots", check=True, stdout=StringIO())
+
+        self.assertEqual(StudentExam.sync_slots([self.exam.id]), 3)
+        self.assertFalse(StudentExam.stale_slots().exists())
+        self.assertEqual(
+            set(StudentExam.objects.values_list("slot_date", "slot_start")), {(date(2025, 1, 14), time(13, 0))}
+        )
+
+    def test_rest_updates_keep_slot_columns_in_sync(self):
+        for s in self.students:
+            StudentExam.objects.create(student=s, exam=self.exam)
+        client = APIClient()
+        client.force_authenticate(User.objects.get(email="admin@example.com"))
+        response = client.patch(f"/api/exams/exams/{self.exam.id}/", {"date": "2025-01-15"}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(StudentExam.stale_slots().exists())
+
+        other = Exam.objects.create(
+            date=date(2025, 1, 20), slot_name="Evening", group=self.exam.group,
+            start_time=time(17, 0), end_time=time(20, 0),
+        )
+        se = StudentExam.objects.get(student=self.students[0])
+        se.exam = other
+        se.save()
+        se.refresh_from_db()
+        self.assertEqual((se.slot_date, se.slot_start), (date(2025, 1, 20), time(17, 0)))
+        self.assertFalse(StudentExam.stale_slots().exists())
+
+    def test_backfill_command(self):
+        StudentExam.objects.bulk_create([StudentExam(student=s, exam=self.exam) for s in self.students])
+        out = StringIO()
+        call_command("sync_student_exam_slots", stdout=out)
+        self.assertIn("Re-synced 3", out.getvalue())
+        call_command("sync_student_exam_slots", check=True, stdout=StringIO())
+
+
+class TimetableReadModelTests(TestCase):
+    def setUp(self):
+        campus = make_campus()
+        self.loc = campus.location
+        self.admin = make_admin()
+        self.instructor = User.objects.create(email="inst@example.com", role="instructor")
+        self.student = make_student(0)
+        self.user = self.student.user
+        self.timetables, self.rows = [], []
+        # Committed, as far as the read model is concerned: the tests start
+        # with no invalidation pending.
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, code in enumerate(("CS101", "CS102")):
+                group = make_group(campus, code=code, title=code)
+                timetable = make_timetable(self.loc, self.admin, status="PUBLISHED" if i == 0 else "DRAFT")
+                exam = make_exam(group, day=date(2025, 1, 13 + i))
+                timetable.exams.add(exam)
+                self.timetables.append(timetable)
+                self.rows.append(StudentExam.objects.create(student=self.student, exam=exam, instructor=self.instructor))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_mine_serves_published_exams_with_etag(self):
+        response = self.client.get("/api/exams/student-exam/mine/")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([se["exam"]["group"]["course"]["code"] for se in body["data"]], ["CS101"])
+        etag = response["ETag"]
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/exams/student-exam/mine/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # At most the student profile and the document.
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rows[0].signin_attendance = True
+            self.rows[0].save()
+        response = self.client.get("/api/exams/student-exam/mine/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertTrue(response.json()["data"][0]["signin_attendance"])
+
+    def test_saves_in_a_transaction_invalidate_once_on_commit(self):
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            for se in self.rows * 3:
+                se.save()
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(sum('"exams_timetabledocument"' in sql for sql in updates), 1)
+        self.assertEqual(sum('"schedules_mastertimetable"' in sql for sql in updates), 1)
+
+    def test_saves_queue_one_callback_per_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            for se in self.rows * 3:
+                se.save()
+        self.assertEqual(len(callbacks), 1)
+
+    def test_rolled_back_saves_are_not_flushed_later(self):
+        versions = dict(MasterTimetable.objects.values_list("id", "data_version"))
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.rows[0].save()
+            raise RuntimeError
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rows[1].save()
+        for timetable in self.timetables:
+            timetable.refresh_from_db()
+        self.assertEqual(self.timetables[0].data_version, versions[self.timetables[0].id])
+        self.assertGreater(self.timetables[1].data_version, versions[self.timetables[1].id])
+
+    def test_publishing_materialises_documents(self):
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", celery_app.conf.task_always_eager)
+        celery_app.conf.task_always_eager = True
+        self.client.get("/api/exams/student-exam/mine/")
+
+        admin = APIClient()
+        admin.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.put("/api/exams/exams/publish/", {"masterTimetable": self.timetables[1].id}, format="json")
+
+        doc = TimetableDocument.objects.get(kind=TimetableDocument.STUDENT, owner_id=self.student.id)
+        codes = [se["exam"]["group"]["course"]["code"] for se in json.loads(doc.body())["data"]]
+        self.assertEqual(codes, ["CS101", "CS102"])
+        self.assertTrue(TimetableDocument.objects.filter(
+            kind=TimetableDocument.INSTRUCTOR_EXAMS, owner_id=self.instructor.id
+        ).exists())
+
+    def test_exam_changes_invalidate(self):
+        self.client.get("/api/exams/student-exam/mine/")
+        doc = TimetableDocument.objects.get(kind=TimetableDocument.STUDENT, owner_id=self.student.id)
+        self.assertIsNone(doc.invalidated_at)
+        exam = self.rows[0].exam
+        exam.start_time = time(9, 0)
+        exam.save()
+        doc.refresh_from_db()
+        self.assertIsNotNone(doc.invalidated_at)
+        body = self.client.get("/api/exams/student-exam/mine/").json()
+        self.assertEqual(body["data"][0]["exam"]["start_time"], "09:00:00")
+
+
+class ExamPassTests(TestCase):
+    def setUp(self):
+        campus = make_campus()
+        group = make_group(campus)
+        admin = make_admin()
+        self.instructor = User.objects.create(email="inst@example.com", role="instructor")
+        self.timetable = make_timetable(campus.location, admin, status="PUBLISHED")
+        exam = make_exam(group)
+        self.timetable.exams.add(exam)
+        self.room = make_room(campus.location, name="Grid", capacity=6, rows=2, columns=3)
+        self.rows = []
+        for i, student in enumerate(make_students(3)):
+            # R2 still owes money.
+            Enrollment.objects.create(student=student, course=group.course, amount_to_pay=100, amount_paid=100 if i < 2 else 40)
+            self.rows.append(StudentExam.objects.create(
+                student=student, exam=exam, room=self.room, seat_row=1, seat_column=i + 1,
+                instructor=self.instructor,
+            ))
+        # 08:00 Africa/Kigali (UTC+2) is 06:00 UTC.
+        self.start = datetime(2025, 1, 13, 6, 0, tzinfo=dt_timezone.utc)
+
+    def _tokens(self):
+        return dict(ExamPass.objects.values_list("student_exam_id", "token"))
+
+    def test_generated_passes_verify_offline(self):
+        self.assertEqual(passes.generate_passes(timetable_id=self.timetable.id), 3)
+        tokens = self._tokens()
+        fields = pass_codec.decode(tokens[self.rows[1].id], passes.public_keys())
+        self.assertEqual(fields["student_exam_id"], self.rows[1].id)
+        self.assertEqual((fields["room_id"], fields["seat_row"], fields["seat_column"]), (self.room.id, 1, 2))
+        self.assertEqual(fields["reg_no"], "R1")
+        self.assertEqual(fields["not_after"], int(self.start.timestamp()) + 3 * 3600)
+        self.assertEqual(fields["not_before"], int(self.start.timestamp()) - 3600)
+        self.assertTrue(fields["payment_cleared"])
+        self.assertFalse(pass_codec.decode(tokens[self.rows[2].id], passes.public_keys())["payment_cleared"])
+
+        forged = tokens[self.rows[0].id]
+        forged = forged[:20] + ("A" if forged[20] != "A" else "B") + forged[21:]
+        with self.assertRaises(pass_codec.InvalidPass):
+            pass_codec.decode(forged, passes.public_keys())
+
+    def test_signing_in_a_process_pool(self):
+        old = passes.POOL_THRESHOLD, passes.SIGN_CHUNK
+        passes.POOL_THRESHOLD, passes.SIGN_CHUNK = 1, 2
+        try:
+            with self.assertNoLogs("exams.passes", level="WARNING"):
+                passes.generate_passes(timetable_id=self.timetable.id)
+        finally:
+            passes.POOL_THRESHOLD, passes.SIGN_CHUNK = old
+        for token in self._tokens().values():
+            pass_codec.decode(token, passes.public_keys())
+
+    def test_sync_applies_scans_once(self):
+        passes.generate_passes(timetable_id=self.timetable.id)
+        tokens = self._tokens()
+        at = (self.start + timedelta(minutes=5)).isoformat()
+        scans = [
+            {"pass": tokens[self.rows[0].id], "action": "signin", "scanned_at": at},
+            {"pass": tokens[self.rows[1].id], "action": "signin", "scanned_at": at},
+            {"pass": tokens[self.rows[2].id], "action": "signin", "scanned_at": at},
+            {"pass": tokens[self.rows[0].id], "action": "signin",
+             "scanned_at": (self.start + timedelta(days=1)).isoformat()},
+        ]
+        client = APIClient()
+        client.force_authenticate(self.instructor)
+        response = client.post("/api/exams/student-exam/pass-sync/", {"scans": scans}, format="json")
+        self.assertEqual(response.status_code, 200)
+        result = response.data["data"]
+        self.assertEqual(result["applied"], 2)
+        self.assertEqual(
+            [(r["index"], r["reason"]) for r in result["rejected"]],
+            [(2, "payment not cleared"), (3, "outside the pass window")],
+        )
+        self.assertEqual(
+            list(StudentExam.objects.order_by("id").values_list("signin_attendance", flat=True)),
+            [True, True, False],
+        )
+
+        result = client.post("/api/exams/student-exam/pass-sync/", {"scans": scans[:2]}, format="json").data["data"]
+        self.assertEqual((result["applied"], result["duplicates"]), (0, 2))
+
+        # Re-issued after a seat change: the device's copy no longer counts.
+        StudentExam.objects.filter(id=self.rows[0].id).update(seat_row=2)
+        passes.generate_passes(student_exam_ids=[self.rows[0].id])
+        result = passes.sync_scans([{**scans[0], "action": "signout"}], self.instructor)
+        self.assertEqual(result["rejected"], [{"index": 0, "reason": "superseded"}])
+
+    def test_moving_an_exam_reissues_its_passes(self):
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", celery_app.conf.task_always_eager)
+        celery_app.conf.task_always_eager = True
+        passes.generate_passes(timetable_id=self.timetable.id)
+        exam_id = self.rows[0].exam_id
+        with self.captureOnCommitCallbacks(execute=True):
+            Exam.objects.filter(id=exam_id).update(date=date(2025, 1, 14))
+            StudentExam.sync_slots([exam_id])
+
+        moved = int((self.start + timedelta(days=1, hours=3)).timestamp())
+        for token in self._tokens().values():
+            self.assertEqual(pass_codec.decode(token, passes.public_keys())["not_after"], moved)
+
+
+class AttendanceBatchTests(TestCase):
+    def setUp(self):
+        group = make_group(make_campus())
+        self.instructor = User.objects.create(email="inst@example.com", role="instructor")
+        self.other = User.objects.create(email="other@example.com", role="instructor")
+        self.exam = make_exam(group)
+        self.rows = [
+            StudentExam.objects.create(student=student, exam=self.exam, instructor=self.instructor)
+            for student in make_students(12)
+        ]
+        self.t0 = datetime(2025, 1, 13, 6, 0, tzinfo=dt_timezone.utc)
+        self.client = APIClient()
+        self.client.force_authenticate(self.instructor)
+
+    def _event(self, key, row, action, minutes):
+        return {
+            "idempotency_key": key, "student_exam_id": row.id, "action": action,
+            "client_timestamp": (self.t0 + timedelta(minutes=minutes)).isoformat(),
+        }
+
+    def _post(self, events):
+        response = self.client.post("/api/exams/student-exam/attendance-batch/", {"events": events}, format="json")
+        self.assertEqual(response.status_code, 200)
+        return response.data["data"]
+
+    def _signed_in(self):
+        return list(StudentExam.objects.order_by("id").values_list("signin_attendance", flat=True))
+
+    def test_batch_is_idempotent_and_latest_event_wins(self):
+        events = [self._event(f"k{i}", row, "signin", 1) for i, row in enumerate(self.rows[:3])]
+        # Same device: signed R0 in, then undid it a minute later.
+        events.append(self._event("k-undo", self.rows[0], "undo_signin", 2))
+        events.append(self._event("k1", self.rows[1], "signin", 1))
+        events.append({"student_exam_id": self.rows[3].id, "action": "teleport"})
+
+        result = self._post(events)
+        self.assertEqual((result["applied"], result["stale"], result["duplicates"]), (3, 1, 1))
+        self.assertEqual([r["index"] for r in result["rejected"]], [5])
+        self.assertEqual(self._signed_in()[:4], [False, True, True, False])
+
+        result = self._post(events[:5])
+        self.assertEqual((result["applied"], result["duplicates"]), (0, 5))
+
+        # A second device syncing late: older than what is stored, so it loses.
+        result = self._post([self._event("late", self.rows[1], "undo_signin", 0)])
+        self.assertEqual(result["stale"], 1)
+        self.assertTrue(self._signed_in()[1])
+
+    def test_instructors_only_touch_their_rows(self):
+        self.client.force_authenticate(self.other)
+        result = self._post([self._event("k", self.rows[0], "signin", 1)])
+        self.assertEqual(result["rejected"], [{"index": 0, "reason": "not invigilated by you"}])
+        self.assertFalse(any(self._signed_in()))
+
+    def test_query_count_and_one_broadcast_per_batch(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)("broadcast_exams", channel)
+
+        def run(rows, tag):
+            events = [self._event(f"{tag}{i}", row, "signin", 1) for i, row in enumerate(rows)]
+            with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+                self._post(events)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(run(self.rows[:2], "a"), run(self.rows[2:12], "b"))
+        first = async_to_sync(layer.receive)(channel)["message"]
+        second = async_to_sync(layer.receive)(channel)["message"]
+        self.assertEqual(first["exams"], [{"exam_id": self.exam.id, "signed_in": 2}])
+        self.assertEqual(second["exams"], [{"exam_id": self.exam.id, "signed_in": 10}])
+
+
+class ExamStatusTransitionTests(TestCase):
+    def setUp(self):
+        campus = make_campus()
+        group = make_group(campus)
+        admin = make_admin()
+        published, draft = [
+            make_timetable(campus.location, admin, status=status) for status in ("PUBLISHED", "DRAFT")
+        ]
+        self.exams = {}
+        for name, start, end, status, timetable in (
+            ("ready", time(10, 10), time(12, 0), "SCHEDULED", published),
+            ("ongoing", time(9, 0), time(11, 0), "READY", published),
+            ("completed", time(7, 0), time(9, 0), "ONGOING", published),
+            ("just_ended", time(7, 0), time(9, 50), "ONGOING", published),
+            ("later", time(14, 0), time(16, 0), "SCHEDULED", published),
+            ("cancelled", time(7, 0), time(9, 0), "CANCELLED", published),
+            ("unpublished", time(9, 0), time(11, 0), "SCHEDULED", draft),
+        ):
+            exam = Exam.objects.create(
+                date=date(2025, 1, 13), group=group, start_time=start, end_time=end, status=status,
+            )
+            timetable.exams.add(exam)
+            self.exams[name] = exam
+        self.now = pytz_timezone(settings.TIME_ZONE).localize(datetime(2025, 1, 13, 10, 0))
+
+    def _statuses(self):
+        return {name: Exam.objects.get(pk=exam.pk).status for name, exam in self.exams.items()}
+
+    def test_day_advances_in_one_statement_exactly_once(self):
+        with CaptureQueriesContext(connection) as ctx:
+            changed = exam_status.advance_statuses(self.now, complete_after=timedelta(minutes=15))
+        self.assertEqual(len([q for q in ctx.captured_queries if q["sql"].startswith('UPDATE "exams_exam"')]), 1)
+        self.assertEqual(changed, {
+            "READY": [self.exams["ready"].id],
+            "ONGOING": [self.exams["ongoing"].id],
+            "COMPLETED": [self.exams["completed"].id],
+        })
+        self.assertEqual(self._statuses(), {
+            "ready": "READY", "ongoing": "ONGOING", "completed": "COMPLETED", "just_ended": "ONGOING",
+            "later": "SCHEDULED", "cancelled": "CANCELLED", "unpublished": "SCHEDULED",
+        })
+
+        # A second runner at the same moment finds nothing left to apply.
+        self.assertEqual(exam_status.advance_statuses(self.now, complete_after=timedelta(minutes=15)), {})
+        self.assertEqual(exam_status.advance_statuses(self.now), {"COMPLETED": [self.exams["just_ended"].id]})
+
+    def test_set_status_applies_once(self):
+        exam = self.exams["later"]
+        self.assertTrue(exam_status.set_status(exam.id, "ONGOING"))
+        self.assertFalse(exam_status.set_status(exam.id, "ONGOING"))
+        self.assertFalse(exam_status.set_status(self.exams["cancelled"].id, "ONGOING"))
+
+
+class MultiLocationGenerationTests(TestCase):
+    def test_locations_generate_as_disjoint_shards(self):
+        summary = generate(seed=5, prefix="M", locations=2, departments=4, rooms=8, instructors=6,
+                           courses=16, students=100)
+        # Students of the first campus taking a course at the second.
+        first_campus, second_campus = summary["location_ids"]
+        group = CourseGroup.objects.filter(course__department__location_id=second_campus).first()
+        for student in Student.objects.filter(department__location_id=first_campus)[:3]:
+            Enrollment.objects.create(student=student, course=group.course, group=group)
+        admin = User.objects.create(email="admin@example.com", role="admin")
+        start = date(2030, 1, 7)
+        params = {
+            "start_date": start, "end_date": start + timedelta(days=20), "course_ids": None,
+            "slots": benchmark._slots(start, start + timedelta(days=20)), "constraints": {},
+            "academic_year": "2030", "category": "Provisional",
+        }
+        shard_events, overall = defaultdict(list), []
+
+        result = generation.generate_locations(
+            params, summary["location_ids"], admin.id, summary["semester_id"],
+            lambda step, total, message, stats=None: overall.append(step),
+            lambda shard, step, total, message, stats=None: shard_events[shard["id"]].append(step),
+        )
+
+        self.assertTrue(result["success"], result["errors"])
+        self.assertEqual(set(shard_events), set(summary["location_ids"]))
+        self.assertEqual(overall[-1], 100)
+        for shard in result["shards"]:
+            timetable = MasterTimetable.objects.get(pk=shard["timetable_id"])
+            self.assertEqual(timetable.location_id, shard["location_id"])
+            # A campus' timetable holds its own courses only.
+            self.assertFalse(
+                Exam.objects.filter(master_timetable=timetable)
+                .exclude(group__course__department__location_id=shard["location_id"]).exists()
+            )
+            self.assertGreater(shard["exams"], 0)
+
+        courses = generation.location_courses(summary["location_ids"])
+        cross = generation.cross_campus_students(courses)
+        self.assertEqual(result["cross_campus"]["students"], len(cross))
+        self.assertTrue(cross)
+
+        # Put a cross-campus student's two exams in the same slot: the
+        # coordinated pass reports it.
+        a, b = [shard["timetable_id"] for shard in result["shards"]]
+        student_id = StudentExam.objects.filter(
+            exam__master_timetable_id=a, student_id__in=cross,
+        ).filter(student__studentexam__exam__master_timetable_id=b).values_list("student_id", flat=True)[0]
+        first = Exam.objects.filter(master_timetable_id=a, studentexam__student_id=student_id).first()
+        Exam.objects.filter(master_timetable_id=b, studentexam__student_id=student_id).update(
+            date=first.date, slot_name=first.slot_name,
+        )
+        clashes = generation.cross_campus_conflicts([a, b])
+        self.assertIn(student_id, [row["student_id"] for row in clashes])
@@ -3,14 +3,14 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from datetime import time
-from schedules.models import MasterTimetable, MasterTimetableExam
+from schedules.models import MasterTimetable, MasterTimetableExam, TimetableTeardown
 from student.serializers import StudentSerializer
-from .models import Student, Exam, StudentExam
+from .models import Student, Exam, ExamPass, StudentExam
 from .serializers import ExamSerializer, StudentExamSerializer
+from schedules.reallocation import reallocate_slot_delta
+from schedules.teardown import request_teardown
 from schedules.utils import (
-    allocate_shared_rooms_updated,
     cancel_exam,
-    generate_exam_schedule,
     reschedule_exam,
     verify_groups_compatibility,
     which_suitable_slot_to_schedule_course_group,
@@ -42,6 +42,10 @@ from collections import defaultdict
 import asyncio
 from asgiref.sync import sync_to_async
 from django.http import StreamingHttpResponse
+from schedules.occupancy import refresh_exams, invalidate_timetable
+from exams import attendance, passes, read_model
+from exams.generation import generate_for_location, generate_locations
+from sharedapp.query_plans import QueryPlanMixin, apply_query_plan
 
 logger = logging.getLogger(__name__)
 
@@ -63,7 +67,20 @@ def _progress(step, total_steps, message, stats=None):
     return _sse_event("progress", event)
 
 
-def _done(stats, warnings, unscheduled=None, unaccommodated=None):
+def _shard_progress(shard, step, total_steps, message, stats=None):
+    event = {
+        "shard": shard,
+        "step": step,
+        "total_steps": total_steps,
+        "percent": round((step / total_steps) * 100),
+        "message": message,
+    }
+    if stats:
+        event["stats"] = stats
+    return _sse_event("shard_progress", event)
+
+
+def _done(stats, warnings, unscheduled=None, unaccommodated=None, **extra):
     return _sse_event("done", {
         "message": (
             "Completed successfully"
@@ -77,6 +94,7 @@ def _done(stats, warnings, unscheduled=None, unaccommodated=None):
         # date/slot at all). This used to be computed and then silently
         # discarded before ever reaching the response.
         "unaccommodated": unaccommodated or [],
+        **extra,
     })
 
 
@@ -84,229 +102,89 @@ def _error(message):
     return _sse_event("error", {"message": message})
 
 
+def _teardown_job_data(job):
+    return {
+        "id": job.id,
+        "timetable_id": job.timetable_id,
+        "archive": job.archive,
+        "status": job.status,
+        "step": job.step,
+        "total_steps": job.total_steps,
+        "message": job.message,
+        "row_counts": job.row_counts,
+        "error": job.error,
+    }
+
+
+def _generation_params(data):
+    start_date_str = data.get("start_date")
+    end_date_str = data.get("end_date")
+    client_config = data.get("configurations")
+
+    # Parse dates more efficiently
+    if start_date_str and "T" in start_date_str:
+        start_date_str = start_date_str.split("T")[0]
+    if end_date_str and "T" in end_date_str:
+        end_date_str = end_date_str.split("T")[0]
+
+    return {
+        "start_date": parse_date(start_date_str) if start_date_str else None,
+        "end_date": parse_date(end_date_str) if end_date_str else None,
+        "course_ids": data.get("course_ids", None),
+        "slots": data.get("slots"),
+        "constraints": client_config.get("constraints", {}),
+        "location": client_config.get("location"),
+        # Several campuses at once, in parallel (see exams/generation.py).
+        "locations": client_config.get("locations") or [],
+        "academic_year": client_config.get("academicYear"),
+        # .get(key, default) only falls back when the key is entirely
+        # absent — the frontend was sending category as "" (present, just
+        # empty), so this default never actually applied. `or` also catches
+        # the empty-string case.
+        "category": client_config.get("category") or "Provisional",
+    }
+
+
 def _run_generate_timetable(request, progress_callback, serializer):
     
     with transaction.atomic():
 
-        start_date_str = request.data.get("start_date")
-        end_date_str = request.data.get("end_date")
-        course_ids = request.data.get("course_ids", None)
-        slots = request.data.get("slots")
-        client_config = request.data.get("configurations")
-        constraints = client_config.get("constraints", {})
+        params = _generation_params(request.data)
         term = Semester.objects.filter(is_active=True).first()
         if not term:
             return Response(
                 {"success": False, "message": "No active semester found"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        location = client_config.get("location")
-        academic_year = client_config.get("academicYear")
-        # .get(key, default) only falls back when the key is entirely
-        # absent — the frontend was sending category as "" (present, just
-        # empty), so this default never actually applied. `or` also catches
-        # the empty-string case.
-        category = client_config.get("category") or "Provisional"
-
-        # Parse dates more efficiently
-        if start_date_str and "T" in start_date_str:
-            start_date_str = start_date_str.split("T")[0]
-        if end_date_str and "T" in end_date_str:
-            end_date_str = end_date_str.split("T")[0]
-
-        start_date = parse_date(start_date_str) if start_date_str else None
-        end_date = parse_date(end_date_str) if end_date_str else None
-
-        # Create master timetable
-        master_timetable = MasterTimetable.objects.create(
-            academic_year=academic_year,
-            generated_by=request.user,
-            start_date=start_date,
-            end_date=end_date,
-            category=category,
-            location_id=int(location),
-            semester_id=int(term.id),
-        )
 
-        # Generate exam schedule
-        exams, unaccommodated, unscheduled, reasons, errors, stats = generate_exam_schedule(
-            slots=slots,
-            course_ids=course_ids,
-            master_timetable=master_timetable,
-            location=int(location),
-            constraints=constraints,
-            progress_callback=progress_callback
+        result = generate_for_location(
+            params, params["location"], request.user.id, term.id,
+            params["course_ids"], progress_callback,
         )
 
-        # Process unscheduled exams efficiently
-        unScheduled = []
-        unscheduled_courses = [course["courses"] for course in unscheduled]
-
-        if unscheduled_courses:
-            # Flatten and collect all unique course IDs and group IDs
-            all_course_ids = set()
-            all_group_ids = set()
-            course_group_mapping = defaultdict(list)
-
-            for unscheduleds_ in unscheduled_courses:
-                for unscheduled_ in unscheduleds_:
-                    course_id = unscheduled_["course_id"]
-                    groups = unscheduled_["groups"]
-                    all_course_ids.add(course_id)
-                    course_group_mapping[course_id].extend(groups)
-                    all_group_ids.update(filter(None, groups))
-
-            # Bulk fetch courses and enrollments
-            courses_dict = {
-                course.id: course
-                for course in Course.objects.filter(id__in=all_course_ids)
-            }
-
-            # Bulk fetch enrollments with related groups
-            enrollments_dict = {}
-            if all_group_ids:
-                enrollments = Enrollment.objects.filter(
-                    course_id__in=all_course_ids, group_id__in=all_group_ids
-                ).select_related("group", "course")
-
-                for enrollment in enrollments:
-                    key = (enrollment.course_id, enrollment.group_id)
-                    enrollments_dict[key] = enrollment
-
-            # Process unscheduled exams in batches
-            unscheduled_exams_to_create = []
-            unscheduled_groups_to_create = []
-
-            for unscheduleds_ in unscheduled_courses:
-                for unscheduled_ in unscheduleds_:
-                    course_id = unscheduled_["course_id"]
-                    groups = unscheduled_["groups"]
-
-                    course = courses_dict.get(course_id)
-                    if not course:
-                        continue
-
-                    # Filter out None/empty groups
-                    valid_groups = [g for g in groups if g]
-                    if not valid_groups:
-                        continue
-
-                    # Get reason for first valid group
-                    reason = reasons.get(valid_groups[0], "Unknown reason")
-
-                    # Prepare course data structure
-                    c = {
-                        "course": CourseSerializer(course).data,
-                        "groups": [],
-                        "reason": reason,
-                    }
-
-                    # Create unscheduled exam object (will be bulk created later)
-                    unscheduled_exam_data = {
-                        "course": course,
-                        "master_timetable": master_timetable,
-                        "reason": reason,
-                        "groups_data": [],
-                    }
-
-                    # Process groups for this course
-                    for group_id in valid_groups:
-                        enrollment = enrollments_dict.get((course_id, group_id))
-                        if enrollment:
-                            c["groups"].append(
-                                CourseGroupSerializer(enrollment.group).data
-                            )
-                            unscheduled_exam_data["groups_data"].append(
-                                enrollment.group
-                            )
-
-                    if c["groups"]:  # Only add if we have valid groups
-                        unScheduled.append(c)
-                        unscheduled_exams_to_create.append(unscheduled_exam_data)
-
-            # Bulk create unscheduled exams
-            if unscheduled_exams_to_create:
-                unscheduled_exam_objects = []
-                for exam_data in unscheduled_exams_to_create:
-                    unscheduled_exam = UnscheduledExam.objects.create(
-                        course=exam_data["course"],
-                        master_timetable=exam_data["master_timetable"],
-                        reason=exam_data["reason"],
-                    )
-                    unscheduled_exam_objects.append(unscheduled_exam)
-
-                    # Bulk create groups for this exam
-                    groups_to_create = [
-                        UnscheduledExamGroup(exam=unscheduled_exam, group=group)
-                        for group in exam_data["groups_data"]
-                    ]
-
-                    if groups_to_create:
-                        UnscheduledExamGroup.objects.bulk_create(groups_to_create)
-
-                        # Add groups to the exam (using add with the created objects)
-                        unscheduled_exam.groups.add(
-                            *[
-                                ug.id
-                                for ug in UnscheduledExamGroup.objects.filter(
-                                    exam=unscheduled_exam
-                                )
-                            ]
-                        )
-
-        # Students whose exam WAS scheduled but who ran out of room during
-        # allocation (distinct from `unScheduled` above — courses that never
-        # got a date/slot at all). This used to be computed and immediately
-        # discarded (`_`) with a hardcoded `"unaccomodated": []` stub here,
-        # so an admin had no way to know a generation left students seatless.
-        # Bulk-fetch student->user in one query instead of one per student
-        # (unaccommodated can easily be 100+ students for an oversubscribed
-        # slot).
-        student_users = {
-            s.id: s.user
-            for s in Student.objects.filter(
-                id__in=[item["student"].id for item in unaccommodated]
-            ).select_related("user")
-        }
-        unaccommodated_summary = [
-            {
-                "student_id": item["student"].id,
-                "reg_no": item["student"].reg_no,
-                "name": (
-                    f"{u.first_name} {u.last_name}".strip()
-                    if (u := student_users.get(item["student"].id))
-                    else ""
-                ),
-                "exam_id": item["exam"].id,
-                "course": item["exam"].group.course.title,
-                "group": item["exam"].group.group_name,
-                # ISO strings, not raw date/time objects — this SSE stream
-                # is encoded with plain json.dumps() (see _sse_event), not
-                # DRF's date-aware renderer, so a raw datetime.date/time
-                # object here throws "Object of type date is not JSON
-                # serializable" and takes down the whole "done" event after
-                # generation otherwise completed successfully.
-                "date": item["exam"].date.isoformat() if item["exam"].date else None,
-                "start_time": (
-                    item["exam"].start_time.isoformat()
-                    if item["exam"].start_time else None
-                ),
-            }
-            for item in unaccommodated
-        ]
-
         return {
         "success": True,
-        "message": f"{len(exams)} exams scheduled successfully.",
+        "message": f"{result['exams']} exams scheduled successfully.",
         "data": serializer.data,
-        "unaccommodated": unaccommodated_summary,
-        "unscheduled": unScheduled,
-        "errors": errors,
-        "stats": stats,
+        "unaccommodated": result["unaccommodated"],
+        "unscheduled": result["unscheduled"],
+        "errors": result["errors"],
+        "stats": result["stats"],
     }
 
 
-class ExamViewSet(viewsets.ModelViewSet):
+def _run_generate_locations(request, progress_callback, shard_callback):
+    # Each campus commits on its own (one transaction per shard).
+    params = _generation_params(request.data)
+    term = Semester.objects.filter(is_active=True).first()
+    if not term:
+        raise ValueError("No active semester found")
+    return generate_locations(
+        params, params["locations"], request.user.id, term.id, progress_callback, shard_callback,
+    )
+
+
+class ExamViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = (
         Exam.objects.select_related("group", "room")
         .all()
@@ -453,6 +331,15 @@ class ExamViewSet(viewsets.ModelViewSet):
             }
         )
 
+    def perform_update(self, serializer):
+        # A PATCH may move the exam (date, times, group): re-copy the slot
+        # columns onto its StudentExams and refresh the occupancy indexes,
+        # as the manual scheduling flows do.
+        with transaction.atomic():
+            exam = serializer.save()
+            StudentExam.sync_slots([exam.id])
+            refresh_exams([exam.id])
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         self.perform_destroy(instance)
@@ -476,21 +363,8 @@ class ExamViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_403_FORBIDDEN,
                 )
 
-            # ✅ Get distinct exams directly, not StudentExam objects
-            exams = (
-                Exam.objects.filter(studentexam__instructor=instructor)
-                .select_related("group", "room")
-                .distinct()
-            )
-
-            serializer = ExamSerializer(exams, many=True)
-            return Response(
-                {
-                    "success": True,
-                    "data": serializer.data,
-                    "message": "Instructor exams fetched successfully",
-                }
-            )
+            # Pre-rendered, see exams/read_model.py.
+            return read_model.respond(request, read_model.INSTRUCTOR_EXAMS, instructor.id)
         except Exception as e:
             return Response(
                 {
@@ -511,6 +385,9 @@ class ExamViewSet(viewsets.ModelViewSet):
                 masterTimetable.status = "PUBLISHED"
 
             masterTimetable.save()
+            read_model.timetable_status_changed(masterTimetable)
+            if masterTimetable.status == "PUBLISHED":
+                passes.request_generation(masterTimetable)
             return Response(
                 {
                     "success": True,
@@ -629,16 +506,29 @@ class ExamViewSet(viewsets.ModelViewSet):
             def progress_callback(step, total, message, stats=None):
                 queue.put_nowait(_progress(step, total, message, stats))
 
+            def shard_callback(shard, step, total, message, stats=None):
+                queue.put_nowait(_shard_progress(shard, step, total, message, stats))
+
+            multi_location = bool(((request.data.get("configurations") or {}).get("locations")))
+
             async def run_generate_timetable():
                 try:
-                    result = await sync_to_async(
-                    _run_generate_timetable, thread_sensitive=False
-                    )(request, progress_callback, serializer)
+                    if multi_location:
+                        result = await sync_to_async(
+                            _run_generate_locations, thread_sensitive=False
+                        )(request, progress_callback, shard_callback)
+                        extra = {"shards": result["shards"], "cross_campus": result["cross_campus"]}
+                    else:
+                        result = await sync_to_async(
+                        _run_generate_timetable, thread_sensitive=False
+                        )(request, progress_callback, serializer)
+                        extra = {}
                     queue.put_nowait(_done(
                         stats=result["stats"],
                         warnings=result.get("errors", []),
                         unscheduled=result.get("unscheduled", []),
                         unaccommodated=result.get("unaccommodated", []),
+                        **extra,
             ))
                 except Exception as e:
                     queue.put_nowait(_error(f"Import failed: {str(e)}"))
@@ -827,6 +717,8 @@ class ExamViewSet(viewsets.ModelViewSet):
         try:
             with transaction.atomic():
                 StudentExam.objects.all().delete()
+                for timetable_id in MasterTimetable.objects.values_list("id", flat=True):
+                    invalidate_timetable(timetable_id)
                 # Exam.objects.all().delete()
                 UnscheduledExam.objects.all().delete()
                 UnscheduledExamGroup.objects.all().delete()
@@ -851,30 +743,30 @@ class ExamViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def truncate_all(self, request):
+        """
+        Queue the teardown of a MasterTimetable (schedules/teardown.py) and
+        return the job to poll at teardown-status. Set-based deletes in
+        short transactions replace the ORM cascade, which loaded every row
+        of the timetable and held its locks for minutes. Pass
+        "archive": true to keep a compressed copy of the rows.
+        """
         try:
-            with transaction.atomic():
-                master_timetableid = request.data.get("id")
-                master_timetable = MasterTimetable.objects.get(id=master_timetableid)
-                related_exams = master_timetable.exams.all()
-                StudentExam.objects.filter(exam__in=related_exams).delete()
-                Exam.objects.filter(id__in=related_exams).delete()
-                UnscheduledExam.objects.filter(
-                    master_timetable=master_timetable
-                ).delete()
-                UnscheduledExamGroup.objects.filter(
-                    exam__master_timetable=master_timetable
-                ).delete()
-                MasterTimetableExam.objects.filter(
-                    master_timetable=master_timetable
-                ).delete()
-                master_timetable.delete()
-
+            master_timetable = MasterTimetable.objects.get(id=request.data.get("id"))
+        except (MasterTimetable.DoesNotExist, ValueError, TypeError):
+            return Response(
+                {"success": False, "message": "Timetable not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        try:
+            archive = str(request.data.get("archive", "")).lower() in ("1", "true", "yes")
+            job = request_teardown(master_timetable, archive=archive, user=request.user)
             return Response(
                 {
                     "success": True,
-                    "message": "All exams and student exam assignments have been truncated successfully.",
+                    "data": _teardown_job_data(job),
+                    "message": "Timetable removal started.",
                 },
-                status=status.HTTP_200_OK,
+                status=status.HTTP_202_ACCEPTED,
             )
         except Exception as e:
             return Response(
@@ -882,6 +774,27 @@ class ExamViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="teardown-status",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def teardown_status(self, request):
+        job_id = request.query_params.get("id")
+        if not str(job_id or "").isdigit():
+            return Response(
+                {"success": False, "message": "Invalid teardown id."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        job = TimetableTeardown.objects.filter(id=job_id).first()
+        if job is None:
+            return Response(
+                {"success": False, "message": "Teardown not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response({"success": True, "data": _teardown_job_data(job), "message": job.message})
+
     @action(
         detail=False,
         methods=["post"],
@@ -937,7 +850,9 @@ class ExamViewSet(viewsets.ModelViewSet):
                 merged_groups = list(set(new_groups + scheduled_date_groups))
 
                 # Check for conflicts
-                conflicts = verify_groups_compatibility(merged_groups)
+                conflicts = verify_groups_compatibility(
+                    merged_groups, involving=new_groups
+                )
 
                 if not conflicts:
                     # No conflicts - can proceed with scheduling
@@ -1128,6 +1043,8 @@ class ExamViewSet(viewsets.ModelViewSet):
                     exam.end_time = end_time
 
                 Exam.objects.bulk_update(exams, fields=["start_time", "end_time"])
+                StudentExam.sync_slots([exam.id for exam in exams])
+                read_model.invalidate_exams([exam.id for exam in exams])
                 return Response(
                     {
                         "success": True,
@@ -1157,7 +1074,6 @@ class ExamViewSet(viewsets.ModelViewSet):
                 existing_slot = request.data.get("slot")
                 date = request.data.get("day")
                 new_group_to_add = request.data.get("course_group")
-                timetable_id = request.data.get("timetable_id")
                 date_formatted = parse_date(date)
                 course_id = new_group_to_add["course"]["id"]
                 course = Course.objects.get(id=course_id)
@@ -1190,48 +1106,27 @@ class ExamViewSet(viewsets.ModelViewSet):
                         student_ids = Enrollment.objects.filter(
                             course=course, group=real_group
                         ).values_list("student_id", flat=True)
-                        for student_id in student_ids:
-                            student_exam = StudentExam.objects.create(
-                                student_id=student_id, exam=exam
-                            )
-                            student_exam.save()
-                        # assigning rooms — scoped to this course's own
-                        # location. Unscoped, this pulled in every
-                        # StudentExam sharing this exact date/time across
-                        # the ENTIRE system (all locations): on the busiest
-                        # slot in production that's ~4,800 rows, each fully
-                        # materialized through a 3-level select_related join,
-                        # for a single group's drag-and-drop — most of it
-                        # irrelevant, since allocate_shared_rooms_updated
-                        # only ever assigns rooms within one location anyway.
                         location = course.department.location
-                        existing_student_exams = (
-                            StudentExam.objects.filter(
-                                exam__date=date_formatted,
-                                exam__start_time=start_time,
-                                exam__end_time=end_time,
-                                exam__group__course__department__location=location,
-                            )
-                            .select_related(
-                                "exam", "exam__group__course__semester", "student"
-                            )
-                            .order_by("exam__date", "exam__start_time")
-                        )
-                        if timetable_id:
-                            existing_student_exams = existing_student_exams.filter(
-                                exam__mastertimetableexam__master_timetable_id=timetable_id
-                            )
-                        student_exams = (
-                            StudentExam.objects.filter(
-                                student_id__in=student_ids, exam=exam
-                            )
-                            .select_related(
-                                "exam", "exam__group__course__semester", "student"
+                        student_exams = StudentExam.objects.bulk_create([
+                            StudentExam(
+                                student_id=student_id, exam=exam,
+                                slot_date=date_formatted, slot_start=start_time,
+                                slot_end=end_time, location=location,
+                                master_timetable=master_timetable,
                             )
-                            .order_by("exam__date", "exam__start_time")
+                            for student_id in student_ids
+                        ])
+                        refresh_exams([exam.id], [master_timetable.id])
+                        # Seat only the new group's students; everyone
+                        # already in the slot keeps their room and seat.
+                        # This used to re-run allocation over every
+                        # StudentExam of the slot at this location for a
+                        # single group's drag-and-drop (see
+                        # schedules/reallocation.py).
+                        reallocate_slot_delta(
+                            location, date_formatted, start_time, end_time,
+                            added=student_exams,
                         )
-                        student_exams = student_exams.union(existing_student_exams)
-                        allocate_shared_rooms_updated(student_exams, location=location)
 
                     except Exception as e:
                         raise Exception(str(e))
@@ -1269,7 +1164,6 @@ class ExamViewSet(viewsets.ModelViewSet):
             existing_slot = request.data.get("slot")
             date = request.data.get("day")
             new_group_to_add = request.data.get("course_group")
-            timetable_id = request.data.get("timetable_id")
             date_formatted = parse_date(date)
             start_time = time.fromisoformat(existing_slot.get("start"))
             end_time = time.fromisoformat(existing_slot.get("end"))
@@ -1298,39 +1192,25 @@ class ExamViewSet(viewsets.ModelViewSet):
                 )
                 master_timetable.exams.add(exam)
 
-                # Update student exam dates
                 student_ids = Enrollment.objects.filter(
                     course=course, group=real_group.group
                 ).values_list("student_id", flat=True)
-                for student_id in student_ids:
-                    student_exam = StudentExam.objects.create(
-                        student_id=student_id, exam=exam
-                    )
-                    student_exam.save()
-                # Scoped to this course's own location — see the identical
-                # comment in schedule_new_exam above for why.
                 location = course.department.location
-                existing_student_exams = (
-                    StudentExam.objects.filter(
-                        exam__date=date_formatted,
-                        exam__start_time=start_time,
-                        exam__end_time=end_time,
-                        exam__group__course__department__location=location,
+                student_exams = StudentExam.objects.bulk_create([
+                    StudentExam(
+                        student_id=student_id, exam=exam,
+                        slot_date=date_formatted, slot_start=start_time,
+                        slot_end=end_time, location=location,
+                        master_timetable=master_timetable,
                     )
-                    .select_related("exam", "exam__group__course__semester", "student")
-                    .order_by("exam__date", "exam__start_time")
+                    for student_id in student_ids
+                ])
+                refresh_exams([exam.id], [master_timetable.id])
+                # Seat only the new students — see schedule_new_exam above.
+                reallocate_slot_delta(
+                    location, date_formatted, start_time, end_time,
+                    added=student_exams,
                 )
-                if timetable_id:
-                    existing_student_exams = existing_student_exams.filter(
-                        exam__mastertimetableexam__master_timetable_id=timetable_id
-                    )
-                student_exams = (
-                    StudentExam.objects.filter(student_id__in=student_ids, exam=exam)
-                    .select_related("exam", "exam__group__course__semester", "student")
-                    .order_by("exam__date", "exam__start_time")
-                )
-                student_exams = student_exams.union(existing_student_exams)
-                allocate_shared_rooms_updated(student_exams, location=location)
             except UnscheduledExam.DoesNotExist:
                 pass
 
@@ -1368,7 +1248,6 @@ class ExamViewSet(viewsets.ModelViewSet):
                 existing_slot = request.data.get("slot")
                 date = request.data.get("day")
                 new_group_to_add = request.data.get("course_group")
-                timetable_id = request.data.get("timetable_id")
                 date_formatted = parse_date(date)
                 weekday = date_formatted.strftime("%A")
                 exam = new_group_to_add.get("exam")
@@ -1380,43 +1259,26 @@ class ExamViewSet(viewsets.ModelViewSet):
                     raise ValueError("We can't schedule exam on Friday evening.")
 
                 try:
+                    # Only this exam's students move: their old seats are
+                    # freed, then they are placed into the new slot's free
+                    # seats. Nobody else in either slot is touched (see
+                    # schedules/reallocation.py).
+                    location = exam.group.course.department.location
+                    moving = list(StudentExam.objects.filter(exam=exam))
+                    reallocate_slot_delta(
+                        location, exam.date, exam.start_time, exam.end_time,
+                        removed=moving,
+                    )
                     exam.start_time = start_time
                     exam.end_time = end_time
                     exam.date = date_formatted
                     exam.save()
-                    student_ids = Enrollment.objects.filter(
-                        course=exam.group.course, group=exam.group
-                    ).values_list("student_id", flat=True)
-                    # Scoped to this course's own location — see the
-                    # identical comment in schedule_new_exam above.
-                    location = exam.group.course.department.location
-                    existing_student_exams = (
-                        StudentExam.objects.filter(
-                            exam__date=date_formatted,
-                            exam__start_time=start_time,
-                            exam__end_time=end_time,
-                            exam__group__course__department__location=location,
-                        )
-                        .select_related(
-                            "exam", "exam__group__course__semester", "student"
-                        )
-                        .order_by("exam__date", "exam__start_time")
+                    StudentExam.sync_slots([exam.id])
+                    refresh_exams([exam.id])
+                    reallocate_slot_delta(
+                        location, date_formatted, start_time, end_time,
+                        added=moving,
                     )
-                    if timetable_id:
-                        existing_student_exams = existing_student_exams.filter(
-                            exam__mastertimetableexam__master_timetable_id=timetable_id
-                        )
-                    student_exams = (
-                        StudentExam.objects.filter(
-                            student_id__in=student_ids, exam=exam
-                        )
-                        .select_related(
-                            "exam", "exam__group__course__semester", "student"
-                        )
-                        .order_by("exam__date", "exam__start_time")
-                    )
-                    student_exams = student_exams.union(existing_student_exams)
-                    allocate_shared_rooms_updated(student_exams, location=location)
 
                 except Exception as e:
                     raise Exception(str(e))
@@ -1478,36 +1340,17 @@ class ExamViewSet(viewsets.ModelViewSet):
                 )
                 unscheduled.groups.add(unscheduled_group)
                 unscheduled.save()
-                student_ids = Enrollment.objects.filter(
-                    course=course, group=exam.group
-                ).values_list("student_id", flat=True)
-
-                StudentExam.objects.filter(
-                    student_id__in=student_ids, exam=exam
-                ).select_related(
-                    "exam", "exam__group__course__semester", "student"
-                ).order_by(
-                    "exam__date", "exam__start_time"
-                ).delete()
-                # Scoped to this course's own location — see the identical
-                # comment in schedule_new_exam above.
-                location = course.department.location
-                existing_student_exams = (
-                    StudentExam.objects.filter(
-                        exam__date=date_formatted,
-                        exam__start_time=exam.start_time,
-                        exam__end_time=exam.end_time,
-                        exam__group__course__department__location=location,
-                    )
-                    .select_related("exam", "exam__group__course__semester", "student")
-                    .order_by("exam__date", "exam__start_time")
+                # Freed seats go to students of the slot still waiting
+                # for a room; nobody already seated moves (see
+                # schedules/reallocation.py). This used to re-run
+                # allocation over the whole slot at this location.
+                removed = list(StudentExam.objects.filter(exam=exam).only("id", "room_id"))
+                StudentExam.objects.filter(exam=exam).delete()
+                reallocate_slot_delta(
+                    course.department.location, exam.date, exam.start_time,
+                    exam.end_time, removed=removed,
                 )
-                if timetable_id:
-                    existing_student_exams = existing_student_exams.filter(
-                        exam__mastertimetableexam__master_timetable_id=timetable_id
-                    )
-
-                allocate_shared_rooms_updated(existing_student_exams, location=location)
+                refresh_exams([exam.id], [master_timetable.id])
                 master_timetable.exams.remove(exam)
                 exam.delete()
                 exams = UnscheduledExam.objects.all()
@@ -1580,7 +1423,7 @@ class ExamViewSet(viewsets.ModelViewSet):
             )
 
 
-class StudentExamViewSet(viewsets.ModelViewSet):
+class StudentExamViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = StudentExam.objects.select_related("student", "exam", "room").all()
     serializer_class = StudentExamSerializer
 
@@ -1659,6 +1502,15 @@ class StudentExamViewSet(viewsets.ModelViewSet):
             }
         )
 
+    def perform_update(self, serializer):
+        # StudentExam.save() re-copies the slot columns when the exam
+        # changes; both exams' occupancy indexes lose or gain a student.
+        old_exam_id = serializer.instance.exam_id
+        with transaction.atomic():
+            student_exam = serializer.save()
+            if student_exam.exam_id != old_exam_id:
+                refresh_exams([old_exam_id, student_exam.exam_id])
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         self.perform_destroy(instance)
@@ -1681,22 +1533,83 @@ class StudentExamViewSet(viewsets.ModelViewSet):
                 status=404,
             )
 
-        exams = list(StudentExam.objects.filter(student=student).select_related("exam"))
-        published_exam_ids = set(
-            MasterTimetableExam.objects.filter(
-                exam_id__in=[se.exam_id for se in exams],
-                master_timetable__status="PUBLISHED",
-            ).values_list("exam_id", flat=True)
-        )
-        published_exams = [se for se in exams if se.exam_id in published_exam_ids]
-        serializer = StudentExamSerializer(published_exams, many=True)
+        # Published exams only, pre-rendered: see exams/read_model.py.
+        return read_model.respond(request, read_model.STUDENT, student.id)
+
+    @action(detail=False, methods=["get"], url_path="pass-keys")
+    def pass_keys(self, request, *args, **kwargs):
+        """Public keys invigilator devices verify exam passes with."""
         return Response(
-            {
-                "success": True,
-                "data": serializer.data,
-                "message": "Fetched successfully",
-            }
+            {"success": True, "data": passes.public_key_data(), "message": "Fetched successfully"}
+        )
+
+    @action(detail=False, methods=["get"], url_path="my-passes")
+    def my_passes(self, request, *args, **kwargs):
+        try:
+            student = request.user.student
+        except Student.DoesNotExist:
+            return Response(
+                {"success": False, "message": "Student profile not found for this user."},
+                status=404,
+            )
+        data = list(
+            ExamPass.objects.filter(
+                student_exam__student=student,
+                student_exam__master_timetable__status="PUBLISHED",
+            )
+            .order_by("not_before")
+            .values("student_exam_id", "token", "not_before", "not_after")
         )
+        return Response({"success": True, "data": data, "message": "Fetched successfully"})
+
+    @action(detail=False, methods=["post"], url_path="attendance-batch")
+    def attendance_batch(self, request, *args, **kwargs):
+        """
+        Apply many sign-in/sign-out events at once (see exams/attendance.py):
+        {"events": [{"idempotency_key", "student_exam_id", "action",
+        "client_timestamp"}]}.
+        """
+        raw_events = request.data.get("events")
+        if not isinstance(raw_events, list):
+            return Response(
+                {"success": False, "message": "Expected a list of events"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(raw_events) > attendance.MAX_BATCH:
+            return Response(
+                {"success": False, "message": f"At most {attendance.MAX_BATCH} events per batch"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        events, rejected = attendance.parse_events(raw_events)
+        try:
+            result = attendance.apply_events(events, request.user)
+        except Exception as e:
+            logger.error(f"Error applying attendance batch: {e}", exc_info=True)
+            return Response(
+                {"success": False, "message": f"Error applying attendance: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        result["rejected"] = sorted(result["rejected"] + rejected, key=lambda r: r["index"])
+        return Response({"success": True, "data": result, "message": "Attendance updated."})
+
+    @action(detail=False, methods=["post"], url_path="pass-sync")
+    def pass_sync(self, request, *args, **kwargs):
+        """Upload scans made offline: {"scans": [{"pass", "action", "scanned_at"}]}."""
+        scans = request.data.get("scans")
+        if not isinstance(scans, list):
+            return Response(
+                {"success": False, "message": "Expected a list of scans"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            result = passes.sync_scans(scans, request.user)
+        except Exception as e:
+            logger.error(f"Error syncing exam pass scans: {e}", exc_info=True)
+            return Response(
+                {"success": False, "message": f"Error syncing scans: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        return Response({"success": True, "data": result, "message": "Scans synced."})
 
     @action(detail=False, methods=["get"], url_path="time")
     def get_exam_qcode_expiration_time(self, request, *args, **kwargs):
@@ -1854,20 +1767,9 @@ class StudentExamViewSet(viewsets.ModelViewSet):
             now = timezone.now().astimezone(tz)
             today = now.date()
 
-            student_exam = StudentExam.objects.filter(
-                exam__date=today,
-                instructor=instructor,
-                exam__status__in=["READY", "ONGOING"],
-            )
-            serializer = StudentExamSerializer(student_exam, many=True)
-
-            return Response(
-                {
-                    "success": True,
-                    "students": serializer.data,
-                    "message": "Fetched successfully",
-                },
-                status=status.HTTP_200_OK,
+            # Today's READY/ONGOING exams, pre-rendered: see exams/read_model.py.
+            return read_model.respond(
+                request, read_model.INSTRUCTOR_DAY, instructor.id, scope=today.isoformat()
             )
 
         except StudentExam.DoesNotExist:
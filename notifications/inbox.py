@@ -0,0 +1,136 @@
+"""
+Notification inbox: keyset pages, unread counts and compaction.
+
+A student collects hundreds of "Exam Update" rows per semester, and the
+list/unread endpoints used to serialise all of them on every poll. Pages
+are now cut with a keyset on (created_at, id), newest first:
+
+    WHERE user_id = %s [AND is_read = false]
+      AND (created_at, id) < (cursor created_at, cursor id)
+    ORDER BY created_at DESC, id DESC LIMIT n
+
+served by notification_inbox_idx / notification_unread_idx, so page 20
+costs what page 1 does and rows arriving meanwhile don't shift the pages.
+The cursor is opaque to clients (base64url of "created_at|id").
+
+The unread badge is read from NotificationCounter (see its docstring).
+
+compact_notifications() moves read notifications older than
+NOTIFICATION_ARCHIVE_AFTER_DAYS to NotificationArchive in batches, then
+recounts the counters from the rows, repairing any drift.
+"""
+import base64
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from notifications.models import Notification, NotificationArchive, NotificationCounter
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+COMPACTION_BATCH = 2000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(notification):
+    raw = f"{notification.created_at.isoformat()}|{notification.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit("|", 1)
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError(created_at)
+        return created_at, int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def page(user, cursor=None, limit=PAGE_SIZE, unread_only=False):
+    """One page of `user`'s inbox, newest first: (notifications, next_cursor)."""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    rows = Notification.objects.filter(user=user)
+    if unread_only:
+        rows = rows.filter(is_read=False)
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        rows = rows.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    rows = list(rows.order_by("-created_at", "-id")[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def unread_count(user):
+    return NotificationCounter.unread_for(user.pk)
+
+
+def _archive_batch(cutoff):
+    with transaction.atomic():
+        rows = list(
+            Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+            .select_for_update(skip_locked=True)
+            .order_by("id")
+            .values("id", "user_id", "title", "message", "created_at", "read_at")[:COMPACTION_BATCH]
+        )
+        if not rows:
+            return 0
+        NotificationArchive.objects.bulk_create(
+            [
+                NotificationArchive(
+                    notification_id=row["id"], user_id=row["user_id"], title=row["title"],
+                    message=row["message"], created_at=row["created_at"], read_at=row["read_at"],
+                )
+                for row in rows
+            ],
+            ignore_conflicts=True,
+        )
+        # Read rows only, so no counter moves.
+        Notification.objects.filter(id__in=[row["id"] for row in rows]).delete()
+        return len(rows)
+
+
+def recount():
+    """Set every existing counter to the real number of unread rows; returns rows fixed."""
+    actual = Coalesce(
+        Subquery(
+            Notification.objects.filter(user_id=OuterRef("user_id"), is_read=False)
+            .order_by()
+            .values("user_id")
+            .annotate(n=Count("id"))
+            .values("n")[:1]
+        ),
+        Value(0),
+    )
+    drifted = NotificationCounter.objects.exclude(unread=actual)
+    return drifted.update(unread=actual, updated_at=timezone.now())
+
+
+def compact_notifications(older_than_days=None):
+    """Archive old read notifications and recount; returns what was done."""
+    days = older_than_days if older_than_days is not None else getattr(
+        settings, "NOTIFICATION_ARCHIVE_AFTER_DAYS", 90
+    )
+    cutoff = timezone.now() - timedelta(days=days)
+    archived = 0
+    while True:
+        moved = _archive_batch(cutoff)
+        archived += moved
+        if moved < COMPACTION_BATCH:
+            break
+    fixed = recount()
+    logger.info(f"Archived {archived} notifications read before {cutoff}; recounted {fixed} counters")
+    return {"archived": archived, "counters_fixed": fixed}
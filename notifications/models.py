@@ -1,12 +1,95 @@
-from django.db import models
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 
 # Create your models here.
-from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
 User = get_user_model()
 
+
+class NotificationCounter(models.Model):
+    """
+    Unread notifications per user, so the badge is one primary-key read
+    instead of a COUNT over the user's whole history.
+
+    Kept in step by Notification.objects.bulk_create (every fan-out goes
+    through it), Notification.save/delete and the mark-read methods below,
+    in the same transaction as the rows they count. A user's row is created
+    from a real COUNT on first read (unread_for), so users who never look
+    cost nothing; writes only adjust rows that exist. compact_notifications
+    recounts every night, which repairs anything that bypassed the hooks
+    (queryset.update()/delete() on Notification).
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    unread = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def adjust(cls, deltas):
+        """Apply {user_id: change}; one UPDATE per distinct change."""
+        by_delta = defaultdict(list)
+        for user_id, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(user_id)
+        for delta, user_ids in by_delta.items():
+            cls.objects.filter(user_id__in=user_ids).update(
+                unread=Greatest(F('unread') + delta, 0), updated_at=timezone.now()
+            )
+
+    @classmethod
+    def unread_for(cls, user_id):
+        unread = cls.objects.filter(user_id=user_id).values_list('unread', flat=True).first()
+        if unread is not None:
+            return unread
+        unread = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, unread=unread)
+        except IntegrityError:
+            # Created concurrently; that row is as good as ours.
+            pass
+        return unread
+
+    def __str__(self):
+        return f"{self.unread} unread for user {self.user_id}"
+
+
+class NotificationQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        NotificationCounter.adjust(Counter(n.user_id for n in created if not n.is_read))
+        return created
+
+    def mark_read(self):
+        """Mark the unread rows of this queryset read; returns how many."""
+        return self._set_read(True)
+
+    def mark_unread(self):
+        return self._set_read(False)
+
+    def _set_read(self, is_read):
+        with transaction.atomic():
+            # Locked, so a concurrent call skips the rows this one flips
+            # and each row moves the counter once.
+            rows = list(
+                self.filter(is_read=not is_read).select_for_update().order_by().values_list('pk', 'user_id')
+            )
+            if not rows:
+                return 0
+            Notification.objects.filter(pk__in=[pk for pk, _ in rows]).update(
+                is_read=is_read, read_at=timezone.now() if is_read else None
+            )
+            sign = -1 if is_read else 1
+            changed = Counter(user_id for _, user_id in rows)
+            NotificationCounter.adjust({user_id: sign * n for user_id, n in changed.items()})
+            return len(rows)
+
+
 class Notification(models.Model):
     
     user = models.ForeignKey(
@@ -26,9 +109,42 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
     read_at = models.DateTimeField(null=True, blank=True)
- 
-     
-    
+
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Inbox pages: keyset on (created_at, id), all or unread only.
+            models.Index(fields=['user', '-created_at', '-id'], name='notification_inbox_idx'),
+            models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='notification_unread_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_is_read = instance.__dict__.get('is_read')
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        before = getattr(self, '_stored_is_read', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                delta = 0 if self.is_read else 1
+            elif before is None or before == self.is_read:
+                delta = 0
+            else:
+                delta = -1 if self.is_read else 1
+            NotificationCounter.adjust({self.user_id: delta})
+        self._stored_is_read = self.is_read
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            if not self.is_read:
+                NotificationCounter.adjust({self.user_id: -1})
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         # There is no `notification_type` field on this model (never was),
         # so get_notification_type_display() always raised AttributeError
@@ -36,13 +152,82 @@ class Notification(models.Model):
         return f"{self.title} for {self.user}"
     
     def mark_as_read(self):
-        if not self.is_read:
-            self.is_read = True
-            self.read_at = timezone.now()
-            self.save()
-    
+        # Through the queryset, so two concurrent clicks decrement once.
+        Notification.objects.filter(pk=self.pk).mark_read()
+        self._reload_read_state()
+
     def mark_as_unread(self):
-        if self.is_read:
-            self.is_read = False
-            self.read_at = None
-            self.save()
\ No newline at end of file
+        Notification.objects.filter(pk=self.pk).mark_unread()
+        self._reload_read_state()
+
+    def _reload_read_state(self):
+        self.refresh_from_db(fields=['is_read', 'read_at'])
+        self._stored_is_read = self.is_read
+
+class NotificationArchive(models.Model):
+    """
+    Read notifications moved out of Notification by compact_notifications
+    (see notifications/inbox.py) once older than
+    NOTIFICATION_ARCHIVE_AFTER_DAYS, so the inbox indexes only cover what
+    users still page through. Content is kept as it was, with the original id.
+    """
+
+    notification_id = models.BigIntegerField(unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    created_at = models.DateTimeField()
+    read_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='notification_archive_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived {self.title} for {self.user_id}"
+
+
+class EmailDelivery(models.Model):
+    """
+    One outbound email handed to the mail queue. Login no longer waits on
+    the provider's round trip, so the row doubles as the delivery handle
+    the client polls to find out whether its OTP actually went out.
+    """
+
+    STATUS_CHOICES = (
+        ("queued", "Queued"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='email_deliveries',
+        null=True,
+        blank=True,
+    )
+    purpose = models.CharField(max_length=50, default="generic")
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    message = models.TextField(blank=True)
+    # Key of notifications.utils.EMAIL_TEMPLATES; when set, the body is
+    # rendered at send time and `message` stays empty.
+    template = models.CharField(max_length=50, blank=True, default="")
+    from_email = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "purpose", "-created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.purpose} email to {self.recipient} ({self.status})"
@@ -2,7 +2,13 @@ from celery import shared_task
 from django.contrib.auth import get_user_model
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from notifications.utils import send_mail
+from django.utils import timezone
+from notifications.utils import EmailTemplateUnavailable, render_email, send_mail
+import logging
+
+logger = logging.getLogger(__name__)
+
+
 @shared_task
 def send_notification( message,user_id=None, broadcast=False):
     user = get_user_model().objects.get(id=user_id)
@@ -62,9 +68,72 @@ def  send_email_task( subject=None, message=None, from_email=None, recipient_lis
         )
 
 
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=2,
+    retry_backoff_max=60,
+    retry_jitter=True,
+    max_retries=5,
+)
+def deliver_email(self, delivery_id):
+    """
+    Send one queued EmailDelivery. Routed to the "mail_high" queue (see
+    CELERY_TASK_ROUTES) so OTP mail is never stuck behind bulk exam
+    notifications. Provider errors are retried with exponential backoff;
+    the row only flips to "failed" once the retries are exhausted.
+    """
+    from notifications.models import EmailDelivery
+
+    try:
+        delivery = EmailDelivery.objects.get(pk=delivery_id)
+    except EmailDelivery.DoesNotExist:
+        logger.warning(f"EmailDelivery {delivery_id} vanished before it could be sent")
+        return
+
+    if delivery.status == "sent":
+        return
+
+    EmailDelivery.objects.filter(pk=delivery.pk).update(
+        status="sending", attempts=self.request.retries + 1
+    )
+
+    try:
+        message = render_email(delivery)
+    except EmailTemplateUnavailable as e:
+        # Retrying cannot bring an expired OTP back.
+        EmailDelivery.objects.filter(pk=delivery.pk).update(status="failed", last_error=str(e))
+        logger.warning(f"Email delivery {delivery.id} not sent: {e}")
+        return
+
+    try:
+        send_mail(
+            subject=delivery.subject,
+            message=message,
+            from_email=delivery.from_email,
+            recipient_list=[delivery.recipient],
+        )
+    except Exception as e:
+        final = self.request.retries >= self.max_retries
+        EmailDelivery.objects.filter(pk=delivery.pk).update(
+            status="failed" if final else "queued",
+            last_error=str(e),
+        )
+        logger.error(
+            f"Email delivery {delivery.id} attempt {self.request.retries + 1} failed: {e}",
+            exc_info=final,
+        )
+        raise
 
+    EmailDelivery.objects.filter(pk=delivery.pk).update(
+        status="sent",
+        sent_at=timezone.now(),
+        last_error=None,
+    )
 
 
+@shared_task
+def compact_notifications():
+    from notifications.inbox import compact_notifications as compact
 
-
-
+    return compact()
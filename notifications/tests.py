@@ -1,3 +1,101 @@
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from notifications.inbox import compact_notifications
+from notifications.models import EmailDelivery, Notification, NotificationArchive, NotificationCounter
+from notifications.tasks import deliver_email
+from users.models import User
+
+
+class NotificationInboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="s@example.com", role="student")
+        self.other = User.objects.create(email="o@example.com", role="student")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _fan_out(self, n, user=None):
+        return Notification.objects.bulk_create(
+            [Notification(user=user or self.user, title="Exam Update", message=f"m{i}") for i in range(n)]
+        )
+
+    def test_unread_is_a_full_list_unless_paged(self):
+        self._fan_out(25)
+        self.assertEqual(len(self.client.get("/api/notifications/unread/").json()), 25)
+
+        response = self.client.get("/api/notifications/unread/", {"limit": 10})
+        self.assertEqual(len(response.json()), 10)
+        second = self.client.get("/api/notifications/unread/", {"limit": 20, "cursor": response["X-Next-Cursor"]})
+        self.assertEqual(len(second.json()), 15)
+        self.assertNotIn("X-Next-Cursor", second)
+
+    def test_keyset_pages_cover_the_inbox_once(self):
+        self._fan_out(7)
+        self._fan_out(3, self.other)
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 3}
+            if cursor:
+                params["cursor"] = cursor
+            body = self.client.get("/api/notifications/inbox/", params).json()["data"]
+            seen += [n["id"] for n in body["results"]]
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+        expected = list(
+            Notification.objects.filter(user=self.user).order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+        self.assertEqual(body["unread_count"], 7)
+        self.assertEqual(self.client.get("/api/notifications/inbox/", {"cursor": "nope"}).status_code, 400)
+
+    def test_counter_follows_fan_out_and_reads(self):
+        self._fan_out(2)
+        self.assertEqual(self.client.get("/api/notifications/unread_count/").json()["data"]["unread_count"], 2)
+        created = self._fan_out(3)
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread, 5)
+
+        self.client.post(f"/api/notifications/{created[0].id}/mark_as_read/", {"is_read": True}, format="json")
+        self.client.post(f"/api/notifications/{created[0].id}/mark_as_read/", {"is_read": True}, format="json")
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread, 4)
+
+        self.client.delete(f"/api/notifications/{created[1].id}/")
+        self.client.post("/api/notifications/mark_all_as_read/")
+        self.assertEqual(self.client.get("/api/notifications/unread_count/").json()["data"]["unread_count"], 0)
+        self.assertEqual(self.client.get("/api/notifications/unread/").json(), [])
+
+    def test_compaction_archives_old_read_rows_and_recounts(self):
+        old = self._fan_out(4)
+        Notification.objects.filter(id__in=[n.id for n in old[:3]]).update(
+            is_read=True, read_at=timezone.now(), created_at=timezone.now() - timedelta(days=200)
+        )
+        NotificationCounter.unread_for(self.user.pk)
+        NotificationCounter.objects.filter(user=self.user).update(unread=9)
+
+        result = compact_notifications(older_than_days=90)
+
+        self.assertEqual(result, {"archived": 3, "counters_fixed": 1})
+        self.assertEqual(NotificationArchive.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(list(Notification.objects.values_list("id", flat=True)), [old[3].id])
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread, 1)
+
+
+class EmailDeliveryRetryTests(TestCase):
+    def test_exhausted_retries_mark_the_delivery_failed(self):
+        delivery = EmailDelivery.objects.create(
+            recipient="s@example.com", subject="Exam reminder", message="See you at 08:00.",
+        )
+        # A directory cannot be appended to: every attempt fails.
+        with override_settings(EMAIL_TRANSPORT="file", EMAIL_FILE_PATH=tempfile.gettempdir()):
+            result = deliver_email.apply(args=[delivery.id])
+        self.assertTrue(result.failed())
+
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, "failed")
+        self.assertEqual(delivery.attempts, deliver_email.max_retries + 1)
+        self.assertTrue(delivery.last_error)
+        self.assertEqual(delivery.message, "See you at 08:00.")
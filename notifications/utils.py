@@ -1,18 +1,170 @@
 import resend
 import os
+import json
+import logging
+from datetime import datetime
+
+from django.conf import settings
 
 resend.api_key = os.environ.get("RESEND_API_KEY")
 
+logger = logging.getLogger(__name__)
+
+
+def _default_from_email():
+    return os.environ.get("RESEND_FROM_EMAIL", "onboarding@resend.dev")
+
+
+class ResendTransport:
+    """Production transport: one Resend API call per message."""
+
+    def send(self, subject, message, from_email, recipient_list):
+        resend.Emails.send({
+            "from": from_email,
+            "to": recipient_list,
+            "subject": subject,
+            "text": message,
+        })
+
+
+class ConsoleTransport:
+    """Writes the message to the log instead of sending it — local dev."""
+
+    def send(self, subject, message, from_email, recipient_list):
+        logger.info(
+            "[console email] from=%s to=%s subject=%s\n%s",
+            from_email, ", ".join(recipient_list), subject, message,
+        )
+
+
+class FileTransport:
+    """
+    Appends each message as one JSON line to EMAIL_FILE_PATH, so tests and
+    local setups can read back exactly what would have been sent (e.g. the
+    OTP code) without a provider account.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, "EMAIL_FILE_PATH", None) or "sent_emails.jsonl"
+
+    def send(self, subject, message, from_email, recipient_list):
+        record = {
+            "sent_at": datetime.now().isoformat(),
+            "from": from_email,
+            "to": list(recipient_list),
+            "subject": subject,
+            "text": message,
+        }
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(record) + "\n")
+
+
+EMAIL_TRANSPORTS = {
+    "resend": ResendTransport,
+    "console": ConsoleTransport,
+    "file": FileTransport,
+}
+
+
+def get_mail_transport(name=None):
+    """
+    Resolve the transport named by settings.EMAIL_TRANSPORT (default
+    "resend"). Unknown names fail loudly rather than silently dropping mail.
+    """
+    name = name or getattr(settings, "EMAIL_TRANSPORT", "resend")
+    try:
+        return EMAIL_TRANSPORTS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown EMAIL_TRANSPORT '{name}'. "
+            f"Expected one of: {', '.join(sorted(EMAIL_TRANSPORTS))}"
+        )
+
 
 def send_mail(subject, message, from_email, recipient_list, **kwargs):
 
-    from_email = from_email or os.environ.get("RESEND_FROM_EMAIL", "onboarding@resend.dev")
-    resend.Emails.send({
-        "from": from_email,
-        "to": recipient_list,
-        "subject": subject,
-        "text": message,
-    })
+    from_email = from_email or _default_from_email()
+    get_mail_transport().send(subject, message, from_email, recipient_list)
+
+
+class EmailTemplateUnavailable(Exception):
+    """The data a templated email renders from is gone (e.g. the OTP expired)."""
+
+
+def _render_otp(delivery):
+    from users.models import UserOtp
+
+    otp = UserOtp.objects.filter(user_id=delivery.user_id).select_related("user").first()
+    if otp is None or otp.is_verified or otp.is_expired():
+        raise EmailTemplateUnavailable("OTP expired or already used")
+    return (
+        f"Hello {otp.user.get_full_name() or otp.user.email},\n\n"
+        f"Your OTP code is: {otp.otp}\n\n"
+        f"It will expire in {UserOtp.OTP_EXPIRY_MINUTES} minutes.\n"
+        "If you did not request this, please ignore this email."
+    )
+
+
+# Bodies rendered at send time from the delivery's user, so a credential
+# such as an OTP is never written to EmailDelivery.message.
+EMAIL_TEMPLATES = {
+    "otp": _render_otp,
+}
+
+
+def render_email(delivery):
+    """
+    The body to send for a delivery: its stored message, or its template
+    rendered now. Raises EmailTemplateUnavailable if the template has
+    nothing left to render.
+    """
+    if not delivery.template:
+        return delivery.message
+    return EMAIL_TEMPLATES[delivery.template](delivery)
+
+
+def queue_email(subject, message, recipient, from_email=None, user=None, purpose="generic", template=None):
+    """
+    Record an EmailDelivery and hand it to the high-priority mail queue.
+    Returns the delivery row immediately; the caller never waits on the
+    provider. If the broker itself is unreachable the row is marked failed
+    straight away so the client's poll reports it instead of hanging on
+    "queued" forever.
+
+    With `template` (a key of EMAIL_TEMPLATES) the body is rendered from
+    `user` when the worker sends it and `message` is not stored.
+
+    Deferred imports for the same circular-import reason as below.
+    """
+    from django.db import transaction
+    from notifications.models import EmailDelivery
+    from notifications.tasks import deliver_email
+
+    if template is not None and template not in EMAIL_TEMPLATES:
+        raise ValueError(f"Unknown email template '{template}'")
+    delivery = EmailDelivery.objects.create(
+        user=user,
+        purpose=purpose,
+        recipient=recipient,
+        subject=subject,
+        message="" if template else message,
+        template=template or "",
+        from_email=from_email,
+    )
+
+    def _enqueue():
+        try:
+            deliver_email.delay(delivery.id)
+        except Exception as e:
+            logger.error(f"Could not enqueue email delivery {delivery.id}: {e}", exc_info=True)
+            EmailDelivery.objects.filter(pk=delivery.pk).update(
+                status="failed", last_error=f"Queue unavailable: {e}"
+            )
+            delivery.status = "failed"
+
+    # Only publish once the row is visible to the worker.
+    transaction.on_commit(_enqueue)
+    return delivery
 
 
 def notify_students_room_changed(changes):
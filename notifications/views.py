@@ -3,7 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import Notification
 from .serializers import NotificationSerializer, MarkAsReadSerializer
-from django.utils import timezone
+from . import inbox
 
 class NotificationViewSet(viewsets.ModelViewSet):
     queryset = Notification.objects.all()
@@ -11,7 +11,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user).order_by('-created_at')
+        return self.queryset.filter(user=self.request.user).order_by('-created_at', '-id')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -33,18 +33,66 @@ class NotificationViewSet(viewsets.ModelViewSet):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def _page(self, request, unread_only):
+        try:
+            limit = int(request.query_params.get('limit', inbox.PAGE_SIZE))
+        except ValueError:
+            limit = inbox.PAGE_SIZE
+        return inbox.page(
+            request.user, cursor=request.query_params.get('cursor'), limit=limit, unread_only=unread_only
+        )
+
     @action(detail=False, methods=['get'])
     def unread(self, request):
-        unread_notifications = self.get_queryset().filter(is_read=False)
-        serializer = self.get_serializer(unread_notifications, many=True)
-        return Response(serializer.data)
+        # The full unread list, as existing clients expect. With ?cursor=
+        # or ?limit= it is paged newest first instead; the body stays a
+        # plain list and the next page is in X-Next-Cursor.
+        if 'cursor' not in request.query_params and 'limit' not in request.query_params:
+            unread_notifications = self.get_queryset().filter(is_read=False)
+            return Response(self.get_serializer(unread_notifications, many=True).data)
+        try:
+            notifications, next_cursor = self._page(request, unread_only=True)
+        except inbox.InvalidCursor as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        response = Response(self.get_serializer(notifications, many=True).data)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
+
+    @action(detail=False, methods=['get'])
+    def inbox(self, request):
+        """
+        ?cursor=&limit=&unread=1 — a keyset page of the inbox (see
+        notifications/inbox.py) with the unread count.
+        """
+        unread_only = request.query_params.get('unread') in ('1', 'true', 'True')
+        try:
+            notifications, next_cursor = self._page(request, unread_only)
+        except inbox.InvalidCursor as e:
+            return Response(
+                {'success': False, 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({
+            'success': True,
+            'data': {
+                'results': self.get_serializer(notifications, many=True).data,
+                'next_cursor': next_cursor,
+                'unread_count': inbox.unread_count(request.user),
+            },
+            'message': 'Fetched successfully',
+        })
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        return Response({
+            'success': True,
+            'data': {'unread_count': inbox.unread_count(request.user)},
+            'message': 'Fetched successfully',
+        })
 
     @action(detail=False, methods=['post'])
     def mark_all_as_read(self, request):
-        updated = self.get_queryset().filter(is_read=False).update(
-            is_read=True,
-            read_at=timezone.now()
-        )
+        updated = self.get_queryset().mark_read()
         return Response({'status': f'{updated} notifications marked as read'})
     
 
@@ -0,0 +1,159 @@
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from rooms.models import Room
+from schedules.models import MasterTimetable
+from student.models import Student
+
+from . import exports
+
+STAFF_ROLES = ("admin", "instructor")
+
+
+def _timetable(timetable_id):
+    return MasterTimetable.objects.filter(pk=timetable_id).first()
+
+
+def _visible_to(user, timetable):
+    # Students only ever see published timetables.
+    return user.role in STAFF_ROLES or timetable.status == "PUBLISHED"
+
+
+class TimetableExportView(APIView):
+    """
+    GET /api/report/timetables/<id>/export/timetable.csv
+    GET /api/report/timetables/<id>/export/seating.xlsx
+        ?department=<id>   only that department's courses
+
+    Streamed (see report/exports.py); admins and instructors only.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, timetable_id, kind, fmt):
+        if request.user.role not in STAFF_ROLES:
+            return Response({"success": False, "message": "Admins and instructors only."}, status=403)
+        if kind not in exports.EXPORTS or fmt not in ("csv", "xlsx"):
+            return Response({"success": False, "message": "Unknown export."}, status=404)
+        timetable = _timetable(timetable_id)
+        if timetable is None:
+            return Response({"success": False, "message": "Timetable not found."}, status=404)
+        department_id = request.GET.get("department")
+        if department_id and not department_id.isdigit():
+            return Response({"success": False, "message": "Invalid department ID."}, status=400)
+
+        etag = exports.etag_for(timetable, kind, fmt, department_id or "")
+        cached = exports.not_modified(request, etag)
+        if cached:
+            return cached
+
+        columns, rows = exports.EXPORTS[kind]
+        rows = rows(timetable, department_id)
+        filename = f"{kind}_{timetable.id}{f'_dept{department_id}' if department_id else ''}.{fmt}"
+        if fmt == "csv":
+            return exports.streaming_response(
+                request, exports.csv_chunks(columns, rows), "text/csv; charset=utf-8", filename, etag,
+            )
+        return exports.streaming_response(
+            request, exports.xlsx_chunks(columns, rows, kind.capitalize()),
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", filename, etag,
+        )
+
+
+class StudentCalendarView(APIView):
+    """
+    GET /api/report/timetables/<id>/students/<student_id>.ics
+
+    A student's exams as an iCalendar feed. Either authenticated (students
+    get only their own feed) or, for calendar apps that cannot send a
+    token, with the ?token= from StudentCalendarLinkView.
+    """
+
+    permission_classes = [AllowAny]
+
+    def get(self, request, timetable_id, student_id):
+        timetable = _timetable(timetable_id)
+        student = Student.objects.filter(pk=student_id).select_related("user").first()
+        if timetable is None or student is None:
+            return Response({"success": False, "message": "Not found."}, status=404)
+
+        token = request.GET.get("token")
+        if token:
+            allowed = exports.feed_token_matches(token, timetable.id, student.id) and timetable.status == "PUBLISHED"
+        elif request.user.is_authenticated:
+            allowed = _visible_to(request.user, timetable) and (
+                request.user.role in STAFF_ROLES or student.user_id == request.user.id
+            )
+        else:
+            return Response({"success": False, "message": "Authentication required."}, status=401)
+        if not allowed:
+            return Response({"success": False, "message": "Not allowed."}, status=403)
+
+        etag = exports.etag_for(timetable, "student", student.id)
+        cached = exports.not_modified(request, etag)
+        if cached:
+            return cached
+        name = f"Exams {timetable.academic_year} - {student.reg_no}"
+        return exports.streaming_response(
+            request,
+            exports.ical_chunks(name, exports.student_events(timetable, student.id), timetable.updated_at),
+            "text/calendar; charset=utf-8", f"exams_{student.reg_no}.ics", etag,
+        )
+
+
+class StudentCalendarLinkView(APIView):
+    """
+    GET /api/report/timetables/<id>/calendar-link/[?student=<id>]
+
+    A subscribable feed URL for the requesting student (admins may pass
+    ?student=). The URL carries a signed token instead of credentials.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, timetable_id):
+        timetable = _timetable(timetable_id)
+        if timetable is None or not _visible_to(request.user, timetable):
+            return Response({"success": False, "message": "Timetable not found."}, status=404)
+        if request.user.role == "admin" and request.GET.get("student"):
+            student = Student.objects.filter(pk=request.GET["student"]).first()
+        else:
+            student = Student.objects.filter(user=request.user).first()
+        if student is None:
+            return Response({"success": False, "message": "Student not found."}, status=404)
+
+        path = reverse("student-calendar", args=[timetable.id, student.id])
+        url = request.build_absolute_uri(f"{path}?token={exports.feed_token(timetable.id, student.id)}")
+        return Response({"success": True, "data": {"url": url}, "message": "Calendar link created"})
+
+
+class RoomCalendarView(APIView):
+    """
+    GET /api/report/timetables/<id>/rooms/<room_id>.ics
+
+    The exams held in a room, one event per exam with its head count.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, timetable_id, room_id):
+        if request.user.role not in STAFF_ROLES:
+            return Response({"success": False, "message": "Admins and instructors only."}, status=403)
+        timetable = _timetable(timetable_id)
+        room = Room.objects.filter(pk=room_id).first()
+        if timetable is None or room is None:
+            return Response({"success": False, "message": "Not found."}, status=404)
+
+        etag = exports.etag_for(timetable, "room", room.id)
+        cached = exports.not_modified(request, etag)
+        if cached:
+            return cached
+        name = f"{room.name} exams {timetable.academic_year}"
+        return exports.streaming_response(
+            request,
+            exports.ical_chunks(name, exports.room_events(timetable, room.id), timetable.updated_at),
+            "text/calendar; charset=utf-8", f"room_{room.id}_{timezone.now():%Y%m%d}.ics", etag,
+        )
@@ -0,0 +1,324 @@
+"""
+Machine-readable timetable exports: CSV, XLSX and iCalendar.
+
+The PDFs in report/views.py build the whole document in memory. These
+exports stream instead, so memory stays flat whatever the timetable size:
+
+    CSV     rows from .values_list().iterator(), written as they are read
+    XLSX    openpyxl write-only workbook (rows go straight to a temporary
+            file), then the file is streamed in chunks
+    iCal    one VEVENT per exam, per student or per room
+
+Under daphne (ASGI) a synchronous iterator handed to StreamingHttpResponse
+is read into a list before anything is sent, so on ASGI requests the
+chunks are pulled from the database in the request's sync thread and
+handed over asynchronously (_stream).
+
+Every export carries an ETag built from the timetable's data_version
+(bumped whenever its exams, rooms or seats change, see MasterTimetable)
+and the request's parameters; a matching If-None-Match gets a 304
+without touching the rows.
+"""
+import csv
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+from openpyxl import Workbook
+from pytz import timezone as pytz_timezone
+
+from exams.models import Exam, StudentExam
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 2000
+FILE_CHUNK = 64 * 1024
+FEED_SALT = "report.exports.student-feed"
+
+TIMETABLE_COLUMNS = [
+    ("Date", "date"),
+    ("Start", "start_time"),
+    ("End", "end_time"),
+    ("Slot", "slot_name"),
+    ("Course code", "group__course__code"),
+    ("Course", "group__course__title"),
+    ("Group", "group__group_name"),
+    ("Department", "group__course__department__name"),
+    ("Instructor first name", "group__instructor__first_name"),
+    ("Instructor last name", "group__instructor__last_name"),
+    ("Room", "room__name"),
+    ("Students", "students"),
+    ("Status", "status"),
+]
+
+SEATING_COLUMNS = [
+    ("Date", "exam__date"),
+    ("Start", "exam__start_time"),
+    ("End", "exam__end_time"),
+    ("Course code", "exam__group__course__code"),
+    ("Group", "exam__group__group_name"),
+    ("Registration number", "student__reg_no"),
+    ("First name", "student__user__first_name"),
+    ("Last name", "student__user__last_name"),
+    ("Room", "room__name"),
+    ("Seat row", "seat_row"),
+    ("Seat column", "seat_column"),
+]
+
+
+# ----------------------------------------------------------------------
+# Rows
+# ----------------------------------------------------------------------
+
+def timetable_exams(timetable, department_id=None):
+    # Scoped as TimetablePDFView scopes its exams.
+    exams = Exam.objects.filter(
+        mastertimetableexam__master_timetable_id=timetable.id, master_timetable=timetable,
+    )
+    if department_id:
+        exams = exams.filter(group__course__department_id=department_id)
+    return exams
+
+
+def timetable_rows(timetable, department_id=None):
+    return (
+        timetable_exams(timetable, department_id)
+        .annotate(students=Count("studentexam"))
+        .order_by("date", "start_time", "group__course__code", "group__group_name", "id")
+        .values_list(*[field for _, field in TIMETABLE_COLUMNS])
+        .iterator(chunk_size=CHUNK_ROWS)
+    )
+
+
+def seating_rows(timetable, department_id=None):
+    rows = StudentExam.objects.filter(exam__in=timetable_exams(timetable, department_id))
+    return (
+        rows.order_by("exam__date", "exam__start_time", "room__name", "seat_row", "seat_column", "student__reg_no")
+        .values_list(*[field for _, field in SEATING_COLUMNS])
+        .iterator(chunk_size=CHUNK_ROWS)
+    )
+
+
+EXPORTS = {
+    "timetable": (TIMETABLE_COLUMNS, timetable_rows),
+    "seating": (SEATING_COLUMNS, seating_rows),
+}
+
+
+# ----------------------------------------------------------------------
+# Streaming and caching
+# ----------------------------------------------------------------------
+
+def etag_for(timetable, *parts):
+    raw = ":".join(str(p) for p in (
+        timetable.id, timetable.data_version, timetable.status, timetable.updated_at.isoformat(), *parts
+    ))
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def not_modified(request, etag):
+    """A 304 for `etag` if the client already has it, else None."""
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        tags = parse_etags(if_none_match)
+        if "*" in tags or etag in tags or f"W/{etag}" in tags:
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+    return None
+
+
+def _batched(chunks, size=32):
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _stream(request, chunks):
+    """Sync iterator for WSGI; on ASGI, an async one over the same chunks."""
+    # DRF's Request wraps the HttpRequest.
+    if not isinstance(getattr(request, "_request", request), ASGIRequest):
+        return chunks
+    batches = _batched(chunks)
+
+    async def _aiter():
+        # thread_sensitive: the database cursor behind `chunks` lives on
+        # the request's sync thread.
+        pull = sync_to_async(lambda: next(batches, None), thread_sensitive=True)
+        while True:
+            batch = await pull()
+            if batch is None:
+                return
+            for chunk in batch:
+                yield chunk
+
+    return _aiter()
+
+
+def streaming_response(request, chunks, content_type, filename, etag):
+    response = StreamingHttpResponse(_stream(request, chunks), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_chunks(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([title for title, _ in columns]).encode("utf-8")
+    for row in rows:
+        yield writer.writerow(row).encode("utf-8")
+
+
+def xlsx_chunks(columns, rows, title):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title[:31])
+    sheet.append([heading for heading, _ in columns])
+    for row in rows:
+        sheet.append(row)
+    handle, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(handle)
+    try:
+        workbook.save(path)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(FILE_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+# ----------------------------------------------------------------------
+# iCalendar
+# ----------------------------------------------------------------------
+
+def _ical_text(value):
+    return (
+        str(value or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line):
+    # RFC 5545: lines of at most 75 octets, continued with a leading space.
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line + "\r\n"
+    parts, current = [], b""
+    for char in line:
+        encoded = char.encode("utf-8")
+        if len(current) + len(encoded) > (75 if not parts else 74):
+            parts.append(current)
+            current = b""
+        current += encoded
+    parts.append(current)
+    return "\r\n ".join(p.decode("utf-8") for p in parts) + "\r\n"
+
+
+def _utc(day, moment, tz):
+    local = tz.localize(datetime.combine(day, moment))
+    return local.astimezone(pytz_timezone("UTC")).strftime("%Y%m%dT%H%M%SZ")
+
+
+def ical_chunks(name, events, stamp):
+    """
+    events: iterable of (uid, date, start, end, summary, location, description).
+    `stamp` (DTSTAMP) is the timetable's last update, so the feed is
+    byte-identical until the data changes.
+    """
+    tz = pytz_timezone(settings.TIME_ZONE)
+    dtstamp = stamp.astimezone(pytz_timezone("UTC")).strftime("%Y%m%dT%H%M%SZ")
+    yield "".join(_fold(line) for line in (
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//AUCA//Exam Management System//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_ical_text(name)}",
+    )).encode("utf-8")
+    for uid, day, start, end, summary, location, description in events:
+        yield "".join(_fold(line) for line in (
+            "BEGIN:VEVENT",
+            f"UID:{uid}",
+            f"DTSTAMP:{dtstamp}",
+            f"DTSTART:{_utc(day, start, tz)}",
+            f"DTEND:{_utc(day, end, tz)}",
+            f"SUMMARY:{_ical_text(summary)}",
+            f"LOCATION:{_ical_text(location)}",
+            f"DESCRIPTION:{_ical_text(description)}",
+            "END:VEVENT",
+        )).encode("utf-8")
+    yield b"END:VCALENDAR\r\n"
+
+
+def student_events(timetable, student_id):
+    rows = (
+        StudentExam.objects.filter(exam__in=timetable_exams(timetable), student_id=student_id)
+        .exclude(exam__status="CANCELLED")
+        .order_by("exam__date", "exam__start_time", "id")
+        .values_list(
+            "id", "exam__date", "exam__start_time", "exam__end_time",
+            "exam__group__course__code", "exam__group__course__title", "exam__group__group_name",
+            "room__name", "seat_row", "seat_column",
+        )
+        .iterator(chunk_size=CHUNK_ROWS)
+    )
+    for se_id, day, start, end, code, title, group, room, row, column in rows:
+        seat = f", row {row} seat {column}" if row and column else ""
+        yield (
+            f"studentexam-{se_id}@exams", day, start, end,
+            f"{code} {title} exam", f"{room or 'Room to be announced'}{seat}",
+            f"Group {group}",
+        )
+
+
+def room_events(timetable, room_id):
+    rows = (
+        StudentExam.objects.filter(exam__in=timetable_exams(timetable), room_id=room_id)
+        .exclude(exam__status="CANCELLED")
+        .values("exam_id", "exam__date", "exam__start_time", "exam__end_time",
+                "exam__group__course__code", "exam__group__group_name", "room__name")
+        .annotate(students=Count("id"))
+        .order_by("exam__date", "exam__start_time", "exam_id")
+        .values_list(
+            "exam_id", "exam__date", "exam__start_time", "exam__end_time",
+            "exam__group__course__code", "exam__group__group_name", "room__name", "students",
+        )
+        .iterator(chunk_size=CHUNK_ROWS)
+    )
+    for exam_id, day, start, end, code, group, room, students in rows:
+        yield (
+            f"exam-{exam_id}-room-{room_id}@exams", day, start, end,
+            f"{code} ({group}) exam", room, f"{students} students",
+        )
+
+
+def feed_token(timetable_id, student_id):
+    return signing.dumps([timetable_id, student_id], salt=FEED_SALT, compress=True)
+
+
+def feed_token_matches(token, timetable_id, student_id):
+    try:
+        return signing.loads(token, salt=FEED_SALT) == [timetable_id, student_id]
+    except signing.BadSignature:
+        return False
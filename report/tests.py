@@ -1,3 +1,92 @@
-from django.test import TestCase
+import csv
+import io
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory, TestCase
+from openpyxl import load_workbook
+from rest_framework.test import APIClient, force_authenticate
+
+from exams.models import StudentExam
+from report.export_views import TimetableExportView
+from sharedapp.testing import make_admin, make_campus, make_exam, make_group, make_room, make_student, make_timetable
+
+
+class TimetableExportTests(TestCase):
+    def setUp(self):
+        campus = make_campus()
+        # The comma exercises CSV quoting and iCalendar escaping.
+        group = make_group(campus, title="Intro, CS")
+        self.room = make_room(campus.location, capacity=40, rows=5, columns=8)
+        self.admin = make_admin()
+        self.timetable = make_timetable(campus.location, self.admin, status="PUBLISHED")
+        exam = make_exam(group, master_timetable=self.timetable)
+        self.timetable.exams.add(exam)
+        self.students = []
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                student = make_student(i)
+                StudentExam.objects.create(student=student, exam=exam, room=self.room, seat_row=1, seat_column=i + 1)
+                self.students.append(student)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.base = f"/api/report/timetables/{self.timetable.id}"
+
+    def test_csv_and_xlsx_exports_with_etag(self):
+        response = self.client.get(f"{self.base}/export/seating.csv")
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][5], "Registration number")
+        self.assertEqual([r[5] for r in rows[1:]], ["R0", "R1", "R2"])
+
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(f"{self.base}/export/seating.csv", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # A seat change bumps the timetable's data version.
+        se = StudentExam.objects.get(student=self.students[0])
+        se.seat_column = 8
+        with self.captureOnCommitCallbacks(execute=True):
+            se.save()
+        self.assertEqual(self.client.get(f"{self.base}/export/seating.csv", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        response = self.client.get(f"{self.base}/export/timetable.xlsx")
+        sheet = load_workbook(io.BytesIO(b"".join(response.streaming_content))).active
+        values = list(sheet.values)
+        self.assertEqual(values[1][4:6], ("CS101", "Intro, CS"))
+        self.assertEqual(values[1][11], 3)
+
+    def test_student_feed_own_only_and_by_token(self):
+        student = self.students[1]
+        url = f"{self.base}/students/{student.id}.ics"
+        self.client.force_authenticate(self.students[0].user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_authenticate(student.user)
+        body = b"".join(self.client.get(url).streaming_content).decode()
+        self.assertIn("DTSTART:20250113T060000Z", body)
+        self.assertIn("SUMMARY:CS101 Intro\\, CS exam", body)
+        self.assertIn("row 1 seat 2", body)
+
+        link = self.client.get(f"{self.base}/calendar-link/").json()["data"]["url"]
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(url).status_code, 401)
+        self.assertEqual(anonymous.get(link).status_code, 200)
+        self.assertEqual(anonymous.get(f"{self.base}/students/{self.students[0].id}.ics?{link.split('?')[1]}").status_code, 403)
+
+    def test_room_feed(self):
+        response = self.client.get(f"{self.base}/rooms/{self.room.id}.ics")
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(body.count("BEGIN:VEVENT"), 1)
+        self.assertIn("DESCRIPTION:3 students", body)
+
+    def test_asgi_request_gets_an_async_stream(self):
+        # Under daphne a sync iterator would be read whole before sending.
+        request = AsyncRequestFactory().get(f"{self.base}/export/seating.csv")
+        force_authenticate(request, self.admin)
+        response = TimetableExportView.as_view()(
+            request, timetable_id=self.timetable.id, kind="seating", fmt="csv"
+        )
+        self.assertTrue(response.is_async)
+
+        async def _read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(async_to_sync(_read)().count(b"\r\n"), 4)
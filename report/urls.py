@@ -1,5 +1,11 @@
 from django.urls import path, include
 from .views import TimetablePDFView
+from .export_views import (
+    TimetableExportView,
+    StudentCalendarView,
+    StudentCalendarLinkView,
+    RoomCalendarView,
+)
 from .attendance_views import (
     AttendanceStatsView,
     ExamAttendanceListView,
@@ -24,4 +30,24 @@ urlpatterns = [
         InstructorAttendancePDFView.as_view(),
         name="instructor-attendance-pdf",
     ),
+    path(
+        "timetables/<int:timetable_id>/export/<str:kind>.<str:fmt>",
+        TimetableExportView.as_view(),
+        name="timetable-export",
+    ),
+    path(
+        "timetables/<int:timetable_id>/students/<int:student_id>.ics",
+        StudentCalendarView.as_view(),
+        name="student-calendar",
+    ),
+    path(
+        "timetables/<int:timetable_id>/calendar-link/",
+        StudentCalendarLinkView.as_view(),
+        name="student-calendar-link",
+    ),
+    path(
+        "timetables/<int:timetable_id>/rooms/<int:room_id>.ics",
+        RoomCalendarView.as_view(),
+        name="room-calendar",
+    ),
 ]
@@ -4,11 +4,11 @@ from django.shortcuts import render
 from rest_framework import viewsets, status, permissions
 from rest_framework.response import Response
 
-from config.utils import JsonConfigManager
 from courses.serializers import CourseSerializer, SemesterSerializer
 from enrollments.models import Enrollment
 from exams.serializers import StudentExamSerializer
 from schedules.models import MasterTimetable
+from schedules.slot_calendar import get_slot_calendar
 
 from semesters.models import Semester
 from .models import Location, Room, RoomAllocationSwitch, RoomOutOfService
@@ -21,6 +21,7 @@ from .serializers import (
     RoomOutOfServiceSerializer,
 )
 from django.contrib.auth import get_user_model
+from exams import attendance, passes
 from exams.models import Exam, StudentExam
 from notifications.utils import notify_students_room_changed
 from django.db.models import Count
@@ -217,7 +218,7 @@ class RoomViewSet(viewsets.ModelViewSet):
                 exam_date = student_exams[0].exam.date
                 exam_start_time = student_exams[0].exam.start_time
                 current_room_occupancy = StudentExam.objects.filter(
-                    room=room, exam__date=exam_date, exam__start_time=exam_start_time
+                    room=room, slot_date=exam_date, slot_start=exam_start_time
                 ).count()
 
                 total_required_capacity = student_exams.count() + current_room_occupancy
@@ -304,6 +305,7 @@ class RoomViewSet(viewsets.ModelViewSet):
                         room_changes.append((student_exam, old_room, room))
                     student_exam.room = room
                     student_exam.save()
+                passes.request_reissue(student_exam_ids=[se.id for se in student_exams])
                 if room_changes:
                     notify_students_room_changed(room_changes)
                 return Response(
@@ -385,7 +387,7 @@ class RoomViewSet(viewsets.ModelViewSet):
 
                 # ✅ Calculate current occupancy in the target room
                 current_room_occupancy = StudentExam.objects.filter(
-                    room=room, exam__date=exam.date, exam__start_time=exam.start_time
+                    room=room, slot_date=exam.date, slot_start=exam.start_time
                 ).count()
 
                 total_required_capacity = student_exams.count() + current_room_occupancy
@@ -473,6 +475,7 @@ class RoomViewSet(viewsets.ModelViewSet):
                         room_changes.append((student_exam, existingRoom, room))
                     student_exam.room = room
                     student_exam.save()
+                passes.request_reissue(student_exam_ids=[se.id for se in student_exams])
                 if room_changes:
                     notify_students_room_changed(room_changes)
                 return Response(
@@ -526,7 +529,7 @@ class RoomViewSet(viewsets.ModelViewSet):
         student_exams = (
             StudentExam.objects.filter(
                 room__isnull=False,
-                exam__group__course__department__location_id=recent_timetable.location.id,
+                location_id=recent_timetable.location.id,
             )
             .values(
                 "room__id",
@@ -559,7 +562,7 @@ class RoomViewSet(viewsets.ModelViewSet):
             StudentExam.objects.filter(
                 room__isnull=False,
                 instructor__isnull=False,
-                exam__group__course__department__location_id=recent_timetable.location.id,
+                location_id=recent_timetable.location.id,
             )
             .values(
                 "room__id",
@@ -676,9 +679,9 @@ class RoomViewSet(viewsets.ModelViewSet):
 
         student_exams = StudentExam.objects.filter(
             room=room,
-            exam__date=exam_date,
-            exam__start_time=start_time,
-            exam__end_time=end_time,
+            slot_date=exam_date,
+            slot_start=start_time,
+            slot_end=end_time,
         ).select_related("student__user", "exam__group__course")
 
         if not room.has_seat_layout():
@@ -773,7 +776,7 @@ class RoomViewSet(viewsets.ModelViewSet):
         bookings_by_date = defaultdict(list)
         exam_rows = (
             StudentExam.objects.filter(
-                room=room, exam__date__range=(start_date, end_date)
+                room=room, slot_date__range=(start_date, end_date)
             )
             .values(
                 "exam__date", "exam__slot_name", "exam__start_time", "exam__end_time",
@@ -1000,10 +1003,6 @@ class RoomViewSet(viewsets.ModelViewSet):
             start_time = None
             end_time = None
 
-            config_manager = JsonConfigManager()
-            config = config_manager.read_config()
-            time_config = config.get("time_constraints", {})
-            time_slots = time_config.get("time_slots", [])
             if not timetable_id:
                 return Response({"error": "timetable_id is required."}, status=400)
 
@@ -1013,13 +1012,9 @@ class RoomViewSet(viewsets.ModelViewSet):
                 ).get(pk=timetable_id)
             except MasterTimetable.DoesNotExist:
                 return Response({"error": "Timetable not found."}, status=404)
-            for slot in time_slots:
-                if slot.get("name", "").lower() == (slot_name or "").lower():
-                    start_time = slot.get("start_time")
-                    end_time = slot.get("end_time")
-                    start_time = time.fromisoformat(start_time)
-                    end_time = time.fromisoformat(end_time)
-                    break
+            slot = get_slot_calendar().slot(slot_name)
+            if slot:
+                start_time, end_time = slot.start, slot.end
 
             if not instructor_id or not room_id or not date or not slot_name:
                 return Response(
@@ -1051,9 +1046,9 @@ class RoomViewSet(viewsets.ModelViewSet):
                 )
 
             already_assigned = StudentExam.objects.filter(
-                exam__date=date,
-                exam__start_time=start_time,
-                exam__end_time=end_time,
+                slot_date=date,
+                slot_start=start_time,
+                slot_end=end_time,
                 instructor=instructor,
                 student__department__location=timetable.location,
             ).exists()
@@ -1072,9 +1067,9 @@ class RoomViewSet(viewsets.ModelViewSet):
 
             student_exams_count = StudentExam.objects.filter(
                 room__id=int(room_id),
-                exam__date=date,
-                exam__start_time=start_time,
-                exam__end_time=end_time,
+                slot_date=date,
+                slot_start=start_time,
+                slot_end=end_time,
                 student__department__location=timetable.location,
             ).update(instructor=instructor)
 
@@ -1207,8 +1202,11 @@ class RoomViewSet(viewsets.ModelViewSet):
             all_paid = total_paid >= total_to_pay
 
             if all_paid:
-                student_exam.signin_attendance = True
-                student_exam.save()
+                # Through the batch path: one-column UPDATE, live count delta.
+                attendance.apply_events(
+                    [attendance.Event(0, None, student_exam.id, "signin", timezone.now())],
+                    request.user,
+                )
                 return Response(
                     {
                         "success": True,
@@ -0,0 +1,189 @@
+"""
+End-to-end scheduler benchmark on synthetic data (see the
+benchmark_scheduler command).
+
+For each scale, inside one transaction that is rolled back at the end:
+
+    dataset                                 schedules/synthetic.generate()
+    find_compatible_courses_within_group    colouring of the campus' courses
+    generate_exam_schedule                  the whole generation run ...
+    allocate_shared_rooms                   ... and its room allocation step,
+                                            timed from the progress callback
+    verify_exam_schedule
+    timetable_pdf, seating_pdf,             the report/ builders, on the
+    attendance_pdf                          generated timetable
+
+Generation runs for the campus with the most courses, over EXAM_DAYS days
+from a fixed Monday, so two runs on different commits schedule the same
+problem. verify_exam_schedule reads every StudentExam in the database, so
+compare reports taken on the same database.
+
+Nothing is left behind: the rollback drops the rows, and the enrollment
+snapshot and occupancy caches built from them are invalidated afterwards.
+"""
+import logging
+import platform
+import subprocess
+import time as time_mod
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from enrollments.snapshot import bump_version
+from exams.models import Exam, StudentExam
+from schedules import occupancy, synthetic
+from schedules.models import MasterTimetable
+from schedules.utils import (
+    find_compatible_courses_within_group, generate_exam_schedule,
+    get_exam_slots, verify_exam_schedule,
+)
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+SCALES = (1, 5, 20)
+EXAM_DAYS = 21
+START_DATE = date(2030, 1, 7)
+ALLOCATION_STEP = 6
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class _Timer:
+    def __init__(self):
+        self.timings = {}
+
+    def __call__(self, name, func, *args, **kwargs):
+        started = time_mod.perf_counter()
+        result = func(*args, **kwargs)
+        self.timings[name] = round(time_mod.perf_counter() - started, 4)
+        return result
+
+
+def _slots(start, end):
+    # Same shape as the generate_slots endpoint returns to the UI.
+    slots = {}
+    for index, (day, label, slot_start, slot_end) in enumerate(get_exam_slots(start, end)):
+        slots.setdefault(day.isoformat(), []).append((index, label, slot_start, slot_end))
+    return slots
+
+
+def _pdfs(timer, timetable):
+    from report.attendance_views import _build_attendance_pdf
+    from report.views import _build_seating_pdf, _build_timetable_pdf
+
+    exams = Exam.objects.filter(
+        mastertimetableexam__master_timetable_id=timetable.id, master_timetable=timetable,
+    )
+    student_exams = (
+        StudentExam.objects.filter(
+            exam__mastertimetableexam__master_timetable_id=timetable.id,
+            exam__master_timetable=timetable,
+        )
+        .select_related("student__user", "room", "exam", "exam__group", "exam__group__course")
+        .order_by("exam__date", "exam__start_time", "student__reg_no")
+    )
+    sizes = {}
+    sizes["timetable_pdf"] = len(timer("timetable_pdf", _build_timetable_pdf, timetable, exams))
+    sizes["seating_pdf"] = len(timer("seating_pdf", _build_seating_pdf, timetable, student_exams))
+    sizes["attendance_pdf"] = len(timer("attendance_pdf", _build_attendance_pdf, timetable, student_exams))
+    return sizes
+
+
+def run_scale(scale, seed=0, pdfs=True, **overrides):
+    """Benchmark one scale; returns its report entry."""
+    timer = _Timer()
+    phases = {}
+    timetable_id = None
+
+    def progress(step, total, message, stats=None):
+        phases.setdefault(step, time_mod.perf_counter())
+
+    with transaction.atomic():
+        summary = timer(
+            "dataset", synthetic.generate, scale=scale, seed=seed,
+            prefix=f"BENCH{seed}", start_date=START_DATE, **overrides,
+        )
+        location_id, course_ids = max(summary["course_ids"].items(), key=lambda item: len(item[1]))
+
+        compatible, _ = timer(
+            "find_compatible_courses_within_group",
+            find_compatible_courses_within_group, course_ids, location_id,
+        )
+
+        admin = User.objects.create(
+            email=f"bench{seed}-admin@synthetic.invalid", role="admin", password="!",
+        )
+        timetable = MasterTimetable.objects.create(
+            name=f"Benchmark x{scale}", academic_year=str(START_DATE.year),
+            generated_by=admin, category="Benchmark",
+            start_date=START_DATE, end_date=START_DATE + timedelta(days=EXAM_DAYS - 1),
+            location_id=location_id, semester_id=summary["semester_id"],
+        )
+        timetable_id = timetable.id
+        exams, unaccommodated, unscheduled, _, errors, stats = timer(
+            "generate_exam_schedule", generate_exam_schedule,
+            slots=_slots(timetable.start_date, timetable.end_date),
+            course_ids=course_ids, master_timetable=timetable, location=location_id,
+            constraints={}, progress_callback=progress,
+        )
+        finished = time_mod.perf_counter()
+        if ALLOCATION_STEP in phases:
+            timer.timings["allocate_shared_rooms"] = round(
+                phases.get(ALLOCATION_STEP + 1, finished) - phases[ALLOCATION_STEP], 4
+            )
+
+        conflicts = timer("verify_exam_schedule", verify_exam_schedule)
+        pdf_bytes = _pdfs(timer, timetable) if pdfs and exams else {}
+
+        transaction.set_rollback(True)
+
+    bump_version()
+    occupancy.invalidate_timetable(timetable_id)
+
+    return {
+        "scale": scale,
+        "rows": summary["rows"],
+        "campus_courses": len(course_ids),
+        "timings": timer.timings,
+        "results": {
+            "compatible_groups": len(compatible),
+            "exams_created": len(exams),
+            "unscheduled_groups": len(unscheduled),
+            "unaccommodated": len(unaccommodated or []),
+            "conflicts": len(conflicts),
+            "errors": errors,
+            "objective": stats.get("objective"),
+            "pdf_bytes": pdf_bytes,
+        },
+    }
+
+
+def run(scales=SCALES, seed=0, pdfs=True, on_scale=None, **overrides):
+    """Benchmark every scale; returns the JSON-serialisable report."""
+    report = {
+        "commit": _commit(),
+        "created_at": timezone.now().isoformat(),
+        "vendor": connection.vendor,
+        "python": platform.python_version(),
+        "seed": seed,
+        "production_size": synthetic.sizes_for(1, **overrides),
+        "scales": [],
+    }
+    for scale in scales:
+        logger.info(f"Benchmarking scheduler at x{scale}")
+        entry = run_scale(scale, seed=seed, pdfs=pdfs, **overrides)
+        report["scales"].append(entry)
+        if on_scale:
+            on_scale(entry)
+    return report
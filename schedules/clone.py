@@ -0,0 +1,331 @@
+"""
+Cloning and diffing MasterTimetables in SQL.
+
+clone_timetable() starts a new DRAFT from an existing timetable without a
+generate_exam_schedule run: its Exam, StudentExam (room and seat
+included), MasterTimetableExam, UnscheduledExam and UnscheduledExamGroup
+rows are copied with one INSERT ... SELECT per table, nothing is loaded
+into Python. New ids are handed out in SQL through temporary id maps
+(old_id -> new_id): on PostgreSQL from each table's own sequence with
+nextval(), elsewhere as MAX(id) + ROW_NUMBER(). Per-sitting state
+(StudentExam status and sign-in/sign-out) starts fresh in the copy.
+
+diff_timetables() compares two timetables with joins, matching exams by
+course group and students by (student, group):
+
+    moved      exams on a different date or time
+    added      groups scheduled only in the second timetable
+    removed    groups scheduled only in the first
+    rooms      students whose room changed
+    seats      students in the same room but a different seat
+"""
+import logging
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from courses.models import Course, CourseGroup
+from exams.models import Exam, StudentExam, UnscheduledExam
+from rooms.models import Room
+from schedules.models import MasterTimetable, MasterTimetableExam
+from schedules.occupancy import invalidate_timetable
+from sharedapp.models import UnscheduledExamGroup
+from student.models import Student
+
+logger = logging.getLogger(__name__)
+
+# Columns reset to these values in cloned StudentExams.
+STUDENT_EXAM_RESET = {
+    "status": "PENDING",
+    "signin_attendance": False,
+    "signout_attendance": False,
+    "signin_at": None,
+    "signout_at": None,
+}
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def _table(model):
+    return _qn(model._meta.db_table)
+
+
+def _columns(model):
+    return [f.column for f in model._meta.concrete_fields if not f.primary_key]
+
+
+class _IdMap:
+    """
+    A temporary table mapping the ids of `model` rows selected by
+    `source_sql` (one column, named old_id) to fresh ones.
+    """
+
+    def __init__(self, cursor, name, model, source_sql, params):
+        self.name = _qn(name)
+        self.model = model
+        cursor.execute(f"DROP TABLE IF EXISTS {self.name}")
+        if connection.vendor == "postgresql":
+            sequence = f"pg_get_serial_sequence('{model._meta.db_table}', '{model._meta.pk.column}')"
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {self.name} ON COMMIT DROP AS "
+                f"SELECT s.old_id, nextval({sequence}) AS new_id "
+                f"FROM ({source_sql}) AS s(old_id)",
+                params,
+            )
+        else:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {self.name} AS "
+                f"SELECT s.old_id AS old_id, "
+                f"(SELECT COALESCE(MAX({_qn(model._meta.pk.column)}), 0) FROM {_table(model)}) "
+                f"+ ROW_NUMBER() OVER (ORDER BY s.old_id) AS new_id "
+                f"FROM ({source_sql}) AS s",
+                params,
+            )
+        cursor.execute(f"SELECT COUNT(*) FROM {self.name}")
+        self.count = cursor.fetchone()[0]
+
+    def drop(self, cursor):
+        if connection.vendor != "postgresql":
+            cursor.execute(f"DROP TABLE IF EXISTS {self.name}")
+
+
+def _copy(cursor, model, id_map, overrides, on=None, joins="", with_pk=True):
+    """
+    INSERT ... SELECT the rows of `model` ("src") matched to `id_map`
+    ("m") on `on` (default: src's primary key = m.old_id). With with_pk,
+    the copies take the mapped ids; otherwise the database assigns them.
+    `overrides` maps column -> (SQL expression, params) for the columns
+    that must not be copied verbatim.
+    """
+    columns = _columns(model)
+    select, params = [], []
+    for column in columns:
+        if column in overrides:
+            expression, expression_params = overrides[column]
+            select.append(expression)
+            params.extend(expression_params)
+        else:
+            select.append(f"src.{_qn(column)}")
+    insert_columns = [_qn(c) for c in columns]
+    pk = _qn(model._meta.pk.column)
+    if with_pk:
+        insert_columns.insert(0, pk)
+        select.insert(0, "m.new_id")
+    cursor.execute(
+        f"INSERT INTO {_table(model)} ({', '.join(insert_columns)}) "
+        f"SELECT {', '.join(select)} FROM {_table(model)} AS src "
+        f"JOIN {id_map.name} AS m ON m.old_id = src.{_qn(on) if on else pk} {joins}",
+        params,
+    )
+    return cursor.rowcount
+
+
+def clone_timetable(source_id, user, name=None):
+    """Copy timetable `source_id` into a new DRAFT; returns (timetable, row counts)."""
+    source = MasterTimetable.objects.get(id=source_id)
+    now = timezone.now()
+    counts = {}
+
+    with transaction.atomic():
+        clone = MasterTimetable.objects.create(
+            name=name or f"{source.name or source.academic_year} (copy)",
+            academic_year=source.academic_year,
+            generated_by=user,
+            category=source.category,
+            start_date=source.start_date,
+            end_date=source.end_date,
+            status="DRAFT",
+            location=source.location,
+            semester=source.semester,
+        )
+        mte = _table(MasterTimetableExam)
+        with connection.cursor() as cursor:
+            exams = _IdMap(
+                cursor, "clone_exam_map", Exam,
+                f"SELECT exam_id AS old_id FROM {mte} WHERE master_timetable_id = %s "
+                f"UNION SELECT id FROM {_table(Exam)} WHERE master_timetable_id = %s",
+                [source.id, source.id],
+            )
+            counts["exams"] = _copy(cursor, Exam, exams, {
+                # Exams linked only through MasterTimetableExam (manual
+                # scheduling) keep a NULL owner, like their originals.
+                "master_timetable_id": (
+                    "CASE WHEN src.master_timetable_id IS NULL THEN NULL ELSE %s END", [clone.id],
+                ),
+                "created_at": ("%s", [now]),
+                "updated_at": ("%s", [now]),
+            })
+            cursor.execute(
+                f"INSERT INTO {mte} (master_timetable_id, exam_id) SELECT %s, new_id FROM {exams.name}",
+                [clone.id],
+            )
+            counts["timetable_links"] = cursor.rowcount
+
+            student_exam_overrides = {
+                "exam_id": ("m.new_id", []),
+                "master_timetable_id": ("%s", [clone.id]),
+                "created_at": ("%s", [now]),
+                "updated_at": ("%s", [now]),
+            }
+            for column, value in STUDENT_EXAM_RESET.items():
+                student_exam_overrides[column] = ("%s", [value])
+            counts["student_exams"] = _copy(
+                cursor, StudentExam, exams, student_exam_overrides, on="exam_id", with_pk=False,
+            )
+
+            unscheduled = _IdMap(
+                cursor, "clone_unscheduled_map", UnscheduledExam,
+                f"SELECT id AS old_id FROM {_table(UnscheduledExam)} WHERE master_timetable_id = %s",
+                [source.id],
+            )
+            counts["unscheduled_exams"] = _copy(cursor, UnscheduledExam, unscheduled, {
+                "master_timetable_id": ("%s", [clone.id]),
+                "created_at": ("%s", [now]),
+                "updated_at": ("%s", [now]),
+            })
+            groups = _IdMap(
+                cursor, "clone_unscheduled_group_map", UnscheduledExamGroup,
+                f"SELECT g.id AS old_id FROM {_table(UnscheduledExamGroup)} AS g "
+                f"JOIN {unscheduled.name} AS u ON u.old_id = g.exam_id",
+                [],
+            )
+            counts["unscheduled_groups"] = _copy(cursor, UnscheduledExamGroup, groups, {
+                "exam_id": ("u.new_id", []),
+                "created_at": ("%s", [now]),
+                "updated_at": ("%s", [now]),
+            }, joins=f"JOIN {unscheduled.name} AS u ON u.old_id = src.exam_id")
+
+            through = UnscheduledExam.groups.through
+            exam_fk = _qn(through._meta.get_field("unscheduledexam").column)
+            group_fk = _qn(through._meta.get_field("unscheduledexamgroup").column)
+            cursor.execute(
+                f"INSERT INTO {_table(through)} ({exam_fk}, {group_fk}) "
+                f"SELECT u.new_id, g.new_id FROM {_table(through)} AS t "
+                f"JOIN {unscheduled.name} AS u ON u.old_id = t.{exam_fk} "
+                f"JOIN {groups.name} AS g ON g.old_id = t.{group_fk}",
+            )
+
+            for id_map in (exams, unscheduled, groups):
+                id_map.drop(cursor)
+
+    invalidate_timetable(clone.id)
+    logger.info(f"Cloned timetable {source.id} into {clone.id}: {counts}")
+    return clone, counts
+
+
+# ----------------------------------------------------------------------
+# Diff
+# ----------------------------------------------------------------------
+
+def _distinct(a, b):
+    """SQL for "a and b differ", treating two NULLs as equal."""
+    if connection.vendor == "postgresql":
+        return f"{a} IS DISTINCT FROM {b}"
+    if connection.vendor == "sqlite":
+        return f"{a} IS NOT {b}"
+    return f"(({a} IS NULL) <> ({b} IS NULL) OR {a} <> {b})"
+
+
+def _exam_set(alias):
+    mte = _table(MasterTimetableExam)
+    return (
+        f"{alias} AS (SELECT e.id, e.group_id, e.date, e.start_time, e.end_time, e.slot_name "
+        f"FROM {_table(Exam)} AS e WHERE e.id IN "
+        f"(SELECT exam_id FROM {mte} WHERE master_timetable_id = %s) OR e.master_timetable_id = %s)"
+    )
+
+
+def _fetch(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def diff_timetables(base_id, other_id, limit=500):
+    """What changed from timetable `base_id` to `other_id` (see module docstring)."""
+    with_sets = f"WITH {_exam_set('a')}, {_exam_set('b')} "
+    set_params = [base_id, base_id, other_id, other_id]
+    course = (
+        f"JOIN {_table(CourseGroup)} AS g ON g.id = {{alias}}.group_id "
+        f"JOIN {_table(Course)} AS c ON c.id = g.course_id"
+    )
+    label = "c.code AS course_code, g.group_name AS group_name"
+
+    moved = _fetch(
+        with_sets
+        + f"SELECT a.group_id, {label}, a.id AS base_exam_id, b.id AS exam_id, "
+        "a.date AS from_date, a.start_time AS from_start, a.end_time AS from_end, "
+        "b.date AS to_date, b.start_time AS to_start, b.end_time AS to_end "
+        f"FROM a JOIN b ON b.group_id = a.group_id {course.format(alias='a')} "
+        "WHERE a.date <> b.date OR a.start_time <> b.start_time OR a.end_time <> b.end_time "
+        "ORDER BY c.code, g.group_name",
+        set_params,
+    )
+    added = _fetch(
+        with_sets
+        + f"SELECT b.group_id, {label}, b.id AS exam_id, b.date, b.start_time, b.end_time "
+        f"FROM b LEFT JOIN a ON a.group_id = b.group_id {course.format(alias='b')} "
+        "WHERE a.id IS NULL ORDER BY c.code, g.group_name",
+        set_params,
+    )
+    removed = _fetch(
+        with_sets
+        + f"SELECT a.group_id, {label}, a.id AS exam_id, a.date, a.start_time, a.end_time "
+        f"FROM a LEFT JOIN b ON b.group_id = a.group_id {course.format(alias='a')} "
+        "WHERE b.id IS NULL ORDER BY c.code, g.group_name",
+        set_params,
+    )
+
+    se = _table(StudentExam)
+    student_pairs = (
+        f"FROM a JOIN b ON b.group_id = a.group_id "
+        f"JOIN {se} AS sa ON sa.exam_id = a.id "
+        f"JOIN {se} AS sb ON sb.exam_id = b.id AND sb.student_id = sa.student_id "
+        f"JOIN {_table(Student)} AS st ON st.id = sa.student_id "
+        f"{course.format(alias='a')} "
+        f"LEFT JOIN {_table(Room)} AS ra ON ra.id = sa.room_id "
+        f"LEFT JOIN {_table(Room)} AS rb ON rb.id = sb.room_id "
+    )
+    student_columns = (
+        f"SELECT sa.student_id, st.reg_no, {label}, "
+        "sa.room_id AS from_room_id, ra.name AS from_room, sb.room_id AS to_room_id, rb.name AS to_room, "
+        "sa.seat_row AS from_seat_row, sa.seat_column AS from_seat_column, "
+        "sb.seat_row AS to_seat_row, sb.seat_column AS to_seat_column "
+    )
+    room_changed = _distinct("sa.room_id", "sb.room_id")
+    seat_changed = (
+        f"NOT ({room_changed}) AND ({_distinct('sa.seat_row', 'sb.seat_row')} "
+        f"OR {_distinct('sa.seat_column', 'sb.seat_column')})"
+    )
+
+    def changes(condition):
+        total = _fetch(with_sets + f"SELECT COUNT(*) AS n {student_pairs} WHERE {condition}", set_params)[0]["n"]
+        rows = _fetch(
+            with_sets + student_columns + student_pairs
+            + f"WHERE {condition} ORDER BY c.code, st.reg_no LIMIT %s",
+            set_params + [limit],
+        )
+        return total, rows
+
+    room_total, rooms = changes(room_changed)
+    seat_total, seats = changes(seat_changed)
+
+    return {
+        "base": base_id,
+        "other": other_id,
+        "summary": {
+            "moved": len(moved),
+            "added": len(added),
+            "removed": len(removed),
+            "room_changes": room_total,
+            "seat_changes": seat_total,
+        },
+        "moved": moved[:limit],
+        "added": added[:limit],
+        "removed": removed[:limit],
+        "room_changes": rooms,
+        "seat_changes": seats,
+    }
@@ -0,0 +1,159 @@
+"""
+Batch feasibility engine for moving one exam to another (date, slot).
+
+get_reschedule_suggestions used to call check_reschedule_feasibility for
+every (date, slot) in its window, and each of those ran one
+StudentExam.exists() per enrolled student plus one Enrollment.count() per
+other exam in the slot — tens of thousands of queries for a single
+300-student course. reschedule_exam repeated the same per-student loop.
+
+RescheduleFeasibility loads everything once for the whole window:
+
+    1. the course roster, together with every course each roster student
+       is enrolled in (for the "same slot, shared students" check) and the
+       roster's reg numbers, in one query. reschedule_exam approves a move
+       on this answer, so it reads Enrollment live rather than the shared
+       enrollment snapshot: a roster write the snapshot has not picked up
+       must not let a conflicting move through;
+    2. the roster's existing exam dates inside the window;
+    3. every other exam at the location inside the window, with its
+       course's enrolment count (per-slot headcount);
+
+plus the location's room capacity. Every candidate is then scored in
+memory.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Count, Sum
+
+from enrollments.models import Enrollment
+from exams.models import Exam, StudentExam
+from rooms.models import Room
+
+
+class RescheduleFeasibility:
+    def __init__(self, exam, start_date, end_date):
+        self.exam = exam
+        self.course = exam.group.course
+        self.location_id = self.course.department.location_id
+        self.start_date = start_date
+        self.end_date = end_date
+
+        # 1. Roster (every status), each roster student's full course list
+        #    and reg number: every enrollment of a student enrolled here.
+        self.courses_by_student = defaultdict(set)
+        self.reg_no = {}
+        for student_id, course_id, reg_no in Enrollment.objects.filter(
+            student__enrollments__course_id=self.course.id
+        ).values_list("student_id", "course_id", "student__reg_no"):
+            self.courses_by_student[student_id].add(course_id)
+            self.reg_no[student_id] = reg_no
+        self.roster = set(self.courses_by_student)
+        roster_ids = list(self.roster)
+        self.exam_student_count = len(self.roster)
+
+        # 2. Roster's existing exams in the window, by date.
+        self.busy_on = defaultdict(lambda: defaultdict(list))  # date -> student -> [titles]
+        for student_id, exam_date, title in (
+            StudentExam.objects.filter(
+                student_id__in=roster_ids,
+                exam__date__range=(start_date, end_date),
+            )
+            .exclude(exam_id=exam.id)
+            .values_list("student_id", "exam__date", "exam__group__course__title")
+        ):
+            self.busy_on[exam_date][student_id].append(title)
+
+        # 3. Other exams at this location in the window, with headcounts.
+        self.slot_exams = defaultdict(list)  # (date, start, end) -> [exam rows]
+        for row in (
+            Exam.objects.filter(
+                date__range=(start_date, end_date),
+                group__course__department__location_id=self.location_id,
+            )
+            .exclude(id=exam.id)
+            .values(
+                "id", "date", "start_time", "end_time",
+                "group__course_id", "group__course__title",
+            )
+            .annotate(enrolled=Count("group__course__enrollments"))
+        ):
+            self.slot_exams[(row["date"], row["start_time"], row["end_time"])].append(row)
+
+        self.total_capacity = (
+            Room.objects.filter(location_id=self.location_id)
+            .aggregate(total=Sum("capacity"))["total"] or 0
+        )
+
+    @classmethod
+    def around(cls, exam, days):
+        return cls(exam, exam.date - timedelta(days=days), exam.date + timedelta(days=days))
+
+    def evaluate(self, new_date, slot_name, start_time, end_time):
+        """
+        Score one candidate. Returns a dict with the student conflicts on
+        that date, the slot's headcount and capacity headroom, and any
+        course sharing students with this one in the same slot.
+        """
+        busy = self.busy_on.get(new_date, {})
+        conflicted = [
+            {"student": self.reg_no.get(student_id), "conflicting_exams": titles}
+            for student_id, titles in busy.items()
+            if student_id in self.roster
+        ]
+
+        others = self.slot_exams.get((new_date, start_time, end_time), [])
+        other_students = sum(row["enrolled"] for row in others)
+        required = self.exam_student_count + other_students
+
+        incompatible = []
+        for row in others:
+            shared = sum(
+                1 for student_id in self.roster
+                if row["group__course_id"] in self.courses_by_student[student_id]
+            )
+            if shared:
+                incompatible.append((row["group__course__title"], shared))
+
+        return {
+            "date": new_date,
+            "slot": slot_name,
+            "start_time": start_time,
+            "end_time": end_time,
+            "weekday": new_date.strftime("%A"),
+            "student_conflicts": len(conflicted),
+            "conflicted_students": conflicted,
+            "required_seats": required,
+            "other_exams_students": other_students,
+            "available_seats": self.total_capacity,
+            "headroom": self.total_capacity - required,
+            "incompatible_courses": incompatible,
+            "exam_student_count": self.exam_student_count,
+            "slot_exam_sizes": [row["enrolled"] for row in others],
+            "feasible": not conflicted and required <= self.total_capacity and not incompatible,
+        }
+
+    def candidates(self, slots_for_date, skip_dates=()):
+        """
+        Evaluate every allowed (date, slot) in the window and rank them:
+        feasible first, then fewest conflicts, closest to the exam's
+        current date, and most spare seats.
+        """
+        results = []
+        current = self.start_date
+        while current <= self.end_date:
+            if current not in skip_dates:
+                for slot_name, start_time, end_time in slots_for_date(current):
+                    results.append(self.evaluate(current, slot_name, start_time, end_time))
+            current += timedelta(days=1)
+
+        results.sort(key=lambda r: (
+            not r["feasible"],
+            r["student_conflicts"] + sum(n for _, n in r["incompatible_courses"]),
+            abs((r["date"] - self.exam.date).days),
+            -r["headroom"],
+        ))
+        for rank, result in enumerate(results, start=1):
+            result["rank"] = rank
+        return results
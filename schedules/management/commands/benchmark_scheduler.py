@@ -0,0 +1,68 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from schedules.benchmark import SCALES, run
+from schedules.synthetic import PRODUCTION_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the scheduler end to end (colouring, generation, room "
+        "allocation, verification, PDF reports) on synthetic universities "
+        "of 1x, 5x and 20x production size, each generated inside a "
+        "transaction that is rolled back afterwards. Write the report with "
+        "--output and pass an earlier one as --baseline to compare commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scales", default=",".join(str(s) for s in SCALES),
+            help="Comma-separated multiples of production size (default 1,5,20).",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed of the datasets (default 0).")
+        parser.add_argument("--no-pdfs", action="store_true", help="Skip the PDF builders.")
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        parser.add_argument("--baseline", help="JSON report from an earlier run to compare against.")
+        for name, count in PRODUCTION_SIZE.items():
+            parser.add_argument(f"--{name}", type=int, help=f"{name.capitalize()} at scale 1 (default {count}).")
+
+    def handle(self, *args, **options):
+        try:
+            scales = [float(s) for s in options["scales"].split(",") if s.strip()]
+        except ValueError:
+            raise CommandError("--scales must be comma-separated numbers, e.g. 1,5,20.")
+        if not scales or min(scales) <= 0:
+            raise CommandError("--scales must be positive.")
+
+        baseline = {}
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                baseline = {entry["scale"]: entry["timings"] for entry in json.load(f)["scales"]}
+
+        def _print(entry):
+            rows = ", ".join(f"{count} {name}" for name, count in entry["rows"].items())
+            self.stdout.write(self.style.MIGRATE_HEADING(f"x{entry['scale']:g}: {rows}"))
+            before = baseline.get(entry["scale"], {})
+            for name, seconds in entry["timings"].items():
+                line = f"  {name}: {seconds:.3f} s"
+                if name in before:
+                    change = (seconds - before[name]) / before[name] * 100 if before[name] else 0.0
+                    line += f" (before {before[name]:.3f} s, {change:+.0f}%)"
+                self.stdout.write(line)
+            results = entry["results"]
+            self.stdout.write(
+                f"  {results['exams_created']} exams, {results['unscheduled_groups']} unscheduled bundles, "
+                f"{results['conflicts']} conflicts"
+            )
+
+        report = run(
+            scales=scales, seed=options["seed"], pdfs=not options["no_pdfs"], on_scale=_print,
+            **{name: options[name] for name in PRODUCTION_SIZE},
+        )
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, default=str)
+            self.stdout.write(f"Report written to {options['output']}")
+        self.stdout.write(self.style.SUCCESS(f"Benchmarked {len(scales)} scale(s)."))
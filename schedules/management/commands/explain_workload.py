@@ -0,0 +1,110 @@
+import json
+import statistics
+import time as time_mod
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from schedules.workload import (
+    builtin_workload, explain, has_full_scan, load_workload, save_workload,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a query workload, time every statement and print the "
+        "EXPLAIN (ANALYZE on PostgreSQL) plan of the slow ones or the ones "
+        "that scan a whole table. Without --workload, the built-in hot "
+        "filters are used with ids sampled from the database. Save timings "
+        "with --output before a schema change and pass them as --baseline "
+        "afterwards to get a before/after comparison."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workload",
+            help="JSON-lines workload to replay (see schedules/workload.py).",
+        )
+        parser.add_argument(
+            "--save-workload",
+            help="Write the workload being replayed to this file, for replaying later.",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5,
+            help="Runs per statement; the median is reported (default 5).",
+        )
+        parser.add_argument(
+            "--slow-ms", type=float, default=20.0,
+            help="Print the plan of statements slower than this (default 20ms).",
+        )
+        parser.add_argument(
+            "--no-analyze", action="store_true",
+            help="Plain EXPLAIN on PostgreSQL instead of EXPLAIN ANALYZE.",
+        )
+        parser.add_argument("--output", help="Write timings as JSON to this file.")
+        parser.add_argument("--baseline", help="Timings JSON from an earlier run to compare against.")
+
+    def handle(self, *args, **options):
+        entries = load_workload(options["workload"]) if options["workload"] else builtin_workload()
+        if not entries:
+            raise CommandError("Nothing to replay: the workload is empty (no data to sample?).")
+        if options["save_workload"]:
+            save_workload(entries, options["save_workload"])
+            self.stdout.write(f"Saved {len(entries)} statements to {options['save_workload']}")
+
+        baseline = {}
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                baseline = json.load(f)["timings"]
+
+        repeat = max(1, options["repeat"])
+        analyze = not options["no_analyze"]
+        timings = {}
+        flagged = 0
+
+        for entry in entries:
+            name, sql, params = entry["name"], entry["sql"], entry.get("params", [])
+            if not sql.lstrip().upper().startswith("SELECT"):
+                self.stdout.write(self.style.WARNING(f"{name}: skipped (not a SELECT)"))
+                continue
+
+            runs = []
+            # Roll back whatever EXPLAIN ANALYZE touches, to be safe.
+            with transaction.atomic():
+                for _ in range(repeat):
+                    started = time_mod.perf_counter()
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql, params)
+                        cursor.fetchall()
+                    runs.append((time_mod.perf_counter() - started) * 1000)
+                plan = explain(sql, params, analyze=analyze)
+                transaction.set_rollback(True)
+
+            median = statistics.median(runs)
+            timings[name] = round(median, 3)
+            full_scan = has_full_scan(plan)
+
+            line = f"{name}: {median:.2f} ms"
+            if name in baseline:
+                before = baseline[name]
+                change = (median - before) / before * 100 if before else 0.0
+                line += f" (before {before:.2f} ms, {change:+.0f}%)"
+            if full_scan:
+                line += " [full scan]"
+
+            if median >= options["slow_ms"] or full_scan:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(line))
+                for plan_line in plan:
+                    self.stdout.write(f"    {plan_line}")
+            else:
+                self.stdout.write(line)
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump({"vendor": connection.vendor, "repeat": repeat, "timings": timings}, f, indent=2)
+            self.stdout.write(f"Timings written to {options['output']}")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Replayed {len(timings)} statement(s), {flagged} flagged.")
+        )
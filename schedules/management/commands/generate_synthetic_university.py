@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from django.utils.dateparse import parse_date
+
+from schedules.synthetic import PRODUCTION_SIZE, generate
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a synthetic university (campuses, departments, rooms with seat "
+        "layouts, instructors, courses with groups, students and enrollments "
+        "with a realistic overlap) into the database with bulk inserts, for "
+        "load testing. Row counts are the production-sized defaults times "
+        "--scale; any of them can be overridden. Every name starts with "
+        "--prefix, so run it again with another prefix for a second dataset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=float, default=1.0, help="Multiplier of all counts (default 1).")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed (default 0).")
+        parser.add_argument("--prefix", default="SYN", help="Prefix of every generated name (default SYN).")
+        parser.add_argument("--start-date", help="First exam day, YYYY-MM-DD (default today).")
+        for name, count in PRODUCTION_SIZE.items():
+            parser.add_argument(f"--{name}", type=int, help=f"{name.capitalize()} at scale 1 (default {count}).")
+
+    def handle(self, *args, **options):
+        start_date = None
+        if options["start_date"]:
+            start_date = parse_date(options["start_date"])
+            if start_date is None:
+                raise CommandError("--start-date must be YYYY-MM-DD.")
+        try:
+            summary = generate(
+                scale=options["scale"], seed=options["seed"], prefix=options["prefix"],
+                start_date=start_date,
+                **{name: options[name] for name in PRODUCTION_SIZE},
+            )
+        except IntegrityError as e:
+            raise CommandError(f"Could not generate (prefix {options['prefix']} already used?): {e}")
+
+        for name, count in summary["rows"].items():
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {options['prefix']}: locations {summary['location_ids']}, "
+                f"semester {summary['semester_id']}."
+            )
+        )
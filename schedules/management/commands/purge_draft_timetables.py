@@ -0,0 +1,46 @@
+import argparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from schedules.models import TimetableTeardown
+from schedules.teardown import run_teardown_job, stale_draft_timetables
+
+
+class Command(BaseCommand):
+    help = (
+        "Tear down DRAFT timetables untouched for --days days (default "
+        "DRAFT_TIMETABLE_RETENTION_DAYS), keeping the newest timetable of "
+        "each location. The same purge celery beat runs nightly, but inline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None)
+        parser.add_argument(
+            "--archive", action=argparse.BooleanOptionalAction, default=None,
+            help="Archive the rows before deleting them (default DRAFT_TIMETABLE_PURGE_ARCHIVE).",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="List the timetables that would be purged.")
+
+    def handle(self, *args, **options):
+        days = options["days"] if options["days"] is not None else settings.DRAFT_TIMETABLE_RETENTION_DAYS
+        archive = options["archive"] if options["archive"] is not None else settings.DRAFT_TIMETABLE_PURGE_ARCHIVE
+        stale = list(stale_draft_timetables(days))
+        if not stale:
+            self.stdout.write(self.style.SUCCESS(f"No DRAFT timetables older than {days} day(s)."))
+            return
+        for timetable in stale:
+            label = f"timetable {timetable.id} ({timetable.name or timetable.academic_year}, updated {timetable.updated_at:%Y-%m-%d})"
+            if options["dry_run"]:
+                self.stdout.write(f"Would purge {label}")
+                continue
+            job = TimetableTeardown.objects.create(
+                timetable_id=timetable.id,
+                timetable_label=str(timetable.name or timetable)[:255],
+                archive=archive,
+            )
+            job = run_teardown_job(job.id)
+            if job.status == "done":
+                self.stdout.write(f"Purged {label}: {job.row_counts}")
+            else:
+                self.stdout.write(self.style.ERROR(f"Failed to purge {label}: {job.error}"))
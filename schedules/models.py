@@ -1,7 +1,11 @@
+import json
+import zlib
+
 from django.db import models
 from courses.models import Course
 from courses.models import Course
 from django.conf import settings
+from django.utils import timezone
 from rooms.models import Location
 from semesters.models import Semester
 
@@ -61,6 +65,15 @@ class MasterTimetable( TimeStampedModel):
         through='MasterTimetableExam',
         related_name='timetables'
     )
+    # Bumped, in the writing transaction, whenever the timetable's exams,
+    # rooms or seats change (the occupancy and read-model hooks, and
+    # StudentExam saves); the exports in report/exports.py derive their
+    # ETag from it.
+    data_version = models.PositiveIntegerField(default=0)
+    # Bumped only by writes that change who sits what when (exam creates,
+    # moves and cancellations, bulk rewrites), not by seat or attendance
+    # edits; the occupancy indexes of schedules/occupancy.py follow it.
+    occupancy_version = models.PositiveIntegerField(default=0)
 
     class Meta:
         indexes = [
@@ -69,6 +82,34 @@ class MasterTimetable( TimeStampedModel):
 
     def __str__(self):
         return f"{self.academic_year} - {self.generated_at}"
+
+    @classmethod
+    def bump_data_version(cls, timetable_ids):
+        # .update() skips auto_now, so updated_at is set here: a timetable
+        # whose exams keep changing is not "untouched" to the draft purge.
+        timetable_ids = {int(t) for t in timetable_ids if t is not None}
+        if timetable_ids:
+            cls.objects.filter(id__in=timetable_ids).update(
+                data_version=models.F('data_version') + 1, updated_at=timezone.now()
+            )
+
+    @classmethod
+    def bump_occupancy_version(cls, timetable_ids):
+        """
+        Bump occupancy_version (and data_version: an occupancy change is a
+        data change too) and return {timetable id: new occupancy_version}.
+        The rows stay locked until the caller's transaction ends, so the
+        versions of one timetable are handed out in commit order.
+        """
+        timetable_ids = {int(t) for t in timetable_ids if t is not None}
+        if not timetable_ids:
+            return {}
+        cls.objects.filter(id__in=timetable_ids).update(
+            occupancy_version=models.F('occupancy_version') + 1,
+            data_version=models.F('data_version') + 1,
+            updated_at=timezone.now(),
+        )
+        return dict(cls.objects.filter(id__in=timetable_ids).values_list('id', 'occupancy_version'))
     
 
 
@@ -80,6 +121,11 @@ class MasterTimetableExam(models.Model):
 
     class Meta:
         unique_together = ('master_timetable', 'exam')
+        # The unique constraint serves timetable -> exams; this serves the
+        # exam -> timetable join used to scope Exam queries to a timetable.
+        indexes = [
+            models.Index(fields=['exam', 'master_timetable'], name='mtt_exam_exam_timetable_idx'),
+        ]
 
     def __str__(self):
         return f"{self.master_timetable} -> {self.exam}"
@@ -92,3 +138,129 @@ class MasterTimetableExam(models.Model):
     
 
 
+
+
+class TimetableTeardown(models.Model):
+    """
+    One truncate-mastertimetable request, run in the background by
+    schedules.tasks.teardown_timetable (see schedules/teardown.py). The
+    client polls the row for progress; it outlives the timetable, so the
+    timetable is referenced by id only.
+    """
+
+    STATUS_CHOICES = (
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    )
+
+    timetable_id = models.PositiveIntegerField()
+    timetable_label = models.CharField(max_length=255, blank=True)
+    archive = models.BooleanField(default=False)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    step = models.PositiveIntegerField(default=0)
+    total_steps = models.PositiveIntegerField(default=0)
+    message = models.CharField(max_length=255, blank=True)
+    row_counts = models.JSONField(default=dict, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["timetable_id", "status"], name="teardown_timetable_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"Teardown of timetable {self.timetable_id} ({self.status})"
+
+
+class TimetableArchive(models.Model):
+    """
+    Rows of a timetable torn down in archive mode. The rows themselves
+    live in TimetableArchiveChunk, zlib-compressed, one chunk per table
+    per teardown step.
+    """
+
+    timetable_id = models.PositiveIntegerField(db_index=True)
+    name = models.CharField(max_length=255, null=True, blank=True)
+    academic_year = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, blank=True)
+    location_id = models.PositiveIntegerField(null=True, blank=True)
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    archived_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    archived_at = models.DateTimeField(auto_now_add=True)
+    row_counts = models.JSONField(default=dict, blank=True)
+
+    def __str__(self):
+        return f"Archive of timetable {self.timetable_id} ({self.archived_at:%Y-%m-%d})"
+
+    def iter_rows(self, table=None):
+        """(table, row dict) for every archived row, in teardown order."""
+        chunks = self.chunks.order_by("seq")
+        if table:
+            chunks = chunks.filter(table=table)
+        for chunk in chunks.iterator():
+            for row in chunk.rows():
+                yield chunk.table, row
+
+
+class TimetableArchiveChunk(models.Model):
+    archive = models.ForeignKey(TimetableArchive, on_delete=models.CASCADE, related_name="chunks")
+    seq = models.PositiveIntegerField()
+    table = models.CharField(max_length=100)
+    row_count = models.PositiveIntegerField()
+    payload = models.BinaryField()   # zlib-compressed JSON list of rows
+
+    class Meta:
+        unique_together = ("archive", "seq")
+
+    def rows(self):
+        return json.loads(zlib.decompress(bytes(self.payload)))
+
+
+class OccupancyChange(models.Model):
+    """
+    The exams one write created, moved or cancelled in a timetable, under
+    the occupancy_version it bumped the timetable to. A cached occupancy
+    index that is behind re-reads just these exams instead of rebuilding;
+    changes to the timetable as a whole bump the version without a row,
+    which forces the rebuild.
+    """
+
+    timetable_id = models.PositiveIntegerField()
+    version = models.PositiveIntegerField()
+    exam_ids = models.JSONField()
+
+    class Meta:
+        unique_together = ('timetable_id', 'version')
+
+    def __str__(self):
+        return f"Occupancy v{self.version} of timetable {self.timetable_id}"
+
+
+class TimetableSimulationSession(models.Model):
+    """
+    A what-if session of schedules/simulation.py between requests, stored
+    here rather than in a per-process cache so any worker can pick it up.
+    Requests on one session lock its row while they load, apply and save.
+    """
+
+    id = models.CharField(max_length=32, primary_key=True)
+    timetable_id = models.PositiveIntegerField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE
+    )
+    payload = models.BinaryField()   # zlib-compressed pickle of the session
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Simulation {self.id} of timetable {self.timetable_id}"
@@ -0,0 +1,381 @@
+"""
+Per-MasterTimetable occupancy index.
+
+Manual slot suggestion (which_suitable_slot_to_schedule_course_group) used
+to prefetch every StudentExam of every exam in its date window on every
+call, then rebuild each exam's roster set once per conflicting student and
+run a capacity aggregate per candidate slot. On a busy timetable the admin
+"suggest slot" dialog took seconds.
+
+This module keeps, per (timetable, location):
+
+    (date, slot) -> bitset of students sitting an exam in that slot
+                    seat usage (number of StudentExam rows)
+                    the exams in that slot, each with its own roster bitset
+
+Students are mapped to bit positions once, so "who in this new group is
+already busy in this slot" is a single integer AND. The index is built with
+three queries and then maintained incrementally, instead of being rebuilt
+per request.
+
+Indexes are cached per process and stamped with
+MasterTimetable.occupancy_version. Exam creates, moves and cancellations
+(refresh_exams) bump it inside the writing transaction and record the
+exams they touched as an OccupancyChange under the new version. A lookup
+reads the committed version (one indexed query); when it moved, it reads
+the changes since its stamp and re-reads only those exams (three queries),
+so a change made by any worker is seen by all of them as soon as it
+commits, without a rebuild. Changes to the timetable as a whole
+(invalidate_timetable) bump the version without a change row, and a
+missing row means a full rebuild. Seat and attendance edits bump
+data_version, not occupancy_version, and leave the index alone.
+"""
+import logging
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Sum
+
+from exams.models import Exam, StudentExam
+from rooms.models import Room
+
+logger = logging.getLogger(__name__)
+
+
+def _slot_key(slot_date, slot_name):
+    # Manually scheduled exams have stored slot names in mixed case
+    # ("morning" from the suggestion flow vs "Morning" from config), so
+    # keys are case-insensitive.
+    return (slot_date, (slot_name or "").lower())
+
+
+class OccupancyIndex:
+    def __init__(self, timetable_id=None, location_id=None):
+        self.timetable_id = timetable_id
+        self.location_id = location_id
+        self.stamp = None
+        self.room_capacity = 0
+
+        self._bit_of = {}        # student_id -> bit position
+        self._student_at = []    # bit position -> student_id
+
+        self.students = defaultdict(int)   # (date, slot) -> student bitset
+        self.seats = defaultdict(int)      # (date, slot) -> seats in use
+        self.exams = defaultdict(dict)     # (date, slot) -> {exam_id: info}
+        self._exam_key = {}                # exam_id -> (date, slot)
+
+    # ------------------------------------------------------------------
+    # Student bitsets
+    # ------------------------------------------------------------------
+
+    def student_mask(self, student_ids):
+        """Bitset for student_ids, assigning bit positions to unseen students."""
+        mask = 0
+        for student_id in student_ids:
+            bit = self._bit_of.get(student_id)
+            if bit is None:
+                bit = len(self._student_at)
+                self._bit_of[student_id] = bit
+                self._student_at.append(student_id)
+            mask |= 1 << bit
+        return mask
+
+    def student_ids(self, mask):
+        """Decode a bitset back into student ids."""
+        ids = []
+        while mask:
+            low = mask & -mask
+            ids.append(self._student_at[low.bit_length() - 1])
+            mask ^= low
+        return ids
+
+    # ------------------------------------------------------------------
+    # Building and incremental maintenance
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def build(cls, timetable_id=None, location_id=None, dates=None):
+        """
+        Load the index in three queries: the exams, their StudentExam rows,
+        and the location's room capacity. `dates` narrows the build when
+        there is no timetable to scope by (the index is then not cached).
+        """
+        index = cls(timetable_id, location_id)
+        exams = index._exam_queryset()
+        if dates is not None:
+            exams = exams.filter(date__in=dates)
+        index._load_exams(exams)
+
+        rooms = Room.objects.filter(location_id=location_id) if location_id else Room.objects.all()
+        index.room_capacity = rooms.aggregate(total=Sum("capacity"))["total"] or 0
+        return index
+
+    def _exam_queryset(self):
+        exams = Exam.objects.all()
+        if self.timetable_id:
+            exams = exams.filter(mastertimetableexam__master_timetable_id=self.timetable_id)
+        if self.location_id:
+            exams = exams.filter(group__course__department__location_id=self.location_id)
+        return exams
+
+    def _load_exams(self, exams):
+        rows = list(
+            exams.values(
+                "id", "date", "slot_name", "group_id",
+                "group__group_name", "group__course__title",
+            )
+        )
+        if not rows:
+            return
+
+        rosters = defaultdict(list)
+        for exam_id, student_id in StudentExam.objects.filter(
+            exam_id__in=[r["id"] for r in rows]
+        ).values_list("exam_id", "student_id"):
+            rosters[exam_id].append(student_id)
+
+        for r in rows:
+            self.add_exam(
+                r["id"], r["date"], r["slot_name"], rosters.get(r["id"], ()),
+                group_id=r["group_id"],
+                group_name=r["group__group_name"],
+                course_title=r["group__course__title"],
+            )
+
+    def add_exam(self, exam_id, exam_date, slot_name, student_ids,
+                 group_id=None, group_name=None, course_title=None):
+        if exam_id in self._exam_key:
+            self.remove_exam(exam_id)
+
+        key = _slot_key(exam_date, slot_name)
+        student_ids = list(student_ids)
+        mask = self.student_mask(student_ids)
+
+        self.exams[key][exam_id] = {
+            "exam_id": exam_id,
+            "group_id": group_id,
+            "group_name": group_name,
+            "course_title": course_title,
+            "mask": mask,
+            "size": len(student_ids),
+        }
+        self._exam_key[exam_id] = key
+        self.students[key] |= mask
+        self.seats[key] += len(student_ids)
+
+    def remove_exam(self, exam_id):
+        key = self._exam_key.pop(exam_id, None)
+        if key is None:
+            return
+        info = self.exams[key].pop(exam_id)
+        self.seats[key] -= info["size"]
+
+        # Another exam in the same slot may share a student only if the
+        # timetable is already conflicted, so recompute the union rather
+        # than clearing bits that might still be owned by someone else.
+        remaining = 0
+        for other in list(self.exams[key].values()):
+            remaining |= other["mask"]
+        self.students[key] = remaining
+
+        if not self.exams[key]:
+            del self.exams[key]
+            self.students.pop(key, None)
+            self.seats.pop(key, None)
+
+    def reload_exams(self, exam_ids):
+        """
+        Re-read the given exams from the DB (two queries): created ones are
+        added, moved ones re-keyed, cancelled or deleted ones dropped.
+        """
+        for exam_id in exam_ids:
+            self.remove_exam(exam_id)
+        self._load_exams(self._exam_queryset().filter(id__in=exam_ids))
+
+    def copy(self):
+        """
+        An independent copy to apply changes to. Callers may still hold the
+        cached index, so it is never changed in place; the bitsets are ints
+        and the per-exam dicts are replaced, not mutated, so a shallow copy
+        of each container is enough.
+        """
+        other = OccupancyIndex(self.timetable_id, self.location_id)
+        other.stamp = self.stamp
+        other.room_capacity = self.room_capacity
+        other._bit_of = dict(self._bit_of)
+        other._student_at = list(self._student_at)
+        other.students = defaultdict(int, self.students)
+        other.seats = defaultdict(int, self.seats)
+        other.exams = defaultdict(dict, {key: dict(infos) for key, infos in self.exams.items()})
+        other._exam_key = dict(self._exam_key)
+        return other
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def headcount(self, slot_date, slot_name):
+        return self.seats.get(_slot_key(slot_date, slot_name), 0)
+
+    def busy_mask(self, slot_date, slot_name):
+        return self.students.get(_slot_key(slot_date, slot_name), 0)
+
+    def conflicts(self, slot_date, slot_name, mask):
+        """
+        (student_id, exam_info) for every student in `mask` already sitting
+        an exam in this slot, one entry per student.
+        """
+        key = _slot_key(slot_date, slot_name)
+        pending = self.students.get(key, 0) & mask
+        found = []
+        if not pending:
+            return found
+        for info in list(self.exams[key].values()):
+            shared = info["mask"] & pending
+            if not shared:
+                continue
+            for student_id in self.student_ids(shared):
+                found.append((student_id, info))
+            pending &= ~shared
+            if not pending:
+                break
+        return found
+
+    def date_bounds(self):
+        dates = [key[0] for key in self.exams]
+        if not dates:
+            return None, None
+        return min(dates), max(dates)
+
+
+# ----------------------------------------------------------------------
+# Process-local registry
+# ----------------------------------------------------------------------
+
+_indexes = {}
+_lock = threading.Lock()
+
+# Change rows kept per timetable; an index further behind rebuilds.
+KEEP_CHANGES = 500
+
+
+def _current_stamp(timetable_id):
+    from schedules.models import MasterTimetable
+
+    return (
+        MasterTimetable.objects.filter(pk=timetable_id)
+        .values_list("occupancy_version", flat=True)
+        .first()
+    )
+
+
+def _catch_up(index, stamp):
+    """
+    The index brought from its stamp to `stamp` by replaying the recorded
+    changes, or None when one is missing (a whole-timetable change, or
+    pruned) and only a rebuild will do.
+    """
+    from schedules.models import OccupancyChange
+
+    if index.stamp is None or stamp is None or stamp < index.stamp:
+        return None
+    changes = list(
+        OccupancyChange.objects.filter(
+            timetable_id=index.timetable_id, version__gt=index.stamp, version__lte=stamp,
+        ).values_list("exam_ids", flat=True)
+    )
+    if len(changes) != stamp - index.stamp:
+        return None
+    updated = index.copy()
+    updated.reload_exams(sorted({exam_id for exam_ids in changes for exam_id in exam_ids}))
+    updated.stamp = stamp
+    return updated
+
+
+def get_occupancy_index(timetable_id, location_id=None):
+    """
+    Cached index for a timetable (optionally narrowed to one location),
+    built on first use and brought up to date with the changes recorded
+    since, or rebuilt when those are not enough.
+    """
+    timetable_id = int(timetable_id)
+    key = (timetable_id, location_id)
+    stamp = _current_stamp(timetable_id)
+
+    with _lock:
+        index = _indexes.get(key)
+    if index is not None and index.stamp == stamp:
+        return index
+
+    updated = _catch_up(index, stamp) if index is not None else None
+    if updated is None:
+        updated = OccupancyIndex.build(timetable_id, location_id)
+        updated.stamp = stamp
+    with _lock:
+        _indexes[key] = updated
+    return updated
+
+
+def _timetable_ids_for_exams(exam_ids):
+    from schedules.models import MasterTimetableExam
+
+    return set(
+        MasterTimetableExam.objects.filter(exam_id__in=exam_ids)
+        .values_list("master_timetable_id", flat=True)
+    )
+
+
+def _drop(timetable_ids):
+    with _lock:
+        for key in [k for k in _indexes if k[0] in timetable_ids]:
+            _indexes.pop(key, None)
+
+
+def refresh_exams(exam_ids, timetable_ids=None):
+    """
+    Record that these exams were created, moved or cancelled. Bumps the
+    owning timetables' occupancy_version and writes the exam ids under the
+    new version, all in the caller's transaction; cached indexes re-read
+    just these exams on their next lookup.
+
+    The owning timetables are resolved immediately (not on commit) so that
+    this also works when the exams are about to be deleted.
+    """
+    from schedules.models import MasterTimetable, OccupancyChange
+
+    exam_ids = sorted({int(e) for e in exam_ids if e is not None})
+    if not exam_ids:
+        return
+    if timetable_ids is None:
+        timetable_ids = _timetable_ids_for_exams(exam_ids)
+    timetable_ids = {int(t) for t in timetable_ids if t is not None}
+    if not timetable_ids:
+        return
+    with transaction.atomic():
+        versions = MasterTimetable.bump_occupancy_version(timetable_ids)
+        OccupancyChange.objects.bulk_create([
+            OccupancyChange(timetable_id=timetable_id, version=version, exam_ids=exam_ids)
+            for timetable_id, version in versions.items()
+        ])
+        for timetable_id, version in versions.items():
+            OccupancyChange.objects.filter(
+                timetable_id=timetable_id, version__lte=version - KEEP_CHANGES
+            ).delete()
+
+
+def invalidate_timetable(timetable_id):
+    """
+    Force a rebuild of every index of a timetable (bulk rewrites, clones,
+    deletion): the version moves with no change row to replay.
+    """
+    from schedules.models import MasterTimetable, OccupancyChange
+
+    if timetable_id is None:
+        return
+    timetable_id = int(timetable_id)
+    with transaction.atomic():
+        MasterTimetable.bump_occupancy_version([timetable_id])
+        OccupancyChange.objects.filter(timetable_id=timetable_id).delete()
+    # The version check alone would catch it; dropping frees the memory.
+    transaction.on_commit(lambda: _drop({timetable_id}))
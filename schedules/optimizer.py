@@ -0,0 +1,412 @@
+"""
+Local-search optimisation of a generated exam placement.
+
+generate_exam_schedule places every bundle (one entry of
+find_compatible_courses_within_group's compatible_groups) greedily: the
+bundle takes the first (date, slot) that passes the hard constraints and is
+never revisited. That leaves students sitting exams on consecutive days,
+split courses scattered across the whole window, and some days packed while
+others sit half empty.
+
+PlacementOptimizer takes that greedy placement vector (bundle -> slot, or
+unscheduled) and improves it with simulated annealing inside a time budget,
+before anything is written to the database. The hard constraints
+(seat capacity, max exams per day, one exam per slot, min gap) are never
+relaxed — a move that breaks one is simply not made. The objective is a
+weighted sum of:
+
+    unscheduled   students in bundles that have no slot
+    gap           pairs of a student's exam days at most preferred_gap_days apart
+    day_load      sum of squared seats used per day / capacity (flatter is better)
+    slot_load     sum of squared seats used per slot / capacity (room balance)
+    spread        for each split course, days between its first and last sitting
+
+Every term is maintained incrementally: moving a bundle only touches its own
+students, the two slots and days involved, and its own split courses, so a
+move costs O(bundle size) rather than a full re-score.
+
+The search stops at whichever comes first: the time budget, or a stretch of
+iterations without a new best (the placement has converged). The budget is
+seconds_per_bundle per bundle, capped at time_budget_seconds, so a small
+timetable does not pay for the largest one; the stall limit is
+stall_moves_per_candidate times the number of (bundle, slot) moves available.
+
+Tuning lives in config/config.json under "optimization" (see
+optimization_settings); the admin-managed config is the source of truth for
+generation policy, as for the rest of generate_exam_schedule.
+"""
+import logging
+import math
+import random
+import time as _time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "enabled": True,
+    "time_budget_seconds": 5,
+    "seconds_per_bundle": 0.02,
+    "stall_moves_per_candidate": 20,
+    "preferred_gap_days": 1,
+    "seed": None,
+    "weights": {
+        "unscheduled": 1000.0,
+        "gap": 10.0,
+        "day_load": 1.0,
+        "slot_load": 1.0,
+        "spread": 25.0,
+    },
+}
+
+TERMS = ("unscheduled", "gap", "day_load", "slot_load", "spread")
+
+# Small instances still get this many non-improving iterations before the
+# search is considered converged.
+MIN_STALL_ITERATIONS = 2000
+
+
+def optimization_settings(config):
+    """The "optimization" section of the scheduling config, over the defaults."""
+    raw = (config or {}).get("optimization") or {}
+    settings = {**DEFAULT_SETTINGS, **{k: v for k, v in raw.items() if k != "weights"}}
+    settings["weights"] = {**DEFAULT_SETTINGS["weights"], **(raw.get("weights") or {})}
+    return settings
+
+
+def time_budget(settings, n_bundles):
+    """Seconds to anneal n_bundles: seconds_per_bundle each, capped at time_budget_seconds."""
+    if not settings.get("enabled", True):
+        return 0.0
+    budget = float(settings.get("time_budget_seconds") or 0)
+    per_bundle = settings.get("seconds_per_bundle")
+    if per_bundle:
+        budget = min(budget, float(per_bundle) * n_bundles)
+    return budget
+
+
+class PlacementOptimizer:
+    def __init__(self, bundles, candidates, placement, capacity,
+                 max_exams_per_day=1, max_exams_per_slot=1, min_gap_days=0,
+                 preferred_gap_days=1, weights=None, fixed=None, seed=None):
+        """
+        bundles     one dict per bundle: {"students": iterable of student ids,
+                    "split_courses": ids of courses split across bundles}
+        candidates  per bundle, the (date, slot_name) pairs it may use
+        placement   per bundle, its starting (date, slot_name) or None
+        fixed       {(date, slot_name): [student ids]} of exams that already
+                    exist and stay where they are
+        """
+        self.capacity = max(int(capacity or 0), 1)
+        self.max_per_day = max_exams_per_day
+        self.block_same_slot = max_exams_per_slot <= 1
+        self.hard_offsets = [o for g in range(1, (min_gap_days or 0) + 1) for o in (-g, g)]
+        self.soft_offsets = [o for g in range(1, (preferred_gap_days or 0) + 1) for o in (-g, g)]
+        self.weights = {**DEFAULT_SETTINGS["weights"], **(weights or {})}
+        self.rng = random.Random(seed)
+
+        # Slots are numbered once; days are date ordinals so "back-to-back"
+        # means consecutive calendar days, and spread is counted in exam days.
+        fixed = fixed or {}
+        keys = {key for cands in candidates for key in cands} | set(fixed)
+        keys |= {key for key in placement if key is not None}
+        self.slot_keys = sorted(keys, key=lambda k: (k[0], k[1]))
+        slot_id = {key: i for i, key in enumerate(self.slot_keys)}
+        exam_days = sorted({key[0] for key in self.slot_keys})
+        day_index = {d: i for i, d in enumerate(exam_days)}
+        self.slot_day = [key[0].toordinal() for key in self.slot_keys]
+        self.slot_day_index = [day_index[key[0]] for key in self.slot_keys]
+
+        self.students = []
+        self.size = []
+        self.split_courses = []
+        self.candidates = []
+        self.movable = []
+        for bundle, cands in zip(bundles, candidates):
+            students = tuple(bundle["students"])
+            self.students.append(students)
+            self.size.append(len(students))
+            self.split_courses.append(tuple(bundle.get("split_courses", ())))
+            self.candidates.append([slot_id[key] for key in cands])
+            self.movable.append(True)
+        # Existing exams become pinned pseudo-bundles.
+        for key, students in fixed.items():
+            students = tuple(students)
+            self.students.append(students)
+            self.size.append(len(students))
+            self.split_courses.append(())
+            self.candidates.append([slot_id[key]])
+            self.movable.append(False)
+
+        self.seats = [0] * len(self.slot_keys)
+        self.day_seats = defaultdict(int)
+        self.stu_days = defaultdict(dict)    # student -> {day ordinal: exams}
+        self.stu_slots = defaultdict(dict)   # student -> {slot id: exams}
+        self.course_days = defaultdict(lambda: defaultdict(int))  # course -> {day index: sittings}
+
+        self.terms = dict.fromkeys(TERMS, 0)
+        self.terms["unscheduled"] = sum(
+            size for size, movable in zip(self.size, self.movable) if movable
+        )
+        self.placement = [None] * len(self.students)
+        starting = list(placement) + [key for key in fixed]
+        for b, key in enumerate(starting):
+            if key is not None:
+                self._add(b, slot_id[key])
+
+        self.iterations = 0
+        self.accepted = 0
+
+    # ------------------------------------------------------------------
+    # Objective
+    # ------------------------------------------------------------------
+
+    def objective(self, terms=None):
+        terms = terms or self.terms
+        w = self.weights
+        return (
+            w["unscheduled"] * terms["unscheduled"]
+            + w["gap"] * terms["gap"]
+            + w["day_load"] * terms["day_load"] / self.capacity
+            + w["slot_load"] * terms["slot_load"] / self.capacity
+            + w["spread"] * terms["spread"]
+        )
+
+    def _near(self, days, day, offsets):
+        return sum(1 for o in offsets if days.get(day + o))
+
+    def _spread(self, course):
+        days = self.course_days[course]
+        return max(days) - min(days) if days else 0
+
+    def _shift(self, b, t, sign):
+        """Add (sign=1) or remove (sign=-1) bundle b at slot t; returns the objective delta."""
+        before = self.objective()
+        terms = self.terms
+        day = self.slot_day[t]
+        size = self.size[b]
+
+        for student_id in self.students[b]:
+            days = self.stu_days[student_id]
+            slots = self.stu_slots[student_id]
+            if sign > 0:
+                if not days.get(day):
+                    terms["gap"] += self._near(days, day, self.soft_offsets)
+                days[day] = days.get(day, 0) + 1
+                slots[t] = slots.get(t, 0) + 1
+            else:
+                left = days[day] - 1
+                if left:
+                    days[day] = left
+                else:
+                    del days[day]
+                    terms["gap"] -= self._near(days, day, self.soft_offsets)
+                left = slots[t] - 1
+                if left:
+                    slots[t] = left
+                else:
+                    del slots[t]
+
+        seats = self.seats[t]
+        terms["slot_load"] += (seats + sign * size) ** 2 - seats ** 2
+        self.seats[t] = seats + sign * size
+        seats = self.day_seats[day]
+        terms["day_load"] += (seats + sign * size) ** 2 - seats ** 2
+        self.day_seats[day] = seats + sign * size
+
+        day_index = self.slot_day_index[t]
+        for course in self.split_courses[b]:
+            old = self._spread(course)
+            sittings = self.course_days[course]
+            sittings[day_index] += sign
+            if not sittings[day_index]:
+                del sittings[day_index]
+            terms["spread"] += self._spread(course) - old
+
+        if self.movable[b]:
+            terms["unscheduled"] -= sign * size
+        self.placement[b] = t if sign > 0 else None
+        return self.objective() - before
+
+    def _add(self, b, t):
+        return self._shift(b, t, 1)
+
+    def _remove(self, b):
+        return self._shift(b, self.placement[b], -1)
+
+    def _fits(self, b, t):
+        if self.seats[t] + self.size[b] > self.capacity:
+            return False
+        day = self.slot_day[t]
+        for student_id in self.students[b]:
+            days = self.stu_days[student_id]
+            if days.get(day, 0) >= self.max_per_day:
+                return False
+            if self.block_same_slot and self.stu_slots[student_id].get(t):
+                return False
+            if self.hard_offsets and self._near(days, day, self.hard_offsets):
+                return False
+        return True
+
+    # ------------------------------------------------------------------
+    # Moves
+    # ------------------------------------------------------------------
+
+    def _relocate(self, temperature):
+        b = self.rng.choice(self._movable)
+        current = self.placement[b]
+        t = self.rng.choice(self.candidates[b])
+        if t == current:
+            return None
+        delta = self._remove(b) if current is not None else 0.0
+        if not self._fits(b, t):
+            if current is not None:
+                self._add(b, current)
+            return None
+        delta += self._add(b, t)
+        if self._accept(delta, temperature):
+            return delta
+        self._remove(b)
+        if current is not None:
+            self._add(b, current)
+        return None
+
+    def _swap(self, temperature):
+        b1, b2 = self.rng.sample(self._movable, 2)
+        t1, t2 = self.placement[b1], self.placement[b2]
+        if t1 is None or t2 is None or t1 == t2:
+            return None
+        if t2 not in self._candidate_sets[b1] or t1 not in self._candidate_sets[b2]:
+            return None
+        delta = self._remove(b1) + self._remove(b2)
+        placed = []
+        for b, t in ((b1, t2), (b2, t1)):
+            if not self._fits(b, t):
+                break
+            delta += self._add(b, t)
+            placed.append(b)
+        if len(placed) == 2 and self._accept(delta, temperature):
+            return delta
+        for b in placed:
+            self._remove(b)
+        self._add(b1, t1)
+        self._add(b2, t2)
+        return None
+
+    def _accept(self, delta, temperature):
+        if delta <= 0:
+            return True
+        return temperature > 0 and self.rng.random() < math.exp(-delta / temperature)
+
+    def _initial_temperature(self, samples=50):
+        """Mean uphill delta of a few random relocations, undone afterwards."""
+        uphill = []
+        for _ in range(samples):
+            b = self.rng.choice(self._movable)
+            current = self.placement[b]
+            t = self.rng.choice(self.candidates[b])
+            if t == current:
+                continue
+            delta = self._remove(b) if current is not None else 0.0
+            if self._fits(b, t):
+                delta += self._add(b, t)
+                if delta > 0:
+                    uphill.append(delta)
+                self._remove(b)
+            if current is not None:
+                self._add(b, current)
+        return sum(uphill) / len(uphill) if uphill else 1.0
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def run(self, time_budget, progress=None, reports=10, stall_moves=20):
+        """
+        Anneal for up to `time_budget` seconds and return the best placement
+        seen, as (date, slot_name) or None per bundle. The search ends early
+        once `stall_moves` iterations per available (bundle, slot) move pass
+        without a new best; a falsy `stall_moves` disables that. `progress`,
+        if given, is called about `reports` times with a stats dict
+        (objective, best, start, iterations).
+        """
+        self._movable = [
+            b for b, movable in enumerate(self.movable)
+            if movable and self.candidates[b]
+        ]
+        self._candidate_sets = [set(c) for c in self.candidates]
+        stall_limit = 0
+        if stall_moves:
+            moves = sum(len(self.candidates[b]) for b in self._movable)
+            stall_limit = max(MIN_STALL_ITERATIONS, int(stall_moves * moves))
+        self.stop_reason = "budget"
+
+        start_objective = self.objective()
+        best_objective, best_terms = start_objective, dict(self.terms)
+        best = list(self.placement)
+
+        started = _time.monotonic()
+        if self._movable and time_budget and time_budget > 0:
+            t_start = self._initial_temperature()
+            t_end = t_start * 1e-3
+            interval = time_budget / max(reports, 1)
+            next_report = started + interval
+            temperature = t_start
+            current = start_objective
+            last_improvement = 0
+            while True:
+                if self.iterations % 64 == 0:
+                    now = _time.monotonic()
+                    elapsed = now - started
+                    if elapsed >= time_budget:
+                        break
+                    if stall_limit and self.iterations - last_improvement >= stall_limit:
+                        self.stop_reason = "converged"
+                        break
+                    temperature = t_start * (t_end / t_start) ** (elapsed / time_budget)
+                    if progress and now >= next_report:
+                        next_report = now + interval
+                        progress(self._stats(current, best_objective, start_objective, best_terms))
+                self.iterations += 1
+
+                if len(self._movable) > 1 and self.rng.random() < 0.5:
+                    delta = self._swap(temperature)
+                else:
+                    delta = self._relocate(temperature)
+                if delta is None:
+                    continue
+                self.accepted += 1
+                current += delta
+                if current < best_objective - 1e-9:
+                    best_objective, best_terms = current, dict(self.terms)
+                    best = list(self.placement)
+                    last_improvement = self.iterations
+
+        self.elapsed = _time.monotonic() - started
+        self.start_objective = start_objective
+        self.best_objective = best_objective
+        self.best_terms = best_terms
+        if progress:
+            progress(self._stats(best_objective, best_objective, start_objective, best_terms))
+        logger.info(
+            f"Placement optimiser: {start_objective:.1f} -> {best_objective:.1f} "
+            f"in {self.iterations} iterations ({self.elapsed:.1f}s, {self.stop_reason})"
+        )
+
+        n_bundles = sum(self.movable)
+        return [
+            self.slot_keys[t] if t is not None else None
+            for t in best[:n_bundles]
+        ]
+
+    def _stats(self, objective, best, start, terms):
+        return {
+            "objective": round(objective, 2),
+            "best_objective": round(best, 2),
+            "initial_objective": round(start, 2),
+            "iterations": self.iterations,
+            "accepted_moves": self.accepted,
+            "gap_pairs": terms["gap"],
+            "unscheduled_students": terms["unscheduled"],
+            "split_course_spread": terms["spread"],
+        }
@@ -0,0 +1,469 @@
+"""
+Database-free planning core of generate_exam_schedule.
+
+generate_exam_schedule loads everything it needs once (enrollments, group
+names, dates, config) into a plain "problem" dict, and this module turns
+that into a plan: colour the courses into compatible bundles, order the
+bundles, place them greedily, then run the local-search pass from
+schedules/optimizer.py. Nothing here touches Django or the database, so an
+attempt can run in a worker process as easily as inline.
+
+Portfolio mode (optimization.portfolio_size > 1 in config/config.json)
+runs several attempts in parallel, each with a different bundle ordering
+and colouring seed, scores them and hands the best one back to be
+persisted. Attempt 0 is always the original deterministic ordering, so the
+portfolio can only match or beat a single run. Each worker gets the full
+optimisation time budget, so on a box with at least portfolio_size cores
+the whole portfolio takes as long as one attempt.
+
+Problem keys:
+
+    course_students        {course_id: set(student ids)}
+    course_group_students  {course_id: {group_id: set(student ids)}}
+    course_group_sizes     {course_id: {group_id: int}}
+    course_conflicts       {course_id: [course ids sharing a student]}
+    room_capacity          raw seat total (colouring limit)
+    effective_seats        seats after the capacity buffer (placement limit)
+    dates, slots, slots_by_date, group_names, group_preferences,
+    defined_time_slots, special_rules
+    max_exams_per_day, max_exams_per_slot, min_gap_days
+    prioritize_large_courses
+    optimization           optimization_settings(config)
+    fixed                  {(date, slot_name): [student ids]} of existing exams
+"""
+import logging
+import multiprocessing
+import os
+import random
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import combinations
+
+from schedules.optimizer import PlacementOptimizer, time_budget
+
+logger = logging.getLogger(__name__)
+
+# Bundle orderings tried by the portfolio, in turn, after attempt 0.
+ORDERINGS = ("largest_first", "most_constrained", "shuffled")
+
+
+def build_course_conflicts(course_students):
+    """Course conflict graph: courses sharing at least one student."""
+    course_conflicts = defaultdict(list)
+    for c1, c2 in combinations(course_students.keys(), 2):
+        if course_students[c1] & course_students[c2]:
+            course_conflicts[c1].append(c2)
+            course_conflicts[c2].append(c1)
+    return course_conflicts
+
+
+def color_courses(course_students, course_group_students, course_group_sizes,
+                  course_conflicts, max_students_per_slot, rng=None):
+    """
+    Greedy graph colouring (one colour = one bundle of courses that can sit
+    together). Courses are taken largest and most conflicted first; with an
+    `rng` the sizes are jittered so each portfolio attempt explores a
+    different colouring.
+    """
+    color_courses        = defaultdict(list)
+    color_student_counts = defaultdict(int)
+    color_course_groups  = defaultdict(lambda: defaultdict(list))
+    colored              = {}
+
+    # Sort: largest course first, most conflicted first
+    if rng is None:
+        sort_key = lambda x: (-len(course_students[x]), -len(course_conflicts.get(x, ())))
+    else:
+        jitter = {c: rng.uniform(0.8, 1.2) for c in course_students}
+        sort_key = lambda x: (
+            -len(course_students[x]) * jitter[x], -len(course_conflicts.get(x, ()))
+        )
+    course_list = sorted(course_students.keys(), key=sort_key)
+
+    for course in course_list:
+        course_size   = len(course_students[course])
+        course_groups = list(course_group_students[course].keys())
+        conflicts     = course_conflicts.get(course, ())
+
+        # FIX: compute compatible count once, use 0 for isolated courses
+        # (so they get a slot immediately rather than being deferred)
+        available_colors = []
+        for color in range(len(course_students)):
+            conflict_free = all(
+                colored.get(conflict) != color
+                for conflict in conflicts
+                if conflict in colored
+            )
+            has_capacity = (
+                color_student_counts[color] + course_size
+            ) <= max_students_per_slot
+
+            if conflict_free and has_capacity:
+                available_colors.append(color)
+
+        if available_colors:
+            chosen = min(available_colors, key=lambda c: color_student_counts[c])
+            colored[course] = chosen
+            color_courses[chosen].append(course)
+            color_student_counts[chosen] += course_size
+            for gid in course_groups:
+                color_course_groups[chosen][course].append(gid)
+        else:
+            # Course doesn't fit in any existing slot — split by group
+            sorted_groups = sorted(
+                course_groups, key=lambda g: -course_group_sizes[course][g]
+            )
+            for gid in sorted_groups:
+                gsize = course_group_sizes[course][gid]
+                best_color, best_remaining = None, float("inf")
+
+                for color in range(len(color_student_counts) + 1):
+                    if any(
+                        colored.get(conflict) == color
+                        for conflict in conflicts
+                        if conflict in colored
+                    ):
+                        continue
+                    current = color_student_counts.get(color, 0)
+                    remaining = max_students_per_slot - current
+                    if gsize <= remaining and remaining < best_remaining:
+                        best_color, best_remaining = color, remaining
+
+                if best_color is not None:
+                    color_course_groups[best_color][course].append(gid)
+                    color_student_counts[best_color] = (
+                        color_student_counts.get(best_color, 0) + gsize
+                    )
+
+    # Convert colour map → output format
+    compatible_groups = []
+    for color in sorted(color_course_groups.keys()):
+        courses_in_slot, total_students = [], 0
+        for course_id, gids in color_course_groups[color].items():
+            slot_size = sum(
+                course_group_sizes[course_id][g] for g in gids
+            )
+            total_students += slot_size
+            courses_in_slot.append({
+                "course_id": course_id,
+                "groups":    gids,
+                "student_count": slot_size,
+                "all_groups_scheduled_together": (
+                    len(gids) == len(course_group_students[course_id])
+                ),
+                "split_course": (
+                    len(gids) < len(course_group_students[course_id])
+                ),
+            })
+        if courses_in_slot:
+            compatible_groups.append({
+                "timeslot":       color + 1,
+                "courses":        courses_in_slot,
+                "student_count":  total_students,
+                "within_capacity": total_students <= max_students_per_slot,
+            })
+
+    return compatible_groups
+
+
+def _student_violates_gap(sorted_exam_dates, proposed_date, min_gap_days):
+    """
+    Return True if proposed_date is within min_gap_days of any
+    date already in sorted_exam_dates (a sorted list of date objects).
+    O(log n) using binary search.
+    """
+    if not sorted_exam_dates or min_gap_days <= 0:
+        return False
+    lo = bisect_left(sorted_exam_dates,
+                     proposed_date - timedelta(days=min_gap_days))
+    hi = bisect_right(sorted_exam_dates,
+                      proposed_date + timedelta(days=min_gap_days))
+    nearby = sorted_exam_dates[lo:hi]
+    return any(d != proposed_date for d in nearby)
+
+
+def bundle_candidate_slots(course_group, dates, slots, slots_by_date, group_names,
+                           group_preferences, defined_time_slots, special_rules):
+    """
+    Every (date, slot_name) a bundle may be placed in, in the order the
+    greedy pass tries them: date first, then the bundle's group slot
+    preference, narrowed by the request's per-date slots and the
+    weekday special rules.
+    """
+    # Determine preferred slot order for this group
+    preferred_slots = []
+    if course_group["courses"] and course_group["courses"][0]["groups"]:
+        first_gid = course_group["courses"][0]["groups"][0]
+        gname = group_names.get(first_gid)
+        if gname in group_preferences:
+            preferred_slots = group_preferences[gname].get(
+                "slots_order", []
+            )
+    if not preferred_slots:
+        preferred_slots = [s["name"] for s in defined_time_slots]
+
+    candidates = []
+    for current_date in dates:
+        weekday = current_date.strftime("%A")
+
+        # Build allowed slots for this day
+        day_slots = preferred_slots[:]
+        if slots and current_date in slots_by_date:
+            cfg = slots_by_date[current_date]
+            cfg_names = set()
+            for s in cfg:
+                if isinstance(s, dict):
+                    n = s.get("name") or s.get("label")
+                    if n: cfg_names.add(n)
+                elif isinstance(s, (list, tuple)) and len(s) >= 2:
+                    cfg_names.add(s[1])
+            if cfg_names:
+                day_slots = [s for s in day_slots if s in cfg_names]
+
+        if weekday in special_rules:
+            rule = special_rules[weekday]
+            if "allowed_slots" in rule:
+                day_slots = [
+                    s for s in preferred_slots
+                    if s in rule["allowed_slots"]
+                ]
+            elif rule.get("no_evening", False):
+                day_slots = [s for s in preferred_slots if s != "Evening"]
+
+        candidates.extend((current_date, slot_name) for slot_name in day_slots)
+    return candidates
+
+
+def _bundle_students(course_group, course_group_students):
+    students = set()
+    for cd in course_group["courses"]:
+        for gid in cd["groups"]:
+            students |= course_group_students[cd["course_id"]].get(gid, set())
+    return students
+
+
+def greedy_place(bundle_students, bundle_sizes, candidates, problem):
+    """
+    First-fit placement in bundle order: each bundle takes the first
+    candidate (date, slot) with enough seats where none of its students
+    exceeds max exams per day / per slot or the min gap.
+    """
+    max_exams_per_day  = problem["max_exams_per_day"]
+    max_exams_per_slot = problem["max_exams_per_slot"]
+    min_gap_days       = problem["min_gap_days"]
+    effective_seats    = problem["effective_seats"]
+
+    # student_daily_exams[student_id][date] = set of slot_names
+    student_daily_exams = defaultdict(lambda: defaultdict(set))
+    # FIX #8: keep sorted list per student for O(log n) gap check
+    student_sorted_dates = defaultdict(list)
+    slot_seats_usage = defaultdict(lambda: defaultdict(int))
+    for (exam_date, slot_name), student_ids in problem["fixed"].items():
+        for sid in student_ids:
+            student_daily_exams[sid][exam_date].add(slot_name)
+            insort(student_sorted_dates[sid], exam_date)
+        slot_seats_usage[exam_date][slot_name] += len(student_ids)
+
+    placement = []
+    for group_student_ids, needed, bundle_candidates in zip(bundle_students, bundle_sizes, candidates):
+        chosen = None
+        for current_date, slot_name in bundle_candidates:
+            # A. Capacity check
+            if slot_seats_usage[current_date][slot_name] + needed > effective_seats:
+                continue
+
+            # B. Per-student constraint checks
+            can_fit = True
+            for sid in group_student_ids:
+                day_slots_used = student_daily_exams[sid][current_date]
+
+                if len(day_slots_used) >= max_exams_per_day:
+                    can_fit = False
+                    break
+
+                if slot_name in day_slots_used and max_exams_per_slot <= 1:
+                    can_fit = False
+                    break
+
+                if min_gap_days > 0 and _student_violates_gap(
+                    student_sorted_dates[sid], current_date, min_gap_days
+                ):
+                    can_fit = False
+                    break
+
+            if can_fit:
+                chosen = (current_date, slot_name)
+                break
+
+        placement.append(chosen)
+        if chosen:
+            current_date, slot_name = chosen
+            for sid in group_student_ids:
+                student_daily_exams[sid][current_date].add(slot_name)
+                insort(student_sorted_dates[sid], current_date)
+            slot_seats_usage[current_date][slot_name] += needed
+    return placement
+
+
+def plan_attempt(problem, attempt=0, ordering=None, seed=None,
+                 compatible_groups=None, progress=None):
+    """
+    One complete in-memory plan. Attempt 0 (no seed) reproduces the
+    deterministic single-run behaviour; later attempts jitter the colouring
+    and use `ordering` for the bundles. Returns a dict with the ordered
+    bundles, their placement, the optimiser's objective and a score.
+    """
+    rng = random.Random(seed) if seed is not None else None
+    if compatible_groups is None:
+        compatible_groups = color_courses(
+            problem["course_students"], problem["course_group_students"],
+            problem["course_group_sizes"], problem["course_conflicts"],
+            problem["room_capacity"], rng=rng,
+        )
+
+    candidates = [
+        bundle_candidate_slots(
+            g, problem["dates"], problem["slots"], problem["slots_by_date"],
+            problem["group_names"], problem["group_preferences"],
+            problem["defined_time_slots"], problem["special_rules"],
+        )
+        for g in compatible_groups
+    ]
+    order = list(range(len(compatible_groups)))
+    if ordering is None:
+        ordering = "largest_first" if problem["prioritize_large_courses"] else "colour"
+    if ordering == "largest_first":
+        order.sort(key=lambda i: -compatible_groups[i]["student_count"])
+    elif ordering == "most_constrained":
+        order.sort(key=lambda i: (len(candidates[i]), -compatible_groups[i]["student_count"]))
+    elif ordering == "shuffled":
+        (rng or random.Random(attempt)).shuffle(order)
+
+    bundles = [compatible_groups[i] for i in order]
+    candidates = [candidates[i] for i in order]
+    students = [_bundle_students(g, problem["course_group_students"]) for g in bundles]
+    sizes = [g["student_count"] for g in bundles]
+    placement = greedy_place(students, sizes, candidates, problem)
+
+    settings = problem["optimization"]
+    optimizer = PlacementOptimizer(
+        [
+            {
+                "students": s,
+                "split_courses": [
+                    cd["course_id"] for cd in g["courses"] if cd.get("split_course")
+                ],
+            }
+            for g, s in zip(bundles, students)
+        ],
+        candidates, placement, problem["effective_seats"],
+        max_exams_per_day=problem["max_exams_per_day"],
+        max_exams_per_slot=problem["max_exams_per_slot"],
+        min_gap_days=problem["min_gap_days"],
+        preferred_gap_days=settings.get("preferred_gap_days", 1),
+        weights=settings.get("weights"),
+        fixed=problem["fixed"],
+        seed=seed if seed is not None else settings.get("seed"),
+    )
+    placement = optimizer.run(
+        time_budget(settings, len(bundles)), progress=progress,
+        stall_moves=settings.get("stall_moves_per_candidate"),
+    )
+
+    plan = {
+        "attempt": attempt,
+        "ordering": ordering,
+        "seed": seed,
+        "bundles": bundles,
+        "placement": placement,
+        "initial_objective": round(optimizer.start_objective, 2),
+        "objective": round(optimizer.best_objective, 2),
+        "iterations": optimizer.iterations,
+        "stop_reason": optimizer.stop_reason,
+        "gap_pairs": optimizer.best_terms["gap"],
+    }
+    plan["score"] = score_plan(plan, problem)
+    return plan
+
+
+def score_plan(plan, problem):
+    """
+    Lower is better, compared in order: course groups left unscheduled,
+    students with no seat, student gap violations, optimiser objective.
+
+    Rooms are only allocated once a plan is written, so "no seat" is
+    estimated here as each slot's headcount above the raw room capacity.
+    """
+    unscheduled_groups = sum(
+        len(cd["groups"])
+        for g, chosen in zip(plan["bundles"], plan["placement"])
+        if chosen is None
+        for cd in g["courses"]
+    )
+    seats = defaultdict(int)
+    for key, student_ids in problem["fixed"].items():
+        seats[key] += len(student_ids)
+    for g, chosen in zip(plan["bundles"], plan["placement"]):
+        if chosen is not None:
+            seats[chosen] += g["student_count"]
+    unaccommodated = sum(max(0, n - problem["room_capacity"]) for n in seats.values())
+    return (unscheduled_groups, unaccommodated, plan["gap_pairs"], plan["objective"])
+
+
+def _portfolio_attempts(size, base_seed):
+    attempts = [(0, None, None)]
+    for i in range(1, size):
+        attempts.append((i, ORDERINGS[(i - 1) % len(ORDERINGS)], base_seed + i))
+    return attempts
+
+
+def run_portfolio(problem, size, compatible_groups=None, progress=None):
+    """
+    Run `size` attempts in worker processes and return (best plan, all
+    scores). Falls back to running the attempts inline, splitting the time
+    budget between them, if worker processes cannot be started (e.g. when
+    already inside a daemonic worker).
+    """
+    base_seed = problem["optimization"].get("seed")
+    if base_seed is None:
+        base_seed = random.randrange(1 << 30)
+    attempts = _portfolio_attempts(size, base_seed)
+    workers = min(size, os.cpu_count() or 1)
+
+    plans = []
+
+    def _done(plan):
+        plans.append(plan)
+        if progress:
+            progress(plan, len(plans), size)
+
+    try:
+        # spawn, not fork: the caller is a threaded web process and the
+        # workers need nothing from it but the pickled problem.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(
+                    plan_attempt, problem, attempt, ordering, seed,
+                    compatible_groups if attempt == 0 else None,
+                )
+                for attempt, ordering, seed in attempts
+            ]
+            for future in futures:
+                _done(future.result())
+    except Exception as exc:
+        logger.warning(f"Portfolio workers unavailable ({exc}); running attempts inline")
+        plans.clear()
+        settings = dict(problem["optimization"])
+        settings["time_budget_seconds"] = float(settings.get("time_budget_seconds") or 0) / size
+        inline_problem = {**problem, "optimization": settings}
+        for attempt, ordering, seed in attempts:
+            _done(plan_attempt(
+                inline_problem, attempt, ordering, seed,
+                compatible_groups if attempt == 0 else None,
+            ))
+
+    best = min(plans, key=lambda p: (p["score"], p["attempt"]))
+    return best, {p["attempt"]: p["score"] for p in plans}
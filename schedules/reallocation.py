@@ -0,0 +1,250 @@
+"""
+Incremental room re-allocation for single-exam edits.
+
+The manual board used to hand the whole slot to allocate_shared_rooms_updated
+after every add, move or removal: every StudentExam of the slot loaded and
+filtered in Python, one UPDATE per exam/room pair, then seat assignment
+re-run for every occupied room. The cost of dragging one group around grew
+with the size of the slot, not with the size of the change.
+
+reallocate_slot_delta() takes the change instead:
+
+    added      StudentExam rows entering the slot (new rows, or rows of an
+               exam that just moved here); they are placed from scratch
+    removed    rows leaving the slot (about to be deleted, or moved away),
+               still carrying their old room; their seats are freed
+
+and a SlotOccupancy (per-room seat counts for the slot, loaded with one
+GROUP BY or passed in by a caller that already has it). Students already
+seated never move. Added students go to rooms already hosting their exam
+first, then to the rooms with the most free seats; in rooms with a seat
+layout they get the free seat with the fewest same-exam neighbours, so the
+interleaving assign_seat_positions_for_room_slot produces is kept. Freed
+seats are offered to students of the slot still waiting for a room. All
+changes are written with one bulk_update.
+"""
+import logging
+from collections import Counter, defaultdict, namedtuple
+
+from django.db.models import Count
+
+from exams import passes, read_model
+from exams.models import StudentExam
+from schedules.utils import get_available_rooms
+
+logger = logging.getLogger(__name__)
+
+ReallocationResult = namedtuple("ReallocationResult", ["placed", "unplaced", "occupancy"])
+
+
+class RoomLoad:
+    __slots__ = ("room", "occupied")
+
+    def __init__(self, room, occupied=0):
+        self.room = room
+        self.occupied = occupied
+
+    @property
+    def available(self):
+        return self.room.capacity - self.occupied
+
+
+class SlotOccupancy:
+    """Seats taken per room for one (location, date, start, end) slot."""
+
+    def __init__(self, location, slot_date, start_time, end_time, loads):
+        self.location = location
+        self.slot_date = slot_date
+        self.start_time = start_time
+        self.end_time = end_time
+        self.loads = loads   # room_id -> RoomLoad
+
+    @classmethod
+    def load(cls, location, slot_date, start_time, end_time, exclude_ids=()):
+        rooms = list(get_available_rooms(location, slot_date, start_time, end_time))
+        counts = dict(
+            StudentExam.objects.filter(
+                room_id__in=[r.id for r in rooms],
+                slot_date=slot_date,
+                slot_start=start_time,
+                slot_end=end_time,
+            )
+            .exclude(id__in=list(exclude_ids))
+            .values_list("room_id")
+            .annotate(n=Count("id"))
+        )
+        loads = {r.id: RoomLoad(r, counts.get(r.id, 0)) for r in rooms}
+        return cls(location, slot_date, start_time, end_time, loads)
+
+    def matches(self, location, slot_date, start_time, end_time):
+        return (
+            self.location.id == location.id
+            and (self.slot_date, self.start_time, self.end_time) == (slot_date, start_time, end_time)
+        )
+
+    def available(self):
+        return sum(max(0, load.available) for load in self.loads.values())
+
+    def release(self, room_ids):
+        for room_id, n in Counter(room_ids).items():
+            load = self.loads.get(room_id)
+            if load is not None:
+                load.occupied = max(0, load.occupied - n)
+
+    def rooms_for(self, preferred=()):
+        """Rooms with free seats: `preferred` ones first, then most free seats first."""
+        preferred = set(preferred)
+        candidates = [load for load in self.loads.values() if load.available > 0]
+        return sorted(candidates, key=lambda load: (load.room.id not in preferred, -load.available))
+
+
+def _seat_grid(room):
+    return [
+        (r, c) for r in range(1, room.rows + 1) for c in range(1, room.columns + 1)
+    ][: room.capacity]
+
+
+class _SeatPicker:
+    """
+    Free seats of the rooms that receive students, loaded on first use.
+    Rows in `exclude_ids` (the edit's added and removed rows) do not hold
+    a seat: on a move they still carry the old one until they are written.
+    """
+
+    def __init__(self, occupancy, exclude_ids=()):
+        self.occupancy = occupancy
+        self.exclude_ids = list(exclude_ids)
+        self._taken = {}   # room_id -> {(row, col): exam_id}
+
+    def _seats(self, room):
+        taken = self._taken.get(room.id)
+        if taken is None:
+            taken = self._taken[room.id] = {
+                (row, col): exam_id
+                for row, col, exam_id in StudentExam.objects.filter(
+                    room_id=room.id,
+                    slot_date=self.occupancy.slot_date,
+                    slot_start=self.occupancy.start_time,
+                    slot_end=self.occupancy.end_time,
+                    seat_row__isnull=False,
+                )
+                .exclude(id__in=self.exclude_ids)
+                .values_list("seat_row", "seat_column", "exam_id")
+            }
+        return taken
+
+    def pick(self, room, exam_id):
+        if not room.has_seat_layout():
+            return None
+        taken = self._seats(room)
+        best, best_score = None, None
+        for row, col in _seat_grid(room):
+            if (row, col) in taken:
+                continue
+            score = sum(
+                taken.get(neighbour) == exam_id
+                for neighbour in ((row, col - 1), (row, col + 1), (row - 1, col), (row + 1, col))
+            )
+            if best is None or score < best_score:
+                best, best_score = (row, col), score
+                if score == 0:
+                    break
+        if best is not None:
+            taken[best] = exam_id
+        return best
+
+
+def _place(student_exams, occupancy, picker):
+    """Assign rooms/seats in memory; returns (placed, unplaced)."""
+    by_exam = defaultdict(list)
+    for se in student_exams:
+        by_exam[se.exam_id].append(se)
+
+    hosting = defaultdict(set)
+    for exam_id, room_id in (
+        StudentExam.objects.filter(
+            exam_id__in=list(by_exam),
+            room_id__in=list(occupancy.loads),
+            slot_date=occupancy.slot_date,
+            slot_start=occupancy.start_time,
+            slot_end=occupancy.end_time,
+        )
+        .exclude(id__in=[se.id for se in student_exams])
+        .values_list("exam_id", "room_id")
+        .distinct()
+    ):
+        hosting[exam_id].add(room_id)
+
+    placed, unplaced = [], []
+    # Largest exams first, as allocate_shared_rooms_updated does.
+    for exam_id, rows in sorted(by_exam.items(), key=lambda kv: -len(kv[1])):
+        pending = list(rows)
+        for load in occupancy.rooms_for(hosting[exam_id]):
+            if not pending:
+                break
+            take, pending = pending[: load.available], pending[load.available:]
+            for se in take:
+                se.room_id = load.room.id
+                seat = picker.pick(load.room, exam_id)
+                se.seat_row, se.seat_column = seat if seat else (None, None)
+            load.occupied += len(take)
+            placed.extend(take)
+        unplaced.extend(pending)
+    return placed, unplaced
+
+
+def reallocate_slot_delta(location, slot_date, start_time, end_time, added=(), removed=(), occupancy=None):
+    """
+    Apply one edit's change to the room allocation of a slot.
+
+    `added` rows are (re)placed from scratch; `removed` rows free their
+    seats and must still carry the room they had. Returns a
+    ReallocationResult; `unplaced` rows are left with room=None.
+    """
+    added = [se for se in added if se.location_id in (None, location.id)]
+    added_ids = [se.id for se in added]
+
+    if occupancy is None or not occupancy.matches(location, slot_date, start_time, end_time):
+        occupancy = SlotOccupancy.load(location, slot_date, start_time, end_time, exclude_ids=added_ids)
+    if removed:
+        occupancy.release(se.room_id for se in removed if se.room_id)
+
+    for se in added:
+        se.room_id = se.seat_row = se.seat_column = None
+
+    removed_ids = [se.id for se in removed]
+    picker = _SeatPicker(occupancy, exclude_ids=added_ids + removed_ids)
+    placed, unplaced = _place(added, occupancy, picker)
+
+    backfilled = []
+    if removed and occupancy.available():
+        waiting = list(
+            StudentExam.objects.filter(
+                location=location,
+                slot_date=slot_date,
+                slot_start=start_time,
+                slot_end=end_time,
+                room__isnull=True,
+            ).exclude(id__in=added_ids + removed_ids)
+        )
+        if waiting:
+            backfilled, _ = _place(waiting, occupancy, picker)
+
+    changed = added + backfilled
+    if changed:
+        StudentExam.objects.bulk_update(changed, ["room", "seat_row", "seat_column"])
+        read_model.invalidate_owners(
+            [se.student_id for se in changed], [se.instructor_id for se in changed]
+        )
+        passes.request_reissue(student_exam_ids=[se.id for se in changed])
+
+    if unplaced:
+        logger.warning(
+            f"Could not place {len(unplaced)} student(s) in {location} on "
+            f"{slot_date} {start_time}-{end_time}: no free seats"
+        )
+    logger.info(
+        f"Slot {slot_date} {start_time}-{end_time} at {location}: placed "
+        f"{len(placed)}, backfilled {len(backfilled)}, freed {len(removed)}"
+    )
+    return ReallocationResult(placed + backfilled, unplaced, occupancy)
@@ -0,0 +1,561 @@
+"""
+What-if simulation of manual timetable edits.
+
+Admins usually try several moves on the manual board (changeTime,
+reschedule-exam, schedule-course-group, remove-scheduled-exam) before
+settling on one, and every attempt used to write to the database, run the
+full conflict checks and then have to be undone by hand.
+
+A TimetableSimulation loads a MasterTimetable snapshot once (exams, rosters,
+room capacity, admin constraints) and applies hypothetical moves in memory.
+Each move returns the change it caused in:
+
+    conflicts       students double-booked in the same slot
+    overflow        seats needed beyond the location's (buffered) capacity
+    day_violations  exams beyond student_constraints.max_exams_per_day
+    gap_violations  consecutive exam days closer than min_gap_between_exams_days
+
+Only the students and slots touched by the move are re-scored, so
+evaluating a move is a dictionary walk over one roster. commit() replays
+the accepted moves against the database in a single transaction, after
+checking nothing it touches was changed by someone else in the meantime.
+
+Sessions are pickled into TimetableSimulationSession rows (see save / get)
+so they survive across requests and workers; locked() holds the row lock
+for the whole load, apply, save of one request, so two concurrent requests
+on the same session cannot overwrite each other's moves.
+"""
+import copy
+import logging
+import pickle
+import uuid
+import zlib
+from collections import defaultdict, Counter
+from contextlib import contextmanager
+from datetime import datetime, date as date_cls, time as time_cls, timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from config.utils import JsonConfigManager
+from enrollments.models import Enrollment
+from exams.models import Exam, StudentExam, UnscheduledExam
+from rooms.models import Room
+from schedules.models import MasterTimetable, TimetableSimulationSession
+from schedules.slot_calendar import get_slot_calendar
+
+logger = logging.getLogger(__name__)
+
+SESSION_TIMEOUT_SECONDS = 60 * 60 * 2
+
+METRICS = ("conflicts", "overflow", "day_violations", "gap_violations")
+
+
+def _as_date(value):
+    if isinstance(value, date_cls):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _as_time(value):
+    if isinstance(value, time_cls):
+        return value
+    return time_cls.fromisoformat(value)
+
+
+class TimetableSimulation:
+    def __init__(self, timetable_id, user_id=None):
+        self.id = uuid.uuid4().hex
+        self.timetable_id = timetable_id
+        self.user_id = user_id
+        self.moves = []          # applied moves, each with what is needed to undo it
+        self._new_seq = 0
+
+        self.exams = {}          # exam key -> exam record (see _record)
+        self.original = {}       # exam id -> (date, slot_name, start, end) at load time
+        self.slot_students = defaultdict(Counter)   # (date, slot) -> student -> exams
+        self.seats = defaultdict(int)               # (date, slot) -> seats needed
+        self.student_days = defaultdict(Counter)    # student -> date -> exams
+        self.group_rosters = {}                     # group_id -> roster, lazily loaded
+        self.metrics = dict.fromkeys(METRICS, 0)
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def load(cls, timetable_id, user_id=None):
+        timetable = MasterTimetable.objects.get(id=timetable_id)
+        sim = cls(timetable.id, user_id)
+        sim.location_id = timetable.location_id
+
+        config = JsonConfigManager().read_config()
+        student_constraints = config.get("student_constraints", {})
+        sim.max_exams_per_day = student_constraints.get("max_exams_per_day", 1)
+        sim.min_gap_days = student_constraints.get("min_gap_between_exams_days", 0)
+        buffer_pct = config.get("room_constraints", {}).get("capacity_buffer_percent", 0)
+        sim.calendar = get_slot_calendar()
+
+        rooms = Room.objects.filter(location_id=sim.location_id) if sim.location_id else Room.objects.all()
+        total_seats = rooms.aggregate(total=Sum("capacity"))["total"] or 0
+        sim.capacity = int(total_seats * (1 - buffer_pct / 100.0))
+
+        rows = list(
+            Exam.objects.filter(mastertimetableexam__master_timetable_id=timetable.id).values(
+                "id", "date", "slot_name", "start_time", "end_time",
+                "group_id", "group__group_name", "group__course__title",
+            )
+        )
+        rosters = defaultdict(list)
+        for exam_id, student_id in StudentExam.objects.filter(
+            exam_id__in=[r["id"] for r in rows]
+        ).values_list("exam_id", "student_id"):
+            rosters[exam_id].append(student_id)
+
+        for r in rows:
+            record = sim._record(
+                r["id"], r["date"], r["slot_name"], r["start_time"], r["end_time"],
+                r["group_id"], r["group__group_name"], r["group__course__title"],
+                rosters.get(r["id"], []),
+            )
+            sim.original[r["id"]] = (r["date"], r["slot_name"], r["start_time"], r["end_time"])
+            sim._place(record)
+
+        # Baseline totals, scored once over the whole snapshot rather than
+        # trusting the per-exam deltas accumulated while loading.
+        sim.metrics = dict.fromkeys(METRICS, 0)
+        sim.metrics["conflicts"] = sum(
+            sum(n - 1 for n in counts.values() if n > 1)
+            for counts in sim.slot_students.values()
+        )
+        sim.metrics["overflow"] = sum(sim._slot_overflow(key) for key in sim.seats)
+        for student_id in sim.student_days:
+            day, gap = sim._student_penalty(student_id)
+            sim.metrics["day_violations"] += day
+            sim.metrics["gap_violations"] += gap
+        return sim
+
+    @staticmethod
+    def _record(exam_id, exam_date, slot_name, start, end, group_id, group_name, course_title, roster):
+        return {
+            "key": exam_id,
+            "exam_id": exam_id,
+            "date": exam_date,
+            "slot_name": slot_name,
+            "start_time": start,
+            "end_time": end,
+            "group_id": group_id,
+            "group_name": group_name,
+            "course_title": course_title,
+            "roster": tuple(roster),
+        }
+
+    # ------------------------------------------------------------------
+    # Scoring helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _slot_key(exam_date, slot_name):
+        return (exam_date, (slot_name or "").lower())
+
+    def _slot_overflow(self, key):
+        return max(0, self.seats.get(key, 0) - self.capacity)
+
+    def _student_penalty(self, student_id):
+        days = self.student_days.get(student_id)
+        if not days:
+            return 0, 0
+        day_violations = sum(
+            n - self.max_exams_per_day for n in days.values() if n > self.max_exams_per_day
+        )
+        gap_violations = 0
+        if self.min_gap_days > 0:
+            ordered = sorted(d for d, n in days.items() if n)
+            gap_violations = sum(
+                1 for a, b in zip(ordered, ordered[1:])
+                if (b - a).days <= self.min_gap_days
+            )
+        return day_violations, gap_violations
+
+    def _place(self, record, sign=1):
+        """Add (sign=1) or take out (sign=-1) a record, returning the metric delta."""
+        key = self._slot_key(record["date"], record["slot_name"])
+        delta = dict.fromkeys(METRICS, 0)
+
+        before_overflow = self._slot_overflow(key)
+        before_penalty = {s: self._student_penalty(s) for s in record["roster"]}
+
+        counts = self.slot_students[key]
+        for student_id in record["roster"]:
+            if sign > 0:
+                if counts[student_id] >= 1:
+                    delta["conflicts"] += 1
+                counts[student_id] += 1
+                self.student_days[student_id][record["date"]] += 1
+            else:
+                counts[student_id] -= 1
+                if counts[student_id] >= 1:
+                    delta["conflicts"] -= 1
+                if counts[student_id] <= 0:
+                    del counts[student_id]
+                days = self.student_days[student_id]
+                days[record["date"]] -= 1
+                if days[record["date"]] <= 0:
+                    del days[record["date"]]
+        self.seats[key] += sign * len(record["roster"])
+
+        delta["overflow"] = self._slot_overflow(key) - before_overflow
+        for student_id, (day_before, gap_before) in before_penalty.items():
+            day_after, gap_after = self._student_penalty(student_id)
+            delta["day_violations"] += day_after - day_before
+            delta["gap_violations"] += gap_after - gap_before
+
+        if sign > 0:
+            self.exams[record["key"]] = record
+        else:
+            self.exams.pop(record["key"], None)
+        for name in METRICS:
+            self.metrics[name] += delta[name]
+        return delta
+
+    # ------------------------------------------------------------------
+    # Moves
+    # ------------------------------------------------------------------
+
+    def _allowed_slot(self, exam_date, slot_name):
+        weekday = exam_date.strftime("%A")
+        tuples = self.calendar.slots_for(exam_date)
+        if not tuples:
+            raise ValueError(f"Cannot schedule an exam on {weekday}.")
+        match = next((t for t in tuples if t[0].lower() == (slot_name or "").lower()), None)
+        if not match:
+            raise ValueError(
+                f"Invalid slot '{slot_name}' for {weekday}. "
+                f"Available slots: {', '.join(t[0] for t in tuples)}"
+            )
+        return match
+
+    def _get(self, exam_key):
+        record = self.exams.get(exam_key)
+        if record is None:
+            try:
+                record = self.exams.get(int(exam_key))
+            except (TypeError, ValueError):
+                record = None
+        if record is None:
+            raise ValueError(f"Exam {exam_key} is not in this timetable.")
+        return record
+
+    def _group_roster(self, group_id):
+        if group_id not in self.group_rosters:
+            rows = list(
+                Enrollment.objects.filter(group_id=group_id).values_list(
+                    "student_id", "group__group_name", "course__title"
+                )
+            )
+            self.group_rosters[group_id] = rows
+        return self.group_rosters[group_id]
+
+    def apply(self, move):
+        """
+        Apply one move and return {"move": ..., "delta": ..., "metrics": ...}.
+        Supported moves:
+
+            {"type": "move",   "exam_id": .., "date": "YYYY-MM-DD", "slot": ".."}
+            {"type": "remove", "exam_id": ..}
+            {"type": "add",    "group_id": .., "date": "YYYY-MM-DD", "slot": ".."}
+            {"type": "retime", "date": "YYYY-MM-DD", "slot": "..", "start": "HH:MM", "end": "HH:MM"}
+        """
+        kind = move.get("type")
+        delta = dict.fromkeys(METRICS, 0)
+
+        def _merge(d):
+            for name in METRICS:
+                delta[name] += d[name]
+
+        if kind == "move":
+            record = self._get(move.get("exam_id"))
+            new_date = _as_date(move["date"])
+            slot_name, start, end = self._allowed_slot(new_date, move.get("slot"))
+            undo = copy.copy(record)
+            _merge(self._place(record, -1))
+            moved = dict(record, date=new_date, slot_name=slot_name, start_time=start, end_time=end)
+            _merge(self._place(moved))
+            entry = {"type": "move", "exam_id": record["key"], "date": new_date,
+                     "slot": slot_name, "start": start, "end": end, "_undo": undo}
+
+        elif kind == "remove":
+            record = self._get(move.get("exam_id"))
+            _merge(self._place(record, -1))
+            entry = {"type": "remove", "exam_id": record["key"], "_undo": record}
+
+        elif kind == "add":
+            group_id = int(move.get("group_id"))
+            if any(r["group_id"] == group_id for r in self.exams.values()):
+                raise ValueError(f"Group {group_id} is already scheduled in this timetable.")
+            new_date = _as_date(move["date"])
+            slot_name, start, end = self._allowed_slot(new_date, move.get("slot"))
+            roster_rows = self._group_roster(group_id)
+            self._new_seq += 1
+            key = f"new-{self._new_seq}"
+            record = self._record(
+                None, new_date, slot_name, start, end, group_id,
+                roster_rows[0][1] if roster_rows else None,
+                roster_rows[0][2] if roster_rows else None,
+                [row[0] for row in roster_rows],
+            )
+            record["key"] = key
+            _merge(self._place(record))
+            entry = {"type": "add", "exam_id": key, "group_id": group_id, "date": new_date,
+                     "slot": slot_name, "start": start, "end": end, "_undo": None}
+
+        elif kind == "retime":
+            retime_date = _as_date(move["date"])
+            slot_key = self._slot_key(retime_date, move.get("slot"))
+            start, end = _as_time(move["start"]), _as_time(move["end"])
+            changed = []
+            for record in self.exams.values():
+                if self._slot_key(record["date"], record["slot_name"]) == slot_key:
+                    changed.append((record["key"], record["start_time"], record["end_time"]))
+                    record["start_time"], record["end_time"] = start, end
+            entry = {"type": "retime", "date": retime_date, "slot": move.get("slot"),
+                     "start": start, "end": end, "_undo": changed}
+
+        else:
+            raise ValueError(f"Unknown move type '{kind}'.")
+
+        entry["delta"] = delta
+        self.moves.append(entry)
+        return {"move": self._public(entry), "delta": delta, "metrics": dict(self.metrics)}
+
+    def undo(self):
+        """Revert the most recent move and return the resulting delta."""
+        if not self.moves:
+            raise ValueError("Nothing to undo.")
+        entry = self.moves.pop()
+        delta = dict.fromkeys(METRICS, 0)
+
+        def _merge(d):
+            for name in METRICS:
+                delta[name] += d[name]
+
+        if entry["type"] == "move":
+            _merge(self._place(self.exams[entry["exam_id"]], -1))
+            _merge(self._place(entry["_undo"]))
+        elif entry["type"] == "remove":
+            _merge(self._place(entry["_undo"]))
+        elif entry["type"] == "add":
+            _merge(self._place(self.exams[entry["exam_id"]], -1))
+        elif entry["type"] == "retime":
+            for key, start, end in entry["_undo"]:
+                if key in self.exams:
+                    self.exams[key]["start_time"], self.exams[key]["end_time"] = start, end
+        return {"move": self._public(entry), "delta": delta, "metrics": dict(self.metrics)}
+
+    @staticmethod
+    def _public(entry):
+        return {k: v for k, v in entry.items() if not k.startswith("_")}
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "timetable_id": self.timetable_id,
+            "metrics": dict(self.metrics),
+            "moves": [self._public(m) for m in self.moves],
+            "capacity": self.capacity,
+        }
+
+    # ------------------------------------------------------------------
+    # Commit
+    # ------------------------------------------------------------------
+
+    def commit(self):
+        """
+        Write the accepted moves in one transaction, then re-seat every
+        slot they touched. Refuses to write if any exam the moves touch was
+        changed in the database since the snapshot was taken.
+        """
+        from exams.models import Exam as ExamModel
+        from sharedapp.models import UnscheduledExamGroup
+        from exams import read_model
+        from schedules.occupancy import refresh_exams
+        from schedules.utils import allocate_shared_rooms_updated
+
+        if not self.moves:
+            return {"created": [], "updated": [], "removed": []}
+
+        touched_ids = {
+            m["exam_id"] for m in self.moves
+            if m["type"] in ("move", "remove") and isinstance(m["exam_id"], int)
+        }
+        for m in self.moves:
+            if m["type"] == "retime":
+                touched_ids.update(k for k, _, _ in m["_undo"] if isinstance(k, int))
+
+        with transaction.atomic():
+            timetable = MasterTimetable.objects.select_for_update().get(id=self.timetable_id)
+            current = {
+                row[0]: row[1:]
+                for row in ExamModel.objects.filter(id__in=touched_ids).values_list(
+                    "id", "date", "slot_name", "start_time", "end_time"
+                )
+            }
+            stale = [i for i in touched_ids if current.get(i) != self.original.get(i)]
+            if stale:
+                raise ValueError(
+                    f"Exams {sorted(stale)} changed since this simulation started. "
+                    f"Start a new simulation."
+                )
+
+            # Final state of every exam the moves touched, keyed as in self.exams.
+            final_keys = {m["exam_id"] for m in self.moves if m["type"] != "retime"}
+            final_keys |= touched_ids
+            created, updated, removed = [], [], []
+            slots_to_reseat = set()
+
+            for key in final_keys:
+                record = self.exams.get(key)
+                if isinstance(key, int) and record is None:
+                    removed.append(key)
+                    orig_date, _, orig_start, orig_end = self.original[key]
+                    slots_to_reseat.add((orig_date, orig_start, orig_end))
+                elif isinstance(key, int):
+                    orig_date, orig_slot, orig_start, orig_end = self.original[key]
+                    if (record["date"], record["slot_name"], record["start_time"], record["end_time"]) != (
+                        orig_date, orig_slot, orig_start, orig_end
+                    ):
+                        updated.append(record)
+                        slots_to_reseat.add((orig_date, orig_start, orig_end))
+                        slots_to_reseat.add((record["date"], record["start_time"], record["end_time"]))
+                elif record is not None:
+                    created.append(record)
+                    slots_to_reseat.add((record["date"], record["start_time"], record["end_time"]))
+
+            # Removals mirror remove-scheduled-exam: the group goes back to
+            # the timetable's unscheduled list.
+            read_model.invalidate_exams(removed)
+            for exam in ExamModel.objects.filter(id__in=removed).select_related("group__course"):
+                unscheduled, _ = UnscheduledExam.objects.get_or_create(
+                    course=exam.group.course, master_timetable=timetable
+                )
+                link = UnscheduledExamGroup.objects.create(exam=unscheduled, group=exam.group)
+                unscheduled.groups.add(link)
+                StudentExam.objects.filter(exam=exam).delete()
+                timetable.exams.remove(exam)
+                exam.delete()
+
+            if updated:
+                exams = list(ExamModel.objects.filter(id__in=[r["exam_id"] for r in updated]))
+                by_id = {r["exam_id"]: r for r in updated}
+                for exam in exams:
+                    r = by_id[exam.id]
+                    exam.date, exam.slot_name = r["date"], r["slot_name"]
+                    exam.start_time, exam.end_time = r["start_time"], r["end_time"]
+                ExamModel.objects.bulk_update(exams, ["date", "slot_name", "start_time", "end_time"])
+                StudentExam.objects.filter(exam__in=exams).update(
+                    room=None, seat_row=None, seat_column=None
+                )
+                StudentExam.sync_slots([exam.id for exam in exams])
+
+            created_ids = []
+            emptied = set()
+            for r in created:
+                exam = ExamModel.objects.create(
+                    date=r["date"], slot_name=r["slot_name"],
+                    start_time=r["start_time"], end_time=r["end_time"],
+                    group_id=r["group_id"],
+                )
+                timetable.exams.add(exam)
+                StudentExam.objects.bulk_create([
+                    StudentExam(
+                        student_id=s, exam=exam, slot_date=exam.date,
+                        slot_start=exam.start_time, slot_end=exam.end_time,
+                        location_id=timetable.location_id, master_timetable=timetable,
+                    )
+                    for s in r["roster"]
+                ])
+                created_ids.append(exam.id)
+                # Scheduling a group takes it off the unscheduled list.
+                links = UnscheduledExamGroup.objects.filter(
+                    exam__master_timetable=timetable, group_id=r["group_id"]
+                )
+                emptied.update(links.values_list("exam_id", flat=True))
+                links.delete()
+            UnscheduledExam.objects.filter(id__in=emptied, groups__isnull=True).delete()
+
+            for slot_date, start, end in slots_to_reseat:
+                student_exams = list(
+                    StudentExam.objects.filter(
+                        master_timetable=timetable,
+                        slot_date=slot_date,
+                        slot_start=start,
+                        slot_end=end,
+                    ).select_related("exam__group__course", "student")
+                )
+                if student_exams and not allocate_shared_rooms_updated(
+                    student_exams, location=timetable.location,
+                    exam_date=slot_date, start_time=start, end_time=end,
+                ):
+                    raise ValueError(
+                        f"Room allocation failed for {slot_date} {start}-{end}; nothing was saved."
+                    )
+
+            refresh_exams(
+                list(touched_ids) + created_ids, [timetable.id]
+            )
+            # Re-seating moves students of untouched exams too.
+            read_model.invalidate_timetable(timetable.id)
+
+        return {
+            "created": created_ids,
+            "updated": [r["exam_id"] for r in updated],
+            "removed": removed,
+        }
+
+    # ------------------------------------------------------------------
+    # Persistence between requests
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _live_sessions():
+        cutoff = timezone.now() - timedelta(seconds=SESSION_TIMEOUT_SECONDS)
+        return TimetableSimulationSession.objects.filter(updated_at__gte=cutoff)
+
+    @staticmethod
+    def _unpickle(row):
+        return pickle.loads(zlib.decompress(bytes(row.payload)))
+
+    def save(self):
+        TimetableSimulationSession.objects.update_or_create(
+            id=self.id,
+            defaults={
+                "timetable_id": self.timetable_id,
+                "user_id": self.user_id,
+                "payload": zlib.compress(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)),
+            },
+        )
+
+    @classmethod
+    def get(cls, session_id):
+        row = cls._live_sessions().filter(id=session_id).first()
+        return cls._unpickle(row) if row is not None else None
+
+    @classmethod
+    @contextmanager
+    def locked(cls, session_id):
+        """
+        Yield the session (None if missing or expired) with its row locked
+        until the block exits; save() inside the block to keep changes.
+        """
+        with transaction.atomic():
+            row = cls._live_sessions().select_for_update().filter(id=session_id).first()
+            yield cls._unpickle(row) if row is not None else None
+
+    def discard(self):
+        TimetableSimulationSession.objects.filter(id=self.id).delete()
+
+    @classmethod
+    def purge_expired(cls):
+        cutoff = timezone.now() - timedelta(seconds=SESSION_TIMEOUT_SECONDS)
+        return TimetableSimulationSession.objects.filter(updated_at__lt=cutoff).delete()[0]
@@ -0,0 +1,180 @@
+"""
+Compiled exam-slot calendar.
+
+Which slots exist, and which of them are allowed on a given date, used to
+be re-derived at every call site: config.json re-read and re-parsed per
+request (twice per date in get_allowed_slot_tuples_for_date), "HH:MM"
+strings split and int()-ed inside the generator's per-group loop, and the
+weekday / holiday / special-rule checks repeated inline wherever a date
+was considered.
+
+get_slot_calendar() compiles time_constraints once per config version
+into an immutable SlotCalendar:
+
+    slots                  (name, start, end) in priority order
+    slot(name)             name -> Slot, case-insensitive
+    slots_for(date)        the Slots allowed on that date ([] if blocked)
+    exam_dates(start, end) allowed dates in a range
+    iter_slots(start, end) (date, Slot) pairs in a range
+
+A date lookup is a holiday-set probe plus an index into a per-weekday
+table. The version is the config file's stat signature: JsonConfigManager
+replaces the file atomically on every write, so any edit (from this
+process or another) changes it, and the next call recompiles.
+"""
+import logging
+import os
+import threading
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+
+from config.utils import JsonConfigManager
+
+logger = logging.getLogger(__name__)
+
+Slot = namedtuple("Slot", ["name", "start", "end"])
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# Used when config.json defines no time slots at all.
+DEFAULT_TIME_SLOTS = [
+    {"name": "Morning", "start_time": "08:00", "end_time": "11:00", "priority": 1},
+    {"name": "Afternoon", "start_time": "13:00", "end_time": "16:00", "priority": 2},
+    {"name": "Evening", "start_time": "17:00", "end_time": "20:00", "priority": 3},
+]
+DEFAULT_NO_EXAM_DAYS = ["Saturday"]
+
+
+def _parse_time(value):
+    if isinstance(value, time):
+        return value
+    return time.fromisoformat(value)
+
+
+def _parse_holidays(holidays):
+    holiday_dates = set()
+    for h in holidays or []:
+        if isinstance(h, datetime):
+            holiday_dates.add(h.date())
+        elif isinstance(h, date):
+            holiday_dates.add(h)
+        else:
+            try:
+                holiday_dates.add(datetime.strptime(h, "%Y-%m-%d").date())
+            except (TypeError, ValueError):
+                logger.warning(f"Ignoring invalid holiday date in config: {h!r}")
+    return frozenset(holiday_dates)
+
+
+class SlotCalendar:
+    """Read-only; build with SlotCalendar.compile(config) or get_slot_calendar()."""
+
+    def __init__(self, time_slots, no_exam_days, special_rules, holiday_dates, version=None):
+        self.version = version
+        self.time_slots = tuple(time_slots)   # raw config dicts, priority order
+        self.no_exam_days = tuple(no_exam_days)
+        self.special_rules = special_rules
+        self.holiday_dates = holiday_dates
+
+        slots = []
+        for s in self.time_slots:
+            try:
+                slots.append(Slot(s["name"], _parse_time(s["start_time"]), _parse_time(s["end_time"])))
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"Ignoring invalid time slot in config: {s!r}")
+        self.slots = tuple(slots)
+        self._by_name = {}
+        for slot in self.slots:
+            self._by_name.setdefault(slot.name.lower(), slot)
+
+        by_weekday = []
+        for weekday in WEEKDAYS:
+            if weekday in self.no_exam_days:
+                by_weekday.append(())
+                continue
+            rule = self.special_rules.get(weekday) or {}
+            if "allowed_slots" in rule:
+                allowed = set(rule["allowed_slots"])
+                by_weekday.append(tuple(s for s in self.slots if s.name in allowed))
+            else:
+                by_weekday.append(self.slots)
+        self._by_weekday = tuple(by_weekday)
+
+    @classmethod
+    def compile(cls, config, version=None):
+        time_config = config.get("time_constraints", {})
+        time_slots = sorted(
+            time_config.get("time_slots") or DEFAULT_TIME_SLOTS,
+            key=lambda x: x.get("priority", 99),
+        )
+        day_restrictions = time_config.get("day_restrictions", {})
+        return cls(
+            time_slots,
+            day_restrictions.get("no_exam_days", DEFAULT_NO_EXAM_DAYS),
+            day_restrictions.get("special_rules", {}),
+            _parse_holidays(day_restrictions.get("holidays", [])),
+            version=version,
+        )
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def slot(self, name):
+        """The configured Slot called `name` (any case), or None."""
+        return self._by_name.get((name or "").lower())
+
+    def slot_names(self):
+        return [s.name for s in self.slots]
+
+    def is_exam_day(self, check_date):
+        return bool(self.slots_for(check_date))
+
+    def slots_for(self, check_date):
+        """Slots allowed on check_date, in priority order (empty if blocked)."""
+        if check_date in self.holiday_dates:
+            return ()
+        return self._by_weekday[check_date.weekday()]
+
+    def slot_names_for(self, check_date):
+        return [s.name for s in self.slots_for(check_date)]
+
+    def exam_dates(self, start_date, end_date):
+        """Dates in [start_date, end_date] with at least one allowed slot."""
+        current = start_date
+        while current <= end_date:
+            if self.slots_for(current):
+                yield current
+            current += timedelta(days=1)
+
+    def iter_slots(self, start_date, end_date):
+        """(date, Slot) for every allowed slot in [start_date, end_date]."""
+        for current in self.exam_dates(start_date, end_date):
+            for slot in self.slots_for(current):
+                yield current, slot
+
+
+_calendar = None
+_lock = threading.Lock()
+
+
+def _config_version(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def get_slot_calendar():
+    """The calendar for the current config.json, recompiled only when it changes."""
+    global _calendar
+    manager = JsonConfigManager()
+    version = _config_version(manager.config_path)
+    with _lock:
+        if _calendar is not None and version is not None and _calendar.version == version:
+            return _calendar
+    calendar = SlotCalendar.compile(manager.read_config(), version=version)
+    with _lock:
+        _calendar = calendar
+    return calendar
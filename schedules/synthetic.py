@@ -0,0 +1,278 @@
+"""
+Synthetic university datasets for load testing the scheduler.
+
+The scheduler tests build a course or two by hand, which says nothing
+about how generation behaves at the size of a real semester. generate()
+writes a whole university straight into the database with bulk inserts:
+
+    locations        each with its own rooms (rows x columns seat layouts)
+    departments      spread over the locations, of uneven size
+    instructors      one user per instructor
+    courses          per department: core courses for each study year plus
+                     a pool of electives
+    students         a department and a study year each
+    enrollments      every student takes the core courses of their year,
+                     a few electives of their department (popular ones more
+                     often) and now and then a course of another department
+                     on the same campus
+    groups           per course, enough groups of GROUP_SIZE students
+
+so the enrollment overlap has the shape the colouring actually meets: dense
+blocks of students sharing a whole cohort's courses, a long tail of small
+electives, and a few cross-department edges.
+
+Everything is named after `prefix` (emails under synthetic.invalid), and
+PRODUCTION_SIZE (any count overridable) times `scale` gives the row
+counts. Same seed and sizes, same dataset. See the
+generate_synthetic_university and benchmark_scheduler commands.
+"""
+import logging
+import math
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from courses.models import Course, CourseGroup
+from departments.models import Department
+from enrollments.models import Enrollment
+from rooms.models import Location, Room
+from semesters.models import Semester
+from student.models import Student
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+# Roughly one semester of our largest campus; benchmark scales multiply it.
+PRODUCTION_SIZE = {
+    "locations": 2,
+    "departments": 10,
+    "rooms": 36,
+    "instructors": 80,
+    "courses": 200,
+    "students": 2500,
+}
+
+YEARS = 4
+CORE_PER_YEAR = 4
+ELECTIVES_PER_STUDENT = 2
+CROSS_DEPARTMENT_RATE = 0.1
+GROUP_SIZE = 45
+PAID_RATE = 0.9
+FEE = Decimal("150000.00")
+BATCH_SIZE = 2000
+
+
+def sizes_for(scale=1.0, **overrides):
+    """Row counts: PRODUCTION_SIZE, with `overrides` replacing counts, times `scale`."""
+    base = dict(PRODUCTION_SIZE, **{name: int(value) for name, value in overrides.items() if value})
+    sizes = {name: max(1, int(round(count * scale))) for name, count in base.items()}
+    sizes["locations"] = min(sizes["locations"], sizes["departments"], sizes["rooms"])
+    return sizes
+
+
+def _insert(model, objects, lookup):
+    """
+    bulk_create `objects` and make sure they carry their ids; backends that
+    cannot return ids from a bulk insert get them re-read by `lookup`, a
+    unique field.
+    """
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    if objects and objects[0].pk is None:
+        ids = dict(
+            model.objects.filter(**{f"{lookup}__in": [getattr(o, lookup) for o in objects]})
+            .values_list(lookup, "id")
+        )
+        for obj in objects:
+            obj.pk = ids[getattr(obj, lookup)]
+    return objects
+
+
+def _group_name(index):
+    name = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        name = chr(ord("A") + rest) + name
+    return name
+
+
+def _weights(n, rng, exponent=1.1):
+    """Zipf-like popularity weights of n items, in random order."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+@transaction.atomic
+def generate(scale=1.0, seed=0, prefix="SYN", start_date=None, **overrides):
+    """
+    Write a synthetic university (see module docstring) and return a summary:
+    row counts plus the ids a benchmark needs (locations, semester, course
+    ids per location).
+    """
+    sizes = sizes_for(scale, **overrides)
+    rng = np.random.default_rng(seed)
+    start_date = start_date or date.today()
+    tag = prefix.lower()
+
+    semester = Semester.objects.create(
+        name=f"{prefix} Semester",
+        start_date=start_date - timedelta(days=120),
+        end_date=start_date + timedelta(days=60),
+    )
+    locations = _insert(
+        Location,
+        [Location(name=f"{prefix} Campus {i + 1}") for i in range(sizes["locations"])],
+        "name",
+    )
+
+    # Rooms: a seat layout each, split evenly over the locations.
+    room_rows = rng.integers(5, 16, sizes["rooms"])
+    room_columns = rng.integers(6, 13, sizes["rooms"])
+    _insert(Room, [
+        Room(
+            name=f"{prefix}-R{i + 1:04d}",
+            rows=int(r), columns=int(c), capacity=int(r * c),
+            location=locations[i % len(locations)],
+        )
+        for i, (r, c) in enumerate(zip(room_rows, room_columns))
+    ], "name")
+
+    departments = _insert(Department, [
+        Department(
+            code=f"{prefix}-D{i + 1:03d}", name=f"{prefix} Department {i + 1}",
+            location=locations[i % len(locations)],
+        )
+        for i in range(sizes["departments"])
+    ], "code")
+    department_location = np.array([i % len(locations) for i in range(len(departments))])
+
+    password = make_password(None)
+    instructors = _insert(User, [
+        User(
+            email=f"{tag}-i{i + 1}@synthetic.invalid", first_name="Instructor", last_name=str(i + 1),
+            role="instructor", password=password,
+        )
+        for i in range(sizes["instructors"])
+    ], "email")
+
+    # Courses: department sizes are uneven; within a department the first
+    # YEARS * CORE_PER_YEAR courses are the cohort cores, the rest electives.
+    course_department = rng.choice(len(departments), sizes["courses"], p=_weights(len(departments), rng, 0.8))
+    course_department[:len(departments)] = np.arange(min(len(departments), sizes["courses"]))
+    courses = _insert(Course, [
+        Course(
+            code=f"{prefix}-C{i + 1:05d}", title=f"{prefix} Course {i + 1}",
+            department=departments[d], semester=semester,
+            enrollment_limit=None,
+        )
+        for i, d in enumerate(course_department)
+    ], "code")
+    core, electives = {}, {}
+    for d in range(len(departments)):
+        own = np.flatnonzero(course_department == d)
+        for year in range(YEARS):
+            core[d, year] = own[year * CORE_PER_YEAR:(year + 1) * CORE_PER_YEAR]
+        electives[d] = own[YEARS * CORE_PER_YEAR:]
+    elective_weights = {d: _weights(len(pool), rng) for d, pool in electives.items() if len(pool)}
+
+    # Students, in proportion to the size of their department.
+    department_courses = np.bincount(course_department, minlength=len(departments)).astype(float)
+    student_department = rng.choice(len(departments), sizes["students"], p=department_courses / department_courses.sum())
+    student_year = rng.integers(0, YEARS, sizes["students"])
+    users = _insert(User, [
+        User(
+            email=f"{tag}-s{i + 1}@synthetic.invalid", first_name="Student", last_name=str(i + 1),
+            role="student", password=password,
+        )
+        for i in range(sizes["students"])
+    ], "email")
+    students = _insert(Student, [
+        Student(
+            user=user, reg_no=f"{prefix}{i + 1:07d}"[:20],
+            department=departments[d], semester=semester,
+        )
+        for i, (user, d) in enumerate(zip(users, student_department))
+    ], "reg_no")
+
+    # Who takes what.
+    by_location = {}
+    for d, location in enumerate(department_location):
+        by_location.setdefault(location, []).append(d)
+    takes = [[] for _ in courses]
+    for s, (d, year) in enumerate(zip(student_department, student_year)):
+        chosen = set(core[d, year].tolist())
+        pool = electives[d]
+        if len(pool):
+            k = min(len(pool), int(rng.poisson(ELECTIVES_PER_STUDENT)))
+            chosen.update(rng.choice(pool, k, replace=False, p=elective_weights[d]).tolist())
+        neighbours = [n for n in by_location[department_location[d]] if n != d and len(electives[n])]
+        if neighbours and rng.random() < CROSS_DEPARTMENT_RATE:
+            n = neighbours[rng.integers(len(neighbours))]
+            chosen.add(int(rng.choice(electives[n], p=elective_weights[n])))
+        for c in chosen:
+            takes[c].append(s)
+
+    # Groups of GROUP_SIZE, students dealt out in random order.
+    groups, members = [], []
+    for c, course in enumerate(courses):
+        enrolled = np.array(takes[c], dtype=np.int64)
+        if not len(enrolled):
+            continue
+        rng.shuffle(enrolled)
+        count = math.ceil(len(enrolled) / GROUP_SIZE)
+        for g, part in enumerate(np.array_split(enrolled, count)):
+            groups.append(CourseGroup(
+                course=course, group_name=_group_name(g), max_member=GROUP_SIZE,
+                current_member=len(part),
+                instructor=instructors[int(rng.integers(len(instructors)))],
+            ))
+            members.append(part)
+    CourseGroup.objects.bulk_create(groups, batch_size=BATCH_SIZE)
+    if groups and groups[0].pk is None:
+        ids = {
+            (course_id, name): pk
+            for pk, course_id, name in CourseGroup.objects.filter(course__in=courses)
+            .values_list("id", "course_id", "group_name")
+        }
+        for group in groups:
+            group.pk = ids[group.course_id, group.group_name]
+
+    paid = rng.random(sizes["students"]) < PAID_RATE
+    enrollments = [
+        Enrollment(
+            student=students[s], course_id=group.course_id, group=group,
+            amount_to_pay=FEE, amount_paid=FEE if paid[s] else Decimal("0"),
+        )
+        for group, part in zip(groups, members)
+        for s in part.tolist()
+    ]
+    Enrollment.objects.bulk_create(enrollments, batch_size=BATCH_SIZE)
+
+    summary = {
+        "prefix": prefix,
+        "seed": seed,
+        "scale": scale,
+        "sizes": sizes,
+        "semester_id": semester.id,
+        "location_ids": [location.id for location in locations],
+        "course_ids": {
+            location.id: [
+                course.id for c, (course, d) in enumerate(zip(courses, course_department))
+                if department_location[d] == i and takes[c]
+            ]
+            for i, location in enumerate(locations)
+        },
+        "rows": {
+            "rooms": sizes["rooms"],
+            "students": len(students),
+            "courses": len(courses),
+            "groups": len(groups),
+            "enrollments": len(enrollments),
+        },
+    }
+    logger.info(f"Generated synthetic university {prefix}: {summary['rows']}")
+    return summary
@@ -0,0 +1,33 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+
+from schedules.teardown import request_teardown, run_teardown_job, stale_draft_timetables
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def teardown_timetable(job_id):
+    """Run one queued TimetableTeardown (see schedules/teardown.py)."""
+    job = run_teardown_job(job_id)
+    return {"status": job.status, "row_counts": job.row_counts}
+
+
+@shared_task
+def purge_stale_draft_timetables():
+    """
+    Tear down DRAFT timetables nobody has touched for
+    DRAFT_TIMETABLE_RETENTION_DAYS (the newest timetable of each location
+    is always kept). Scheduled daily by celery beat; the rows are archived
+    first unless DRAFT_TIMETABLE_PURGE_ARCHIVE is turned off.
+    """
+    days = getattr(settings, "DRAFT_TIMETABLE_RETENTION_DAYS", 14)
+    archive = getattr(settings, "DRAFT_TIMETABLE_PURGE_ARCHIVE", True)
+    purged = []
+    for timetable in stale_draft_timetables(days):
+        job = request_teardown(timetable, archive=archive)
+        purged.append(job.timetable_id)
+    logger.info(f"Queued teardown of {len(purged)} stale draft timetable(s): {purged}")
+    return purged
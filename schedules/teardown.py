@@ -0,0 +1,323 @@
+"""
+Set-based teardown of a MasterTimetable.
+
+truncate-mastertimetable used to delete through the ORM: Django's
+collector loads every StudentExam, Exam and unscheduled row of the
+timetable into memory before deleting, and all of it ran in one
+transaction, so a 60k-row timetable took minutes and held its locks the
+whole time. Admins regenerate drafts over and over while testing, so this
+path runs a lot.
+
+Teardown deletes with plain SQL instead, children before parents:
+
+    for every chunk of CHUNK_EXAMS exams of the timetable   (one transaction each)
+        rows referencing those exams (StudentExam, timetable links,
+        cheating reports, ...), then the exams themselves
+    then, in a last transaction
+        unscheduled exams and their groups, StudentExam.master_timetable
+        references from other timetables (SET NULL), the timetable row
+
+The dependents of each table are read from the model graph, so a model
+added later with a CASCADE foreign key to Exam is torn down too; a
+PROTECT/RESTRICT one aborts the teardown instead of being bypassed. On
+PostgreSQL each step is a `DELETE ... USING (<parent rows>)`; other
+backends get `DELETE ... WHERE fk IN (<parent rows>)`.
+
+With archive=True every row is first copied into a TimetableArchiveChunk
+(zlib-compressed JSON) in the same transaction as its delete, so an
+interrupted teardown never loses rows; re-running it picks up where it
+stopped, because each committed step leaves a consistent timetable behind.
+"""
+import json
+import logging
+import zlib
+from datetime import timedelta
+
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from exams import read_model
+from exams.models import Exam, StudentExam
+from schedules.models import (
+    MasterTimetable, MasterTimetableExam, TimetableArchive, TimetableArchiveChunk,
+    TimetableTeardown,
+)
+from schedules.occupancy import invalidate_timetable
+
+logger = logging.getLogger(__name__)
+
+CHUNK_EXAMS = 200
+
+
+class TeardownError(Exception):
+    pass
+
+
+def _dependents(model):
+    """(model, fk column, on_delete) for every concrete FK pointing at `model`."""
+    for rel in model._meta.get_fields(include_hidden=True):
+        if rel.auto_created and not rel.concrete and (rel.one_to_many or rel.one_to_one):
+            yield rel.related_model, rel.field.column, rel.on_delete
+
+
+class _Selection:
+    """The rows of `model` matched by `sql` (a `SELECT pk FROM ...`)."""
+
+    def __init__(self, model, sql, params):
+        self.model = model
+        self.sql = sql
+        self.params = list(params)
+
+
+class Teardown:
+    def __init__(self, timetable_id, archive=False, user=None, progress=None):
+        self.timetable_id = timetable_id
+        self.archive = archive
+        self.user = user
+        self.progress = progress
+        self.counts = {}
+        self._archive = None
+        self._seq = 0
+        self._qn = connection.ops.quote_name
+        self._postgres = connection.vendor == "postgresql"
+
+    # ------------------------------------------------------------------
+    # SQL
+    # ------------------------------------------------------------------
+
+    def _table(self, model):
+        return self._qn(model._meta.db_table)
+
+    def _children(self, parent):
+        for model, column, on_delete in _dependents(parent.model):
+            if on_delete is models.DO_NOTHING:
+                continue
+            if on_delete not in (models.CASCADE, models.SET_NULL):
+                raise TeardownError(
+                    f"{model._meta.label}.{column} protects {parent.model._meta.label} "
+                    f"({on_delete.__name__}); delete those rows first."
+                )
+            yield model, column, on_delete
+
+    def _archive_rows(self, model, where_sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT * FROM {self._table(model)} WHERE {where_sql}", params)
+            columns = [c[0] for c in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        if not rows:
+            return
+        self._seq += 1
+        TimetableArchiveChunk.objects.create(
+            archive=self._archive,
+            seq=self._seq,
+            table=model._meta.db_table,
+            row_count=len(rows),
+            payload=zlib.compress(json.dumps(rows, default=str).encode(), 6),
+        )
+
+    def _delete(self, selection):
+        """Delete `selection` and, first, everything that depends on it."""
+        for model, column, on_delete in self._children(selection):
+            fk = self._qn(column)
+            if on_delete is models.SET_NULL:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"UPDATE {self._table(model)} SET {fk} = NULL WHERE {fk} IN ({selection.sql})",
+                        selection.params,
+                    )
+                continue
+            pk = self._qn(model._meta.pk.column)
+            child = _Selection(
+                model,
+                f"SELECT {pk} FROM {self._table(model)} WHERE {fk} IN ({selection.sql})",
+                selection.params,
+            )
+            self._delete(child)
+
+        table = self._table(selection.model)
+        pk = self._qn(selection.model._meta.pk.column)
+        if self.archive:
+            self._archive_rows(selection.model, f"{pk} IN ({selection.sql})", selection.params)
+        with connection.cursor() as cursor:
+            if self._postgres:
+                cursor.execute(
+                    f"DELETE FROM {table} AS x USING ({selection.sql}) AS p(id) WHERE x.{pk} = p.id",
+                    selection.params,
+                )
+            else:
+                cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({selection.sql})", selection.params)
+            deleted = cursor.rowcount
+        if deleted:
+            label = selection.model._meta.db_table
+            self.counts[label] = self.counts.get(label, 0) + deleted
+
+    # ------------------------------------------------------------------
+    # Steps
+    # ------------------------------------------------------------------
+
+    def _exam_ids(self):
+        linked = MasterTimetableExam.objects.filter(
+            master_timetable_id=self.timetable_id
+        ).values_list("exam_id", flat=True)
+        owned = Exam.objects.filter(master_timetable_id=self.timetable_id).values_list("id", flat=True)
+        return sorted(set(linked) | set(owned))
+
+    def _report(self, step, total, message):
+        if self.progress:
+            self.progress(step, total, message, dict(self.counts))
+
+    def run(self):
+        timetable = MasterTimetable.objects.filter(id=self.timetable_id).first()
+        if timetable is None:
+            self._report(1, 1, "Timetable already removed.")
+            return self.counts
+
+        if self.archive:
+            # A re-run of an interrupted teardown keeps filling the same archive.
+            self._archive = TimetableArchive.objects.filter(
+                timetable_id=timetable.id, row_counts={}
+            ).order_by("-archived_at").first()
+            if self._archive is not None:
+                self._seq = self._archive.chunks.count()
+        if self.archive and self._archive is None:
+            self._archive = TimetableArchive.objects.create(
+                timetable_id=timetable.id,
+                name=timetable.name,
+                academic_year=timetable.academic_year,
+                status=timetable.status,
+                location_id=timetable.location_id,
+                start_date=timetable.start_date,
+                end_date=timetable.end_date,
+                archived_by=self.user,
+            )
+
+        # Resolved now, while the StudentExams still exist.
+        read_model.invalidate_timetable(timetable.id)
+        exam_ids = self._exam_ids()
+        chunks = [exam_ids[i:i + CHUNK_EXAMS] for i in range(0, len(exam_ids), CHUNK_EXAMS)]
+        total = len(chunks) + 1
+        exam_pk = self._qn(Exam._meta.pk.column)
+
+        for step, chunk in enumerate(chunks, start=1):
+            placeholders = ", ".join(["%s"] * len(chunk))
+            with transaction.atomic():
+                self._delete(_Selection(
+                    Exam,
+                    f"SELECT {exam_pk} FROM {self._table(Exam)} WHERE {exam_pk} IN ({placeholders})",
+                    chunk,
+                ))
+            self._report(step, total, f"Removed {min(step * CHUNK_EXAMS, len(exam_ids))} of {len(exam_ids)} exams")
+
+        tt_pk = self._qn(MasterTimetable._meta.pk.column)
+        with transaction.atomic():
+            self._delete(_Selection(
+                MasterTimetable,
+                f"SELECT {tt_pk} FROM {self._table(MasterTimetable)} WHERE {tt_pk} = %s",
+                [self.timetable_id],
+            ))
+            if self._archive is not None:
+                TimetableArchive.objects.filter(pk=self._archive.pk).update(row_counts=self.counts)
+        invalidate_timetable(self.timetable_id)
+        self._report(total, total, "Timetable removed.")
+        logger.info(
+            f"Tore down timetable {self.timetable_id}"
+            f"{' (archived)' if self.archive else ''}: {self.counts}"
+        )
+        return self.counts
+
+
+def run_teardown_job(job_id):
+    """Run one TimetableTeardown job, recording progress on its row."""
+    job = TimetableTeardown.objects.get(pk=job_id)
+    if job.status == "done":
+        return job
+
+    def progress(step, total, message, counts):
+        TimetableTeardown.objects.filter(pk=job_id).update(
+            step=step, total_steps=total, message=message[:255], row_counts=counts,
+        )
+
+    TimetableTeardown.objects.filter(pk=job_id).update(status="running", error=None)
+    try:
+        counts = Teardown(
+            job.timetable_id, archive=job.archive, user=job.requested_by, progress=progress
+        ).run()
+    except Exception as e:
+        logger.error(f"Teardown of timetable {job.timetable_id} failed: {e}", exc_info=True)
+        TimetableTeardown.objects.filter(pk=job_id).update(
+            status="failed", error=str(e), finished_at=timezone.now(),
+        )
+    else:
+        TimetableTeardown.objects.filter(pk=job_id).update(
+            status="done", row_counts=counts, finished_at=timezone.now(),
+        )
+    job.refresh_from_db()
+    return job
+
+
+def request_teardown(timetable, archive=False, user=None):
+    """
+    The pending TimetableTeardown for `timetable`, creating and enqueueing
+    one if there is none. Enqueued once the surrounding transaction
+    commits; if the queue is unreachable the job runs inline instead.
+    """
+    from schedules.tasks import teardown_timetable
+
+    job = TimetableTeardown.objects.filter(
+        timetable_id=timetable.id, status__in=("queued", "running")
+    ).first()
+    if job is not None:
+        return job
+    job = TimetableTeardown.objects.create(
+        timetable_id=timetable.id,
+        timetable_label=str(timetable.name or timetable)[:255],
+        archive=archive,
+        requested_by=user,
+    )
+
+    def _enqueue():
+        try:
+            teardown_timetable.delay(job.id)
+        except Exception as e:
+            logger.warning(f"Could not enqueue teardown {job.id} ({e}); running it inline")
+            run_teardown_job(job.id)
+
+    transaction.on_commit(_enqueue)
+    return job
+
+
+def stale_draft_timetables(older_than_days):
+    """
+    DRAFT timetables untouched for `older_than_days`, except the newest
+    timetable of each location (the one an admin is most likely still
+    working on). Edits to a timetable's exams and student rows count as
+    touching it, including ones written with .update().
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    newest = set()
+    seen_locations = set()
+    for tt_id, location_id in MasterTimetable.objects.order_by("-created_at").values_list("id", "location_id"):
+        if location_id not in seen_locations:
+            seen_locations.add(location_id)
+            newest.add(tt_id)
+    busy = TimetableTeardown.objects.filter(status__in=("queued", "running")).values_list("timetable_id", flat=True)
+    last_exam = (
+        Exam.objects.filter(mastertimetableexam__master_timetable=models.OuterRef("pk"))
+        .order_by("-updated_at").values("updated_at")[:1]
+    )
+    last_student_exam = (
+        StudentExam.objects.filter(master_timetable=models.OuterRef("pk"))
+        .order_by("-updated_at").values("updated_at")[:1]
+    )
+    return (
+        MasterTimetable.objects.filter(status="DRAFT", updated_at__lt=cutoff)
+        .annotate(
+            last_exam_at=models.Subquery(last_exam),
+            last_student_exam_at=models.Subquery(last_student_exam),
+        )
+        .filter(models.Q(last_exam_at__isnull=True) | models.Q(last_exam_at__lt=cutoff))
+        .filter(models.Q(last_student_exam_at__isnull=True) | models.Q(last_student_exam_at__lt=cutoff))
+        .exclude(id__in=newest)
+        .exclude(id__in=list(busy))
+        .order_by("created_at")
+    )
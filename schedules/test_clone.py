@@ -0,0 +1,104 @@
+from datetime import date
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from courses.models import CourseGroup
+from exams.models import Exam, StudentExam, UnscheduledExam
+from schedules.clone import clone_timetable, diff_timetables
+from schedules.models import MasterTimetable, MasterTimetableExam
+from sharedapp.models import UnscheduledExamGroup
+from sharedapp.testing import make_admin, make_campus, make_course, make_exam, make_room, make_students, make_timetable
+
+
+class TimetableCloneTests(TestCase):
+    def setUp(self):
+        campus = make_campus()
+        self.loc = campus.location
+        self.hall = make_room(self.loc, capacity=40)
+        self.grid = make_room(self.loc, name="Grid", capacity=6, rows=2, columns=3)
+        self.admin = make_admin()
+        self.course = make_course(campus)
+        self.groups = [CourseGroup.objects.create(course=self.course, group_name=g) for g in "ABC"]
+        self.students = make_students(3)
+        self.source = make_timetable(self.loc, self.admin, name="Jan draft")
+        self.exams = [self._exam(self.groups[0], 13), self._exam(self.groups[1], 14)]
+        unscheduled = UnscheduledExam.objects.create(course=self.course, master_timetable=self.source, reason="No room")
+        unscheduled.groups.add(UnscheduledExamGroup.objects.create(exam=unscheduled, group=self.groups[2]))
+
+    def _exam(self, group, day):
+        exam = make_exam(group, day=date(2025, 1, day), master_timetable=self.source)
+        self.source.exams.add(exam)
+        for i, student in enumerate(self.students):
+            StudentExam.objects.create(
+                student=student, exam=exam, room=self.grid, seat_row=1, seat_column=i + 1,
+                status="COMPLETED", signin_attendance=True,
+            )
+        return exam
+
+    def test_clone_copies_rows_and_leaves_source_untouched(self):
+        source_rows = set(StudentExam.objects.values_list("id", "room_id", "seat_column", "status"))
+        clone, counts = clone_timetable(self.source.id, self.admin)
+
+        self.assertEqual(clone.status, "DRAFT")
+        self.assertEqual(clone.name, "Jan draft (copy)")
+        self.assertEqual(counts["exams"], 2)
+        self.assertEqual(counts["student_exams"], 6)
+        self.assertEqual(counts["unscheduled_exams"], 1)
+        self.assertEqual(counts["unscheduled_groups"], 1)
+
+        cloned_exams = Exam.objects.filter(timetables=clone)
+        self.assertEqual(set(cloned_exams.values_list("group_id", flat=True)), {self.groups[0].id, self.groups[1].id})
+        self.assertTrue(all(e.master_timetable_id == clone.id for e in cloned_exams))
+        self.assertFalse(set(cloned_exams.values_list("id", flat=True)) & {e.id for e in self.exams})
+
+        copies = StudentExam.objects.filter(exam__in=cloned_exams)
+        self.assertEqual(
+            sorted(copies.values_list("room_id", "seat_row", "seat_column")),
+            sorted(StudentExam.objects.filter(exam__in=self.exams).values_list("room_id", "seat_row", "seat_column")),
+        )
+        self.assertEqual(set(copies.values_list("status", "signin_attendance")), {("PENDING", False)})
+        self.assertEqual(set(copies.values_list("master_timetable_id", flat=True)), {clone.id})
+
+        unscheduled = UnscheduledExam.objects.get(master_timetable=clone)
+        self.assertEqual(list(unscheduled.groups.values_list("group_id", flat=True)), [self.groups[2].id])
+        self.assertEqual(MasterTimetableExam.objects.filter(master_timetable=self.source).count(), 2)
+        self.assertTrue(source_rows <= set(StudentExam.objects.values_list("id", "room_id", "seat_column", "status")))
+
+    def test_diff_reports_moves_room_and_seat_changes(self):
+        clone, _ = clone_timetable(self.source.id, self.admin)
+        moved = Exam.objects.get(timetables=clone, group=self.groups[0])
+        Exam.objects.filter(id=moved.id).update(date=date(2025, 1, 20))
+        other = StudentExam.objects.filter(exam__timetables=clone, exam__group=self.groups[1])
+        other.filter(student=self.students[0]).update(room=self.hall, seat_row=None, seat_column=None)
+        other.filter(student=self.students[1]).update(seat_row=2)
+        Exam.objects.filter(id=self.exams[1].id).update(group=self.groups[2])
+
+        diff = diff_timetables(self.source.id, clone.id)
+        self.assertEqual(diff["summary"], {
+            "moved": 1, "added": 1, "removed": 1, "room_changes": 0, "seat_changes": 0,
+        })
+        Exam.objects.filter(id=self.exams[1].id).update(group=self.groups[1])
+
+        diff = diff_timetables(self.source.id, clone.id)
+        self.assertEqual(diff["summary"], {
+            "moved": 1, "added": 0, "removed": 0, "room_changes": 1, "seat_changes": 1,
+        })
+        self.assertEqual(diff["moved"][0]["exam_id"], moved.id)
+        self.assertEqual(diff["room_changes"][0]["reg_no"], "R0")
+        self.assertEqual(diff["room_changes"][0]["to_room"], "Hall")
+        self.assertEqual(diff["seat_changes"][0]["to_seat_row"], 2)
+
+    def test_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post(f"/api/schedules/timetables/{self.source.id}/clone/", {"name": "Try 2"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        clone_id = response.data["data"]["id"]
+        self.assertEqual(MasterTimetable.objects.get(id=clone_id).name, "Try 2")
+
+        response = client.get(f"/api/schedules/timetables/{self.source.id}/diff/?against={clone_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"]["summary"]["moved"], 0)
+        response = client.get(f"/api/schedules/timetables/{self.source.id}/diff/?against=999999")
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,53 @@
+from django.db.models import QuerySet
+from django.test import TestCase
+from datetime import date
+from schedules.utils import get_reschedule_suggestions, check_reschedule_feasibility
+from exams.models import StudentExam
+from enrollments.models import Enrollment
+from enrollments.snapshot import get_enrollment_snapshot
+from sharedapp.testing import make_campus, make_exam, make_group, make_room, make_students
+
+
+class RescheduleFeasibilityTests(TestCase):
+    def setUp(self):
+        self.campus = campus = make_campus()
+        make_room(campus.location)
+
+        group = make_group(campus)
+        other_group = make_group(campus, code="MA101", title="Maths")
+        self.course, other = group.course, other_group.course
+
+        # Monday 2025-01-13, Morning
+        self.exam = make_exam(group)
+        # The same students already sit Maths on Tuesday.
+        self.other_exam = make_exam(other_group, day=date(2025, 1, 14))
+        for s in make_students(30):
+            Enrollment.objects.create(student=s, course=self.course, group=group)
+            Enrollment.objects.create(student=s, course=other, group=other_group)
+            StudentExam.objects.create(student=s, exam=self.exam)
+            StudentExam.objects.create(student=s, exam=self.other_exam)
+
+    def test_suggestions_use_a_fixed_number_of_queries(self):
+        with self.assertNumQueries(5):
+            suggestions = get_reschedule_suggestions(self.exam.id, preferred_date_range=3)
+
+        dates = {s["date"] for s in suggestions}
+        self.assertNotIn(date(2025, 1, 14), dates)
+        self.assertIn(date(2025, 1, 15), dates)
+        self.assertEqual(suggestions[0]["rank"], 1)
+
+    def test_feasibility_reports_student_conflicts(self):
+        conflicts = check_reschedule_feasibility(self.exam.id, date(2025, 1, 14), "Afternoon")
+        self.assertEqual(conflicts, ["30 student conflicts"])
+        self.assertEqual(check_reschedule_feasibility(self.exam.id, date(2025, 1, 15), "Morning"), [])
+
+    def test_feasibility_reads_the_roster_live(self):
+        get_enrollment_snapshot()
+        late = make_students(1, start=30)[0]
+        # A writer the snapshot has not seen (plain QuerySet: no version bump).
+        QuerySet(Enrollment).bulk_create([Enrollment(student=late, course=self.course, group=self.exam.group)])
+        third = make_exam(make_group(self.campus, code="PH101", title="Physics"), day=date(2025, 1, 15))
+        StudentExam.objects.create(student=late, exam=third)
+
+        conflicts = check_reschedule_feasibility(self.exam.id, date(2025, 1, 15), "Morning")
+        self.assertEqual(conflicts, ["1 student conflicts"])
@@ -0,0 +1,88 @@
+from django.test import TestCase
+from datetime import date
+from schedules.occupancy import OccupancyIndex, get_occupancy_index, invalidate_timetable, refresh_exams
+from schedules.models import MasterTimetable
+from exams.models import Exam, StudentExam
+from sharedapp.testing import make_admin, make_campus, make_exam, make_group, make_room, make_students, make_timetable
+
+
+class OccupancyIndexTests(TestCase):
+    def setUp(self):
+        campus = make_campus()
+        self.loc = campus.location
+        self.group = make_group(campus)
+        make_room(self.loc, capacity=50)
+        self.timetable = make_timetable(
+            self.loc, make_admin(), start_date=date(2025, 1, 6), end_date=date(2025, 1, 31),
+        )
+        self.students = make_students(3)
+
+        self.exam = make_exam(self.group, day=date(2025, 1, 6))
+        self.timetable.exams.add(self.exam)
+        for s in self.students[:2]:
+            StudentExam.objects.create(student=s, exam=self.exam)
+
+    def test_build_and_conflicts(self):
+        index = OccupancyIndex.build(self.timetable.id, self.loc.id)
+        self.assertEqual(index.room_capacity, 50)
+        self.assertEqual(index.headcount(date(2025, 1, 6), "morning"), 2)
+
+        mask = index.student_mask([s.id for s in self.students[1:]])
+        found = index.conflicts(date(2025, 1, 6), "Morning", mask)
+        self.assertEqual([student_id for student_id, _ in found], [self.students[1].id])
+        self.assertEqual(index.conflicts(date(2025, 1, 6), "Afternoon", mask), [])
+
+    def test_reload_moves_and_drops(self):
+        index = OccupancyIndex.build(self.timetable.id, self.loc.id)
+        Exam.objects.filter(id=self.exam.id).update(date=date(2025, 1, 7), slot_name="Evening")
+        index.reload_exams([self.exam.id])
+        self.assertEqual(index.headcount(date(2025, 1, 6), "Morning"), 0)
+        self.assertEqual(index.headcount(date(2025, 1, 7), "Evening"), 2)
+
+        exam_id = self.exam.id
+        self.exam.delete()
+        index.reload_exams([exam_id])
+        self.assertEqual(index.headcount(date(2025, 1, 7), "Evening"), 0)
+        self.assertEqual(index.date_bounds(), (None, None))
+
+    def test_cached_index_applies_recorded_changes(self):
+        index = get_occupancy_index(self.timetable.id, self.loc.id)
+        self.assertEqual(index.headcount(date(2025, 1, 6), "Morning"), 2)
+        self.assertIs(get_occupancy_index(self.timetable.id, self.loc.id), index)
+
+        StudentExam.objects.create(student=self.students[2], exam=self.exam)
+        refresh_exams([self.exam.id])
+        moved = make_exam(self.group, day=date(2025, 1, 8))
+        self.timetable.exams.add(moved)
+        StudentExam.objects.create(student=self.students[0], exam=moved)
+        refresh_exams([moved.id])
+
+        # Version read, change rows, exams, rosters: no rebuild.
+        with self.assertNumQueries(4):
+            cached = get_occupancy_index(self.timetable.id, self.loc.id)
+        self.assertEqual(cached.headcount(date(2025, 1, 6), "Morning"), 3)
+        self.assertEqual(cached.headcount(date(2025, 1, 8), "Morning"), 1)
+        # Callers still holding the old index keep a consistent view.
+        self.assertEqual(index.headcount(date(2025, 1, 6), "Morning"), 2)
+
+    def test_seat_and_attendance_saves_keep_the_index(self):
+        index = get_occupancy_index(self.timetable.id, self.loc.id)
+        se = StudentExam.objects.get(student=self.students[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            se.signin_attendance = True
+            se.save()
+        self.assertIs(get_occupancy_index(self.timetable.id, self.loc.id), index)
+
+    def test_whole_timetable_change_rebuilds(self):
+        index = get_occupancy_index(self.timetable.id, self.loc.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_timetable(self.timetable.id)
+        rebuilt = get_occupancy_index(self.timetable.id, self.loc.id)
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.headcount(date(2025, 1, 6), "Morning"), 2)
+
+    def test_missing_changes_rebuild(self):
+        index = get_occupancy_index(self.timetable.id, self.loc.id)
+        # Another worker's bump whose change rows were pruned.
+        MasterTimetable.bump_occupancy_version([self.timetable.id])
+        self.assertIsNot(get_occupancy_index(self.timetable.id, self.loc.id), index)
@@ -0,0 +1,80 @@
+import time
+from django.test import SimpleTestCase
+from datetime import date
+from schedules.optimizer import PlacementOptimizer, optimization_settings, time_budget
+
+
+class PlacementOptimizerTests(SimpleTestCase):
+    def setUp(self):
+        # Mon 5 Jan - Fri 9 Jan 2026, one Morning slot a day.
+        self.days = [date(2026, 1, d) for d in range(5, 10)]
+        self.slots = [(d, "Morning") for d in self.days]
+
+    def _student_days(self, bundles, placement):
+        days = {}
+        for bundle, chosen in zip(bundles, placement):
+            if chosen is None:
+                continue
+            for sid in bundle["students"]:
+                days.setdefault(sid, []).append(chosen[0])
+        return days
+
+    def test_spreads_back_to_back_exams(self):
+        bundles = [
+            {"students": {1, 2}},
+            {"students": {1, 3}},
+            {"students": {4}},
+        ]
+        # Greedy first-fit: student 1 sits on Monday and Tuesday.
+        greedy = [self.slots[0], self.slots[1], self.slots[0]]
+        optimizer = PlacementOptimizer(
+            bundles, [self.slots] * 3, greedy, capacity=10, seed=1,
+        )
+        before = optimizer.objective()
+        placement = optimizer.run(0.3)
+
+        self.assertLess(optimizer.best_objective, before)
+        for sid, days in self._student_days(bundles, placement).items():
+            self.assertEqual(len(days), len(set(days)), f"student {sid} twice in a day")
+        first, second = sorted(self._student_days(bundles, placement)[1])
+        self.assertGreater((second - first).days, 1)
+
+    def test_places_unscheduled_bundle_within_capacity(self):
+        bundles = [{"students": {1, 2, 3}}, {"students": {4, 5}}]
+        optimizer = PlacementOptimizer(
+            bundles, [self.slots[:1], self.slots[:2]], [self.slots[0], None], capacity=4, seed=1,
+        )
+        placement = optimizer.run(0.2)
+
+        self.assertEqual(placement, [self.slots[0], self.slots[1]])
+        self.assertEqual(optimizer.best_terms["unscheduled"], 0)
+
+    def test_respects_fixed_exams_and_min_gap(self):
+        bundles = [{"students": {1}}]
+        fixed = {self.slots[2]: [1]}  # student 1 already sits Wednesday
+        optimizer = PlacementOptimizer(
+            bundles, [self.slots], [None], capacity=10, min_gap_days=1, fixed=fixed, seed=1,
+        )
+        placement = optimizer.run(0.2)
+
+        self.assertIn(placement[0][0], {self.days[0], self.days[4]})
+
+    def test_stops_once_converged(self):
+        bundles = [{"students": {1, 2}}, {"students": {1, 3}}, {"students": {4}}]
+        optimizer = PlacementOptimizer(
+            bundles, [self.slots] * 3, [self.slots[0], self.slots[1], self.slots[0]],
+            capacity=10, seed=1,
+        )
+        started = time.monotonic()
+        optimizer.run(5)
+
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(optimizer.stop_reason, "converged")
+        self.assertLess(optimizer.best_objective, optimizer.start_objective)
+
+    def test_budget_scales_with_bundles(self):
+        settings = optimization_settings({"optimization": {"time_budget_seconds": 5, "seconds_per_bundle": 0.02}})
+
+        self.assertAlmostEqual(time_budget(settings, 10), 0.2)
+        self.assertEqual(time_budget(settings, 1000), 5)
+        self.assertEqual(time_budget({**settings, "enabled": False}, 10), 0)
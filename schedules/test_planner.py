@@ -0,0 +1,58 @@
+from django.test import SimpleTestCase
+from datetime import date
+from schedules.planner import build_course_conflicts, plan_attempt, run_portfolio
+from schedules.optimizer import optimization_settings
+
+
+class PlannerTests(SimpleTestCase):
+    def setUp(self):
+        # Course 1 and 2 share student 3; course 3 is independent.
+        course_group_students = {
+            1: {11: {1, 2, 3}},
+            2: {21: {3, 4}},
+            3: {31: {5, 6}},
+        }
+        course_students = {
+            c: set().union(*groups.values()) for c, groups in course_group_students.items()
+        }
+        settings = optimization_settings({"optimization": {"time_budget_seconds": 0.1, "seed": 7}})
+        self.problem = {
+            "course_students": course_students,
+            "course_group_students": course_group_students,
+            "course_group_sizes": {
+                c: {g: len(s) for g, s in groups.items()}
+                for c, groups in course_group_students.items()
+            },
+            "course_conflicts": dict(build_course_conflicts(course_students)),
+            "room_capacity": 10,
+            "effective_seats": 10,
+            "dates": [date(2026, 1, 5), date(2026, 1, 6), date(2026, 1, 7)],
+            "slots": None,
+            "slots_by_date": {},
+            "group_names": {11: "A", 21: "A", 31: "A"},
+            "group_preferences": {},
+            "defined_time_slots": [{"name": "Morning", "start_time": "08:00", "end_time": "11:00"}],
+            "special_rules": {},
+            "max_exams_per_day": 1,
+            "max_exams_per_slot": 1,
+            "min_gap_days": 0,
+            "prioritize_large_courses": True,
+            "optimization": settings,
+            "fixed": {},
+        }
+
+    def test_plan_places_every_bundle_without_clashes(self):
+        plan = plan_attempt(self.problem)
+        self.assertEqual(plan["score"][0], 0)
+        slot_of = {}
+        for bundle, chosen in zip(plan["bundles"], plan["placement"]):
+            for cd in bundle["courses"]:
+                slot_of[cd["course_id"]] = chosen
+        self.assertNotEqual(slot_of[1][0], slot_of[2][0])
+        # Student 3 sits courses 1 and 2: they should not be back to back.
+        self.assertGreater(abs((slot_of[1][0] - slot_of[2][0]).days), 1)
+
+    def test_portfolio_returns_lowest_score(self):
+        best, scores = run_portfolio(self.problem, 3)
+        self.assertEqual(len(scores), 3)
+        self.assertEqual(best["score"], min(scores.values()))
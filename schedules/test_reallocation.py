@@ -0,0 +1,110 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from datetime import date, time
+
+from exams.models import StudentExam
+from schedules.reallocation import SlotOccupancy, reallocate_slot_delta
+from sharedapp.testing import make_campus, make_exam, make_group, make_room, make_student
+
+DAY = date(2025, 1, 13)
+START, END = time(8, 0), time(11, 0)
+
+
+class IncrementalReallocationTests(TestCase):
+    def setUp(self):
+        self.campus = make_campus()
+        self.loc = self.campus.location
+        self.grid = make_room(self.loc, name="Grid", capacity=6, rows=2, columns=3)
+        self.hall = make_room(self.loc, capacity=40)
+        self.students = 0
+
+    def _exam(self, code):
+        return make_exam(make_group(self.campus, code=code, title=code), day=DAY, start_time=START, end_time=END)
+
+    def _rows(self, exam, n, room=None, seats=()):
+        rows = []
+        for i in range(n):
+            self.students += 1
+            student = make_student(self.students)
+            row, col = seats[i] if i < len(seats) else (None, None)
+            rows.append(StudentExam.objects.create(
+                student=student, exam=exam, room=room, seat_row=row, seat_column=col,
+            ))
+        return rows
+
+    def _state(self):
+        return dict(StudentExam.objects.values_list("id", "room_id"))
+
+    def test_added_students_fill_free_seats_without_moving_anyone(self):
+        first = self._exam("C1")
+        seated = self._rows(first, 3, room=self.grid, seats=[(1, 1), (1, 3), (2, 2)])
+        hall_rows = self._rows(first, 30, room=self.hall)
+        before = self._state()
+
+        second = self._exam("C2")
+        added = self._rows(second, 13)
+        result = reallocate_slot_delta(self.loc, DAY, START, END, added=added)
+
+        self.assertEqual(result.unplaced, [])
+        after = self._state()
+        for se in seated + hall_rows:
+            self.assertEqual(after[se.id], before[se.id])
+        self.assertEqual(StudentExam.objects.filter(room=self.hall).count(), 40)
+        self.assertEqual(StudentExam.objects.filter(room=self.grid).count(), 6)
+        # Free grid seats are the ones between C1 students.
+        grid_seats = set(
+            StudentExam.objects.filter(exam=second, room=self.grid).values_list("seat_row", "seat_column")
+        )
+        self.assertEqual(grid_seats, {(1, 2), (2, 1), (2, 3)})
+
+    def test_overflow_is_left_unplaced(self):
+        first = self._exam("C1")
+        self._rows(first, 40, room=self.hall)
+        self._rows(first, 4, room=self.grid, seats=[(1, 1), (1, 2), (1, 3), (2, 1)])
+        added = self._rows(self._exam("C2"), 4)
+        result = reallocate_slot_delta(self.loc, DAY, START, END, added=added)
+        self.assertEqual(len(result.placed), 2)
+        self.assertEqual(len(result.unplaced), 2)
+        self.assertEqual(StudentExam.objects.filter(room__isnull=True).count(), 2)
+
+    def test_removal_frees_seats_for_waiting_students(self):
+        leaving = self._exam("C1")
+        removed = self._rows(leaving, 6, room=self.grid, seats=[(1, 1), (1, 2), (1, 3), (2, 1), (2, 2), (2, 3)])
+        self._rows(self._exam("C2"), 40, room=self.hall)
+        waiting = self._rows(self._exam("C3"), 2)
+
+        StudentExam.objects.filter(exam=leaving).delete()
+        reallocate_slot_delta(self.loc, DAY, START, END, removed=removed)
+        self.assertEqual(
+            set(StudentExam.objects.filter(id__in=[se.id for se in waiting]).values_list("room_id", flat=True)),
+            {self.grid.id},
+        )
+
+    def test_moved_rows_free_their_seats_before_they_are_written(self):
+        # reschedule_exam and the move flows pass rows that still sit in
+        # the old slot with their old seats.
+        leaving = self._exam("C1")
+        removed = self._rows(leaving, 6, room=self.grid, seats=[(1, 1), (1, 2), (1, 3), (2, 1), (2, 2), (2, 3)])
+        self._rows(self._exam("C2"), 40, room=self.hall)
+        waiting = self._rows(self._exam("C3"), 2)
+
+        reallocate_slot_delta(self.loc, DAY, START, END, removed=removed)
+        seats = list(
+            StudentExam.objects.filter(id__in=[se.id for se in waiting])
+            .values_list("room_id", "seat_row", "seat_column")
+        )
+        self.assertEqual({room_id for room_id, _, _ in seats}, {self.grid.id})
+        self.assertTrue(all(row is not None and col is not None for _, row, col in seats))
+
+    def test_query_count_does_not_depend_on_slot_size(self):
+        def run(seated):
+            self._rows(self._exam(f"S{seated}"), seated, room=self.hall)
+            added = self._rows(self._exam(f"N{seated}"), 2)
+            occupancy = SlotOccupancy.load(self.loc, DAY, START, END, exclude_ids=[se.id for se in added])
+            with CaptureQueriesContext(connection) as ctx:
+                reallocate_slot_delta(self.loc, DAY, START, END, added=added, occupancy=occupancy)
+            StudentExam.objects.all().delete()
+            return len(ctx.captured_queries)
+
+        self.assertEqual(run(5), run(30))
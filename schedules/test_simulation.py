@@ -0,0 +1,80 @@
+from django.test import TestCase
+from datetime import date
+from schedules.simulation import TimetableSimulation
+from schedules.models import TimetableSimulationSession
+from exams.models import Exam, StudentExam
+from enrollments.models import Enrollment
+from sharedapp.testing import make_admin, make_campus, make_exam, make_group, make_room, make_students, make_timetable
+
+
+class TimetableSimulationTests(TestCase):
+    def setUp(self):
+        campus = make_campus()
+        make_room(campus.location, rows=10, columns=10)
+        self.timetable = make_timetable(
+            campus.location, make_admin(), start_date=date(2025, 1, 13), end_date=date(2025, 1, 31),
+        )
+
+        self.exams = []
+        for i, exam_date in enumerate([date(2025, 1, 13), date(2025, 1, 14)]):
+            exam = make_exam(make_group(campus, code=f"C{i}", title=f"Course {i}"), day=exam_date)
+            self.timetable.exams.add(exam)
+            self.exams.append(exam)
+
+        # Ten students sit both exams.
+        for s in make_students(10):
+            for exam in self.exams:
+                Enrollment.objects.create(student=s, course=exam.group.course, group=exam.group)
+                StudentExam.objects.create(student=s, exam=exam)
+
+    def test_moves_report_deltas_without_writing(self):
+        sim = TimetableSimulation.load(self.timetable.id)
+        self.assertEqual(sim.metrics["conflicts"], 0)
+
+        result = sim.apply({"type": "move", "exam_id": self.exams[1].id, "date": "2025-01-13", "slot": "Morning"})
+        self.assertEqual(result["delta"]["conflicts"], 10)
+        self.assertEqual(result["delta"]["day_violations"], 10)
+
+        result = sim.apply({"type": "move", "exam_id": self.exams[1].id, "date": "2025-01-15", "slot": "Afternoon"})
+        self.assertEqual(result["metrics"]["conflicts"], 0)
+
+        sim.undo()
+        self.assertEqual(sim.metrics["conflicts"], 10)
+        self.exams[1].refresh_from_db()
+        self.assertEqual(self.exams[1].date, date(2025, 1, 14))
+
+    def test_commit_writes_moves(self):
+        sim = TimetableSimulation.load(self.timetable.id)
+        sim.apply({"type": "move", "exam_id": self.exams[1].id, "date": "2025-01-15", "slot": "Afternoon"})
+        sim.apply({"type": "remove", "exam_id": self.exams[0].id})
+        result = sim.commit()
+
+        self.assertEqual(result["updated"], [self.exams[1].id])
+        self.assertEqual(result["removed"], [self.exams[0].id])
+        self.exams[1].refresh_from_db()
+        self.assertEqual((self.exams[1].date, self.exams[1].slot_name), (date(2025, 1, 15), "Afternoon"))
+        self.assertFalse(Exam.objects.filter(id=self.exams[0].id).exists())
+        self.assertEqual(
+            StudentExam.objects.filter(exam=self.exams[1], room__isnull=False).count(), 10
+        )
+
+    def test_commit_refuses_stale_snapshot(self):
+        sim = TimetableSimulation.load(self.timetable.id)
+        sim.apply({"type": "move", "exam_id": self.exams[1].id, "date": "2025-01-15", "slot": "Afternoon"})
+        Exam.objects.filter(id=self.exams[1].id).update(date=date(2025, 1, 16))
+        with self.assertRaises(ValueError):
+            sim.commit()
+
+    def test_session_is_stored_in_the_database(self):
+        sim = TimetableSimulation.load(self.timetable.id)
+        sim.save()
+        self.assertTrue(TimetableSimulationSession.objects.filter(id=sim.id).exists())
+
+        with TimetableSimulation.locked(sim.id) as session:
+            session.apply({"type": "move", "exam_id": self.exams[1].id, "date": "2025-01-15", "slot": "Afternoon"})
+            session.save()
+
+        stored = TimetableSimulation.get(sim.id)
+        self.assertEqual(len(stored.moves), 1)
+        stored.discard()
+        self.assertIsNone(TimetableSimulation.get(sim.id))
@@ -0,0 +1,43 @@
+from django.test import SimpleTestCase
+from datetime import date, time
+from schedules.slot_calendar import SlotCalendar
+
+
+class SlotCalendarTests(SimpleTestCase):
+    def setUp(self):
+        self.calendar = SlotCalendar.compile({
+            "time_constraints": {
+                "time_slots": [
+                    {"name": "Evening", "start_time": "17:00", "end_time": "20:00", "priority": 3},
+                    {"name": "Morning", "start_time": "08:00", "end_time": "11:00", "priority": 1},
+                    {"name": "Afternoon", "start_time": "13:00:00", "end_time": "16:00", "priority": 2},
+                    {"name": "Broken", "start_time": "soon", "end_time": "16:00", "priority": 4},
+                ],
+                "day_restrictions": {
+                    "no_exam_days": ["Saturday"],
+                    "special_rules": {"Friday": {"allowed_slots": ["Morning", "Afternoon"]}},
+                    "holidays": ["2026-01-07", "not-a-date"],
+                },
+            }
+        })
+
+    def test_slots_in_priority_order_and_by_name(self):
+        self.assertEqual(self.calendar.slot_names(), ["Morning", "Afternoon", "Evening"])
+        self.assertEqual(self.calendar.slot("morning"), ("Morning", time(8, 0), time(11, 0)))
+        self.assertEqual(self.calendar.slot("Afternoon").start, time(13, 0))
+        self.assertIsNone(self.calendar.slot("Night"))
+
+    def test_day_rules(self):
+        self.assertEqual(self.calendar.slot_names_for(date(2026, 1, 5)), ["Morning", "Afternoon", "Evening"])
+        self.assertEqual(self.calendar.slot_names_for(date(2026, 1, 9)), ["Morning", "Afternoon"])  # Friday
+        self.assertEqual(self.calendar.slots_for(date(2026, 1, 10)), ())  # Saturday
+        self.assertFalse(self.calendar.is_exam_day(date(2026, 1, 7)))  # holiday
+
+    def test_range_iteration(self):
+        dates = list(self.calendar.exam_dates(date(2026, 1, 5), date(2026, 1, 11)))
+        self.assertEqual([d.day for d in dates], [5, 6, 8, 9, 11])
+        slots = list(self.calendar.iter_slots(date(2026, 1, 9), date(2026, 1, 11)))
+        self.assertEqual(
+            [(d.day, s.name) for d, s in slots],
+            [(9, "Morning"), (9, "Afternoon"), (11, "Morning"), (11, "Afternoon"), (11, "Evening")],
+        )
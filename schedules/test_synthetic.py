@@ -0,0 +1,58 @@
+from django.core.management import call_command
+from django.test import TestCase
+from io import StringIO
+import json
+import os
+import tempfile
+
+from courses.models import Course, CourseGroup
+from enrollments.models import Enrollment
+from exams.models import Exam
+from rooms.models import Room
+from schedules.models import MasterTimetable
+from schedules.synthetic import generate
+from student.models import Student
+
+SMALL = dict(locations=1, departments=2, rooms=6, instructors=4, courses=40, students=120)
+
+
+class SyntheticUniversityTests(TestCase):
+    def test_generate_builds_cohorts_with_overlap(self):
+        summary = generate(seed=3, prefix="T", **SMALL)
+
+        self.assertEqual(Student.objects.filter(reg_no__startswith="T").count(), 120)
+        self.assertFalse(Room.objects.filter(name__startswith="T-", rows__isnull=True).exists())
+        enrollments = Enrollment.objects.filter(course__code__startswith="T-")
+        self.assertEqual(enrollments.count(), summary["rows"]["enrollments"])
+        self.assertFalse(enrollments.filter(group__isnull=True).exists())
+        # Cohort cores: several students share more than one course.
+        per_student = enrollments.values_list("student_id", flat=True)
+        self.assertGreater(len(per_student), 120 * 3)
+        for group in CourseGroup.objects.filter(course__code__startswith="T-"):
+            self.assertEqual(group.current_member, enrollments.filter(group=group).count())
+
+        # Same seed, same dataset.
+        again = generate(seed=3, prefix="U", **SMALL)
+        self.assertEqual(again["rows"], summary["rows"])
+
+    def test_benchmark_rolls_back_and_writes_report(self):
+        path = os.path.join(tempfile.mkdtemp(), "report.json")
+        out = StringIO()
+        call_command(
+            "benchmark_scheduler", scales="1", no_pdfs=True, output=path, stdout=out,
+            **SMALL,
+        )
+        report = json.load(open(path))
+        entry = report["scales"][0]
+        for name in (
+            "dataset", "find_compatible_courses_within_group",
+            "generate_exam_schedule", "verify_exam_schedule",
+        ):
+            self.assertIn(name, entry["timings"])
+        self.assertGreater(entry["results"]["exams_created"], 0)
+        self.assertFalse(Course.objects.exists())
+        self.assertFalse(Exam.objects.exists())
+        self.assertFalse(MasterTimetable.objects.exists())
+
+        call_command("benchmark_scheduler", scales="1", no_pdfs=True, baseline=path, stdout=out, **SMALL)
+        self.assertIn("(before ", out.getvalue())
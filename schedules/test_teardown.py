@@ -0,0 +1,127 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ExamManagementSystem.celery import app as celery_app
+from courses.models import CourseGroup
+from exams.models import Exam, StudentExam, UnscheduledExam
+from schedules.models import (
+    MasterTimetable, MasterTimetableExam, TimetableArchive, TimetableTeardown,
+)
+from schedules import teardown
+from schedules.teardown import Teardown, stale_draft_timetables
+from sharedapp.models import UnscheduledExamGroup
+from sharedapp.testing import make_admin, make_campus, make_course, make_exam, make_room, make_students, make_timetable
+
+
+class TimetableTeardownTests(TestCase):
+    def setUp(self):
+        campus = make_campus()
+        self.loc = campus.location
+        self.room = make_room(self.loc)
+        self.admin = make_admin()
+        self.course = make_course(campus)
+        self.groups = [CourseGroup.objects.create(course=self.course, group_name=g) for g in "ABC"]
+        self.students = make_students(4)
+        self.keep = self._timetable()
+        self.kept_exam = self._exam(self.keep, self.groups[2])
+
+    def _timetable(self):
+        return make_timetable(self.loc, self.admin)
+
+    def _exam(self, timetable, group, day=13):
+        exam = make_exam(group, day=date(2025, 1, day), room=self.room)
+        timetable.exams.add(exam)
+        for s in self.students:
+            StudentExam.objects.create(student=s, exam=exam, room=self.room)
+        return exam
+
+    def _doomed(self):
+        timetable = self._timetable()
+        for day, group in ((13, self.groups[0]), (14, self.groups[1])):
+            self._exam(timetable, group, day)
+        unscheduled = UnscheduledExam.objects.create(course=self.course, master_timetable=timetable)
+        unscheduled.groups.add(UnscheduledExamGroup.objects.create(exam=unscheduled, group=self.groups[2]))
+        return timetable
+
+    def _assert_only_kept(self):
+        self.assertEqual(list(MasterTimetable.objects.values_list("id", flat=True)), [self.keep.id])
+        self.assertEqual(list(Exam.objects.values_list("id", flat=True)), [self.kept_exam.id])
+        self.assertEqual(StudentExam.objects.count(), 4)
+        self.assertEqual(MasterTimetableExam.objects.count(), 1)
+        self.assertFalse(UnscheduledExam.objects.exists())
+        self.assertFalse(UnscheduledExamGroup.objects.exists())
+
+    def test_delete_in_chunks(self):
+        timetable = self._doomed()
+        steps = []
+        teardown.CHUNK_EXAMS, old = 1, teardown.CHUNK_EXAMS
+        try:
+            counts = Teardown(timetable.id, progress=lambda *a: steps.append(a[:2])).run()
+        finally:
+            teardown.CHUNK_EXAMS = old
+        self._assert_only_kept()
+        self.assertEqual(steps, [(1, 3), (2, 3), (3, 3)])
+        self.assertEqual(counts["exams_studentexam"], 8)
+        self.assertEqual(counts["exams_exam"], 2)
+
+    def test_archive_keeps_compressed_rows(self):
+        timetable = self._doomed()
+        Teardown(timetable.id, archive=True, user=self.admin).run()
+        self._assert_only_kept()
+        archive = TimetableArchive.objects.get(timetable_id=timetable.id)
+        tables = [table for table, _ in archive.iter_rows()]
+        self.assertEqual(tables.count("exams_studentexam"), 8)
+        self.assertEqual(tables[-1], "schedules_mastertimetable")
+        self.assertEqual(archive.row_counts["exams_exam"], 2)
+        # Children are archived (and deleted) before their parents.
+        self.assertLess(tables.index("exams_studentexam"), tables.index("exams_exam"))
+
+    def test_endpoint_queues_and_reports(self):
+        timetable = self._doomed()
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.delete("/api/exams/exams/truncate-mastertimetable/", {"id": timetable.id}, format="json")
+        self.assertEqual(response.status_code, 202, response.content)
+        job_id = response.json()["data"]["id"]
+        status = client.get(f"/api/exams/exams/teardown-status/?id={job_id}").json()["data"]
+        self.assertEqual(status["status"], "done")
+        self._assert_only_kept()
+
+    def test_stale_drafts(self):
+        old = self._doomed()
+        newest = self._timetable()
+        month_ago = timezone.now() - timedelta(days=30)
+        MasterTimetable.objects.filter(id__in=[old.id, self.keep.id, newest.id]).update(updated_at=month_ago)
+        MasterTimetable.objects.filter(id=self.keep.id).update(status="PUBLISHED")
+        # Its exams were edited recently, which still counts as a touch.
+        self.assertEqual(list(stale_draft_timetables(14)), [])
+
+        Exam.objects.filter(mastertimetableexam__master_timetable=old).update(updated_at=month_ago)
+        StudentExam.objects.filter(master_timetable=old).update(updated_at=month_ago)
+        self.assertEqual(list(stale_draft_timetables(14)), [old])
+
+        call_command("purge_draft_timetables", "--days", "14", stdout=StringIO())
+        self.assertFalse(MasterTimetable.objects.filter(id=old.id).exists())
+        job = TimetableTeardown.objects.get(timetable_id=old.id)
+        self.assertEqual((job.status, job.archive), ("done", True))
+        self.assertTrue(TimetableArchive.objects.filter(timetable_id=old.id).exists())
+
+    def test_data_version_bump_counts_as_a_touch(self):
+        old = self._doomed()
+        self._timetable()
+        month_ago = timezone.now() - timedelta(days=30)
+        MasterTimetable.objects.filter(id=old.id).update(updated_at=month_ago)
+        Exam.objects.filter(mastertimetableexam__master_timetable=old).update(updated_at=month_ago)
+        StudentExam.objects.filter(master_timetable=old).update(updated_at=month_ago)
+        self.assertEqual(list(stale_draft_timetables(14)), [old])
+
+        MasterTimetable.bump_data_version([old.id])
+        self.assertEqual(list(stale_draft_timetables(14)), [])
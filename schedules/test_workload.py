@@ -0,0 +1,49 @@
+from django.core.management import call_command
+from django.test import TestCase
+from datetime import date
+from io import StringIO
+import json
+import os
+import tempfile
+
+from enrollments.models import Enrollment
+from exams.models import Exam, StudentExam
+from schedules.workload import builtin_workload, explain, record_workload
+from sharedapp.testing import make_campus, make_exam, make_group, make_room, make_students
+
+
+class ExplainWorkloadTests(TestCase):
+    def setUp(self):
+        campus = make_campus()
+        room = make_room(campus.location)
+        group = make_group(campus)
+        exam = make_exam(group, room=room)
+        for i, s in enumerate(make_students(3)):
+            Enrollment.objects.create(student=s, course=group.course, group=group)
+            StudentExam.objects.create(student=s, exam=exam, room=room if i else None)
+        self.dir = tempfile.mkdtemp()
+
+    def test_builtin_workload_uses_the_slot_indexes(self):
+        entries = {e["name"]: e for e in builtin_workload()}
+        self.assertIn("studentexam_room_slot", entries)
+        plan = explain(entries["exam_date_slot"]["sql"], entries["exam_date_slot"]["params"])
+        self.assertTrue(any("exam_date_slot_idx" in line for line in plan), plan)
+
+    def test_replay_with_baseline(self):
+        workload = os.path.join(self.dir, "workload.jsonl")
+        before = os.path.join(self.dir, "before.json")
+        out = StringIO()
+        call_command("explain_workload", save_workload=workload, output=before, repeat=1, stdout=out)
+        self.assertIn("exam_date_times", json.load(open(before))["timings"])
+
+        out = StringIO()
+        call_command("explain_workload", workload=workload, baseline=before, repeat=1, stdout=out)
+        self.assertIn("(before ", out.getvalue())
+
+    def test_record_workload(self):
+        path = os.path.join(self.dir, "recorded.jsonl")
+        with record_workload(path):
+            list(Exam.objects.filter(date=date(2025, 1, 13)))
+        out = StringIO()
+        call_command("explain_workload", workload=path, repeat=1, stdout=out)
+        self.assertIn("recorded_1", out.getvalue())
@@ -3,10 +3,16 @@ from django.urls import path, include
 from .views import (
     
     CourseScheduleViewSet,
+    MasterTimetableViewSet,
+    TimetableSimulationViewSet,
 )
 
 router = DefaultRouter()
- 
+
+# Registered before the catch-all '' prefix so its routes aren't swallowed
+# by CourseScheduleViewSet's detail route.
+router.register(r'simulations', TimetableSimulationViewSet, basename='timetable-simulation')
+router.register(r'timetables', MasterTimetableViewSet, basename='master-timetable')
 router.register(r'', CourseScheduleViewSet)
 
 urlpatterns = [
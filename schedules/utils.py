@@ -15,10 +15,18 @@ from django.db.models import Count, Sum
 from courses.models import Course, CourseGroup
 from departments.models import Department
 from enrollments.models import Enrollment
+from enrollments.snapshot import NO_GROUP, get_enrollment_snapshot
 from exams.models import Exam, StudentExam
 from notifications.utils import notify_students_room_changed
-from rooms.models import Room, RoomOutOfService
-from schedules.models import MasterTimetable
+from rooms.models import Location, Room, RoomOutOfService
+from schedules.models import MasterTimetable, MasterTimetableExam
+from schedules.occupancy import OccupancyIndex, get_occupancy_index, refresh_exams
+from schedules.feasibility import RescheduleFeasibility
+from schedules.optimizer import optimization_settings
+from schedules.slot_calendar import get_slot_calendar
+from schedules.planner import (
+    build_course_conflicts, color_courses, plan_attempt, run_portfolio,
+)
 from django.db.models import Min, Max
 from datetime import timedelta, time
 from bisect import bisect_left, bisect_right
@@ -85,9 +93,7 @@ def analyze_student_course_conflicts():
     conflict_matrix = defaultdict(int)
 
     # Get all enrollments grouped by student
-    student_courses = defaultdict(list)
-    for enrollment in Enrollment.objects.all():
-        student_courses[enrollment.student_id].append(enrollment.course_id)
+    student_courses = get_enrollment_snapshot().courses_by_student()
 
     # Build conflict matrix
     for student_id, courses in student_courses.items():
@@ -175,61 +181,34 @@ def find_compatible_courses(course_conflict_matrix):
 
 def _get_day_restrictions_config():
     """
-    Load admin-configured day-restriction rules (config/config.json) —
-    single source of truth shared by every function that needs to know
-    which days/slots are blocked, instead of each duplicating its own
-    hardcoded "Saturday is off, Friday has no Evening" logic that ignored
-    whatever the admin actually configured.
+    Admin-configured day-restriction rules (config/config.json), as
+    compiled by the slot calendar (schedules/slot_calendar.py) — single
+    source of truth shared by every function that needs to know which
+    days/slots are blocked, instead of each duplicating its own hardcoded
+    "Saturday is off, Friday has no Evening" logic that ignored whatever
+    the admin actually configured.
     """
-    config = JsonConfigManager().read_config()
-    day_restrictions = config.get("time_constraints", {}).get("day_restrictions", {})
-    holiday_dates = set()
-    for h in day_restrictions.get("holidays", []):
-        try:
-            holiday_dates.add(datetime.strptime(h, "%Y-%m-%d").date())
-        except (TypeError, ValueError):
-            pass
+    calendar = get_slot_calendar()
     return {
-        "no_exam_days": day_restrictions.get("no_exam_days", NO_EXAM_DAYS),
-        "special_rules": day_restrictions.get("special_rules", {}),
-        "holiday_dates": holiday_dates,
+        "no_exam_days": list(calendar.no_exam_days),
+        "special_rules": calendar.special_rules,
+        "holiday_dates": set(calendar.holiday_dates),
     }
 
 
 def _get_config_slot_tuples():
     """(label, start_time, end_time) tuples from admin config.json, falling back to SLOTS."""
-    config = JsonConfigManager().read_config()
-    raw_time_slots = config.get("time_constraints", {}).get("time_slots") or [
-        {"name": label, "start_time": start.strftime("%H:%M"), "end_time": end.strftime("%H:%M"), "priority": i}
-        for i, (label, start, end) in enumerate(SLOTS)
-    ]
-    slot_tuples = []
-    for s in sorted(raw_time_slots, key=lambda x: x.get("priority", 99)):
-        try:
-            start_t = datetime.strptime(s["start_time"], "%H:%M").time()
-            end_t = datetime.strptime(s["end_time"], "%H:%M").time()
-            slot_tuples.append((s["name"], start_t, end_t))
-        except (KeyError, ValueError):
-            continue
-    return slot_tuples
+    return list(get_slot_calendar().slots)
 
 
 def get_allowed_slot_tuples_for_date(check_date):
     """Config-driven (label, start, end) tuples permitted on check_date (empty if the day is blocked)."""
-    cfg = _get_day_restrictions_config()
-    weekday = check_date.strftime("%A")
-    if weekday in cfg["no_exam_days"] or check_date in cfg["holiday_dates"]:
-        return []
-    all_tuples = _get_config_slot_tuples()
-    rule = cfg["special_rules"].get(weekday)
-    if rule and "allowed_slots" in rule:
-        return [t for t in all_tuples if t[0] in rule["allowed_slots"]]
-    return all_tuples
+    return list(get_slot_calendar().slots_for(check_date))
 
 
 def get_allowed_slot_names_for_date(check_date):
     """Config-driven list of slot names permitted on check_date (empty if the day is blocked)."""
-    return [t[0] for t in get_allowed_slot_tuples_for_date(check_date)]
+    return get_slot_calendar().slot_names_for(check_date)
 
 
 def get_exam_slots(start_date, end_date, max_slots=None):
@@ -243,15 +222,10 @@ def get_exam_slots(start_date, end_date, max_slots=None):
     later actually allows.
     """
     date_slots = []
-    current_date = start_date
-
-    while current_date <= end_date:
-        for label, start, end in get_allowed_slot_tuples_for_date(current_date):
-            date_slots.append((current_date, label, start, end))
-            if max_slots and len(date_slots) >= max_slots:
-                return date_slots
-        current_date += timedelta(days=1)
-
+    for current_date, (label, start, end) in get_slot_calendar().iter_slots(start_date, end_date):
+        date_slots.append((current_date, label, start, end))
+        if max_slots and len(date_slots) >= max_slots:
+            break
     return date_slots
 
 
@@ -339,25 +313,48 @@ def which_suitable_slot_to_schedule_course_group(date, new_group, suggested_slot
     all_conflicts = defaultdict(list)
     possible_slots = []
 
-    day_cfg = _get_day_restrictions_config()
+    calendar = get_slot_calendar()
     weekday_name = date.strftime("%A")
 
     # Early exits for optimization
-    if weekday_name in day_cfg["no_exam_days"] or date in day_cfg["holiday_dates"]:
+    if not calendar.is_exam_day(date):
         all_conflicts[weekday_name].append(f"No exams can be scheduled on {weekday_name}")
         return new_group, None, all_suggestions, all_conflicts
 
-    allowed_today = get_allowed_slot_names_for_date(date)
+    allowed_today = calendar.slot_names_for(date)
     if allowed_today and suggested_slot not in allowed_today:
         suggested_slot = allowed_today[0]
 
-    # Get date range once
-    date_range = Exam.objects.aggregate(
-        min_date=Min("date"), 
-        max_date=Max("date")
+    # Room-capacity checks below must be scoped to this group's own campus —
+    # otherwise a slot at a full campus can be misreported as "available"
+    # just because some other, unrelated campus has spare seats.
+    new_group_rows = list(
+        Enrollment.objects.filter(group_id__in=new_group)
+        .values_list("student_id", "course__department__location_id")
     )
-    min_exam_date = date_range["min_date"]
-    max_exam_date = date_range["max_date"]
+    enrolled_students_new_group = {student_id for student_id, _ in new_group_rows}
+    location_id = new_group_rows[0][1] if new_group_rows else None
+
+    # Occupancy comes from the per-timetable index (schedules/occupancy.py)
+    # — scoped to this group's own campus and, when known, to the
+    # currently-open MasterTimetable. Unscoped, this checked slot
+    # availability against exams from every campus and every other
+    # timetable in the system, reporting slots as conflicted/full because
+    # of exams the admin scheduling this group can't even see. The index is
+    # built once and kept current on every create/move/cancel, so each
+    # candidate slot below is a bitset intersection instead of a roster
+    # rebuild plus a capacity aggregate.
+    if timetable_id:
+        occupancy = get_occupancy_index(timetable_id, location_id)
+        min_exam_date, max_exam_date = occupancy.date_bounds()
+    else:
+        date_range = Exam.objects.aggregate(
+            min_date=Min("date"),
+            max_date=Max("date")
+        )
+        min_exam_date = date_range["min_date"]
+        max_exam_date = date_range["max_date"]
+        occupancy = None
 
     # Calculate all dates to check upfront
     dates_to_check = []
@@ -365,105 +362,54 @@ def which_suitable_slot_to_schedule_course_group(date, new_group, suggested_slot
     # Current date
     dates_to_check.append(date)
     
-    # Past dates (up to min_exam_date)
+    # Past dates (up to min_exam_date). With no exams scheduled yet there is
+    # nothing to anchor the window on, so only the requested date is checked.
     current_date = date - timedelta(days=1)
-    while current_date >= min_exam_date:
-        wd = current_date.strftime("%A")
-        if wd not in day_cfg["no_exam_days"] and current_date not in day_cfg["holiday_dates"]:
+    while min_exam_date and current_date >= min_exam_date:
+        if calendar.is_exam_day(current_date):
             dates_to_check.append(current_date)
         current_date -= timedelta(days=1)
 
     # Future dates (up to 14 days or max_exam_date)
     for days_after in range(1, 15):
         future_date = date + timedelta(days=days_after)
-        wd = future_date.strftime("%A")
         if (
-            future_date > max_exam_date
-            or wd in day_cfg["no_exam_days"]
-            or future_date in day_cfg["holiday_dates"]
+            max_exam_date is None
+            or future_date > max_exam_date
+            or not calendar.is_exam_day(future_date)
         ):
             continue
         dates_to_check.append(future_date)
 
-    # Bulk fetch all enrolled students for new groups
-    enrolled_students_new_group = set(
-        Enrollment.objects.filter(group_id__in=new_group)
-        .values_list("student_id", flat=True)
-    )
-
-    # Room-capacity checks below must be scoped to this group's own campus —
-    # otherwise a slot at a full campus can be misreported as "available"
-    # just because some other, unrelated campus has spare seats.
-    location_id = (
-        Enrollment.objects.filter(group_id__in=new_group)
-        .values_list("course__department__location_id", flat=True)
-        .first()
-    )
+    if occupancy is None:
+        # No timetable to cache against — build a throwaway index over just
+        # the dates being considered.
+        occupancy = OccupancyIndex.build(location_id=location_id, dates=dates_to_check)
 
-    # Bulk fetch all exams and related data for the date range — scoped to
-    # this group's own campus (location_id was already computed above but
-    # never actually applied here) and, when known, to the currently-open
-    # MasterTimetable. Unscoped, this checked slot availability against
-    # exams from every campus and every other timetable in the system,
-    # reporting slots as conflicted/full because of exams the admin
-    # scheduling this group can't even see.
-    all_exams = (
-        Exam.objects
-        .filter(date__in=dates_to_check, group__course__department__location_id=location_id)
-        .select_related('group', 'group__course')
-        .prefetch_related(
-            Prefetch(
-                'studentexam_set',
-                queryset=StudentExam.objects.select_related('student')
-            )
-        )
+    new_group_mask = occupancy.student_mask(enrolled_students_new_group)
+    location_name = (
+        Location.objects.filter(id=location_id).values_list("name", flat=True).first()
+        if location_id else None
     )
-    if timetable_id:
-        all_exams = all_exams.filter(mastertimetableexam__master_timetable_id=timetable_id)
-
-    # Pre-process exam data into efficient lookup structures
-    exams_by_date_slot = defaultdict(list)
-    students_by_date_slot = defaultdict(set)
-    
-    for exam in all_exams:
-        key = (exam.date, exam.slot_name)
-        exams_by_date_slot[key].append(exam)
-        
-        # Get all students for this exam
-        exam_students = {se.student_id for se in exam.studentexam_set.all()}
-        students_by_date_slot[key].update(exam_students)
 
     def get_available_slots_for_date(check_date):
         """Get available slots for a given date, per admin config."""
-        return get_allowed_slot_names_for_date(check_date)
+        return calendar.slot_names_for(check_date)
 
     def check_slot_conflicts_optimized(check_date, slot):
-        """Optimized conflict checking using pre-fetched data"""
-        key = (check_date, slot)
-        slot_students = students_by_date_slot.get(key, set())
-        
-        conflicts = []
-        conflicting_students = enrolled_students_new_group.intersection(slot_students)
-        
-        if conflicting_students:
-            # Only get exam details for conflicting students
-            slot_exams = exams_by_date_slot.get(key, [])
-            for student_id in conflicting_students:
-                # Find the exam this student is enrolled in
-                for exam in slot_exams:
-                    if exam.group:
-                        exam_student_ids = {se.student_id for se in exam.studentexam_set.all()}
-                        if student_id in exam_student_ids:
-                            conflicts.append({
-                                "student": student_id,
-                                "group": exam.group.group_name,
-                                "course": exam.group.course.title,
-                                "date": check_date,
-                                "slot": slot,
-                            })
-                            break
-
-        return conflicts, len(slot_students)
+        """Conflicts for the new group in one slot, from the occupancy index."""
+        conflicts = [
+            {
+                "student": student_id,
+                "group": info["group_name"],
+                "course": info["course_title"],
+                "date": check_date,
+                "slot": slot,
+            }
+            for student_id, info in occupancy.conflicts(check_date, slot, new_group_mask)
+            if info["group_id"]
+        ]
+        return conflicts, occupancy.headcount(check_date, slot)
 
     def evaluate_slot_optimized(check_date, slot, is_suggested=False):
         """Optimized slot evaluation"""
@@ -482,8 +428,10 @@ def which_suitable_slot_to_schedule_course_group(date, new_group, suggested_slot
             })
             return False
             
-        elif not check_rooms_availability_for_slots(total_students, location_id):
+        elif occupancy.room_capacity < total_students:
             room_msg = f"{check_date} {slot} slot lacks room capacity"
+            if location_name:
+                room_msg += f" at {location_name}"
             all_conflicts[check_date].append(room_msg)
             all_suggestions.append({
                 "suggested": False,
@@ -566,63 +514,59 @@ def get_slot_name(start_time, end_time):
     return None
 
 # Alternative approach for very large datasets
-def verify_groups_compatibility(groups):
+def verify_groups_compatibility(groups, involving=None):
     """
-    Alternative implementation optimized for very large datasets.
-    Uses bulk operations and minimal memory footprint.
+    Pairs of the given groups that share students, as
+    (group1, group2, set of shared student ids).
+
+    Reads the group x group overlap index of the enrollment snapshot, so
+    each candidate pair is a lookup in a sorted row rather than a roster
+    intersection; member lists are only built for pairs that do overlap.
+    add_new_exam approves a placement on this answer; the snapshot is
+    current for it because every ORM write to Enrollment, update() and
+    bulk_create() included, bumps the version in its own transaction (see
+    EnrollmentQuerySet). With `involving`, only pairs containing at least
+    one of those groups are checked (add_new_exam only reports conflicts
+    of the groups being added, not the ones already scheduled that day).
     """
-    
-    # Use raw SQL for maximum performance if needed
-    from django.db import connection
-    
-    with connection.cursor() as cursor:
-        placeholders = ','.join(['%s'] * len(groups))
-        cursor.execute(f"""
-            SELECT course_id, group_id, student_id 
-            FROM enrollments_enrollment 
-            WHERE group_id IN ({placeholders})
-            ORDER BY student_id, course_id, group_id
-        """, groups)
-        
-        enrollments = cursor.fetchall()
-    
-    # Process results with minimal memory usage
-    course_group_students = defaultdict(lambda: defaultdict(set))
-    for course_id, group_id, student_id in enrollments:
-        course_group_students[course_id][group_id].add(student_id)
-    
-    # Rest of the logic remains the same as the optimized version
-    student_to_groups = defaultdict(set)
-    for course_id, groups_dict in course_group_students.items():
-        for group_id, students in groups_dict.items():
-            for student_id in students:
-                student_to_groups[student_id].add((course_id, group_id))
-    
+    groups = list(dict.fromkeys(groups))
+    if len(groups) < 2:
+        return []
+    snapshot = get_enrollment_snapshot()
+    members = set(groups)
+    focus = groups if involving is None else [g for g in groups if g in set(involving)]
+
     group_conflicts = []
     processed_pairs = set()
-    
-    for student_id, student_groups in student_to_groups.items():
-        if len(student_groups) > 1:
-            student_groups_list = list(student_groups)
-            for i in range(len(student_groups_list)):
-                for j in range(i + 1, len(student_groups_list)):
-                    course1, group1 = student_groups_list[i]
-                    course2, group2 = student_groups_list[j]
-                    
+    for group1 in focus:
+        overlapping, _ = snapshot.overlapping_groups(group1)
+        for group2 in overlapping.tolist():
+            if group2 not in members:
+                continue
+            pair = (min(group1, group2), max(group1, group2))
+            if pair in processed_pairs:
+                continue
+            processed_pairs.add(pair)
+            shared_students = set(snapshot.shared_students(group1, group2).tolist())
+            group_conflicts.append((group1, group2, shared_students))
+    return group_conflicts
 
 
-                    pair = tuple(sorted([(course1, group1), (course2, group2)]))
-                    
-                    if pair not in processed_pairs:
-                        processed_pairs.add(pair)
-                        students1 = course_group_students[course1][group1]
-                        students2 = course_group_students[course2][group2]
-                        shared_students = students1 & students2
-                        
-                        if shared_students:
-                            group_conflicts.append((group1, group2, shared_students))
-    
-    return group_conflicts
+def load_course_enrollments(courses):
+    """
+    Enrolment maps for colouring and placement, as plain dicts (picklable,
+    see schedules/planner.py): course -> students, course -> group ->
+    students, course -> group -> size. Read from the shared enrollment
+    snapshot; enrolments without a group are skipped.
+    """
+    course_students, course_group_students, course_group_sizes, missing = (
+        get_enrollment_snapshot().course_group_maps(courses)
+    )
+    if missing:
+        logger.warning(
+            f"{missing} enrollments have no group and will be skipped."
+        )
+    return course_students, course_group_students, course_group_sizes
 
 
 def find_compatible_courses_within_group(courses, location_id=None):
@@ -646,126 +590,15 @@ def find_compatible_courses_within_group(courses, location_id=None):
 
     max_students_per_slot = total_seats
 
-    # Build enrollment maps
-    course_students      = defaultdict(set)
-    course_group_students = defaultdict(lambda: defaultdict(set))
-    course_group_sizes   = defaultdict(lambda: defaultdict(int))
-
-    enrollments = Enrollment.objects.filter(
-        course_id__in=courses, status='enrolled'
+    course_students, course_group_students, course_group_sizes = (
+        load_course_enrollments(courses)
     )
-    missing = enrollments.filter(group__isnull=True).count()
-    if missing:
-        logger.warning(
-            f"{missing} enrollments have no group and will be skipped."
-        )
-
-    for enr in enrollments.filter(group__isnull=False).iterator():
-        course_students[enr.course_id].add(enr.student_id)
-        course_group_students[enr.course_id][enr.group_id].add(enr.student_id)
-        course_group_sizes[enr.course_id][enr.group_id] += 1
-
-    # Build conflict graph between courses
-    course_conflicts = defaultdict(list)
-    for c1, c2 in combinations(course_students.keys(), 2):
-        if course_students[c1] & course_students[c2]:
-            course_conflicts[c1].append(c2)
-            course_conflicts[c2].append(c1)
-
-    # --- Greedy graph colouring (one colour = one timeslot) ---
-    color_courses        = defaultdict(list)
-    color_student_counts = defaultdict(int)
-    color_course_groups  = defaultdict(lambda: defaultdict(list))
-    colored              = {}
-
-    # Sort: largest course first, most conflicted first
-    course_list = sorted(
-        course_students.keys(),
-        key=lambda x: (-len(course_students[x]), -len(course_conflicts[x]))
+    course_conflicts = build_course_conflicts(course_students)
+    compatible_groups = color_courses(
+        course_students, course_group_students, course_group_sizes,
+        course_conflicts, max_students_per_slot,
     )
 
-    for course in course_list:
-        course_size   = len(course_students[course])
-        course_groups = list(course_group_students[course].keys())
-
-        # FIX: compute compatible count once, use 0 for isolated courses
-        # (so they get a slot immediately rather than being deferred)
-        available_colors = []
-        for color in range(len(course_students)):
-            conflict_free = all(
-                colored.get(conflict) != color
-                for conflict in course_conflicts[course]
-                if conflict in colored
-            )
-            has_capacity = (
-                color_student_counts[color] + course_size
-            ) <= max_students_per_slot
-
-            if conflict_free and has_capacity:
-                available_colors.append(color)
-
-        if available_colors:
-            chosen = min(available_colors, key=lambda c: color_student_counts[c])
-            colored[course] = chosen
-            color_courses[chosen].append(course)
-            color_student_counts[chosen] += course_size
-            for gid in course_groups:
-                color_course_groups[chosen][course].append(gid)
-        else:
-            # Course doesn't fit in any existing slot — split by group
-            sorted_groups = sorted(
-                course_groups, key=lambda g: -course_group_sizes[course][g]
-            )
-            for gid in sorted_groups:
-                gsize = course_group_sizes[course][gid]
-                best_color, best_remaining = None, float("inf")
-
-                for color in range(len(color_student_counts) + 1):
-                    if any(
-                        colored.get(conflict) == color
-                        for conflict in course_conflicts[course]
-                        if conflict in colored
-                    ):
-                        continue
-                    current = color_student_counts.get(color, 0)
-                    remaining = max_students_per_slot - current
-                    if gsize <= remaining and remaining < best_remaining:
-                        best_color, best_remaining = color, remaining
-
-                if best_color is not None:
-                    color_course_groups[best_color][course].append(gid)
-                    color_student_counts[best_color] = (
-                        color_student_counts.get(best_color, 0) + gsize
-                    )
-
-    # Convert colour map → output format
-    compatible_groups = []
-    for color in sorted(color_course_groups.keys()):
-        courses_in_slot, total_students = [], 0
-        for course_id, gids in color_course_groups[color].items():
-            slot_size = sum(
-                course_group_sizes[course_id][g] for g in gids
-            )
-            total_students += slot_size
-            courses_in_slot.append({
-                "course_id": course_id,
-                "groups":    gids,
-                "student_count": slot_size,
-                "all_groups_scheduled_together": (
-                    len(gids) == len(course_group_students[course_id])
-                ),
-                "split_course": (
-                    len(gids) < len(course_group_students[course_id])
-                ),
-            })
-        if courses_in_slot:
-            compatible_groups.append({
-                "timeslot":       color + 1,
-                "courses":        courses_in_slot,
-                "student_count":  total_students,
-                "within_capacity": total_students <= max_students_per_slot,
-            })
-
     return compatible_groups, course_conflicts
 
 
@@ -840,10 +673,13 @@ def find_compatible_courses_with_group_optimization(courses):
     course_group_students = defaultdict(lambda: defaultdict(set))
     
     # Populate enrollment data
-    for enrollment in Enrollment.objects.filter(course_id__in=courses).iterator():
-        course_group_students[enrollment.course_id][enrollment.group_id].add(
-            enrollment.student_id
-        )
+    snapshot = get_enrollment_snapshot()
+    for course_id in courses:
+        students, groups, _ = snapshot.course_enrollments(course_id)
+        for student_id, group_id in zip(students.tolist(), groups.tolist()):
+            course_group_students[course_id][
+                None if group_id == NO_GROUP else group_id
+            ].add(student_id)
     
     # For each course, find which groups can be combined (no student overlap)
     course_combined_groups = {}
@@ -1075,13 +911,8 @@ def prefetch_enrollments(course_groups):
     for group in course_groups:
         for course in group["courses"]:
             group_ids.extend(course["groups"])
-    
-    enrollments = Enrollment.objects.filter(group_id__in=group_ids, status='enrolled').values('group_id', 'student_id')
-    enrollments_by_group = defaultdict(set)
-    for enrollment in enrollments:
-        enrollments_by_group[enrollment['group_id']].add(enrollment['student_id'])
-    
-    return dict(enrollments_by_group)
+
+    return get_enrollment_snapshot().group_student_sets(group_ids)
 
 
 def verify_day_off_constraints(min_gap_days=1):
@@ -1141,9 +972,9 @@ def assign_seat_positions_for_room_slot(room, date, start_time, end_time):
     student_exams = list(
         StudentExam.objects.filter(
             room=room,
-            exam__date=date,
-            exam__start_time=start_time,
-            exam__end_time=end_time,
+            slot_date=date,
+            slot_start=start_time,
+            slot_end=end_time,
             seat_row__isnull=True,
         ).select_related("exam")
     )
@@ -1189,6 +1020,7 @@ def cancel_exam(exam_id):
     Returns True if successful
     """
     with transaction.atomic():
+        refresh_exams([exam_id])
         StudentExam.objects.filter(exam_id=exam_id).delete()
         Exam.objects.filter(id=exam_id).delete()
 
@@ -1218,6 +1050,7 @@ def reschedule_exam(exam_id, new_date, slot=None):
         # 2. VALIDATE AND SET TIME SLOT
         new_start_time = exam.start_time  # Default to current time
         new_end_time = exam.end_time
+        new_slot_name = exam.slot_name
 
         if slot:
             slot_match = next(
@@ -1230,7 +1063,7 @@ def reschedule_exam(exam_id, new_date, slot=None):
                     f"Available slots: {', '.join(available_slot_names)}"
                 )
 
-            _, new_start_time, new_end_time = slot_match
+            new_slot_name, new_start_time, new_end_time = slot_match
         else:
             # If no slot specified, validate current time slot is valid for the new day
             current_slot = (exam.start_time, exam.end_time)
@@ -1246,30 +1079,24 @@ def reschedule_exam(exam_id, new_date, slot=None):
                     f"Please specify a valid slot."
                 )
 
-        # 3. CHECK STUDENT CONFLICTS
+        # 3-5. STUDENT CONFLICTS, ROOM CAPACITY, COURSE COMPATIBILITY
         # Exam has no `course` field — only `group` (FK to CourseGroup), with
         # the course reached via `group.course`. Every `.course` reference in
         # this function used to raise AttributeError immediately, so
         # reschedule-exam crashed on every real call.
+        #
+        # All three checks come from one RescheduleFeasibility load (a fixed
+        # handful of queries) instead of one StudentExam query per enrolled
+        # student and one Enrollment count per other exam in the slot. Room
+        # capacity and the slot's other exams are scoped to this exam's own
+        # location — unscoped, this pulled in unrelated exams from every
+        # other location and checked against the WHOLE SYSTEM's capacity.
         location = exam.group.course.department.location
-        enrolled_students = Enrollment.objects.filter(course=exam.group.course)
-        conflicted_students = []
-
-        for enrollment in enrolled_students:
-            existing_exams = StudentExam.objects.filter(
-                student=enrollment.student, exam__date=new_date
-            ).exclude(exam_id=exam_id)
-
-            if existing_exams.exists():
-                conflicted_students.append(
-                    {
-                        "student": enrollment.student.reg_no,
-                        "conflicting_exams": [
-                            se.exam.group.course.title for se in existing_exams
-                        ],
-                    }
-                )
+        feasibility = RescheduleFeasibility(exam, new_date, new_date).evaluate(
+            new_date, new_slot_name, new_start_time, new_end_time
+        )
 
+        conflicted_students = feasibility["conflicted_students"]
         if conflicted_students:
             conflict_details = []
             for conflict in conflicted_students[:3]:
@@ -1284,80 +1111,30 @@ def reschedule_exam(exam_id, new_date, slot=None):
 
             raise ValueError(error_msg)
 
-        # 4. CHECK ROOM CAPACITY CONFLICTS
-        # Get number of students for this exam
-        exam_student_count = Enrollment.objects.filter(course=exam.group.course).count()
-
-        # Check existing exams in the same time slot — scoped to this exam's
-        # own location. Unscoped, this both pulled in unrelated exams from
-        # every other location and checked capacity against the WHOLE
-        # SYSTEM's room capacity below instead of just this location's.
-        existing_slot_exams = Exam.objects.filter(
-            date=new_date,
-            start_time=new_start_time,
-            end_time=new_end_time,
-            group__course__department__location=location,
-        ).exclude(id=exam_id)
-
-        # Calculate total students that would need accommodation in this slot
-        total_students_needed = exam_student_count
-        other_exams_students = 0
-
-        for other_exam in existing_slot_exams:
-            other_exam_students = Enrollment.objects.filter(
-                course=other_exam.group.course
-            ).count()
-            other_exams_students += other_exam_students
-            total_students_needed += other_exam_students
-
-        # Check available room capacity (this location only)
-        total_room_capacity = get_total_room_capacity(location_id=location.id)
-
-        if total_students_needed > total_room_capacity:
+        if feasibility["headroom"] < 0:
             raise ValueError(
-                f"Insufficient room capacity. Required: {total_students_needed} students, "
-                f"Available: {total_room_capacity} seats. "
-                f"This exam needs {exam_student_count} seats, "
-                f"other exams in this slot need {other_exams_students} seats."
+                f"Insufficient room capacity. Required: {feasibility['required_seats']} students, "
+                f"Available: {feasibility['available_seats']} seats. "
+                f"This exam needs {feasibility['exam_student_count']} seats, "
+                f"other exams in this slot need {feasibility['other_exams_students']} seats."
             )
 
-        # 5. CHECK FOR COURSE COMPATIBILITY CONFLICTS
         # Ensure courses scheduled together don't share students
-        if existing_slot_exams:
-            exam_students = set(
-                Enrollment.objects.filter(course=exam.group.course).values_list(
-                    "student_id", flat=True
-                )
+        if feasibility["incompatible_courses"]:
+            other_title, common_count = feasibility["incompatible_courses"][0]
+            raise ValueError(
+                f"Course compatibility conflict: {common_count} student(s) are enrolled in both "
+                f"'{exam.group.course.title}' and '{other_title}'. "
+                f"These courses cannot be scheduled in the same time slot."
             )
 
-            for other_exam in existing_slot_exams:
-                other_students = set(
-                    Enrollment.objects.filter(course=other_exam.group.course).values_list(
-                        "student_id", flat=True
-                    )
-                )
-
-                common_students = exam_students.intersection(other_students)
-                if common_students:
-                    common_count = len(common_students)
-                    raise ValueError(
-                        f"Course compatibility conflict: {common_count} student(s) are enrolled in both "
-                        f"'{exam.group.course.title}' and '{other_exam.group.course.title}'. "
-                        f"These courses cannot be scheduled in the same time slot."
-                    )
-
         # 6. VALIDATE ROOM ALLOCATION FEASIBILITY
         # Check if we can actually allocate rooms for all courses in this slot
-        if existing_slot_exams:
+        if feasibility["slot_exam_sizes"]:
             # Simulate room allocation
-            all_slot_exams = list(existing_slot_exams) + [exam]
-            room_requirements = []
-
-            for slot_exam in all_slot_exams:
-                student_count = Enrollment.objects.filter(
-                    course=slot_exam.group.course
-                ).count()
-                room_requirements.append(student_count)
+            room_requirements = (
+                [feasibility["exam_student_count"]] + feasibility["slot_exam_sizes"]
+            )
 
             # Check if we can fit all exams in available rooms (this
             # location only — was every room system-wide — and excluding
@@ -1370,64 +1147,44 @@ def reschedule_exam(exam_id, new_date, slot=None):
                 )
 
         # 7. UPDATE EXAM AND HANDLE ROOM REALLOCATION
-        exam.date = new_date
-        exam.start_time = new_start_time
-        exam.end_time = new_end_time
-        exam.save()
+        # Only this exam's students move: their seats in the old slot are
+        # freed (and offered to anyone there still waiting for a room) and
+        # they are placed into the free seats of the new slot. This used to
+        # clear and re-allocate every student of the new slot, which both
+        # cost a full-slot reallocation per edit and silently moved
+        # already-seated students of unrelated exams. See
+        # schedules/reallocation.py.
+        from schedules.reallocation import reallocate_slot_delta
 
-        # 8. REALLOCATE ROOMS FOR THIS TIME SLOT
-        # Get all exams in the new time slot (including the rescheduled one),
-        # scoped to this location — was every exam system-wide sharing this
-        # date/time, so rescheduling one exam at one campus was clearing
-        # room assignments (room=None) for every student at every OTHER
-        # campus sharing that date/time too.
-        slot_exams = list(
-            Exam.objects.filter(
-                date=new_date,
-                start_time=new_start_time,
-                end_time=new_end_time,
-                group__course__department__location=location,
+        location = exam.group.course.department.location
+        moving = list(
+            StudentExam.objects.filter(exam=exam).select_related(
+                "exam__group__course", "student__user"
             )
         )
-
-        # Snapshot room assignments before clearing them, so afterward we can
-        # tell which students actually landed in a DIFFERENT room (vs got
-        # reassigned to the exact same one) — this reschedule can silently
-        # move already-seated students of OTHER exams sharing the slot, not
-        # just the one being rescheduled, which is exactly the case worth
-        # notifying students about.
-        old_room_by_se_id = dict(
-            StudentExam.objects.filter(
-                exam__in=slot_exams, room__isnull=False
-            ).values_list("id", "room_id")
+        old_room_by_se_id = {se.id: se.room_id for se in moving if se.room_id}
+        reallocate_slot_delta(
+            location, exam.date, exam.start_time, exam.end_time, removed=moving
         )
 
-        # Clear existing room assignments for this slot
-        StudentExam.objects.filter(exam__in=slot_exams).update(room=None)
+        # slot_name has to move with the times — it used to keep the old
+        # label, so an exam rescheduled from Morning to Evening still showed
+        # (and was conflict-checked) as Morning.
+        original_slot_name = exam.slot_name
+        exam.date = new_date
+        exam.start_time = new_start_time
+        exam.end_time = new_end_time
+        exam.slot_name = new_slot_name
+        exam.save()
+        StudentExam.sync_slots([exam.id])
+        refresh_exams([exam.id])
 
-        # Reallocate rooms
+        # 8. PLACE THIS EXAM'S STUDENTS IN THE NEW SLOT
         try:
-            slot_student_exams = list(
-                StudentExam.objects.filter(exam__in=slot_exams).select_related(
-                    "exam__group__course__department__location",
-                    "exam__group__course",
-                    "student__user",
-                )
+            result = reallocate_slot_delta(
+                location, new_date, new_start_time, new_end_time, added=moving
             )
-            success = allocate_shared_rooms_updated(
-                slot_student_exams,
-                location=location,
-                exam_date=new_date,
-                start_time=new_start_time,
-                end_time=new_end_time,
-            )
-            if not success:
-                # Rollback the exam changes
-                exam.date = original_date
-                exam.start_time = original_start_time
-                exam.end_time = original_end_time
-                exam.save()
-
+            if result.unplaced:
                 raise ValueError(
                     f"Room allocation failed: some students could not be accommodated. "
                     f"Exam rescheduling has been cancelled."
@@ -1435,27 +1192,25 @@ def reschedule_exam(exam_id, new_date, slot=None):
 
             if old_room_by_se_id:
                 changed = [
-                    se for se in slot_student_exams
+                    se for se in moving
                     if se.id in old_room_by_se_id
                     and se.room_id
                     and se.room_id != old_room_by_se_id[se.id]
                 ]
                 if changed:
-                    old_rooms = {
+                    rooms = {
                         r.id: r for r in Room.objects.filter(
                             id__in=set(old_room_by_se_id.values())
+                            | {se.room_id for se in changed}
                         )
                     }
                     notify_students_room_changed(
-                        (se, old_rooms.get(old_room_by_se_id[se.id]), se.room)
+                        (se, rooms.get(old_room_by_se_id[se.id]), rooms.get(se.room_id))
                         for se in changed
                     )
         except Exception as e:
-            # Rollback on any room allocation error
-            exam.date = original_date
-            exam.start_time = original_start_time
-            exam.end_time = original_end_time
-            exam.save()
+            # Raising inside the atomic block rolls back the move, the freed
+            # seats and any placements together.
             raise ValueError(f"Room allocation error: {str(e)}")
 
     return exam
@@ -1500,49 +1255,29 @@ def can_accommodate_exams(student_counts, rooms):
 def get_reschedule_suggestions(exam_id, preferred_date_range=7):
     """
     Get suggestions for rescheduling an exam
-    Returns available slots within the preferred date range
+    Returns available slots within the preferred date range, best first
+    (see RescheduleFeasibility.candidates for the ranking). The whole
+    window is evaluated from one batch load instead of a feasibility query
+    storm per (date, slot).
     """
-    exam = Exam.objects.get(id=exam_id)
-    current_date = exam.date
-
-    # Look for available slots within the date range
-    start_search = current_date - timedelta(days=preferred_date_range)
-    end_search = current_date + timedelta(days=preferred_date_range)
+    exam = Exam.objects.select_related("group__course__department").get(id=exam_id)
+    engine = RescheduleFeasibility.around(exam, preferred_date_range)
 
     suggestions = []
-    current = start_search
-
-    while current <= end_search:
-        if current == exam.date:
-            current += timedelta(days=1)
-            continue
-
-        weekday = current.strftime("%A")
-        available_slots = get_allowed_slot_tuples_for_date(current)
-        if not available_slots:
-            current += timedelta(days=1)
+    for candidate in engine.candidates(get_allowed_slot_tuples_for_date, skip_dates={exam.date}):
+        if not candidate["feasible"]:
             continue
-
-        for slot_name, start_time, end_time in available_slots:
-            try:
-                # Test if this slot would work (without actually rescheduling)
-                test_conflicts = check_reschedule_feasibility(
-                    exam_id, current, slot_name
-                )
-                if not test_conflicts:
-                    suggestions.append(
-                        {
-                            "date": current,
-                            "slot": slot_name,
-                            "start_time": start_time,
-                            "end_time": end_time,
-                            "weekday": weekday,
-                        }
-                    )
-            except:
-                continue  # Skip this slot if it has issues
-
-        current += timedelta(days=1)
+        suggestions.append(
+            {
+                "date": candidate["date"],
+                "slot": candidate["slot"],
+                "start_time": candidate["start_time"],
+                "end_time": candidate["end_time"],
+                "weekday": candidate["weekday"],
+                "headroom": candidate["headroom"],
+                "rank": candidate["rank"],
+            }
+        )
 
     return suggestions
 
@@ -1555,7 +1290,7 @@ def check_reschedule_feasibility(exam_id, new_date, slot_name):
     conflicts = []
 
     try:
-        exam = Exam.objects.get(id=exam_id)
+        exam = Exam.objects.select_related("group__course__department").get(id=exam_id)
         weekday = new_date.strftime("%A")
 
         # Check day validity and get admin-configured allowed slots
@@ -1571,43 +1306,15 @@ def check_reschedule_feasibility(exam_id, new_date, slot_name):
             conflicts.append(f"Invalid slot '{slot_name}' for {weekday}")
             return conflicts
 
-        _, new_start_time, new_end_time = slot_match
+        result = RescheduleFeasibility(exam, new_date, new_date).evaluate(new_date, *slot_match)
 
-        # Check student conflicts
-        enrolled_students = Enrollment.objects.filter(course=exam.group.course)
-        student_conflicts = 0
+        if result["student_conflicts"] > 0:
+            conflicts.append(f"{result['student_conflicts']} student conflicts")
 
-        for enrollment in enrolled_students:
-            existing_exams = StudentExam.objects.filter(
-                student=enrollment.student, exam__date=new_date
-            ).exclude(exam_id=exam_id)
-
-            if existing_exams.exists():
-                student_conflicts += 1
-
-        if student_conflicts > 0:
-            conflicts.append(f"{student_conflicts} student conflicts")
-
-        # Check room capacity (scoped to this exam's own location)
-        location = exam.group.course.department.location
-        exam_students = Enrollment.objects.filter(course=exam.group.course).count()
-        existing_slot_exams = Exam.objects.filter(
-            date=new_date,
-            start_time=new_start_time,
-            end_time=new_end_time,
-            group__course__department__location=location,
-        ).exclude(id=exam_id)
-
-        total_students = exam_students
-        for other_exam in existing_slot_exams:
-            total_students += Enrollment.objects.filter(
-                course=other_exam.group.course
-            ).count()
-
-        total_capacity = get_total_room_capacity(location_id=location.id)
-        if total_students > total_capacity:
+        if result["headroom"] < 0:
             conflicts.append(
-                f"Insufficient capacity ({total_students} needed, {total_capacity} available)"
+                f"Insufficient capacity ({result['required_seats']} needed, "
+                f"{result['available_seats']} available)"
             )
 
     except Exception as e:
@@ -1700,8 +1407,9 @@ def verify_exam_schedule():
 
     # Check for courses in same slot without being in same group
     # (they shouldn't share any students)
+    snapshot = get_enrollment_snapshot()
     exams_by_slot = defaultdict(list)
-    for exam in Exam.objects.all():
+    for exam in Exam.objects.select_related("group__course"):
         slot_key = (exam.date, exam.start_time, exam.end_time)
         exams_by_slot[slot_key].append(exam)
 
@@ -1715,14 +1423,10 @@ def verify_exam_schedule():
             for exam2 in slot_exams[i + 1 :]:
                 # Check if these exams share any students
                 students1 = set(
-                    Enrollment.objects.filter(course=exam1.group.course).values_list(
-                        "student_id", flat=True
-                    )
+                    snapshot.course_students(exam1.group.course_id, enrolled_only=False).tolist()
                 )
                 students2 = set(
-                    Enrollment.objects.filter(course=exam2.group.course).values_list(
-                        "student_id", flat=True
-                    )
+                    snapshot.course_students(exam2.group.course_id, enrolled_only=False).tolist()
                 )
 
                 common_students = students1.intersection(students2)
@@ -1743,6 +1447,8 @@ def verify_exam_schedule():
 
 
 def schedule_unscheduled_group(course_id, group_id):
+    from schedules.reallocation import reallocate_slot_delta
+
     try:
         enrolled_students = set(
             Enrollment.objects.filter(
@@ -1839,14 +1545,18 @@ def schedule_unscheduled_group(course_id, group_id):
 
             # Create StudentExam records in bulk
             student_exams = StudentExam.objects.bulk_create([
-                StudentExam(student_id=sid, exam=exam)
+                StudentExam(
+                    student_id=sid, exam=exam, slot_date=current_date,
+                    slot_start=st_time, slot_end=en_time, location=loc_obj,
+                )
                 for sid in enrolled_students
             ])
 
-            # Allocate rooms
-            success = allocate_shared_rooms_updated(
-                student_exams, loc_obj, current_date, st_time, en_time
-            )
+            # Seat only the new students; everyone already in the slot
+            # stays where they are.
+            success = not reallocate_slot_delta(
+                loc_obj, current_date, st_time, en_time, added=student_exams
+            ).unplaced
             if not success:
                 exam.delete()
                 logger.warning(
@@ -1935,9 +1645,9 @@ def allocate_shared_rooms_updated(student_exams, location=None, exam_date=None,
         occupancy_counts = dict(
             StudentExam.objects.filter(
                 room_id__in=[r.id for r in rooms],
-                exam__date=slot_date,
-                exam__start_time=slot_start,
-                exam__end_time=slot_end,
+                slot_date=slot_date,
+                slot_start=slot_start,
+                slot_end=slot_end,
             )
             .values_list("room_id")
             .annotate(count=Count("id"))
@@ -2118,9 +1828,9 @@ def allocate_shared_rooms(location_id, current_step=None, total_steps=None, prog
 
     `master_timetable`, when given, scopes both the "who still needs a
     room" query AND the "how much of this room is already occupied" query
-    to that one timetable's own exams (via the MasterTimetableExam M2M —
-    Exam.master_timetable is NULL for manually-scheduled exams so the
-    direct FK can't be used). Unscoped, every DRAFT timetable ever
+    to that one timetable's own exams (via StudentExam.master_timetable,
+    copied from the exam's MasterTimetableExam link — Exam.master_timetable
+    is NULL for manually-scheduled exams so that FK can't be used). Unscoped, every DRAFT timetable ever
     generated for a location competed for the exact same physical rooms as
     every other one — regenerating a timetable 5 times during testing left
     5 drafts' worth of "demand" stacked on the same rooms, making later
@@ -2131,16 +1841,16 @@ def allocate_shared_rooms(location_id, current_step=None, total_steps=None, prog
 
     def _scope_by_timetable(qs):
         if master_timetable is not None:
-            return qs.filter(exam__mastertimetableexam__master_timetable=master_timetable)
+            return qs.filter(master_timetable=master_timetable)
         return qs
 
     # ── 1. Find slots needing allocation ──────────────────────────────────────
     slots_to_allocate = list(
         _scope_by_timetable(StudentExam.objects.filter(
             room__isnull=True,
-            exam__group__course__department__location_id=location_id,
+            location_id=location_id,
         ))
-        .values_list("exam__date", "exam__start_time", "exam__end_time")
+        .values_list("slot_date", "slot_start", "slot_end")
         .distinct()
     )
 
@@ -2154,7 +1864,7 @@ def allocate_shared_rooms(location_id, current_step=None, total_steps=None, prog
         return list(
             _scope_by_timetable(StudentExam.objects.filter(
                 room__isnull=True,
-                exam__group__course__department__location_id=location_id,
+                location_id=location_id,
             )).values_list("student", flat=True)
         )
 
@@ -2171,10 +1881,10 @@ def allocate_shared_rooms(location_id, current_step=None, total_steps=None, prog
             unaccommodated_students.extend(
                 _scope_by_timetable(StudentExam.objects.filter(
                     room__isnull=True,
-                    exam__group__course__department__location_id=location_id,
-                    exam__date=date,
-                    exam__start_time=start,
-                    exam__end_time=end,
+                    location_id=location_id,
+                    slot_date=date,
+                    slot_start=start,
+                    slot_end=end,
                 )).values_list("student", flat=True)
             )
             continue
@@ -2182,10 +1892,10 @@ def allocate_shared_rooms(location_id, current_step=None, total_steps=None, prog
         student_exams_qs = (
             _scope_by_timetable(StudentExam.objects.filter(
                 room__isnull=True,
-                exam__group__course__department__location_id=location_id,
-                exam__date=date,
-                exam__start_time=start,
-                exam__end_time=end,
+                location_id=location_id,
+                slot_date=date,
+                slot_start=start,
+                slot_end=end,
             ))
             .select_related("exam", "student")
         )
@@ -2211,9 +1921,9 @@ def allocate_shared_rooms(location_id, current_step=None, total_steps=None, prog
             for room in rooms:
                 already = _scope_by_timetable(StudentExam.objects.filter(
                     room=room,
-                    exam__date=date,
-                    exam__start_time=start,
-                    exam__end_time=end,
+                    slot_date=date,
+                    slot_start=start,
+                    slot_end=end,
                 )).count()
                 room_available[room.id] = room.capacity - already
 
@@ -2329,20 +2039,112 @@ def allocate_shared_rooms(location_id, current_step=None, total_steps=None, prog
     return unaccommodated_students
 
 
-def _student_violates_gap(sorted_exam_dates, proposed_date, min_gap_days):
+def _resolve_exam_times(g_obj, slot_name, current_date, slots, slots_by_date, calendar):
     """
-    Return True if proposed_date is within min_gap_days of any
-    date already in sorted_exam_dates (a sorted list of date objects).
-    O(log n) using binary search.
+    Start/end time for a group's exam in a slot: the group's own saved
+    times if they fall inside the slot, else the request's per-date slot
+    times, else the configured slot definition, else SLOT_MAP (8-11am as a
+    last resort).
     """
-    if not sorted_exam_dates or min_gap_days <= 0:
-        return False
-    lo = bisect_left(sorted_exam_dates,
-                     proposed_date - timedelta(days=min_gap_days))
-    hi = bisect_right(sorted_exam_dates,
-                      proposed_date + timedelta(days=min_gap_days))
-    nearby = sorted_exam_dates[lo:hi]
-    return any(d != proposed_date for d in nearby)
+    group_start_time = g_obj.start_time
+    group_end_time   = g_obj.end_time
+    st_time = en_time = None
+    slot_def = calendar.slot(slot_name)
+
+    if group_start_time and group_end_time:
+        # Only trust group times if they fall within the slot's range
+        if slot_def and group_start_time >= slot_def.start and group_end_time <= slot_def.end:
+            st_time = group_start_time
+            en_time = group_end_time
+        # else: fall through to slot-based resolution below
+    else:
+        if slots and current_date in slots_by_date:
+            for s in slots_by_date[current_date]:
+                sn = ss = se = None
+                if isinstance(s, dict):
+                    sn = s.get("name") or s.get("label")
+                    ss = s.get("start") or s.get("start_time")
+                    se = s.get("end") or s.get("end_time")
+                elif isinstance(s, (list, tuple)) and len(s) >= 4:
+                    sn, ss, se = s[1], s[2], s[3]
+                if sn == slot_name and ss and se:
+                    st_time = (
+                        time(*map(int, ss.split(":")))
+                        if isinstance(ss, str) else ss
+                    )
+                    en_time = (
+                        time(*map(int, se.split(":")))
+                        if isinstance(se, str) else se
+                    )
+                    break
+
+    if not st_time and slot_def:
+        st_time, en_time = slot_def.start, slot_def.end
+
+    # Final fallback using central SLOT_MAP
+    if not st_time:
+        st_time, en_time = SLOT_MAP.get(
+            slot_name, (time(8, 0), time(11, 0))
+        )
+    return st_time, en_time
+
+
+def _create_planned_exams(bundles, placement, groups_dict, enrollments_by_group,
+                          slots, slots_by_date, calendar,
+                          master_timetable=None, progress_callback=None,
+                          location_id=None):
+    """
+    Write a finished in-memory placement: one Exam per group of every placed
+    bundle, linked to the timetable, plus its StudentExam rows. Three bulk
+    inserts instead of one create() + one bulk_create() per group.
+    """
+    exams, rosters = [], []
+    for course_group, chosen in zip(bundles, placement):
+        if chosen is None:
+            continue
+        current_date, slot_name = chosen
+        for cd in course_group["courses"]:
+            for gid in cd["groups"]:
+                g_obj = groups_dict[gid]
+                st_time, en_time = _resolve_exam_times(
+                    g_obj, slot_name, current_date, slots, slots_by_date, calendar
+                )
+                exams.append(Exam(
+                    date=current_date,
+                    start_time=st_time,
+                    end_time=en_time,
+                    group=g_obj,
+                    slot_name=slot_name,
+                    master_timetable=master_timetable,
+                ))
+                rosters.append(enrollments_by_group.get(gid, set()))
+
+        logger.info(
+            f"Scheduled {course_group['student_count']} students "
+            f"on {current_date} [{slot_name}]"
+        )
+        if progress_callback:
+            progress_callback(
+                f"Scheduled {course_group['student_count']} students "
+                f"on {current_date} [{slot_name}]"
+            )
+
+    exams = Exam.objects.bulk_create(exams)
+    if master_timetable:
+        MasterTimetableExam.objects.bulk_create([
+            MasterTimetableExam(master_timetable=master_timetable, exam=exam)
+            for exam in exams
+        ])
+    StudentExam.objects.bulk_create([
+        StudentExam(
+            student_id=sid, exam=exam, slot_date=exam.date,
+            slot_start=exam.start_time, slot_end=exam.end_time,
+            location_id=location_id, master_timetable=master_timetable,
+        )
+        for exam, s_ids in zip(exams, rosters)
+        for sid in s_ids
+    ], batch_size=5000)
+    return exams
 
 
 def generate_exam_schedule(
@@ -2369,29 +2171,14 @@ def generate_exam_schedule(
         # does, consistently.
         config_manager = JsonConfigManager()
         config = config_manager.read_config()
-        time_config = config.get("time_constraints", {})
-        defined_time_slots = time_config.get("time_slots", [])
-        defined_time_slots.sort(key=lambda x: x.get("priority", 99))
+        calendar = get_slot_calendar()
+        defined_time_slots = list(calendar.time_slots)
 
         student_constraints = config.get("student_constraints", {})
         room_constraints    = config.get("room_constraints", {})
         group_preferences   = config.get("group_preferences", {})
         course_constraints  = config.get("course_constraints", {})
-
-        day_restrictions = time_config.get("day_restrictions", {})
-        no_exam_days     = day_restrictions.get("no_exam_days", ["Saturday"])
-        special_rules    = day_restrictions.get("special_rules", {})
-        holidays         = day_restrictions.get("holidays", [])
-
-        holiday_dates = set()
-        for h in holidays:
-            if isinstance(h, str):
-                try:
-                    holiday_dates.add(datetime.strptime(h, "%Y-%m-%d").date())
-                except ValueError:
-                    pass
-            elif isinstance(h, (datetime, date)):
-                holiday_dates.add(h if isinstance(h, date) else h.date())
+        special_rules       = calendar.special_rules
 
         if not course_ids:
             course_ids = list(
@@ -2402,8 +2189,16 @@ def generate_exam_schedule(
 
         # Step 1 — compatibility grouping
         progress_callback(2, TOTAL_STEPS, "Finding merging compatible courses ...")
-        compatible_groups, course_conflicts = find_compatible_courses_within_group(
-            course_ids, location_id=location
+        total_seats = Room.objects.filter(
+            location_id=location
+        ).aggregate(total=Sum("capacity"))["total"] or 0
+        course_students, course_group_students, course_group_sizes = (
+            load_course_enrollments(course_ids)
+        )
+        course_conflicts = build_course_conflicts(course_students)
+        compatible_groups = color_courses(
+            course_students, course_group_students, course_group_sizes,
+            course_conflicts, total_seats,
         )
         if not compatible_groups:
             # Must match the 6-tuple every other return path (and the
@@ -2420,7 +2215,7 @@ def generate_exam_schedule(
         slots_by_date = get_slots_by_date(slots) if slots else {}
         dates = sorted([
             d for d in slots_by_date
-            if d.strftime("%A") not in no_exam_days and d not in holiday_dates
+            if calendar.is_exam_day(d)
         ])
         if not dates:
             reasons = {}
@@ -2433,263 +2228,108 @@ def generate_exam_schedule(
 
         # Step 3 — pre-fetch data
         progress_callback(4, TOTAL_STEPS, "Preparing courses and rooms information ...")
-        total_seats = Room.objects.filter(
-            location_id=location
-        ).aggregate(total=Sum("capacity"))["total"] or 0
         buffer_pct       = room_constraints.get("capacity_buffer_percent", 0)
         effective_seats  = int(total_seats * (1 - buffer_pct / 100.0))
 
-        enrollments_by_group = prefetch_enrollments(compatible_groups)
-        all_group_ids = {
-            gid
-            for g in compatible_groups
-            for c in g["courses"]
-            for gid in c["groups"]
+        # Every group of every course, not just the ones in this colouring:
+        # portfolio attempts colour the courses differently.
+        enrollments_by_group = {
+            gid: students
+            for groups in course_group_students.values()
+            for gid, students in groups.items()
         }
-        groups_dict  = fetch_course_groups(all_group_ids)
-        courses_dict = fetch_courses(course_ids)
+        groups_dict  = fetch_course_groups(enrollments_by_group.keys())
         progress_callback(4, TOTAL_STEPS, f"Found {total_seats} Seats and {len(groups_dict)} Groups")
 
-        # Step 4 — state tracking
-        # student_daily_exams[student_id][date] = set of slot_names
-        student_daily_exams = defaultdict(lambda: defaultdict(set))
-        # student_sorted_dates[student_id] = sorted list of exam dates
-        # FIX #8: keep sorted list per student for O(log n) gap check
-        student_sorted_dates = defaultdict(list)
-
+        # Step 4 — exams already in this timetable stay where they are
         existing_exams = Exam.objects.filter(date__in=dates,master_timetable=master_timetable ).prefetch_related(
             "studentexam_set"
         )
-        
-        for ex in existing_exams:
-            for se in ex.studentexam_set.all():
-                student_daily_exams[se.student_id][ex.date].add(ex.slot_name)
-                # Insert date in sorted order
-                import bisect
-                bisect.insort(student_sorted_dates[se.student_id], ex.date)
-
-        slot_seats_usage = defaultdict(lambda: defaultdict(int))
+        fixed = defaultdict(list)
         for ex in existing_exams:
-            slot_seats_usage[ex.date][ex.slot_name] += ex.studentexam_set.count()
+            fixed[(ex.date, ex.slot_name)].extend(
+                se.student_id for se in ex.studentexam_set.all()
+            )
 
-        # Step 5 — scheduling loop
+        # Step 5 — placement. Each attempt colours, orders and places the
+        # bundles in memory, improves the placement with the local-search
+        # pass in schedules/optimizer.py, and only the winning plan is
+        # written (see _create_planned_exams). Creating Exam/StudentExam
+        # rows inside the greedy loop, as before, made every placement
+        # final the moment it was found. See schedules/planner.py.
         progress_callback(5, TOTAL_STEPS, f"Generating Timetable ...")
-        exams_created      = []
         unscheduled_groups = []
         unscheduled_reasons = {}
 
-        max_exams_per_day  = student_constraints.get("max_exams_per_day", 1)
-        max_exams_per_slot = student_constraints.get("max_exams_per_slot", 1)
-        min_gap_days       = student_constraints.get("min_gap_between_exams_days", 0)
+        opt_settings = optimization_settings(config)
+        problem = {
+            "course_students": course_students,
+            "course_group_students": course_group_students,
+            "course_group_sizes": course_group_sizes,
+            "course_conflicts": dict(course_conflicts),
+            "room_capacity": total_seats,
+            "effective_seats": effective_seats,
+            "dates": dates,
+            "slots": slots,
+            "slots_by_date": slots_by_date,
+            "group_names": {gid: g.group_name for gid, g in groups_dict.items()},
+            "group_preferences": group_preferences,
+            "defined_time_slots": defined_time_slots,
+            "special_rules": special_rules,
+            "max_exams_per_day": student_constraints.get("max_exams_per_day", 1),
+            "max_exams_per_slot": student_constraints.get("max_exams_per_slot", 1),
+            "min_gap_days": student_constraints.get("min_gap_between_exams_days", 0),
+            "prioritize_large_courses": course_constraints.get("prioritize_large_courses", True),
+            "optimization": opt_settings,
+            "fixed": dict(fixed),
+        }
 
-        with transaction.atomic():
-            remaining = copy.deepcopy(compatible_groups)
-            if course_constraints.get("prioritize_large_courses", True):
-                remaining.sort(key=lambda g: -g["student_count"])
-
-            for course_group in remaining:
-                scheduled = False
-
-                # Determine preferred slot order for this group
-                preferred_slots = []
-                if course_group["courses"] and course_group["courses"][0]["groups"]:
-                    first_gid = course_group["courses"][0]["groups"][0]
-                    if first_gid in groups_dict:
-                        gname = groups_dict[first_gid].group_name
-                        if gname in group_preferences:
-                            preferred_slots = group_preferences[gname].get(
-                                "slots_order", []
-                            )
-                if not preferred_slots:
-                    preferred_slots = [s["name"] for s in defined_time_slots]
-
-                for current_date in dates:
-                    if scheduled:
-                        break
-                    weekday = current_date.strftime("%A")
-                    
+        portfolio_size = int(opt_settings.get("portfolio_size") or 1)
+        if portfolio_size > 1:
+            progress_callback(5, TOTAL_STEPS, f"Running {portfolio_size} generation attempts ...")
+
+            def _attempt_done(plan, finished, total):
+                unplaced = sum(1 for chosen in plan["placement"] if chosen is None)
+                progress_callback(
+                    5, TOTAL_STEPS,
+                    f"Attempt {finished}/{total} ({plan['ordering']}): "
+                    f"{unplaced} bundles unscheduled, objective {plan['objective']}",
+                    {"attempt": plan["attempt"], "score": list(plan["score"])},
+                )
 
-                    # Build allowed slots for this day
-                    day_slots = preferred_slots[:]
-                    if slots and current_date in slots_by_date:
-                        cfg = slots_by_date[current_date]
-                        cfg_names = set()
-                        for s in cfg:
-                            if isinstance(s, dict):
-                                n = s.get("name") or s.get("label")
-                                if n: cfg_names.add(n)
-                            elif isinstance(s, (list, tuple)) and len(s) >= 2:
-                                cfg_names.add(s[1])
-                        if cfg_names:
-                            day_slots = [s for s in day_slots if s in cfg_names]
-                    # Used to progress_callback() a "Scheduling day: ..." message
-                    # here — but this fires once per (course_group, date) pair
-                    # scanned, so a run with e.g. 53 groups x 15 candidate dates
-                    # produced 700+ near-duplicate SSE events on top of the
-                    # per-exam messages below (a real generation run's SSE log
-                    # exceeded 50,000 characters and got truncated). The
-                    # frontend's onDownloadProgress handler re-reads the ENTIRE
-                    # accumulated response text on every single event, so more
-                    # events means quadratically more frontend work — a likely
-                    # contributor to reported slowness/memory issues on
-                    # generation. The per-course-group "Scheduled N students on
-                    # DATE [SLOT]" summary below already conveys the meaningful
-                    # progress.
-
-                    if weekday in special_rules:
-                        rule = special_rules[weekday]
-                        if "allowed_slots" in rule:
-                            day_slots = [
-                                s for s in preferred_slots
-                                if s in rule["allowed_slots"]
-                            ]
-                        elif rule.get("no_evening", False):
-                            day_slots = [s for s in preferred_slots if s != "Evening"]
-
-                    for slot_name in day_slots:
-                        if scheduled:
-                            break
+            plan, scores = run_portfolio(
+                problem, portfolio_size,
+                compatible_groups=compatible_groups, progress=_attempt_done,
+            )
+            stats["portfolio_attempts"] = len(scores)
+            stats["portfolio_winner"] = plan["attempt"]
+        else:
+            def _report(opt_stats):
+                progress_callback(
+                    5, TOTAL_STEPS,
+                    f"Optimising placement: objective {opt_stats['best_objective']} "
+                    f"(started at {opt_stats['initial_objective']})",
+                    opt_stats,
+                )
 
-                        # A. Capacity check
-                        needed = course_group["student_count"]
-                        if slot_seats_usage[current_date][slot_name] + needed > effective_seats:
-                            continue
-
-                        # B. Per-student constraint checks
-                        group_student_ids = set()
-                        for cd in course_group["courses"]:
-                            for gid in cd["groups"]:
-                                group_student_ids.update(
-                                    enrollments_by_group.get(gid, set())
-                                )
-
-                        can_fit = True
-                        for sid in group_student_ids:
-                            day_slots_used = student_daily_exams[sid][current_date]
-
-                            if len(day_slots_used) >= max_exams_per_day:
-                                can_fit = False
-                                break
-
-                            if slot_name in day_slots_used and max_exams_per_slot <= 1:
-                                can_fit = False
-                                break
-
-                            # FIX #8: O(log n) gap check using sorted list + bisect
-                            if min_gap_days > 0 and _student_violates_gap(
-                                student_sorted_dates[sid], current_date, min_gap_days
-                            ):
-                                can_fit = False
-                                break
-
-                        if not can_fit:
-                            continue
-
-                        # C. Create exams
-                        for cd in course_group["courses"]:
-                            c_id = cd["course_id"]
-                            for gid in cd["groups"]:
-                                g_obj = groups_dict[gid]
-                                s_ids = enrollments_by_group.get(gid, set())
-                                # set start and end_time based on the what saved in database for this group and slot, then fallback to defined_time_slots, then fallback to SLOT_MAP, then default 8-11am
-                                # Resolve slot times
-                                group_start_time= g_obj.start_time
-                                group_end_time= g_obj.end_time
-                                st_time = en_time = None
-                                group_start_time = g_obj.start_time
-                                group_end_time   = g_obj.end_time
-                                st_time = en_time = None
-
-                                if group_start_time and group_end_time:
-                                    # Find what time range the chosen slot_name expects
-                                    slot_def = next(
-                                        (s for s in defined_time_slots if s["name"] == slot_name), None
-                                    )
-                                    if slot_def:
-                                        slot_start = time(*map(int, slot_def["start_time"].split(":")))
-                                        slot_end   = time(*map(int, slot_def["end_time"].split(":")))
-                                        # Only trust group times if they fall within the slot's range
-                                        if group_start_time >= slot_start and group_end_time <= slot_end:
-                                            st_time = group_start_time
-                                            en_time = group_end_time
-                                        # else: fall through to slot-based resolution below
-                                else:
-                                    if slots and current_date in slots_by_date:
-                                        for s in slots_by_date[current_date]:
-                                            sn = ss = se = None
-                                            if isinstance(s, dict):
-                                                sn = s.get("name") or s.get("label")
-                                                ss = s.get("start") or s.get("start_time")
-                                                se = s.get("end") or s.get("end_time")
-                                            elif isinstance(s, (list, tuple)) and len(s) >= 4:
-                                                sn, ss, se = s[1], s[2], s[3]
-                                            if sn == slot_name and ss and se:
-                                                st_time = (
-                                                    time(*map(int, ss.split(":")))
-                                                    if isinstance(ss, str) else ss
-                                                )
-                                                en_time = (
-                                                    time(*map(int, se.split(":")))
-                                                    if isinstance(se, str) else se
-                                                )
-                                                break
-
-                                if not st_time:
-                                    slot_def = next(
-                                        (s for s in defined_time_slots
-                                         if s["name"] == slot_name), None
-                                    )
-                                    if slot_def:
-                                        st_time = time(*map(int, slot_def["start_time"].split(":")))
-                                        en_time = time(*map(int, slot_def["end_time"].split(":")))
-
-                                # Final fallback using central SLOT_MAP
-                                if not st_time:
-                                    st_time, en_time = SLOT_MAP.get(
-                                        slot_name, (time(8, 0), time(11, 0))
-                                    )
-
-                                exam = Exam.objects.create(
-                                    date=current_date,
-                                    start_time=st_time,
-                                    end_time=en_time,
-                                    group=g_obj,
-                                    slot_name=slot_name,
-                                    master_timetable=master_timetable
-                                )
-                                # Fired once per constituent group here (a
-                                # course_group bundle can hold 5-9 groups), so
-                                # this alone produced thousands of near-
-                                # identical SSE events for a full run — the
-                                # "Scheduled N students on DATE [SLOT]" summary
-                                # right after this whole bundle is placed
-                                # already covers it.
-                                if master_timetable:
-                                    master_timetable.exams.add(exam)
-                                exams_created.append(exam)
-
-                                ses = [
-                                    StudentExam(student_id=sid, exam=exam)
-                                    for sid in s_ids
-                                ]
-                                StudentExam.objects.bulk_create(ses)
-
-                                # Update trackers
-                                import bisect as _bisect
-                                for sid in s_ids:
-                                    student_daily_exams[sid][current_date].add(slot_name)
-                                    _bisect.insort(student_sorted_dates[sid], current_date)
-                                slot_seats_usage[current_date][slot_name] += len(s_ids)
-
-                        scheduled = True
-                        logger.info(
-                            f"Scheduled {course_group['student_count']} students "
-                            f"on {current_date} [{slot_name}]"
-                        )
-                        progress_callback(5, TOTAL_STEPS, f"Scheduled {course_group['student_count']} students "
-                            f"on {current_date} [{slot_name}]")
+            plan = plan_attempt(problem, compatible_groups=compatible_groups, progress=_report)
+
+        remaining, placement = plan["bundles"], plan["placement"]
+        stats["objective_initial"] = plan["initial_objective"]
+        stats["objective"] = plan["objective"]
+        stats["optimizer_iterations"] = plan["iterations"]
+        stats["optimizer_stop_reason"] = plan["stop_reason"]
+
+        with transaction.atomic():
+            exams_created = _create_planned_exams(
+                remaining, placement, groups_dict, enrollments_by_group,
+                slots, slots_by_date, calendar, master_timetable,
+                progress_callback=lambda message: progress_callback(5, TOTAL_STEPS, message),
+                location_id=location,
+            )
 
-                if not scheduled:
+            for course_group, chosen in zip(remaining, placement):
+                if chosen is None:
                     unscheduled_groups.append(course_group)
                     for cd in course_group["courses"]:
                         for gid in cd["groups"]:
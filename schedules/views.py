@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from collections import defaultdict
 from rest_framework import viewsets, status, permissions
 from rest_framework.response import Response
@@ -12,6 +13,8 @@ from .serializers import (
 from .permissions import IsAdminOrInstructor
 from rest_framework.decorators import action
 from .utils import get_exam_slots
+from .simulation import TimetableSimulation
+from .clone import clone_timetable, diff_timetables
 import json
 import datetime
 import logging
@@ -642,4 +645,207 @@ class CourseScheduleViewSet(viewsets.ModelViewSet):
                     "message": "Failed to retrieves. Please Try again.",
                 },
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
\ No newline at end of file
+            )
+
+class TimetableSimulationViewSet(viewsets.ViewSet):
+    """
+    What-if sessions for the manual timetable board (see
+    schedules/simulation.py). Moves are evaluated in memory against a
+    snapshot of the timetable; nothing is written until commit.
+    """
+
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrInstructor]
+
+    def _session(self, request, pk):
+        session = TimetableSimulation.get(pk)
+        if session is None or session.user_id != request.user.id:
+            return None
+        return session
+
+    @contextmanager
+    def _locked(self, request, pk):
+        """The request's session with its row locked, or None."""
+        with TimetableSimulation.locked(pk) as session:
+            if session is not None and session.user_id != request.user.id:
+                session = None
+            yield session
+
+    def _not_found(self):
+        return Response(
+            {"success": False, "message": "Simulation not found or expired."},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    def create(self, request):
+        timetable_id = request.data.get("timetable_id")
+        if not timetable_id:
+            return Response(
+                {"success": False, "message": "Missing timetable_id"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            session = TimetableSimulation.load(timetable_id, user_id=request.user.id)
+        except MasterTimetable.DoesNotExist:
+            return Response(
+                {"success": False, "message": f"Timetable {timetable_id} not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        TimetableSimulation.purge_expired()
+        session.save()
+        return Response(
+            {
+                "success": True,
+                "data": session.summary(),
+                "message": "Simulation started.",
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    def retrieve(self, request, pk=None):
+        session = self._session(request, pk)
+        if session is None:
+            return self._not_found()
+        return Response(
+            {"success": True, "data": session.summary(), "message": "Simulation fetched."}
+        )
+
+    def destroy(self, request, pk=None):
+        with self._locked(request, pk) as session:
+            if session is None:
+                return self._not_found()
+            session.discard()
+        return Response({"success": True, "message": "Simulation discarded."})
+
+    @action(detail=True, methods=["post"], url_path="apply")
+    def apply(self, request, pk=None):
+        """Apply one move ({"type": ...}) or several ({"moves": [...]})."""
+        moves = request.data.get("moves")
+        if moves is None:
+            moves = [request.data]
+
+        with self._locked(request, pk) as session:
+            if session is None:
+                return self._not_found()
+
+            results = []
+            try:
+                for move in moves:
+                    results.append(session.apply(move))
+            except (ValueError, KeyError, TypeError) as e:
+                # Moves applied before the bad one stay applied; the client
+                # gets their results plus the error.
+                session.save()
+                return Response(
+                    {
+                        "success": False,
+                        "data": results,
+                        "metrics": session.metrics,
+                        "message": f"Invalid move: {e}",
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            session.save()
+        return Response(
+            {"success": True, "data": results, "metrics": session.metrics, "message": "Moves applied."}
+        )
+
+    @action(detail=True, methods=["post"], url_path="undo")
+    def undo(self, request, pk=None):
+        with self._locked(request, pk) as session:
+            if session is None:
+                return self._not_found()
+            try:
+                result = session.undo()
+            except ValueError as e:
+                return Response(
+                    {"success": False, "message": str(e)},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            session.save()
+        return Response({"success": True, "data": result, "message": "Move undone."})
+
+    @action(detail=True, methods=["post"], url_path="commit")
+    def commit(self, request, pk=None):
+        try:
+            with self._locked(request, pk) as session:
+                if session is None:
+                    return self._not_found()
+                result = session.commit()
+                session.discard()
+        except ValueError as e:
+            return Response(
+                {"success": False, "message": str(e)},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except Exception as e:
+            logger.error(f"Error committing simulation {pk}: {e}", exc_info=True)
+            return Response(
+                {"success": False, "message": f"Error committing simulation: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        return Response(
+            {"success": True, "data": result, "message": "Simulation committed."}
+        )
+
+
+class MasterTimetableViewSet(viewsets.ViewSet):
+    """
+    Draft iteration on whole timetables: copy one into a new DRAFT
+    (schedules/clone.py) and compare two of them.
+    """
+
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrInstructor]
+
+    @action(detail=True, methods=["post"], url_path="clone")
+    def clone(self, request, pk=None):
+        try:
+            timetable, counts = clone_timetable(pk, request.user, name=request.data.get("name"))
+        except MasterTimetable.DoesNotExist:
+            return Response(
+                {"success": False, "message": f"Timetable {pk} not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        except Exception as e:
+            logger.error(f"Error cloning timetable {pk}: {e}", exc_info=True)
+            return Response(
+                {"success": False, "message": f"Error cloning timetable: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        return Response(
+            {
+                "success": True,
+                "data": {"id": timetable.id, "name": timetable.name, "counts": counts},
+                "message": "Timetable cloned.",
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(detail=True, methods=["get"], url_path="diff")
+    def diff(self, request, pk=None):
+        """Changes from this timetable to ?against=<id> (limit= caps each list)."""
+        against = request.query_params.get("against")
+        try:
+            limit = min(int(request.query_params.get("limit", 500)), 5000)
+        except ValueError:
+            limit = 500
+        if not against:
+            return Response(
+                {"success": False, "message": "Missing 'against' timetable id"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        ids = [int(i) for i in (pk, against) if str(i).isdigit()]
+        found = set(MasterTimetable.objects.filter(id__in=ids).values_list("id", flat=True))
+        missing = [i for i in (pk, against) if not str(i).isdigit() or int(i) not in found]
+        if missing:
+            return Response(
+                {"success": False, "message": f"Timetable {missing[0]} not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(
+            {
+                "success": True,
+                "data": diff_timetables(int(pk), int(against), limit=limit),
+                "message": "Timetables compared.",
+            }
+        )
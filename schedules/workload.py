@@ -0,0 +1,142 @@
+"""
+Query workloads for plan inspection (see the explain_workload command).
+
+A workload is a list of {"name", "sql", "params"} entries, stored as JSON
+lines. It comes from one of two places:
+
+    builtin_workload()      the hot filters of room allocation, seat maps,
+                            QR checks, rescheduling and the dashboard,
+                            instantiated with ids sampled from the current
+                            database
+    record_workload(path)   a context manager that appends every SELECT
+                            run inside it, e.g. around a request replayed
+                            from `manage.py shell`
+
+Recording a workload once and replaying it before and after a schema
+change (new indexes, a migration) gives comparable EXPLAIN output and
+timings for the same statements.
+"""
+import json
+import logging
+from contextlib import contextmanager
+from datetime import date, datetime, time
+
+from django.db import connection
+
+from enrollments.models import Enrollment
+from exams.models import Exam, StudentExam
+from schedules.models import MasterTimetableExam
+
+logger = logging.getLogger(__name__)
+
+
+def _json_param(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def _entry(name, queryset):
+    sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+    return {"name": name, "sql": sql, "params": [_json_param(p) for p in params]}
+
+
+def builtin_workload():
+    """The hot filters, with parameters taken from existing rows."""
+    exam = Exam.objects.filter(room__isnull=False).order_by("-date").first() or Exam.objects.order_by("-date").first()
+    student_exam = StudentExam.objects.filter(room__isnull=False).select_related("exam").first()
+    link = MasterTimetableExam.objects.order_by("-id").first()
+    group_id = Enrollment.objects.exclude(group__isnull=True).values_list("group_id", flat=True).first()
+
+    entries = []
+    if student_exam:
+        se_exam = student_exam.exam
+        entries += [
+            _entry("studentexam_room_slot", StudentExam.objects.filter(
+                room_id=student_exam.room_id, exam__date=se_exam.date,
+                exam__start_time=se_exam.start_time, exam__end_time=se_exam.end_time,
+            )),
+            _entry("studentexam_student_date", StudentExam.objects.filter(
+                student_id=student_exam.student_id, exam__date=se_exam.date,
+            )),
+        ]
+    if exam:
+        entries += [
+            _entry("exam_date_slot", Exam.objects.filter(date=exam.date, slot_name=exam.slot_name)),
+            _entry("exam_date_times", Exam.objects.filter(
+                date=exam.date, start_time=exam.start_time, end_time=exam.end_time,
+            )),
+            _entry("studentexam_pending_room", StudentExam.objects.filter(
+                exam__date=exam.date, room__isnull=True,
+            )),
+        ]
+    if group_id:
+        entries.append(_entry("enrollment_group_status", Enrollment.objects.filter(
+            group_id=group_id, status="enrolled",
+        )))
+    if link:
+        entries += [
+            _entry("mtt_exams", MasterTimetableExam.objects.filter(master_timetable_id=link.master_timetable_id)),
+            _entry("exams_of_timetable", Exam.objects.filter(
+                mastertimetableexam__master_timetable_id=link.master_timetable_id,
+            )),
+        ]
+    return entries
+
+
+def load_workload(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_workload(entries, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+
+@contextmanager
+def record_workload(path, prefix="recorded"):
+    """Append every SELECT executed inside the block to `path`."""
+    recorded = []
+
+    def wrapper(execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith("SELECT"):
+            recorded.append({
+                "name": f"{prefix}_{len(recorded) + 1}",
+                "sql": sql,
+                "params": [_json_param(p) for p in (params or [])],
+            })
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield recorded
+    with open(path, "a", encoding="utf-8") as f:
+        for entry in recorded:
+            f.write(json.dumps(entry) + "\n")
+    logger.info(f"Recorded {len(recorded)} queries to {path}")
+
+
+def explain(sql, params, analyze=True):
+    """The plan of one statement as a list of text lines."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            options = "ANALYZE, BUFFERS" if analyze else "COSTS"
+            cursor.execute(f"EXPLAIN ({options}) {sql}", params)
+            return [row[0] for row in cursor.fetchall()]
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f"EXPLAIN {sql}", params)
+        return [" ".join(str(c) for c in row) for row in cursor.fetchall()]
+
+
+def has_full_scan(plan_lines):
+    """Whether a plan reads a whole table instead of going through an index."""
+    for line in plan_lines:
+        text = line.strip()
+        if "Seq Scan" in text:
+            return True
+        if text.startswith("SCAN ") and " USING " not in text:
+            return True
+    return False
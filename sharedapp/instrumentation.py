@@ -0,0 +1,536 @@
+"""
+Per-endpoint query and latency instrumentation.
+
+Every HTTP request (QueryMetricsMiddleware) and every Celery task
+(task_prerun / task_postrun) gets a QueryRecorder in a context variable.
+A single execute-wrapper, installed on every database connection as it
+is created, adds each statement to whichever recorder is current:
+
+    queries         statements executed
+    sql time        time spent inside cursor.execute
+    fingerprints    statements with literals and IN-lists collapsed; a
+                    fingerprint seen more than once in the same request
+                    is a duplicate, usually an N+1 loop
+    wall time       for streaming (SSE) responses, until the stream ends
+
+Because the recorder lives in a contextvar, work handed to
+sync_to_async threads or asyncio tasks (the generate-timetable and
+import streams) is attributed to the request that started it.
+
+Finished samples go into the process-wide MetricsRegistry: cumulative
+Prometheus histograms plus a rolling window of recent samples for
+percentiles. Web and worker processes each dump their registry to
+QUERY_METRICS_DIR/metrics-<pid>.json (at most every FLUSH_INTERVAL
+seconds), so the /api/metrics/ endpoint and the query_metrics command
+see Celery workers and every gunicorn worker, not just themselves.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 10.0
+# Dumps not refreshed for this long belong to dead processes.
+MAX_DUMP_AGE = 24 * 3600
+ROLLING_WINDOW = 200
+MAX_FINGERPRINTS = 50
+
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current = ContextVar("query_recorder", default=None)
+
+_IN_LIST = re.compile(r"\bIN\s*\(\s*%s(?:\s*,\s*%s)*\s*\)", re.IGNORECASE)
+_VALUES_LIST = re.compile(r"\bVALUES\s*\(.*\)", re.IGNORECASE | re.DOTALL)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def enabled():
+    return getattr(settings, "QUERY_METRICS_ENABLED", True)
+
+
+def fingerprint(sql):
+    """`sql` with parameters, literals and IN-lists collapsed, for grouping."""
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _VALUES_LIST.sub("VALUES (...)", sql)
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _WHITESPACE.sub(" ", sql).strip()[:500]
+
+
+class QueryRecorder:
+    def __init__(self, name, kind="http"):
+        self.name = name
+        self.kind = kind
+        self.queries = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, sql, duration):
+        fp = fingerprint(sql)
+        with self._lock:
+            self.queries += 1
+            self.sql_time += duration
+            self.fingerprints[fp] += 1
+
+    def duplicates(self):
+        """fingerprint -> extra executions, for fingerprints seen more than once."""
+        return {fp: n - 1 for fp, n in self.fingerprints.items() if n > 1}
+
+    def finish(self):
+        wall = time.perf_counter() - self.started
+        duplicates = self.duplicates()
+        budget = getattr(settings, "QUERY_BUDGET", None)
+        if budget and self.queries > budget:
+            worst = max(duplicates.items(), key=lambda kv: kv[1], default=None)
+            logger.warning(
+                f"{self.name}: {self.queries} queries ({self.sql_time * 1000:.0f} ms SQL, "
+                f"{wall * 1000:.0f} ms wall), over the budget of {budget}"
+                + (f"; most repeated ({worst[1] + 1}x): {worst[0][:200]}" if worst else "")
+            )
+        registry.observe(self.name, self.kind, self.queries, self.sql_time, wall, duplicates)
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.record(sql, time.perf_counter() - started)
+
+
+def install(connection, **kwargs):
+    """Add the execute-wrapper to `connection` (a connection_created receiver)."""
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_wrapper)
+
+
+def install_all():
+    from django.db import connections
+    for conn in connections.all(initialized_only=True):
+        install(conn)
+
+
+@contextmanager
+def track(name, kind="task"):
+    """Record everything executed inside the block under `name`."""
+    if not enabled() or _current.get() is not None:
+        yield None
+        return
+    install_all()
+    recorder = QueryRecorder(name, kind)
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+        recorder.finish()
+
+
+# ----------------------------------------------------------------------
+# Registry
+# ----------------------------------------------------------------------
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)   # last one is +Inf
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        return {"buckets": list(self.buckets), "sum": self.sum, "max": self.max}
+
+
+class EndpointStats:
+    def __init__(self, kind):
+        self.kind = kind
+        self.count = 0
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = Histogram(SECONDS_BUCKETS)
+        self.wall_seconds = Histogram(SECONDS_BUCKETS)
+        self.duplicates = 0
+        self.fingerprints = Counter()
+        self.recent = deque(maxlen=ROLLING_WINDOW)
+
+    def observe(self, queries, sql_time, wall, duplicates):
+        self.count += 1
+        self.queries.observe(queries)
+        self.sql_seconds.observe(sql_time)
+        self.wall_seconds.observe(wall)
+        self.recent.append((queries, round(sql_time, 6), round(wall, 6)))
+        for fp, extra in duplicates.items():
+            self.duplicates += extra
+            if fp in self.fingerprints or len(self.fingerprints) < MAX_FINGERPRINTS:
+                self.fingerprints[fp] += extra
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "count": self.count,
+            "queries": self.queries.to_dict(),
+            "sql_seconds": self.sql_seconds.to_dict(),
+            "wall_seconds": self.wall_seconds.to_dict(),
+            "duplicates": self.duplicates,
+            "fingerprints": dict(self.fingerprints),
+            "recent": list(self.recent),
+        }
+
+
+def _metrics_dir():
+    return getattr(settings, "QUERY_METRICS_DIR", None)
+
+
+def _reset_marker(directory):
+    return os.path.join(directory, "reset")
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._last_flush = 0.0
+        self._reset_seen = time.time()
+
+    def observe(self, name, kind, queries, sql_time, wall, duplicates):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = EndpointStats(kind)
+            stats.observe(queries, sql_time, wall, duplicates)
+            due = time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def clear(self):
+        with self._lock:
+            self._stats = {}
+
+    def _apply_reset(self, directory):
+        marker = _mtime(_reset_marker(directory)) if directory else None
+        if marker is not None and marker > self._reset_seen:
+            self._reset_seen = marker
+            self.clear()
+
+    def snapshot(self):
+        """This process's metrics as {name: stats dict}."""
+        self._apply_reset(_metrics_dir())
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+    def flush(self):
+        directory = _metrics_dir()
+        with self._lock:
+            self._last_flush = time.monotonic()
+        if not directory:
+            return
+        data = self.snapshot()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"pid": os.getpid(), "written": time.time(), "endpoints": data}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write query metrics to {directory}: {e}")
+
+    def collect(self):
+        """Metrics of every live process (this one included), merged by name."""
+        merged = {}
+        own = self.snapshot()
+        directory = _metrics_dir()
+        if directory and os.path.isdir(directory):
+            reset_at = _mtime(_reset_marker(directory)) or 0
+            for filename in os.listdir(directory):
+                if not (filename.startswith("metrics-") and filename.endswith(".json")):
+                    continue
+                if filename == f"metrics-{os.getpid()}.json":
+                    continue
+                path = os.path.join(directory, filename)
+                written = _mtime(path)
+                if written is None:
+                    continue
+                if time.time() - written > MAX_DUMP_AGE:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                if written < reset_at:
+                    continue
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        endpoints = json.load(f)["endpoints"]
+                except (OSError, ValueError, KeyError):
+                    continue
+                _merge_into(merged, endpoints)
+        _merge_into(merged, own)
+        return merged
+
+    def reset(self):
+        """Forget everything recorded so far, in every process sharing the directory."""
+        self.clear()
+        directory = _metrics_dir()
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        with open(_reset_marker(directory), "w") as f:
+            f.write(str(time.time()))
+        self._reset_seen = _mtime(_reset_marker(directory))
+        for filename in os.listdir(directory):
+            if filename.startswith("metrics-"):
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except OSError:
+                    pass
+
+
+def _merge_histogram(into, other):
+    into["buckets"] = [a + b for a, b in zip(into["buckets"], other["buckets"])]
+    into["sum"] += other["sum"]
+    into["max"] = max(into["max"], other["max"])
+
+
+def _merge_into(merged, endpoints):
+    for name, stats in endpoints.items():
+        if name not in merged:
+            merged[name] = json.loads(json.dumps(stats))
+            continue
+        into = merged[name]
+        into["count"] += stats["count"]
+        for key in ("queries", "sql_seconds", "wall_seconds"):
+            _merge_histogram(into[key], stats[key])
+        into["duplicates"] += stats["duplicates"]
+        fingerprints = Counter(into["fingerprints"])
+        fingerprints.update(stats["fingerprints"])
+        into["fingerprints"] = dict(fingerprints)
+        into["recent"] = (into["recent"] + stats["recent"])[-ROLLING_WINDOW:]
+
+
+registry = MetricsRegistry()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# ----------------------------------------------------------------------
+# Prometheus text format
+# ----------------------------------------------------------------------
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _bound(value):
+    return f"{value:g}"
+
+
+def render_prometheus(endpoints):
+    lines = [
+        "# HELP auca_endpoint_requests_total Requests or task runs recorded.",
+        "# TYPE auca_endpoint_requests_total counter",
+    ]
+    for name, stats in sorted(endpoints.items()):
+        lines.append(
+            f'auca_endpoint_requests_total{{endpoint="{_label(name)}",kind="{stats["kind"]}"}} {stats["count"]}'
+        )
+
+    histograms = (
+        ("auca_endpoint_queries", "queries", QUERY_BUCKETS, "SQL statements per request."),
+        ("auca_endpoint_sql_seconds", "sql_seconds", SECONDS_BUCKETS, "Time spent in SQL per request."),
+        ("auca_endpoint_wall_seconds", "wall_seconds", SECONDS_BUCKETS, "Wall time per request."),
+    )
+    for metric, key, bounds, help_text in histograms:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+        for name, stats in sorted(endpoints.items()):
+            label = f'endpoint="{_label(name)}",kind="{stats["kind"]}"'
+            cumulative = 0
+            for bound, n in zip(bounds + (None,), stats[key]["buckets"]):
+                cumulative += n
+                le = "+Inf" if bound is None else _bound(bound)
+                lines.append(f'{metric}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{label}}} {stats[key]['sum']:g}")
+            lines.append(f"{metric}_count{{{label}}} {stats['count']}")
+
+    lines += [
+        "# HELP auca_endpoint_duplicate_queries_total Repeated executions of the same statement shape within one request.",
+        "# TYPE auca_endpoint_duplicate_queries_total counter",
+    ]
+    for name, stats in sorted(endpoints.items()):
+        lines.append(
+            f'auca_endpoint_duplicate_queries_total{{endpoint="{_label(name)}",kind="{stats["kind"]}"}} {stats["duplicates"]}'
+        )
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------------------------------------------------
+# Middleware
+# ----------------------------------------------------------------------
+
+def endpoint_name(request):
+    """ViewSet.action for DRF viewsets, the view's dotted name otherwise."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return f"{request.method} <unresolved>"
+    func = match.func
+    cls = getattr(func, "cls", None) or getattr(func, "view_class", None)
+    actions = getattr(func, "actions", None)
+    if cls is not None and actions:
+        action = actions.get(request.method.lower(), request.method.lower())
+        return f"{cls.__name__}.{action}"
+    if cls is not None:
+        return f"{cls.__name__}.{request.method.lower()}"
+    return f"{getattr(func, '__module__', '')}.{getattr(func, '__name__', match.view_name)}"
+
+
+def _wrap_sync_stream(content, recorder):
+    iterator = iter(content)
+    try:
+        while True:
+            token = _current.set(recorder)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close:
+            close()
+        recorder.finish()
+
+
+async def _wrap_async_stream(content, recorder):
+    iterator = content.__aiter__()
+    try:
+        while True:
+            token = _current.set(recorder)
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield chunk
+    finally:
+        close = getattr(iterator, "aclose", None)
+        if close:
+            await close()
+        recorder.finish()
+
+
+class QueryMetricsMiddleware:
+    """Record query count, SQL time, duplicates and wall time per endpoint."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not enabled():
+            return self.get_response(request)
+
+        install_all()
+        recorder = QueryRecorder(f"{request.method} <unresolved>")
+        token = _current.set(recorder)
+        try:
+            response = self.get_response(request)
+        except Exception:
+            recorder.name = endpoint_name(request)
+            _current.reset(token)
+            recorder.finish()
+            raise
+        _current.reset(token)
+        recorder.name = endpoint_name(request)
+
+        if getattr(response, "streaming", False):
+            # SSE endpoints do their work while the body is consumed.
+            if response.is_async:
+                response.streaming_content = _wrap_async_stream(response.streaming_content, recorder)
+            else:
+                response.streaming_content = _wrap_sync_stream(response.streaming_content, recorder)
+        else:
+            recorder.finish()
+        return response
+
+
+# ----------------------------------------------------------------------
+# Celery
+# ----------------------------------------------------------------------
+
+_task_recorders = {}
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    if not enabled() or task_id is None:
+        return
+    install_all()
+    recorder = QueryRecorder(getattr(task, "name", str(task)), kind="task")
+    _task_recorders[task_id] = (recorder, _current.set(recorder))
+
+
+def _task_postrun(task_id=None, **kwargs):
+    entry = _task_recorders.pop(task_id, None)
+    if entry is None:
+        return
+    recorder, token = entry
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Reset from a different context (e.g. an eventlet greenlet); just clear it.
+        _current.set(None)
+    recorder.finish()
+
+
+def _worker_shutdown(**kwargs):
+    registry.flush()
+
+
+def connect_signals():
+    from celery.signals import task_postrun, task_prerun, worker_process_shutdown
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(install, dispatch_uid="sharedapp.instrumentation.install")
+    task_prerun.connect(_task_prerun, dispatch_uid="sharedapp.instrumentation.prerun", weak=False)
+    task_postrun.connect(_task_postrun, dispatch_uid="sharedapp.instrumentation.postrun", weak=False)
+    worker_process_shutdown.connect(_worker_shutdown, dispatch_uid="sharedapp.instrumentation.shutdown", weak=False)
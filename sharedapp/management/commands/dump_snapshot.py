@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sharedapp import snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the database (or an existing dumpdata fixture, with "
+        "--from-fixture) to a snapshot directory of gzipped NDJSON files, "
+        "one per model, that load_snapshot restores in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Snapshot directory to write (created if missing).")
+        parser.add_argument(
+            "--include", nargs="*", default=None,
+            help="Only these apps or app.model labels (default: everything).",
+        )
+        parser.add_argument(
+            "--exclude", nargs="*", default=list(snapshots.DEFAULT_EXCLUDE),
+            help=f"Apps or app.model labels to leave out (default: {' '.join(snapshots.DEFAULT_EXCLUDE)}).",
+        )
+        parser.add_argument("--from-fixture", help="Convert this dumpdata JSON fixture instead of the database.")
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        try:
+            if options["from_fixture"]:
+                manifest = snapshots.from_fixture(options["from_fixture"], options["directory"])
+            else:
+                manifest = snapshots.dump(
+                    options["directory"], options["include"], options["exclude"], using=options["database"]
+                )
+        except snapshots.SnapshotError as e:
+            raise CommandError(str(e))
+        rows = sum(entry["rows"] for entry in manifest["models"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {rows} rows of {len(manifest['models'])} models to {options['directory']}"
+        ))
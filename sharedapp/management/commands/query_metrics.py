@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+
+from sharedapp.instrumentation import percentile, registry
+
+SORT_KEYS = {
+    "queries": lambda s: s["queries"]["sum"] / max(1, s["count"]),
+    "sql": lambda s: s["sql_seconds"]["sum"],
+    "wall": lambda s: percentile([r[2] for r in s["recent"]], 95),
+    "duplicates": lambda s: s["duplicates"],
+    "count": lambda s: s["count"],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "List the endpoints and Celery tasks that issue the most SQL, from "
+        "the metrics every web and worker process dumps into "
+        "QUERY_METRICS_DIR. Percentiles cover the most recent samples; "
+        "totals cover everything since the last --reset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=10, help="How many rows to show (default 10).")
+        parser.add_argument(
+            "--sort",
+            choices=sorted(SORT_KEYS),
+            default="queries",
+            help="queries = mean statements per call, sql = total SQL time, "
+                 "wall = p95 wall time, duplicates = repeated statements (default queries).",
+        )
+        parser.add_argument(
+            "--fingerprints", type=int, default=3,
+            help="Most repeated statements to show per row (default 3, 0 to hide).",
+        )
+        parser.add_argument("--kind", choices=["http", "task"], help="Only endpoints or only tasks.")
+        parser.add_argument("--reset", action="store_true", help="Discard all recorded metrics and exit.")
+
+    def handle(self, *args, **options):
+        if options["reset"]:
+            registry.reset()
+            self.stdout.write(self.style.SUCCESS("Query metrics reset."))
+            return
+
+        endpoints = registry.collect()
+        if options["kind"]:
+            endpoints = {n: s for n, s in endpoints.items() if s["kind"] == options["kind"]}
+        if not endpoints:
+            self.stdout.write("No query metrics recorded yet.")
+            return
+
+        key = SORT_KEYS[options["sort"]]
+        rows = sorted(endpoints.items(), key=lambda item: key(item[1]), reverse=True)[: options["top"]]
+
+        self.stdout.write(
+            f"{'endpoint':<50} {'calls':>7} {'q/call':>7} {'q p95':>6} {'q max':>6} "
+            f"{'sql ms':>8} {'sql p95':>8} {'wall p95':>9} {'dupes':>7}"
+        )
+        for name, stats in rows:
+            count = max(1, stats["count"])
+            recent = stats["recent"]
+            self.stdout.write(
+                f"{name[:50]:<50} {stats['count']:>7} "
+                f"{stats['queries']['sum'] / count:>7.1f} "
+                f"{percentile([r[0] for r in recent], 95):>6} "
+                f"{stats['queries']['max']:>6.0f} "
+                f"{stats['sql_seconds']['sum'] * 1000:>8.0f} "
+                f"{percentile([r[1] for r in recent], 95) * 1000:>8.1f} "
+                f"{percentile([r[2] for r in recent], 95) * 1000:>9.1f} "
+                f"{stats['duplicates']:>7}"
+            )
+            if options["fingerprints"]:
+                top = sorted(stats["fingerprints"].items(), key=lambda kv: kv[1], reverse=True)
+                for fp, extra in top[: options["fingerprints"]]:
+                    self.stdout.write(f"    +{extra} {fp[:160]}")
@@ -0,0 +1,147 @@
+"""
+Declarative query plans for nested read serializers.
+
+The read serializers nest several levels deep (StudentExam -> Student ->
+User, StudentExam -> Exam -> CourseGroup -> Course -> Department ->
+Location, ...), and every nested FK, reverse FK, M2M and per-row method
+turned into its own query per row. A 50-row StudentExam page cost several
+hundred queries.
+
+query_plan_for(SerializerClass) walks the serializer's readable fields and
+composes what the queryset needs:
+
+    nested single FK serializer   select_related(source), plus the nested
+                                  plan's own select/prefetch, prefixed
+    nested many / reverse / M2M   Prefetch(source, queryset=<nested plan>)
+    ManyRelatedField (pk lists)   prefetch_related(source)
+
+Anything a serializer needs that cannot be inferred from its fields (a
+per-row count, a relation read inside a method field) is declared on the
+serializer itself:
+
+    class Meta:
+        query_plan = QueryPlan(prefetch_related=["user_permissions"])
+
+A nested serializer whose plan carries annotations is always prefetched
+(with the annotated queryset) rather than joined, since select_related
+rows cannot carry the nested model's annotations.
+
+Viewsets pick this up through QueryPlanMixin.get_queryset; custom actions
+that build their own queryset call apply_query_plan().
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+class QueryPlan:
+    def __init__(self, select_related=(), prefetch_related=(), annotations=None):
+        self.select_related = list(select_related)
+        self.prefetch_related = list(prefetch_related)
+        self.annotations = dict(annotations or {})
+
+    def __add__(self, other):
+        return QueryPlan(
+            self.select_related + [s for s in other.select_related if s not in self.select_related],
+            self.prefetch_related + other.prefetch_related,
+            {**self.annotations, **other.annotations},
+        )
+
+    def __repr__(self):
+        return (
+            f"QueryPlan(select_related={self.select_related}, "
+            f"prefetch_related={[_lookup(p) for p in self.prefetch_related]}, "
+            f"annotations={list(self.annotations)})"
+        )
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        return queryset
+
+
+def _lookup(prefetch):
+    return prefetch.prefetch_through if isinstance(prefetch, Prefetch) else prefetch
+
+
+def _prefixed(prefetch, prefix):
+    if isinstance(prefetch, Prefetch):
+        return Prefetch(
+            f"{prefix}__{prefetch.prefetch_through}",
+            queryset=prefetch.queryset,
+            to_attr=prefetch.to_attr,
+        )
+    return f"{prefix}__{prefetch}"
+
+
+@lru_cache(maxsize=None)
+def query_plan_for(serializer_class):
+    """The composed plan for a ModelSerializer class (cached per class)."""
+    meta = getattr(serializer_class, "Meta", None)
+    model = getattr(meta, "model", None)
+    declared = getattr(meta, "query_plan", None) or QueryPlan()
+    plan = QueryPlan(declared.select_related, declared.prefetch_related, declared.annotations)
+    if model is None:
+        return plan
+
+    seen = {_lookup(p) for p in plan.prefetch_related}
+    for field in serializer_class().fields.values():
+        if field.write_only or field.source == "*" or "." in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+        source = field.source
+
+        if isinstance(field, serializers.ManyRelatedField):
+            if source not in seen:
+                plan.prefetch_related.append(source)
+                seen.add(source)
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            child = field.child
+        elif isinstance(field, serializers.BaseSerializer):
+            child = field
+        else:
+            continue
+
+        child_plan = query_plan_for(type(child))
+        many = model_field.many_to_many or model_field.one_to_many
+        if many or child_plan.annotations:
+            if source not in seen:
+                related = model_field.related_model._default_manager.all()
+                plan.prefetch_related.append(
+                    Prefetch(source, queryset=child_plan.apply(related))
+                )
+                seen.add(source)
+        else:
+            if source not in plan.select_related:
+                plan.select_related.append(source)
+            for nested in child_plan.select_related:
+                plan.select_related.append(f"{source}__{nested}")
+            for nested in child_plan.prefetch_related:
+                lookup = f"{source}__{_lookup(nested)}"
+                if lookup not in seen:
+                    plan.prefetch_related.append(_prefixed(nested, source))
+                    seen.add(lookup)
+    return plan
+
+
+def apply_query_plan(queryset, serializer_class):
+    return query_plan_for(serializer_class).apply(queryset)
+
+
+class QueryPlanMixin:
+    """Apply the serializer's query plan to every queryset the view serves."""
+
+    def get_queryset(self):
+        return apply_query_plan(super().get_queryset(), self.get_serializer_class())
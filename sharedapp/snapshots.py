@@ -0,0 +1,494 @@
+"""
+Bulk database snapshots: dump and restore without fixtures.
+
+Staging and benchmark databases used to be seeded with `loaddata dump.json`,
+which deserialises every object through the ORM and saves it one INSERT at
+a time: fine for the few hundred rows in dump.json, hours for a semester's
+million enrollment, exam and notification rows.
+
+A snapshot is a directory instead:
+
+    manifest.json               format, source, and per model (in load
+                                order): table, file, columns, row count
+    <app>.<model>.ndjson.gz     one gzipped JSON array per row, values in
+                                the manifest's column order
+
+Dumping streams each table with .values_list().iterator() inside one
+REPEATABLE READ transaction (PostgreSQL), so the files are consistent with
+each other. Models are written in foreign-key dependency order, auto-created
+many-to-many tables included.
+
+Loading runs in one transaction:
+
+    --flush         empty the snapshot's tables first
+    rows            PostgreSQL: COPY ... FROM STDIN, rows converted to CSV
+                    as they are read from the file; elsewhere: executemany
+                    INSERTs in batches of BATCH_ROWS. Values go in raw, so
+                    auto_now fields and save() side effects do not fire.
+    constraints     deferred (SET CONSTRAINTS ALL DEFERRED, or
+                    constraint_checks_disabled on SQLite) and checked once
+                    at the end, so cycles and self-references load in any
+                    order
+    sequences       reset to the highest loaded id
+    caches          enrollment snapshot version bumped and every timetable's
+                    occupancy index dropped
+
+Columns added to a model since the dump are filled with the field default;
+columns the model no longer has are an error. contenttypes, permissions,
+sessions and admin log entries are environment-specific and left out by
+default, as is anything pointing at an excluded model.
+
+from_fixture() converts an existing dumpdata fixture (dump.json) into a
+snapshot directory so old fixtures get the fast path too.
+"""
+import base64
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from uuid import UUID
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.utils import timezone
+from django.utils.duration import duration_iso_string
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+BATCH_ROWS = 5000
+COPY_BUFFER = 256 * 1024
+COMPRESSLEVEL = 6
+DEFAULT_EXCLUDE = ("contenttypes", "auth.permission", "sessions", "admin.logentry")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+# ----------------------------------------------------------------------
+# Models and order
+# ----------------------------------------------------------------------
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _matches(model, labels):
+    return model._meta.app_label.lower() in labels or _label(model) in labels
+
+
+def _targets(model):
+    return {
+        f.related_model for f in model._meta.concrete_fields
+        if f.is_relation and f.related_model is not model
+    }
+
+
+def dependency_order(model_list):
+    """Models sorted so that every model comes after the models it references."""
+    pending = {m: _targets(m) & set(model_list) for m in model_list}
+    ordered = []
+    while pending:
+        ready = sorted((m for m, deps in pending.items() if not deps), key=_label)
+        if not ready:
+            # A reference cycle; constraints are deferred, so any order loads.
+            ready = [min(pending, key=lambda m: (len(pending[m]), _label(m)))]
+        for model in ready:
+            ordered.append(model)
+            del pending[model]
+        for deps in pending.values():
+            deps.difference_update(ready)
+    return ordered
+
+
+def snapshot_models(include=None, exclude=DEFAULT_EXCLUDE):
+    """The models a snapshot covers, in load order."""
+    include = {label.lower() for label in include or ()}
+    exclude = {label.lower() for label in exclude or ()}
+    chosen = {
+        m for m in apps.get_models(include_auto_created=True)
+        if m._meta.managed and not m._meta.proxy
+        and (not include or _matches(m, include)) and not _matches(m, exclude)
+    }
+    # Rows pointing at models left out could not be restored consistently.
+    while True:
+        orphans = {m for m in chosen if _targets(m) - chosen}
+        if not orphans:
+            break
+        for model in sorted(orphans, key=_label):
+            missing = ", ".join(sorted(_label(t) for t in _targets(model) - chosen))
+            logger.warning(f"Snapshot skips {_label(model)}: it references {missing}, which is excluded")
+        chosen -= orphans
+    return dependency_order(chosen)
+
+
+# ----------------------------------------------------------------------
+# Files
+# ----------------------------------------------------------------------
+
+def _file_name(model):
+    return f"{_label(model)}.ndjson.gz"
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return duration_iso_string(value)
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    raise TypeError(f"Cannot store {type(value).__name__} in a snapshot")
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+
+def _write_rows(path, rows):
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=COMPRESSLEVEL) as out:
+        for row in rows:
+            out.write(_encoder.encode(row))
+            out.write("\n")
+            count += 1
+    return count
+
+
+def _read_rows(path):
+    with gzip.open(path, "rt", encoding="utf-8") as rows:
+        for line in rows:
+            yield json.loads(line)
+
+
+def _write_manifest(directory, source, vendor, entries):
+    manifest = {
+        "format": FORMAT_VERSION,
+        "created_at": timezone.now().isoformat(),
+        "source": source,
+        "vendor": vendor,
+        "models": entries,
+    }
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise SnapshotError(f"{path} not found; not a snapshot directory")
+    if manifest.get("format") != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format')!r}")
+    return manifest
+
+
+# ----------------------------------------------------------------------
+# Dump
+# ----------------------------------------------------------------------
+
+def dump(directory, include=None, exclude=DEFAULT_EXCLUDE, using=DEFAULT_DB_ALIAS):
+    """Write every snapshot model's rows to `directory`; returns the manifest."""
+    os.makedirs(directory, exist_ok=True)
+    connection = connections[using]
+    entries = []
+    with transaction.atomic(using=using):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        for model in snapshot_models(include, exclude):
+            started = time.monotonic()
+            fields = model._meta.concrete_fields
+            rows = (
+                model._base_manager.using(using)
+                .order_by(model._meta.pk.attname)
+                .values_list(*[f.attname for f in fields])
+                .iterator(chunk_size=BATCH_ROWS)
+            )
+            count = _write_rows(os.path.join(directory, _file_name(model)), rows)
+            entries.append({
+                "model": _label(model),
+                "table": model._meta.db_table,
+                "file": _file_name(model),
+                "columns": [f.attname for f in fields],
+                "rows": count,
+            })
+            logger.info(f"Dumped {count} {_label(model)} rows in {time.monotonic() - started:.1f}s")
+    return _write_manifest(directory, "database", connection.vendor, entries)
+
+
+class _NaturalKeys:
+    """Natural key -> id, from the fixture's own objects first, then the database."""
+
+    def __init__(self, objects):
+        self._objects = objects
+        self._index = {}
+
+    def _build(self, model):
+        index = {}
+        concrete = {f.name: f for f in model._meta.concrete_fields if not f.is_relation}
+        if hasattr(model, "natural_key"):
+            for obj in self._objects.get(model, ()):
+                values = {concrete[n].attname: v for n, v in obj.get("fields", {}).items() if n in concrete}
+                key = model(pk=obj.get("pk"), **values).natural_key()
+                index[json.dumps(list(key), default=str)] = obj.get("pk")
+        return index
+
+    def resolve(self, model, key):
+        if model not in self._index:
+            self._index[model] = self._build(model)
+        found = self._index[model].get(json.dumps(key, default=str))
+        if found is not None:
+            return found
+        try:
+            return model._default_manager.get_by_natural_key(*key).pk
+        except (AttributeError, model.DoesNotExist):
+            raise SnapshotError(f"No {_label(model)} with natural key {key!r}")
+
+
+def from_fixture(fixture_path, directory):
+    """
+    Convert a dumpdata JSON fixture (optionally .gz) into a snapshot
+    directory. Natural foreign keys are resolved against the fixture, then
+    the database; fields the models no longer have are dropped with a
+    warning.
+    """
+    opener = gzip.open if fixture_path.endswith(".gz") else open
+    with opener(fixture_path, "rt", encoding="utf-8") as f:
+        objects = json.load(f)
+
+    by_model = {}
+    for obj in objects:
+        try:
+            model = apps.get_model(obj["model"])
+        except (LookupError, KeyError, ValueError):
+            raise SnapshotError(f"Unknown model {obj.get('model')!r} in {fixture_path}")
+        if obj.get("pk") is None:
+            raise SnapshotError(f"{_label(model)} objects need their pk; dump without --natural-primary")
+        by_model.setdefault(model, []).append(obj)
+    natural = _NaturalKeys(by_model)
+
+    def _id(model, value):
+        return natural.resolve(model, value) if isinstance(value, list) else value
+
+    rows, unknown = {}, set()
+    for model, model_objects in by_model.items():
+        opts = model._meta
+        for obj in model_objects:
+            row = {opts.pk.attname: obj["pk"]}
+            for name, value in obj.get("fields", {}).items():
+                try:
+                    field = opts.get_field(name)
+                except FieldDoesNotExist:
+                    unknown.add(f"{_label(model)}.{name}")
+                    continue
+                if field.many_to_many:
+                    through = field.remote_field.through
+                    if not through._meta.auto_created:
+                        continue
+                    source = through._meta.get_field(field.m2m_field_name()).attname
+                    target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+                    for target_id in value or ():
+                        rows.setdefault(through, []).append(
+                            {source: obj["pk"], target: _id(field.related_model, target_id)}
+                        )
+                elif field.concrete:
+                    row[field.attname] = _id(field.related_model, value) if field.is_relation else value
+            rows.setdefault(model, []).append(row)
+    for name in sorted(unknown):
+        logger.warning(f"Fixture field {name} no longer exists; dropped")
+
+    os.makedirs(directory, exist_ok=True)
+    entries = []
+    for model in dependency_order(list(rows)):
+        # Only the columns the fixture has; the rest get defaults on load.
+        columns = [
+            f.attname for f in model._meta.concrete_fields
+            if any(f.attname in row for row in rows[model])
+        ]
+        count = _write_rows(
+            os.path.join(directory, _file_name(model)),
+            ([row.get(c, _default(model._meta.get_field(c))) for c in columns] for row in rows[model]),
+        )
+        entries.append({
+            "model": _label(model),
+            "table": model._meta.db_table,
+            "file": _file_name(model),
+            "columns": columns,
+            "rows": count,
+        })
+    return _write_manifest(directory, f"fixture:{os.path.basename(fixture_path)}", None, entries)
+
+
+# ----------------------------------------------------------------------
+# Load
+# ----------------------------------------------------------------------
+
+def _default(field):
+    value = field.get_default()
+    if value is None and (getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)):
+        value = timezone.now()
+    return value
+
+
+def _plan(entry):
+    """The model, its fields in load order, and the defaults for absent columns."""
+    try:
+        model = apps.get_model(entry["model"])
+    except LookupError:
+        raise SnapshotError(f"Snapshot model {entry['model']} does not exist here")
+    by_attname = {f.attname: f for f in model._meta.concrete_fields}
+    unknown = [c for c in entry["columns"] if c not in by_attname]
+    if unknown:
+        raise SnapshotError(f"{entry['model']} has no column(s) {', '.join(unknown)}; migrate first")
+    present = set(entry["columns"])
+    fields = [by_attname[c] for c in entry["columns"]]
+    # Let the database number rows whose snapshot has no id (m2m rows from fixtures).
+    absent = [
+        f for f in model._meta.concrete_fields
+        if f.attname not in present and f is not model._meta.auto_field
+    ]
+    return model, fields + absent, [_default(f) for f in absent]
+
+
+def _copy_converter(field):
+    if isinstance(field, models.BinaryField):
+        return lambda v: "\\x" + base64.b64decode(v).hex()
+    if isinstance(field, models.JSONField):
+        return lambda v: json.dumps(v, ensure_ascii=False)
+    if isinstance(field, models.BooleanField):
+        return lambda v: "t" if v else "f"
+    if isinstance(field, models.DurationField):
+        return lambda v: v if isinstance(v, str) else duration_iso_string(v)
+    return str
+
+
+def _csv_lines(fields, rows, defaults):
+    converters = [_copy_converter(f) for f in fields]
+    extra = [_default_text(c, v) for c, v in zip(converters[len(fields) - len(defaults):], defaults)]
+    for row in rows:
+        # CSV COPY: an unquoted empty value is NULL, a quoted one is ''.
+        values = [
+            "" if v is None else '"' + convert(v).replace('"', '""') + '"'
+            for convert, v in zip(converters, row)
+        ]
+        yield ",".join(values + extra) + "\n"
+
+
+def _default_text(convert, value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date, dt_time)):
+        value = value.isoformat()
+    return '"' + convert(value).replace('"', '""') + '"'
+
+
+class _LineReader:
+    """File-like .read() over an iterator of text lines, for copy_expert."""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = ""
+
+    def read(self, size=-1):
+        size = COPY_BUFFER if size is None or size < 0 else size
+        parts, length = [self._buffer], len(self._buffer)
+        for line in self._lines:
+            parts.append(line)
+            length += len(line)
+            if length >= size:
+                break
+        data = "".join(parts)
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def _copy(connection, model, fields, rows, defaults):
+    qn = connection.ops.quote_name
+    sql = (
+        f"COPY {qn(model._meta.db_table)} ({', '.join(qn(f.column) for f in fields)}) "
+        f"FROM STDIN WITH (FORMAT csv)"
+    )
+    lines = _csv_lines(fields, rows, defaults)
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, "copy_expert"):  # psycopg2
+            raw.copy_expert(sql, _LineReader(lines), size=COPY_BUFFER)
+        else:  # psycopg 3
+            with raw.copy(sql) as copy:
+                for line in lines:
+                    copy.write(line)
+
+
+def _insert(connection, model, fields, rows, defaults):
+    qn = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {qn(model._meta.db_table)} ({', '.join(qn(f.column) for f in fields)}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))})"
+    )
+    # to_python turns the file's strings back into dates, bytes, etc.
+    prepare = [
+        (lambda v, f=f: f.get_db_prep_save(f.to_python(v), connection)) for f in fields
+    ]
+    batch = []
+    with connection.cursor() as cursor:
+        for row in rows:
+            batch.append([p(v) for p, v in zip(prepare, list(row) + defaults)])
+            if len(batch) >= BATCH_ROWS:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+def _invalidate_caches():
+    from enrollments.snapshot import bump_version
+    from schedules import occupancy
+    from schedules.models import MasterTimetable
+
+    bump_version()
+    for timetable_id in MasterTimetable.objects.values_list("id", flat=True):
+        occupancy.invalidate_timetable(timetable_id)
+
+
+def load(directory, using=DEFAULT_DB_ALIAS, flush=False):
+    """Restore a snapshot directory; returns {model label: rows loaded}."""
+    manifest = read_manifest(directory)
+    plans = [(entry, *_plan(entry)) for entry in manifest["models"]]
+    connection = connections[using]
+    loaded = {}
+    with transaction.atomic(using=using):
+        if flush:
+            tables = [model._meta.db_table for _, model, _, _ in plans]
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sql_flush(no_style(), tables):
+                    cursor.execute(sql)
+        with connection.constraint_checks_disabled():
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+            for entry, model, fields, defaults in plans:
+                started = time.monotonic()
+                rows = _read_rows(os.path.join(directory, entry["file"]))
+                if connection.vendor == "postgresql":
+                    _copy(connection, model, fields, rows, defaults)
+                else:
+                    _insert(connection, model, fields, rows, defaults)
+                loaded[entry["model"]] = entry["rows"]
+                logger.info(f"Loaded {entry['rows']} {entry['model']} rows in {time.monotonic() - started:.1f}s")
+        connection.check_constraints(table_names=[model._meta.db_table for _, model, _, _ in plans])
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [model for _, model, _, _ in plans]):
+                cursor.execute(sql)
+        _invalidate_caches()
+    return loaded
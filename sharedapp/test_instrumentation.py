@@ -0,0 +1,74 @@
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from exams.models import Exam
+from exams.tasks import check_and_update_exams
+from sharedapp import instrumentation
+from sharedapp.instrumentation import fingerprint, registry
+from sharedapp.testing import make_admin, make_campus, make_exam, make_group
+
+
+class QueryInstrumentationTests(TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        override = override_settings(QUERY_METRICS_DIR=self._dir.name, METRICS_TOKEN="secret", DEBUG=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(self._dir.cleanup)
+        registry.clear()
+
+        campus = make_campus()
+        for i in range(3):
+            make_exam(make_group(campus, code=f"C{i}", title=f"Course {i}"), day=timezone.localdate())
+        self.admin = make_admin()
+
+    def test_fingerprint_collapses_parameters(self):
+        self.assertEqual(
+            fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s) LIMIT 21'),
+            fingerprint('SELECT "a"  FROM "t" WHERE "id" IN (%s) LIMIT 5'),
+        )
+
+    def test_request_and_task_are_recorded(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        self.assertEqual(client.get("/api/exams/exams/").status_code, 200)
+        check_and_update_exams.apply()
+
+        endpoints = registry.collect()
+        self.assertEqual(endpoints["ExamViewSet.list"]["count"], 1)
+        self.assertGreater(endpoints["ExamViewSet.list"]["queries"]["sum"], 0)
+        task = endpoints["exams.tasks.check_and_update_exams"]
+        self.assertEqual(task["kind"], "task")
+        self.assertGreater(task["queries"]["sum"], 0)
+
+    def test_duplicates_are_counted(self):
+        with instrumentation.track("loop") as recorder:
+            for exam in Exam.objects.all():
+                exam.group.course.code   # N+1 on purpose
+        self.assertEqual(max(recorder.duplicates().values()), 2)
+        self.assertEqual(registry.collect()["loop"]["duplicates"], 4)
+
+    def test_metrics_endpoint_and_command(self):
+        with instrumentation.track("job"):
+            list(Exam.objects.all())
+        registry.flush()
+
+        client = APIClient()
+        self.assertEqual(client.get("/api/metrics/").status_code, 403)
+        response = client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('auca_endpoint_queries_bucket{endpoint="job",kind="task",le="1"} 1', body)
+        self.assertIn('auca_endpoint_queries_count{endpoint="job",kind="task"} 1', body)
+
+        out = StringIO()
+        call_command("query_metrics", "--top", "5", stdout=out)
+        self.assertIn("job", out.getvalue())
+
+        call_command("query_metrics", "--reset", stdout=StringIO())
+        self.assertEqual(registry.collect(), {})
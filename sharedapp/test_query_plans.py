@@ -0,0 +1,82 @@
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from courses.serializers import CourseSerializer
+from enrollments.models import Enrollment
+from exams.models import StudentExam
+from exams.serializers import StudentExamSerializer
+from sharedapp.query_plans import query_plan_for
+from sharedapp.testing import make_admin, make_campus, make_exam, make_group, make_room, make_student
+from users.models import User
+
+
+class SerializerQueryPlanTests(TestCase):
+    """
+    Query counts of the read endpoints must not grow with the number of
+    rows: each scenario is measured at N and 2N rows and must match.
+    """
+
+    def setUp(self):
+        self.campus = make_campus()
+        self.room = make_room(self.campus.location, capacity=500)
+        self.admin = make_admin()
+        self.instructor = User.objects.create(email="inst@example.com", role="instructor")
+        self.today = timezone.localdate()
+        self.client = APIClient()
+        self.rows = 0
+
+    def _add_rows(self, n):
+        for _ in range(n):
+            i = self.rows
+            self.rows += 1
+            group = make_group(self.campus, code=f"C{i:03}", title=f"Course {i}")
+            exam = make_exam(group, day=self.today, room=self.room, status="READY")
+            student = make_student(i)
+            Enrollment.objects.create(student=student, course=group.course, group=group)
+            StudentExam.objects.create(
+                student=student, exam=exam, room=self.room, instructor=self.instructor,
+            )
+
+    def _count(self, user, url):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content[:200])
+        return len(ctx.captured_queries), response.json()
+
+    def _assert_flat(self, user, url):
+        # Saved StudentExams invalidate cached documents on commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            self._add_rows(3)
+        small, _ = self._count(user, url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._add_rows(3)
+        large, body = self._count(user, url)
+        self.assertEqual(small, large, f"{url}: {small} queries for 3 rows, {large} for 6")
+        return body
+
+    def test_student_exam_list_is_constant(self):
+        body = self._assert_flat(self.admin, "/api/exams/student-exam/")
+        self.assertEqual(len(body["data"]), 6)
+        self.assertEqual(body["data"][0]["exam"]["group"]["course"]["code"], "C000")
+
+    def test_course_list_is_constant(self):
+        body = self._assert_flat(self.admin, "/api/courses/")
+        self.assertEqual(len(body["data"]), 6)
+        self.assertEqual({c["students_enrolled"] for c in body["data"]}, {1})
+
+    def test_instructor_student_exams_is_constant(self):
+        body = self._assert_flat(self.instructor, "/api/exams/student-exam/instructor_student_exams/")
+        self.assertEqual(len(body["students"]), 6)
+
+    def test_plan_composes_nested_serializers(self):
+        plan = query_plan_for(StudentExamSerializer)
+        self.assertIn("exam__group", plan.select_related)
+        self.assertIn("student__user", plan.select_related)
+        # Course carries an annotation, so it is prefetched rather than joined.
+        self.assertIn("exam__group__course", [getattr(p, "prefetch_through", p) for p in plan.prefetch_related])
+        self.assertIn("students_enrolled_count", query_plan_for(CourseSerializer).annotations)
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import zlib
+from datetime import timedelta
+
+from django.contrib.auth.models import Group
+from django.core import serializers
+from django.test import TestCase
+from django.utils import timezone
+
+from departments.models import Department
+from exams.models import TimetableDocument
+from rooms.models import Location, Room
+from sharedapp import snapshots
+from student.models import Student
+from users.models import User
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _state(self):
+        return {
+            "rooms": list(Room.objects.order_by("id").values()),
+            "departments": list(Department.objects.order_by("id").values()),
+            "users": list(User.objects.order_by("id").values("id", "email", "role", "date_joined")),
+            "groups": list(User.groups.through.objects.order_by("user_id").values_list("user_id", "group_id")),
+            "documents": [(d.etag, d.body(), d.built_at) for d in TimetableDocument.objects.order_by("id")],
+        }
+
+    def test_round_trip_keeps_values_and_resets_sequences(self):
+        loc = Location.objects.create(name="Main Campus")
+        Department.objects.create(name='Maths "Pure"', code="MA", location=loc)
+        Room.objects.create(name="Hall", capacity=40, location=loc, rows=None, columns=8)
+        # auto_now values must come back as stored, not as "now".
+        Room.objects.update(updated_at=timezone.now() - timedelta(days=30))
+        user = User.objects.create(email="a@example.com", role="admin")
+        user.groups.add(Group.objects.create(name="Planners"))
+        TimetableDocument.objects.create(
+            kind="student", owner_id=1, etag="e", payload=zlib.compress(b"[]"),
+            built_at=timezone.now(),
+        )
+        before = self._state()
+
+        manifest = snapshots.dump(self.directory, include=["rooms", "departments", "users", "auth.group", "exams.timetabledocument"])
+        labels = [entry["model"] for entry in manifest["models"]]
+        self.assertLess(labels.index("rooms.location"), labels.index("rooms.room"))
+        self.assertLess(labels.index("users.user"), labels.index("users.user_groups"))
+        self.assertNotIn("auth.permission", labels)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "rooms.room.ndjson.gz")))
+
+        Room.objects.all().delete()
+        snapshots.load(self.directory, flush=True)
+        self.assertEqual(self._state(), before)
+        # The next row is numbered after the loaded ones.
+        self.assertGreater(Location.objects.create(name="North").id, loc.id)
+
+    def test_fixture_with_natural_keys_converts(self):
+        loc = Location.objects.create(name="Main Campus")
+        dept = Department.objects.create(name="CS", code="CS", location=loc)
+        user = User.objects.create(email="s@example.com", role="student")
+        user.groups.add(Group.objects.create(name="Class reps"))
+        Student.objects.create(user=user, reg_no="R1", department=dept)
+        objects = [loc, dept, user, *Student.objects.all()]
+        fixture = os.path.join(self.directory, "dump.json")
+        with open(fixture, "w") as f:
+            # As dump.json was made: users referenced by email.
+            serializers.serialize("json", objects, stream=f, use_natural_foreign_keys=True)
+        Student.objects.all().delete()
+        User.objects.all().delete()
+        Department.objects.all().delete()
+        Location.objects.all().delete()
+
+        snapshot = os.path.join(self.directory, "snapshot")
+        snapshots.from_fixture(fixture, snapshot)
+        loaded = snapshots.load(snapshot)
+
+        self.assertEqual(loaded["users.user_groups"], 1)
+        student = Student.objects.select_related("user", "department").get()
+        self.assertEqual((student.user.email, student.department.code), ("s@example.com", "CS"))
+        self.assertEqual(list(student.user.groups.values_list("name", flat=True)), ["Class reps"])
+
+    def test_copy_csv_tells_null_from_empty(self):
+        fields = [Room._meta.get_field(name) for name in ("name", "rows", "created_at")]
+        lines = list(snapshots._csv_lines(fields, [['a "b", c', None]], [None]))
+        self.assertEqual(lines, ['"a ""b"", c",,\n'])
@@ -0,0 +1,67 @@
+"""
+Fixture builders shared by the test modules.
+
+Most tests need the same small campus: a "Main Campus" location with a CS
+department and a semester, a hall, an "Intro CS" course group, an admin,
+a timetable and a few students s0@example.com, s1@example.com, ... Each
+helper creates one piece with the values the tests have always used, so a
+setUp only spells out what its test actually varies.
+"""
+from collections import namedtuple
+from datetime import date, time
+
+from courses.models import Course, CourseGroup
+from departments.models import Department
+from exams.models import Exam
+from rooms.models import Location, Room
+from schedules.models import MasterTimetable
+from semesters.models import Semester
+from student.models import Student
+from users.models import User
+
+Campus = namedtuple("Campus", "location department semester")
+
+
+def make_campus(name="Main Campus"):
+    location = Location.objects.create(name=name)
+    department = Department.objects.create(name="CS", code="CS", location=location)
+    semester = Semester.objects.create(name="Sem 1", start_date=date(2025, 1, 1), end_date=date(2025, 6, 1))
+    return Campus(location, department, semester)
+
+
+def make_room(location, name="Hall", capacity=100, **fields):
+    return Room.objects.create(name=name, capacity=capacity, location=location, **fields)
+
+
+def make_course(campus, code="CS101", title="Intro CS"):
+    return Course.objects.create(title=title, code=code, department=campus.department, semester=campus.semester)
+
+
+def make_group(campus, code="CS101", title="Intro CS", group_name="A"):
+    """A course group; its course is created alongside, see group.course."""
+    return CourseGroup.objects.create(course=make_course(campus, code, title), group_name=group_name)
+
+
+def make_admin(email="admin@example.com"):
+    return User.objects.create(email=email, role="admin")
+
+
+def make_timetable(location, generated_by, start_date=date(2025, 1, 1), end_date=date(2025, 2, 1), **fields):
+    return MasterTimetable.objects.create(
+        generated_by=generated_by, academic_year="2025", location=location,
+        start_date=start_date, end_date=end_date, **fields,
+    )
+
+
+def make_exam(group, day=date(2025, 1, 13), start_time=time(8, 0), end_time=time(11, 0), **fields):
+    fields.setdefault("slot_name", "Morning")
+    return Exam.objects.create(date=day, group=group, start_time=start_time, end_time=end_time, **fields)
+
+
+def make_student(i):
+    user = User.objects.create(email=f"s{i}@example.com", role="student")
+    return Student.objects.create(user=user, reg_no=f"R{i}")
+
+
+def make_students(n, start=0):
+    return [make_student(i) for i in range(start, start + n)]
@@ -1,3 +1,24 @@
-from django.shortcuts import render
+import hmac
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from sharedapp.instrumentation import registry, render_prometheus
+
+
+def metrics_view(request):
+    """
+    Per-endpoint query metrics in the Prometheus text format. Open when
+    DEBUG is on; otherwise the scraper must send
+    `Authorization: Bearer <METRICS_TOKEN>`.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if not settings.DEBUG:
+        header = request.headers.get("Authorization", "")
+        supplied = header[len("Bearer "):] if header.startswith("Bearer ") else ""
+        if not token or not hmac.compare_digest(supplied, token):
+            return HttpResponseForbidden("Forbidden")
+    return HttpResponse(
+        render_prometheus(registry.collect()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -13,6 +13,7 @@ from .models import UserOtp
 # since completing OTP verification (or logging out) requires one.
 OTP_EXEMPT_PATHS = {
     "/api/users/verify_otp/",
+    "/api/users/otp_delivery/",
     "/api/users/logout/",
     "/api/users/check_password_strength/",
 }
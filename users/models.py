@@ -71,7 +71,9 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     def get_permissions_list(self):
         """Return list of permission codenames for the user"""
-        return list(self.user_permissions.values_list("codename", flat=True))
+        # .all() rather than values_list() so a prefetched user_permissions
+        # (see UserSerializer's query plan) is used instead of a query per user.
+        return [p.codename for p in self.user_permissions.all()]
 
     def get_all_permissions(self):
         """Override to include both group and user permissions"""
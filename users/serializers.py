@@ -11,6 +11,7 @@ from django.utils.translation import gettext_lazy as _
 from Admin.models import Admin
 from django.conf import settings
 from django.contrib.auth.models import Permission
+from sharedapp.query_plans import QueryPlan
 import logging
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -52,6 +53,8 @@ class UserSerializer(serializers.ModelSerializer):
             'password': {'write_only': True},
             'user_permissions': {'write_only': True}
         }
+        # current_permissions reads user_permissions once per user.
+        query_plan = QueryPlan(prefetch_related=["user_permissions"])
     
     def get_all_permissions(self, obj):
         """Return all permissions (including groups)"""
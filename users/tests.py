@@ -1,3 +1,103 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ExamManagementSystem.celery import app as celery_app
+from notifications.models import EmailDelivery
+
+from .models import User, UserOtp
+
+
+class LoginOtpDeliveryTests(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", celery_app.conf.task_always_eager)
+        celery_app.conf.task_always_eager = True
+        fd, self.mail_file = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+        self.addCleanup(os.remove, self.mail_file)
+        mail = override_settings(EMAIL_TRANSPORT="file", EMAIL_FILE_PATH=self.mail_file)
+        mail.enable()
+        self.addCleanup(mail.disable)
+
+        self.user = User.objects.create(email="s0@example.com", role="student")
+        self.user.set_password("Correct-Horse-9")
+        self.user.save()
+        self.client = APIClient()
+
+    def _sent(self):
+        with open(self.mail_file, encoding="utf-8") as fh:
+            return [json.loads(line) for line in fh]
+
+    def _login(self, password="Correct-Horse-9"):
+        return self.client.post(
+            "/api/users/token/", {"email": self.user.email, "password": password}, format="json"
+        )
+
+    def test_login_validates_once(self):
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            response = self._login()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIn("access", response.data)
+        self.assertNotIn("refresh", response.data)
+        self.assertIn("refresh_token", response.cookies)
+        user_lookups = [
+            q["sql"] for q in ctx.captured_queries
+            if q["sql"].startswith("SELECT") and 'FROM "users_user"' in q["sql"] and '"email" =' in q["sql"]
+        ]
+        self.assertEqual(len(user_lookups), 1)
+
+        self.assertEqual(self._login("wrong").status_code, 401)
+
+    def test_otp_mail_is_sent_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self._login()
+        delivery = EmailDelivery.objects.get(id=response.data["otp_delivery"]["id"])
+        self.assertEqual(response.data["otp_delivery"]["status"], "queued")
+        self.assertEqual((delivery.status, delivery.template, delivery.message), ("queued", "otp", ""))
+        self.assertEqual(self._sent(), [])
+
+        for callback in callbacks:
+            callback()
+        sent = self._sent()
+        self.assertEqual([m["to"] for m in sent], [[self.user.email]])
+        self.assertIn(UserOtp.objects.get(user=self.user).otp, sent[0]["text"])
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.message), ("sent", 1, ""))
+
+    def test_expired_otp_is_not_sent(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self._login()
+        UserOtp.objects.filter(user=self.user).update(
+            created_at=timezone.now() - timedelta(minutes=UserOtp.OTP_EXPIRY_MINUTES + 1)
+        )
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(self._sent(), [])
+        delivery = EmailDelivery.objects.get(id=response.data["otp_delivery"]["id"])
+        self.assertEqual((delivery.status, delivery.attempts, delivery.message), ("failed", 1, ""))
+
+    def test_otp_delivery_poll(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._login()
+        handle = response.data["otp_delivery"]["id"]
+        # The not-yet-verified token may poll.
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+        body = self.client.get("/api/users/otp_delivery/", {"id": handle}).json()
+        self.assertEqual((body["data"]["id"], body["data"]["status"]), (handle, "sent"))
+        self.assertEqual(self.client.get("/api/users/otp_delivery/").json()["data"]["id"], handle)
+        self.assertEqual(self.client.get("/api/users/otp_delivery/", {"id": "x"}).status_code, 400)
+
+        other = EmailDelivery.objects.create(
+            user=User.objects.create(email="s1@example.com", role="student"),
+            purpose="otp", recipient="s1@example.com", subject="OTP", message="",
+        )
+        self.assertEqual(self.client.get("/api/users/otp_delivery/", {"id": other.id}).status_code, 404)
@@ -20,7 +20,8 @@ from rest_framework_simplejwt.token_blacklist.models import (
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import User, UserOtp
-from notifications.utils import send_mail
+from notifications.utils import queue_email
+from notifications.models import EmailDelivery
 
 import logging
 
@@ -90,6 +91,9 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request, *args, **kwargs):
+        # Validate exactly once. Calling super().post() after is_valid()
+        # ran the whole serializer (and the password hash check) a second
+        # time on every login; the tokens are already in validated_data.
         serializer = self.get_serializer(data=request.data)
 
         try:
@@ -100,52 +104,54 @@ class CustomTokenObtainPairView(TokenObtainPairView):
                 {"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED
             )
 
-        response = super().post(request, *args, **kwargs)
-
-        if response.status_code == status.HTTP_200_OK:
-            refresh_token = response.data.get("refresh")
-            user_permissions = user.get_permissions_list()
-
-            response.set_cookie(
-                key="refresh_token",
-                value=refresh_token,
-                httponly=True,
-                secure=True,
-                samesite="None",
-                max_age=60 * 60 * 24,
+        data = dict(serializer.validated_data)
+        refresh_token = data.pop("refresh", None)
+        data["permissions"] = user.get_permissions_list()
+
+        # Generate the OTP and hand its email to the outbound mail queue
+        # rather than calling the provider inline, so login latency no
+        # longer includes the provider's round trip. Access is still gated
+        # on OTP verification (see users/authentication.py); the client
+        # polls otp_delivery with the returned handle to learn whether the
+        # mail actually went out instead of waiting on a code that never
+        # arrives.
+        try:
+            otp_obj, _ = UserOtp.objects.get_or_create(user=user)
+            otp_obj.generate_otp()
+            # The code itself is rendered by the mail worker from UserOtp
+            # and never stored on the delivery row.
+            delivery = queue_email(
+                subject="Your One-Time Password",
+                message=None,
+                recipient=user.email,
+                user=user,
+                purpose="otp",
+                template="otp",
             )
-            response.data.pop("refresh", None)
-            response.data["permissions"] = user_permissions
-
-            # Generate and send OTP immediately after successful login.
-            # Access is now gated on OTP verification (see
-            # users/authentication.py), so silently swallowing a send
-            # failure here would leave the user stuck on the "enter OTP"
-            # screen with a code that never arrives and no way to know why.
-            try:
-                otp_obj, _ = UserOtp.objects.get_or_create(user=user)
-                otp_code = otp_obj.generate_otp()
-                send_mail(
-                    subject="Your One-Time Password",
-                    message=(
-                        f"Hello {user.get_full_name() or user.email},\n\n"
-                        f"Your OTP code is: {otp_code}\n\n"
-                        f"It will expire in {UserOtp.OTP_EXPIRY_MINUTES} minutes.\n"
-                        "If you did not request this, please ignore this email."
-                    ),
-                    from_email=None,
-                    recipient_list=[user.email],
-                    fail_silently=False,
-                )
-                response.data["otp_sent"] = True
-            except Exception as e:
-                logger.error(f"Error sending OTP email to {user.email}: {e}", exc_info=True)
-                response.data["otp_sent"] = False
-                response.data["otp_error"] = (
+            data["otp_sent"] = delivery.status != "failed"
+            data["otp_delivery"] = {"id": delivery.id, "status": delivery.status}
+            if delivery.status == "failed":
+                data["otp_error"] = (
                     "We couldn't send your OTP email. Please try logging in again "
                     "or contact support."
                 )
+        except Exception as e:
+            logger.error(f"Error queueing OTP email to {user.email}: {e}", exc_info=True)
+            data["otp_sent"] = False
+            data["otp_error"] = (
+                "We couldn't send your OTP email. Please try logging in again "
+                "or contact support."
+            )
 
+        response = Response(data, status=status.HTTP_200_OK)
+        response.set_cookie(
+            key="refresh_token",
+            value=refresh_token,
+            httponly=True,
+            secure=True,
+            samesite="None",
+            max_age=60 * 60 * 24,
+        )
         return response
 
 
@@ -165,7 +171,7 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated]
         elif self.action in ["check_password_strength"]:
             permission_classes = [permissions.AllowAny]
-        elif self.action in ["change_password", "verify_otp"]:
+        elif self.action in ["change_password", "verify_otp", "otp_delivery"]:
             permission_classes = [permissions.IsAuthenticated]
         else:
             permission_classes = [IsAdmin]
@@ -370,6 +376,48 @@ class UserViewSet(viewsets.ModelViewSet):
             {"success": True, "message": "OTP verified successfully."}
         )
 
+    @action(
+        detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated]
+    )
+    def otp_delivery(self, request):
+        """
+        Poll the state of the OTP email queued at login. Takes `?id=` (the
+        handle from the login response); without it, returns the latest
+        OTP delivery for the requesting user.
+        """
+        deliveries = EmailDelivery.objects.filter(user=request.user, purpose="otp")
+        delivery_id = request.query_params.get("id")
+        if delivery_id:
+            if not str(delivery_id).isdigit():
+                return Response(
+                    {"success": False, "message": "Invalid delivery id."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            deliveries = deliveries.filter(id=delivery_id)
+        delivery = deliveries.order_by("-created_at").only(
+            "id", "status", "attempts", "created_at", "sent_at"
+        ).first()
+
+        if delivery is None:
+            return Response(
+                {"success": False, "message": "OTP delivery not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        return Response(
+            {
+                "success": True,
+                "data": {
+                    "id": delivery.id,
+                    "status": delivery.status,
+                    "attempts": delivery.attempts,
+                    "created_at": delivery.created_at,
+                    "sent_at": delivery.sent_at,
+                },
+                "message": "OTP delivery status fetched successfully",
+            }
+        )
+
     @action(
         detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated]
     )
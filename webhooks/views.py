@@ -3,16 +3,19 @@ import hmac
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.utils import timezone
 from django.conf import settings
-from datetime import datetime
-from pytz import timezone as pytz_timezone
+from collections import defaultdict
+from datetime import timedelta
 
 from schedules.models import MasterTimetableExam
 from exams.models import Exam, StudentExam
+from exams.status import advance_statuses, local_now
 from notifications.models import Notification
 from notifications.tasks import send_notification, send_email_task
 
+# The webhook marks an exam COMPLETED only this long after it ends.
+COMPLETE_AFTER = timedelta(minutes=15)
+
 
 def _notify_admins(exam, new_status):
     from users.models import User
@@ -139,69 +142,50 @@ class CheckAndUpdateExamsWebhookView(APIView):
                 status=status.HTTP_401_UNAUTHORIZED,
             )
 
-        tz = pytz_timezone(settings.TIME_ZONE)
-        now = timezone.now().astimezone(tz)
-        today = now.date()
-
-        exams_today = Exam.objects.filter(date=today).exclude(
-            status='CANCELLED'
-        ).prefetch_related(
-            'mastertimetableexam_set__master_timetable'
+        now = local_now()
+        exams_today = list(
+            Exam.objects.filter(date=now.date()).exclude(status='CANCELLED').select_related('group__course')
         )
 
-        if not exams_today.exists():
+        if not exams_today:
             return Response({'message': 'No exams today.'}, status=status.HTTP_200_OK)
 
+        # One conditional UPDATE (exams/status.py): only the transitions this
+        # request applied come back, so a concurrent beat run or a repeated
+        # ping never notifies the same transition twice.
+        changed = advance_statuses(now, complete_after=COMPLETE_AFTER)
+        new_statuses = {exam_id: new for new, ids in changed.items() for exam_id in ids}
+
+        published = defaultdict(list)
+        for exam_id, timetable_id in MasterTimetableExam.objects.filter(
+            exam__in=exams_today, master_timetable__status="PUBLISHED"
+        ).values_list('exam_id', 'master_timetable_id'):
+            published[exam_id].append(timetable_id)
+
         results = []
         skipped = []
 
         for exam in exams_today:
-            # Find all published timetables for this exam
-            published_entries = MasterTimetableExam.objects.filter(
-                exam=exam,
-                master_timetable__status="PUBLISHED"
-            ).select_related('master_timetable')
-
-            if not published_entries.exists():
+            if not published[exam.id]:
                 skipped.append({'exam': str(exam), 'reason': 'No published timetable found.'})
                 continue
 
-            start_dt = datetime.combine(exam.date, exam.start_time)
-            end_dt = datetime.combine(exam.date, exam.end_time)
-
-            start_time = timezone.make_aware(start_dt) if timezone.is_naive(start_dt) else start_dt
-            end_time = timezone.make_aware(end_dt) if timezone.is_naive(end_dt) else end_dt
-
-            time_diff = (start_time - now).total_seconds()
-            time_after_end = (now - end_time).total_seconds()
             previous_status = exam.status
-
-            if 0 < time_diff <= 900 and exam.status != 'READY':
-                exam.status = 'READY'
-                exam.save(update_fields=['status'])
-
-            elif start_time <= now < end_time and exam.status != 'ONGOING':
-                exam.status = 'ONGOING'
-                exam.save(update_fields=['status'])
-
-            elif now >= end_time and time_after_end >= 900 and exam.status != 'COMPLETED':
-                exam.status = 'COMPLETED'
-                exam.save(update_fields=['status'])
-
-            if previous_status != exam.status:
+            updated = exam.id in new_statuses
+            if updated:
+                exam.status = new_statuses[exam.id]
                 message = _get_notification_message(exam, exam.status)
                 if message:
                     _notify_students(exam, message)
                     _notify_admins(exam, exam.status)
 
-
             results.append({
                 'exam': str(exam),
                 'course': exam.group.course.title,
                 'previous_status': previous_status,
                 'new_status': exam.status,
-                'updated': previous_status != exam.status,
-                'published_timetables': [entry.master_timetable.id for entry in published_entries],
+                'updated': updated,
+                'published_timetables': published[exam.id],
             })
 
         return Response({
@@ -209,4 +193,4 @@ class CheckAndUpdateExamsWebhookView(APIView):
             'exams_processed': len(results),
             'exams_skipped': skipped,
             'results': results,
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)